@@ -72,6 +72,8 @@ import traceback
 import logging
 import warnings
 
+from contextlib import contextmanager
+
 # get logger for this module
 _log = logging.getLogger(__name__)
 
@@ -231,6 +233,28 @@ def add_file_log(filename, level=logging.DEBUG, log_fmt=LOG_FMT, log_datefmt=LOG
     return logger_root, handler_file
 
 
+@contextmanager
+def logging_locks_held():
+    """
+    Holds logging module lock and locks of all logging handlers while active,
+    so processes forked meanwhile (e.g., multiprocessing pool workers) do not
+    inherit locks held by other threads (Python 2 logging is not fork-safe:
+    a child inheriting a held handler lock hangs on its first log entry)
+    """
+    logging._acquireLock()
+    handlers = []
+    try:
+        for handler_ref in list(logging._handlerList):
+            handler = handler_ref()
+            if handler is not None:
+                handler.acquire()
+                handlers.append(handler)
+        yield
+    finally:
+        for handler in reversed(handlers):
+            handler.release()
+        logging._releaseLock()
+
 
 def log_trace(exception, level=logging.ERROR, log=_log, output_fmt='std'):
     """
@@ -13,22 +13,28 @@ From scratch implementation from PV-Wave cleaned-up code, daytime method
 import os
 import sys
 import logging
+import hashlib
 import numpy
 
 from statsmodels import robust
 from datetime import datetime, timedelta
+from functools import partial
 from scipy.optimize import leastsq
 from scipy import stats
 from scipy.interpolate import splev, splrep, interp1d, LSQUnivariateSpline
 
-from oneflux import ONEFluxError
+from oneflux import ONEFluxError, add_file_log, log_trace
 
 from oneflux.partition.compu import compu_qcnee_filter, compu_daylight, compu_daylight_zero, compu_sunrise, compu_sunset, compu_nee_night
 from oneflux.partition.ecogeo import lloyd_taylor_dt, gpp_vpd
 from oneflux.partition.auxiliary import compare_col_to_pvwave, FLOAT_PREC, DOUBLE_PREC, NAN, NAN_TEST, nan, not_nan
 from oneflux.partition.library import QC_AUTO_DIR, METEO_PROC_DIR, NEE_PROC_DIR, DT_OUTPUT_DIR, HEADER_SEPARATOR, EXTRA_FILENAME, DT_STR
-from oneflux.partition.library import load_output, get_latitude, add_empty_vars, create_data_structures, nomi, newselif, nlinlts2, check_parameters, remove_errored_entries, jacobian, ONEFluxPartitionError
+from oneflux.partition.library import load_output, get_latitude, add_empty_vars, add_time_columns, create_data_structures, nomi, nlinlts2, check_parameters, remove_errored_entries, jacobian, WindowIndex, ONEFluxPartitionError
+from oneflux.partition.library import run_partitioning_tasks, get_task_dataset, PARTITIONING_METEO_KEY
+from oneflux.partition.library import keep_result_columns, store_result_columns, pop_result_columns
 from oneflux.utils.files import check_create_directory
+from oneflux.utils.writers import write_csv
+from oneflux.utils.profiling import resource_usage, record_phase, profile_phase
 from oneflux.utils.helper_fns import islessthan
 
 from oneflux.graph.compare import plot_comparison
@@ -74,9 +80,12 @@ class ONEFluxPartitionBrokenOptError(ONEFluxPartitionError):
         self.day_end = day_end
         self.prod = prod
         self.perc = perc
+        self.opt_message = message
 
         line2add = '{s}_{year}_{prod},{b:.0f},{e:.0f}'.format(s=site_id, b=day_begin, e=day_end, prod=prod, year=year)
         self.line2add = line2add
+        self.lines2add = [line2add]
+        self.broken_tasks = [(prod, year, perc, day_begin, day_end)] # (ustar_type, year, percentile, window begin, window end) of each broken task
 
         msg = 'Broken DT optimization, {m}'.format(m=message)
         msg += ' for {s}, percentile {perc}, product {prod}, year {year}, at window {b}-{e}.'.format(s=site_id, b=day_begin, e=day_end, perc=perc, prod=prod, year=year)
@@ -84,7 +93,11 @@ class ONEFluxPartitionBrokenOptError(ONEFluxPartitionError):
         super(ONEFluxPartitionBrokenOptError, self).__init__(msg)
 
 
-def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare):
+DT_WORKERS = 1  # default number of worker processes (1 is serial execution)
+DT_WARM_START = False  # default for warm-started window fits in estimate_parasets (False reproduces legacy results exactly)
+
+
+def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare, workers=DT_WORKERS, warm_start=DT_WARM_START, cache_dir=None, keep_columns=None):
     """
     DT partitioning wrapper function.
     Handles all "versions" (percentiles, CUT/VUT, years, etc)
@@ -101,10 +114,21 @@ def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
     :type perc_to_compare: list (of str)
     :param years_to_compare: list of years to compare - [1996, 1997, ... , 2014]
     :type years_to_compare: list (of int)
+    :param workers: number of worker processes for (ustar_type, year, percentile) tasks, 1 runs serially
+    :type workers: int
+    :param warm_start: if True, window fits start from parameters of previous window (see estimate_parasets)
+    :type warm_start: bool
+    :param cache_dir: columnar cache directory for parsed inputs (if None, no caching)
+    :type cache_dir: str
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
     """
 
     _log.info("Started DT partitioning of {s}".format(s=siteid))
 
+    # gap filling neighbour indices are reused within this run (all site-years), release any left from previous runs
+    clear_gapfill_neighbour_indices()
+
     sitedir_full = os.path.join(datadir, sitedir)
     qc_auto_dir = os.path.join(sitedir_full, QC_AUTO_DIR)
     meteo_proc_dir = os.path.join(sitedir_full, METEO_PROC_DIR)
@@ -125,7 +149,12 @@ def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
             _log.critical(msg)
             raise ONEFluxError(msg)
     _log.info("Will now load meteo file '{f}'".format(f=meteo_proc_f))
-    whole_dataset_meteo, headers_meteo, timestamp_list_meteo, year_list_meteo = load_output(meteo_proc_f)
+    with profile_phase(label='load'):
+        whole_dataset_meteo, headers_meteo, timestamp_list_meteo, year_list_meteo = load_output(meteo_proc_f, cache_dir=cache_dir)
+
+    # datasets shared (read-only) by all tasks, and list of pending tasks for parallel execution
+    datasets = {PARTITIONING_METEO_KEY: whole_dataset_meteo}
+    tasks = []
 
     # iterate through UStar threshold types
     for ustar_type in prod_to_compare:
@@ -152,7 +181,10 @@ def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
                     msg = "Invalid USTAR type '{u}'".format(u=ustar_type)
                     raise ONEFluxError(msg)
         _log.info("Will now load nee percentiles file '{f}'".format(f=nee_proc_percentiles_f))
-        whole_dataset_nee, headers_nee, timestamp_list_nee, year_list_nee = load_output(nee_proc_percentiles_f)
+        with profile_phase(label='load'):
+            whole_dataset_nee, headers_nee, timestamp_list_nee, year_list_nee = load_output(nee_proc_percentiles_f, cache_dir=cache_dir)
+            whole_dataset_nee = add_time_columns(whole_dataset_nee)
+        datasets[ustar_type] = whole_dataset_nee
 
         # iterate through each year
         for iteration, year in enumerate(year_list_nee):
@@ -168,77 +200,276 @@ def partitioning_dt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
 
             # iterate through UStar threshold values
             for percentile in percentiles_data_columns:
-                _log.info("Started processing percentile '{p}'".format(p=percentile))
                 percentile_print = percentile.replace(HEADER_SEPARATOR, '.')
                 output_filename = os.path.join(dt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra=EXTRA_FILENAME))
-                temp_output_filename = os.path.join(dt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra='{extra}'))
                 if os.path.isfile(output_filename):
                     _log.info("Output file found, skipping: '{f}'".format(f=output_filename))
                     continue
                 else:
                     _log.debug("Output file missing, will be processed: '{f}'".format(f=output_filename))
 
-                # create masks for current year for both nee and meteo
-                year_mask_nee = (whole_dataset_nee['year'] == year)
-                year_mask_meteo = (whole_dataset_meteo['year'] == year)
-
-                # account for first entry being from previous year
-                if iteration == 0:
-                    _log.debug("First site-year available ({y}), removing first midnight entry from meteo only".format(y=year))
-                    first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
-                    first_nee = None
-                    year_mask_meteo[first_meteo] = 0
+                task = (siteid, sitedir_full, dt_output_dir, ustar_type, iteration, year, percentile, latitude)
+                if workers > 1:
+                    tasks.append(task)
                 else:
-                    _log.debug("Regular site-year ({y}), removing first midnight entry from meteo and nee".format(y=year))
-                    first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
-                    first_nee = numpy.where(year_mask_nee == 1)[0][0]
-                    year_mask_meteo[first_meteo] = 0
-                    year_mask_nee[first_nee] = 0
-
-                # account for last entry being from next year
-                _log.debug("Site-year ({y}), adding first midnight entry from next year for meteo and nee".format(y=year))
-                last_meteo = numpy.where(year_mask_meteo == 1)[0][-1] + 1
-                last_nee = numpy.where(year_mask_nee == 1)[0][-1] + 1
-                year_mask_meteo[last_meteo] = 1
-                year_mask_nee[last_nee] = 1
-
-                _log.debug("Site-year {y}: first NEE '{tn}' and first meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][0]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][0]['timestamp_end']))
-                _log.debug("Site-year {y}:  last NEE '{tn}' and  last meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][-1]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][-1]['timestamp_end']))
-
-                if numpy.sum(year_mask_nee) != numpy.sum(year_mask_meteo):
-                    msg = "Incompatible array sizes (nee={n}, meteo={m}) for year '{y}' while processing '{f}'".format(y=year, f=output_filename, n=numpy.sum(year_mask_nee), m=numpy.sum(year_mask_meteo))
-                    _log.error(msg)
-                    raise ONEFluxError(msg)
+                    partitioning_dt_task(whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo, warm_start=warm_start, keep_columns=keep_columns, *task)
+            _log.info("Finished processing year '{y}'".format(y=year))
+        _log.info("Finished processing UStar threshold type '{u}'".format(u=ustar_type))
 
-                #### Get a cleaned-up organized numpy version of the data
-                working_year_data = create_data_structures(ustar_type=ustar_type, whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo,
-                                                           percentile=percentile, year_mask_nee=year_mask_nee, year_mask_meteo=year_mask_meteo, latitude=latitude, part_type=DT_STR)
+    if tasks:
+        results = run_partitioning_tasks(func=partial(_partitioning_dt_worker, warm_start=warm_start, keep_columns=keep_columns), tasks=tasks, datasets=datasets, workers=workers, label='DT partitioning')
+        merge_dt_task_results(tasks=tasks, results=results)
 
-                #### Remove entries that fall into specified error-ranges
-                working_year_data = remove_errored_entries(ustar_type=ustar_type, site=siteid, site_dir=sitedir_full, year=year, working_year_data=working_year_data)
+    clear_gapfill_neighbour_indices()
+    _log.info("Finished DT partitioning of {s}".format(s=siteid))
 
-                name_out = str(siteid) + "_" + str(year) + "_" + str(ustar_type)
 
-                name_file = "nee_" + str(ustar_type) + "_" + str(percentile) + "_" + str(siteid) + "_" + str(year)
+def partitioning_dt_task(siteid, sitedir_full, dt_output_dir, ustar_type, iteration, year, percentile, latitude, whole_dataset_nee, whole_dataset_meteo, warm_start=DT_WARM_START, keep_columns=None):
+    """
+    DT partitioning of a single (ustar_type, year, percentile) task,
+    saving results to its output file
 
-                #### call flux_part_gl2010 for day time (main partitioning process)
-                result_year_data = flux_part_gl2010(data=working_year_data, name_file=name_file, name_out=name_out, dt_output_dir=dt_output_dir, site_id=siteid, ustar_type=ustar_type, percentile_num=percentile, year=year)
+    :param siteid: site flux id to be processed - in format CC-SSS
+    :type siteid: str
+    :param sitedir_full: data directory for site (full path)
+    :type sitedir_full: str
+    :param dt_output_dir: DT partitioning output directory (full path)
+    :type dt_output_dir: str
+    :param ustar_type: UStar threshold type - 'c' or 'y'
+    :type ustar_type: str
+    :param iteration: index of year in list of years of the NEE dataset (0 for first site-year)
+    :type iteration: int
+    :param year: year to be processed
+    :type year: int
+    :param percentile: percentile data column label - e.g., '1__25'
+    :type percentile: str
+    :param latitude: site latitude
+    :type latitude: float
+    :param whole_dataset_nee: full NEE percentiles dataset for UStar threshold type
+    :type whole_dataset_nee: numpy.ndarray
+    :param whole_dataset_meteo: full meteo dataset
+    :type whole_dataset_meteo: numpy.ndarray
+    :param warm_start: if True, window fits start from parameters of previous window (see estimate_parasets)
+    :type warm_start: bool
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
+    :rtype: str
+    """
+    _log.info("Started processing percentile '{p}'".format(p=percentile))
+    percentile_print = percentile.replace(HEADER_SEPARATOR, '.')
+    output_filename = os.path.join(dt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra=EXTRA_FILENAME))
+
+    # create masks for current year for both nee and meteo
+    year_mask_nee = (whole_dataset_nee['year'] == year)
+    year_mask_meteo = (whole_dataset_meteo['year'] == year)
+
+    # account for first entry being from previous year
+    if iteration == 0:
+        _log.debug("First site-year available ({y}), removing first midnight entry from meteo only".format(y=year))
+        first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
+        first_nee = None
+        year_mask_meteo[first_meteo] = 0
+    else:
+        _log.debug("Regular site-year ({y}), removing first midnight entry from meteo and nee".format(y=year))
+        first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
+        first_nee = numpy.where(year_mask_nee == 1)[0][0]
+        year_mask_meteo[first_meteo] = 0
+        year_mask_nee[first_nee] = 0
 
-                if result_year_data is None:
-                    _log.error("Error processing output file '{f}".format(f=output_filename))
-                else:
-                    # save output data file
-                    _log.debug("Saving output file '{f}".format(f=output_filename))
-                    numpy.savetxt(fname=output_filename, X=result_year_data, delimiter=',', fmt='%s', header=','.join(result_year_data.dtype.names), comments='')
-                    _log.debug("Saved output file '{f}".format(f=output_filename))
+    # account for last entry being from next year
+    _log.debug("Site-year ({y}), adding first midnight entry from next year for meteo and nee".format(y=year))
+    last_meteo = numpy.where(year_mask_meteo == 1)[0][-1] + 1
+    last_nee = numpy.where(year_mask_nee == 1)[0][-1] + 1
+    year_mask_meteo[last_meteo] = 1
+    year_mask_nee[last_nee] = 1
 
-                _log.info("Finished processing percentile '{p}'".format(p=percentile))
-            _log.info("Finished processing year '{y}'".format(y=year))
-        _log.info("Finished processing UStar threshold type '{u}'".format(u=ustar_type))
-    _log.info("Finished DT partitioning of {s}".format(s=siteid))
+    _log.debug("Site-year {y}: first NEE '{tn}' and first meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][0]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][0]['timestamp_end']))
+    _log.debug("Site-year {y}:  last NEE '{tn}' and  last meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][-1]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][-1]['timestamp_end']))
 
+    if numpy.sum(year_mask_nee) != numpy.sum(year_mask_meteo):
+        msg = "Incompatible array sizes (nee={n}, meteo={m}) for year '{y}' while processing '{f}'".format(y=year, f=output_filename, n=numpy.sum(year_mask_nee), m=numpy.sum(year_mask_meteo))
+        _log.error(msg)
+        raise ONEFluxError(msg)
 
-def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_type, percentile_num, year):
+    #### Get a cleaned-up organized numpy version of the data
+    working_year_data = create_data_structures(ustar_type=ustar_type, whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo,
+                                               percentile=percentile, year_mask_nee=year_mask_nee, year_mask_meteo=year_mask_meteo, latitude=latitude, part_type=DT_STR)
+
+    #### Remove entries that fall into specified error-ranges
+    working_year_data = remove_errored_entries(ustar_type=ustar_type, site=siteid, site_dir=sitedir_full, year=year, working_year_data=working_year_data)
+
+    name_out = str(siteid) + "_" + str(year) + "_" + str(ustar_type)
+
+    name_file = "nee_" + str(ustar_type) + "_" + str(percentile) + "_" + str(siteid) + "_" + str(year)
+
+    #### call flux_part_gl2010 for day time (main partitioning process)
+    result_year_data = flux_part_gl2010(data=working_year_data, name_file=name_file, name_out=name_out, dt_output_dir=dt_output_dir, site_id=siteid, ustar_type=ustar_type, percentile_num=percentile, year=year, warm_start=warm_start)
+
+    if result_year_data is None:
+        _log.error("Error processing output file '{f}".format(f=output_filename))
+    else:
+        # save output data file
+        _log.debug("Saving output file '{f}".format(f=output_filename))
+        with profile_phase(label='write'):
+            write_csv(filename=output_filename, data=result_year_data, delimiter=',', header=','.join(result_year_data.dtype.names))
+            keep_result_columns(filename=output_filename, data=result_year_data, columns=keep_columns)
+        _log.debug("Saved output file '{f}".format(f=output_filename))
+
+    _log.info("Finished processing percentile '{p}'".format(p=percentile))
+    return output_filename
+
+
+DT_TASK_OK = 'ok'                    # task finished, details are output filename and result columns kept (see keep_result_columns)
+DT_TASK_BROKEN_OPT = 'broken_opt'    # task stopped by broken optimization, window to be added to errors file
+DT_TASK_ERROR = 'error'              # task stopped by any other error
+
+
+def _partitioning_dt_worker(task, warm_start=DT_WARM_START, keep_columns=None):
+    """
+    Worker process entry point for a single (ustar_type, year, percentile) task,
+    logs task execution into its own log file (same name as output file, with .log extension;
+    level of root logger restored afterwards).
+    Exceptions are returned as status and (picklable) details, to be merged by merge_dt_task_results
+
+    :param task: arguments for partitioning_dt_task (siteid, sitedir_full, dt_output_dir, ustar_type, iteration, year, percentile, latitude)
+    :type task: tuple
+    :param warm_start: if True, window fits start from parameters of previous window (see estimate_parasets)
+    :type warm_start: bool
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
+    :rtype: tuple (status, details)
+    """
+    siteid, _, dt_output_dir, ustar_type, _, year, percentile, _ = task
+    log_filename = os.path.join(dt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.log".format(t=ustar_type, p=percentile.replace(HEADER_SEPARATOR, '.'), s=siteid, y=year, extra=EXTRA_FILENAME))
+    previous_level = logging.getLogger().level
+    logger, handler = add_file_log(filename=log_filename)
+    try:
+        output_filename = partitioning_dt_task(whole_dataset_nee=get_task_dataset(ustar_type), whole_dataset_meteo=get_task_dataset(PARTITIONING_METEO_KEY), warm_start=warm_start, keep_columns=keep_columns, *task)
+        return DT_TASK_OK, (output_filename, pop_result_columns(filename=output_filename))
+    except ONEFluxPartitionBrokenOptError as e:
+        _log.error(str(e))
+        return DT_TASK_BROKEN_OPT, (e.opt_message, e.site_id, e.year, e.day_begin, e.day_end, e.prod, e.perc)
+    except Exception as e:
+        msg = "DT partitioning task failed (ustar_type={u}, year={y}, percentile={p}): {e}".format(u=ustar_type, y=year, p=percentile, e=e)
+        log_trace(exception=e, level=logging.CRITICAL, log=_log)
+        _log.critical(msg)
+        return DT_TASK_ERROR, msg
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+        logger.setLevel(previous_level)
+
+
+def merge_dt_task_results(tasks, results):
+    """
+    Merges results from DT partitioning tasks run in parallel, reproducing serial execution:
+    the first failed task (in serial order) determines the exception raised; for broken
+    optimizations, the first broken window of each site-year-product is kept (errors entries
+    are per site-year-product, independent from each other), and outputs from later tasks
+    in the same site-year-product are removed since they were computed without that window excluded
+    (removal done for all tasks before raising, even if a later task failed with another error)
+
+    :param tasks: list of task arguments for partitioning_dt_task (siteid, sitedir_full, dt_output_dir, ustar_type, iteration, year, percentile, latitude)
+    :type tasks: list (of tuple)
+    :param results: list of (status, details) results from _partitioning_dt_worker, same order as tasks
+    :type results: list (of tuple)
+    """
+    first_broken = None
+    first_error = None
+    lines2add = []
+    broken_tasks = []
+    broken_keys = set()
+    for task, (status, details) in zip(tasks, results):
+        siteid, _, _, ustar_type, _, year, _, _ = task
+        key = "{s}_{y}_{u}".format(s=siteid, y=year, u=ustar_type)
+        if status == DT_TASK_ERROR:
+            if first_broken is None and first_error is None:
+                first_error = details
+        elif status == DT_TASK_BROKEN_OPT:
+            if key not in broken_keys:
+                broken_keys.add(key)
+                error = ONEFluxPartitionBrokenOptError(details[0], site_id=details[1], year=details[2], day_begin=details[3], day_end=details[4], prod=details[5], perc=details[6])
+                lines2add.append(error.line2add)
+                broken_tasks.extend(error.broken_tasks)
+                if first_broken is None:
+                    first_broken = error
+        else:
+            output_filename, kept = details
+            if key in broken_keys and os.path.isfile(output_filename):
+                _log.debug("Removing output file computed before broken optimization in same site-year-product: '{f}'".format(f=output_filename))
+                os.remove(output_filename)
+            elif kept:
+                store_result_columns(filename=output_filename, columns=kept)
+
+    if first_error is not None:
+        raise ONEFluxPartitionError(first_error)
+    if first_broken is not None:
+        first_broken.lines2add = lines2add
+        first_broken.broken_tasks = broken_tasks
+        raise first_broken
+
+
+class DTWindowPartition(object):
+    """
+    Partition of a site-year in daytime partitioning windows, with contiguous
+    offsets of all windows computed once and shared by estimate_parasets,
+    compute_flux and compute_var (data sorted by julday, with 'ind' set to
+    the entry position, as in flux_part_gl2010)
+    """
+
+    def __init__(self, data, winsize):
+        """
+        :param data: data structure for partitioning
+        :type data: numpy.ndarray
+        :param winsize: window size (in days), windows overlap by half their size
+        :type winsize: int
+        """
+        self.data = data
+        self.winsize = winsize
+        self.n_parasets = long(365 / winsize) * 2
+
+        window_numbers = numpy.arange(self.n_parasets)
+
+        # windows for optimization, with julday in (day_begin, day_end]
+        self.day_begins = window_numbers * winsize / 2.0
+        self.day_ends = self.day_begins + winsize
+        self.windows = WindowIndex(days=data['julday'], starts=self.day_begins, ends=self.day_ends, closed='right')
+
+        # wider windows for night time data, with julday in (day_begin2, day_end2]
+        self.day_begins2 = numpy.where(window_numbers > 1, (window_numbers - 2) * winsize / 2.0, 0)
+        self.day_ends2 = numpy.where(window_numbers < self.n_parasets - 2, (window_numbers + 2) * winsize / 2.0 + winsize, numpy.amax(data['julday']))
+        self.windows2 = WindowIndex(days=data['julday'], starts=self.day_begins2, ends=self.day_ends2, closed='right')
+
+    def parameter_windows(self, params):
+        """
+        Windows covered by each (okay) parameter set (see get_parameter_windows)
+
+        :param params: parameters from estimate_parasets
+        :type params: numpy.ndarray
+        :rtype: WindowIndex
+        """
+        return get_parameter_windows(data=self.data, params=params)
+
+
+def get_parameter_windows(data, params):
+    """
+    Windows covered by each (okay) parameter set, from the center index (last row
+    of params) of previous window to the center index of next window;
+    first window starts at first entry, last window ends at last entry
+
+    :param data: data structure for partitioning (with 'ind' column)
+    :type data: numpy.ndarray
+    :param params: parameters from estimate_parasets
+    :type params: numpy.ndarray
+    :rtype: WindowIndex
+    """
+    centers = params[-1, :]
+    starts = numpy.append(0, centers[:-1])
+    ends = numpy.append(centers[1:], numpy.inf)
+    return WindowIndex(days=data['ind'], starts=starts, ends=ends, closed='left')
+
+
+def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_type, percentile_num, year, warm_start=DT_WARM_START):
     """
 
     :Task:  Main flux partitioning function (for day time)
@@ -269,6 +500,8 @@ def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_ty
     :type percentile_num: string
     :param year: year being processed
     :type year: int
+    :param warm_start: if True, window fits start from parameters of previous window (see estimate_parasets)
+    :type warm_start: bool
     """
     _log.info("Starting flux_part_gl2010 for daytime for nee_{u}_{p}_{s}_{y}".format(u=ustar_type, p=percentile_num, s=site_id, y=year))
 
@@ -296,7 +529,8 @@ def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_ty
     #compare_results_pv_py(py_data=h_data, pvwave_file_path='../test_before_uncert_gapfill.csv', var='NEE')
 
     # Compute uncertainties via gap filling
-    uncert_via_gapFill(data=h_data, var='NEE'.lower(), nomsg=True, maxMissFrac=1.0)
+    with profile_phase(label='gap_fill'):
+        uncert_via_gapFill(data=h_data, var='NEE'.lower(), nomsg=True, maxMissFrac=1.0)
 
     #pvwave_file_path = '../test_after_uncert_gapfill.csv'
     #file_basename = 'after_gapfill_1999_y'
@@ -316,9 +550,14 @@ def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_ty
     NEE_fqcok = (h_data['nee_f'] > -999).astype(int) * h_data['nee_fqcok']
     add_empty_vars(data=h_data, records=NEE_fqcok, column=str("nee_fqcok"))
 
+    #### Window partition of the site-year, shared by estimate_parasets,
+    #### compute_flux and compute_var
+    windows = DTWindowPartition(data=h_data, winsize=winsize)
+
     #### Calling estimate_parasets to get the best model for
     #### the NEE data
-    params, whichmodel, JTJ_inv, res_cor, p_correl_return = estimate_parasets(data=h_data, winsize=winsize, fguess=fguess, trimperc=trimperc, name_out=name_out, dt_output_dir=dt_output_dir, site_id=site_id, ustar_type=ustar_type, percentile_num=percentile_num, year=year)
+    with profile_phase(label='window_fits'):
+        params, whichmodel, JTJ_inv, res_cor, p_correl_return = estimate_parasets(data=h_data, winsize=winsize, fguess=fguess, trimperc=trimperc, name_out=name_out, dt_output_dir=dt_output_dir, site_id=site_id, ustar_type=ustar_type, percentile_num=percentile_num, year=year, windows=windows, warm_start=warm_start)
 
     paramsOK = numpy.where(params == -9999)
 
@@ -334,12 +573,16 @@ def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_ty
     if len(paramsOK[0]) == params.size:
         return
 
+    phase_begin = resource_usage(children=False)
+    parameter_windows = windows.parameter_windows(params=params)
+
     #### Calling compute_flux to calculate the Reco and GPP variables
-    reco_flux, gpp_flux, pf_flux1, pf_flux2 = compute_flux(data=h_data, params=params, dt_output_dir=dt_output_dir, site_id=site_id, ustar_type=ustar_type, percentile_num=percentile_num, year=year)
+    reco_flux, gpp_flux, pf_flux1, pf_flux2 = compute_flux(data=h_data, params=params, dt_output_dir=dt_output_dir, site_id=site_id, ustar_type=ustar_type, percentile_num=percentile_num, year=year, windows=parameter_windows)
 
     #### Calling compute_var to get the predicted variable by specifying
     #### the model we used in estimate_params
-    varGPP = compute_var(data=h_data, params=params, whichmodel=whichmodel, JTJ_inv=JTJ_inv, res_cor=res_cor)
+    varGPP = compute_var(data=h_data, params=params, whichmodel=whichmodel, JTJ_inv=JTJ_inv, res_cor=res_cor, windows=parameter_windows)
+    record_phase(label='flux', begin=phase_begin)
 
     #print("flux")
     #print(flux)
@@ -387,7 +630,7 @@ def flux_part_gl2010(data, name_file, name_out, dt_output_dir, site_id, ustar_ty
     return h_data
 
 
-def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_num, year):
+def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_num, year, windows=None):
     """
     :Task:  This function is responsible to calculate the Reco and GPP values
 
@@ -439,8 +682,12 @@ def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_nu
     :type percentile_num: string
     :param year: year being processed
     :type year: int
+    :param windows: windows covered by each parameter set (computed from params if None)
+    :type windows: oneflux.partition.library.WindowIndex
     """
     _log.info("Starting compute_flux of daytime for nee_{u}_{p}_{s}_{y}".format(u=ustar_type, p=percentile_num, s=site_id, y=year))
+    if windows is None:
+        windows = get_parameter_windows(data=data, params=params)
     filename_range = 'nee_' + ustar_type + '_' + str(percentile_num) + '_' + site_id + '_' + str(year) + '_params_after_es_python.csv'
 
     n_params = len(params[:, 0])
@@ -468,45 +715,10 @@ def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_nu
 
     #### We iterate over the "okay" parameters we got from estimate_params
     for i in range(n_parasets):
-        sub = None
-
         #### Getting the data in each window while keeping in mind
         #### the position of each window. i.e we handle the data of
-        #### the first window and the last window.
-        if i == 0:
-            ind_begin = 0
-            ind_end = params[n_params - 1, i + 1]
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] < ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-        elif i == (n_parasets - 1):
-            ind_begin = params[n_params - 1, i - 1]
-            ind_end = numpy.max(data['ind'])
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] <= ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-        else:
-            ind_begin = params[n_params - 1, i - 1]
-            ind_end = params[n_params - 1, i + 1]
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] < ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-
-            '''
-            #if i == 15:
-            if i >= 13 and i <= 24:
-                print("i")
-                print(i)
-                print("ind_begin")
-                print(ind_begin)
-                print("ind_end")
-                print(ind_end)
-                print("rref")
-                print(params[3, i])
-                print("e0")
-                print(params[4, i])
-                print("sub['tair_f'].size")
-                print(sub['tair_f'].size)
-                #if i == 24:
-                #    exit()
-            '''
+        #### the first window and the last window (zero-copy view of data)
+        sub = windows.select(data=data, window=i)
 
         #### We apply the best parameters we got on the right model
         #### functions to estimate the Reco and GPP. We do this by fitting
@@ -529,120 +741,55 @@ def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_nu
     #end for i
 
 
-    #### We iterate over each data point in the whole dataset.
-    #### i.e j could represent around 17,000 data points.
-    for j in range(n_set):
-
-        #### For each data-point "j", there could be up to two windows
-        #### that have covered this data-point "j". So we check how many
-        #### windows have covered it and save the number in count.
-        Reco_ind = numpy.where(Reco_mat[:, j] > NAN)[0]
-        count = len(Reco_ind)
-
-        #### If there are two windows covering this data-point "j", then we are going
-        #### to assign weights to each window and multiply the Reco and GPP
-        #### values we got previously with it's assigned weight. We get the
-        #### final Reco and GPP values by adding the multiplied values together.
-        if count > 1:
-            weight1 = (params[n_params - 1, Reco_ind[1]] - j) / (params[n_params - 1, Reco_ind[1]] - params[n_params - 1, Reco_ind[0]])
-            weight2 = (j - params[n_params - 1, Reco_ind[0]]) / (params[n_params - 1, Reco_ind[1]] - params[n_params - 1, Reco_ind[0]])
-            Reco[j] = Reco_mat[Reco_ind[0], j] * weight1 + Reco_mat[Reco_ind[1], j] * weight2
-            GPP[j] = GPP_mat[Reco_ind[0], j] * weight1 + GPP_mat[Reco_ind[1], j] * weight2
-            partition_flag1[j] = numpy.abs(params[n_params - 1, Reco_ind[1]] - j)
-            partition_flag2[j] = numpy.abs(j - params[n_params - 1, Reco_ind[0]])
-
-            # my code
-            reco_gpp_orig[0, j] = j
-            reco_gpp_orig[1, j] = data['year'][j]
-            reco_gpp_orig[2, j] = data['month'][j]
-            reco_gpp_orig[3, j] = data['day'][j]
-            reco_gpp_orig[4, j] = data['hr'][j]
-            reco_gpp_orig[5, j] = data['julday'][j]
-            reco_gpp_orig[6, j] = Reco_mat[Reco_ind[0], j]
-            reco_gpp_orig[7, j] = Reco_mat[Reco_ind[1], j]
-            reco_gpp_orig[8, j] = GPP_mat[Reco_ind[0], j]
-            reco_gpp_orig[9, j] = GPP_mat[Reco_ind[1], j]
-
-            '''
-            if j == 1952:
-                print("j")
-                print(j)
-                print("count")
-                print(count)
-                print("Reco_ind[0]")
-                print(Reco_ind[0])
-                print("Reco_ind[1]")
-                print(Reco_ind[1])
-                print("weight1")
-                print(weight1)
-                print("weight2")
-                print(weight2)
-                print("params[n_params - 1, Reco_ind[0]]")
-                print(params[n_params - 1, Reco_ind[0]])
-                print("params[n_params - 1, Reco_ind[1]]")
-                print(params[n_params - 1, Reco_ind[1]])
-                print("Reco_mat[Reco_ind[0], j]")
-                print(Reco_mat[Reco_ind[0], j])
-                print("Reco_mat[Reco_ind[1], j]")
-                print(Reco_mat[Reco_ind[1], j])
-                print("GPP_mat[Reco_ind[0], j]")
-                print(GPP_mat[Reco_ind[0], j])
-                print("GPP_mat[Reco_ind[1], j]")
-                print(GPP_mat[Reco_ind[1], j])
-                print("Reco[j]")
-                print(Reco[j])
-                print("GPP[j]")
-                print(GPP[j])
-
-                #if j == 1952:
-                #    exit()
-
-                #if j == 8840:
-                 #   exit()
-            '''
-
-                #end code
-
-        #### If there is only one window covering this data-point "j", then
-        #### we are going to assign the final Reco and GPP values
-        #### to the previously calculated Reco and GPP.
-        elif count == 1:
-            Reco[j] = Reco_mat[Reco_ind[0], j]
-            GPP[j] = GPP_mat[Reco_ind[0], j]
-            partition_flag1[j] = numpy.abs(params[n_params - 1, Reco_ind[0]] - j)
+    #### For each data-point "j", there could be up to two windows
+    #### that have covered this data-point "j". So we check how many
+    #### windows have covered it (for all data points at once).
+    Reco_ind0, Reco_ind1, count = get_covering_windows(values_mat=Reco_mat)
+
+    #### If there is no window covering a data-point "j", then exit.
+    if numpy.any(count == 0): # TODO: investigate and replace behavior (same as broken opt error?)
+        msg = "DT EXIT EXCEPTION: no window covering data point j"
+        _log.critical(msg)
+        raise ONEFluxPartitionError(msg)
+
+    j_all = numpy.arange(n_set)
+    window_centers = params[n_params - 1, :].astype(DOUBLE_PREC)
+
+    #### If there are two windows covering a data-point "j", then we are going
+    #### to assign weights to each window and multiply the Reco and GPP
+    #### values we got previously with it's assigned weight. We get the
+    #### final Reco and GPP values by adding the multiplied values together.
+    j = j_all[count > 1]
+    ind0, ind1 = Reco_ind0[j], Reco_ind1[j]
+    weight1 = (window_centers[ind1] - j) / (window_centers[ind1] - window_centers[ind0])
+    weight2 = (j - window_centers[ind0]) / (window_centers[ind1] - window_centers[ind0])
+    Reco[j] = Reco_mat[ind0, j] * weight1 + Reco_mat[ind1, j] * weight2
+    GPP[j] = GPP_mat[ind0, j] * weight1 + GPP_mat[ind1, j] * weight2
+    partition_flag1[j] = numpy.abs(window_centers[ind1] - j)
+    partition_flag2[j] = numpy.abs(j - window_centers[ind0])
 
-            if Reco_ind[0] == 0:
-                partition_flag2[j] = j
-            else:
-                partition_flag2[j] = n_set - 1 - j
-
-            '''
-            if j == 5605:
-                print("j")
-                print(j)
-                print("count")
-                print(count)
-                print("Reco_ind[0]")
-                print(Reco_ind[0])
-                print("Reco_mat[Reco_ind[0], j]")
-                print(Reco_mat[Reco_ind[0], j])
-                print("GPP_mat[Reco_ind[0], j]")
-                print(GPP_mat[Reco_ind[0], j])
-                print("Reco[j]")
-                print(Reco[j])
-                print("GPP[j]")
-                print(GPP[j])
-
-                #if j == 8840:
-                #    exit()
-            '''
-
-        #### If there is no window covering this data-point "j", then exit.
-        else: # TODO: investigate and replace behavior (same as broken opt error?)
-            msg = "DT EXIT EXCEPTION: no window covering data point j"
-            _log.critical(msg)
-            raise ONEFluxPartitionError(msg)
-    #### end "for j"
+    # my code
+    reco_gpp_orig[0, j] = j
+    reco_gpp_orig[1, j] = data['year'][j]
+    reco_gpp_orig[2, j] = data['month'][j]
+    reco_gpp_orig[3, j] = data['day'][j]
+    reco_gpp_orig[4, j] = data['hr'][j]
+    reco_gpp_orig[5, j] = data['julday'][j]
+    reco_gpp_orig[6, j] = Reco_mat[ind0, j]
+    reco_gpp_orig[7, j] = Reco_mat[ind1, j]
+    reco_gpp_orig[8, j] = GPP_mat[ind0, j]
+    reco_gpp_orig[9, j] = GPP_mat[ind1, j]
+    #end code
+
+    #### If there is only one window covering a data-point "j", then
+    #### we are going to assign the final Reco and GPP values
+    #### to the previously calculated Reco and GPP.
+    j = j_all[count == 1]
+    ind0 = Reco_ind0[j]
+    Reco[j] = Reco_mat[ind0, j]
+    GPP[j] = GPP_mat[ind0, j]
+    partition_flag1[j] = numpy.abs(window_centers[ind0] - j)
+    partition_flag2[j] = numpy.where(ind0 == 0, j, n_set - 1 - j)
 
     #print("Reco")
     #print(Reco)
@@ -661,7 +808,7 @@ def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_nu
     var_names_reco_gpp = "j,year,month,day,hr,julday,reco_first,reco_second,gpp_first,gpp_second"
 
     filename_reco = 'nee_' + ustar_type + '_' + str(percentile_num) + '_' + site_id + '_' + str(year) + '_reco_before_weights_python.csv'
-    numpy.savetxt(os.path.join(dt_output_dir, filename_reco), numpy.transpose(reco_gpp_orig), delimiter=',', fmt='%s', header=var_names_reco_gpp, comments='')
+    write_csv(filename=os.path.join(dt_output_dir, filename_reco), data=numpy.transpose(reco_gpp_orig), delimiter=',', header=var_names_reco_gpp)
     #exit()
 
     _log.info("Finished compute_flux of daytime for nee_{u}_{p}_{s}_{y}".format(u=ustar_type, p=percentile_num, s=site_id, y=year))
@@ -669,7 +816,7 @@ def compute_flux(data, params, dt_output_dir, site_id, ustar_type, percentile_nu
     return Reco, GPP, partition_flag1, partition_flag2
 
 
-def compute_var(data, params, whichmodel, JTJ_inv, res_cor):
+def compute_var(data, params, whichmodel, JTJ_inv, res_cor, windows=None):
     """
     :Task:  Get the predicted values of a variable for all windows covered in the model.
 
@@ -688,8 +835,12 @@ def compute_var(data, params, whichmodel, JTJ_inv, res_cor):
     :type JTJ_inv: numpy.ndarray
     :param res_cor: 
     :type res_cor: numpy.ndarray
+    :param windows: windows covered by each parameter set (computed from params if None)
+    :type windows: oneflux.partition.library.WindowIndex
     """
     _log.info("Starting compute_var of daytime")
+    if windows is None:
+        windows = get_parameter_windows(data=data, params=params)
 
     n_params = len(params[:, 0])
     n_parasets = len(params[0, :])
@@ -709,22 +860,7 @@ def compute_var(data, params, whichmodel, JTJ_inv, res_cor):
 
     #### Iterate over each parameter
     for i in range(n_parasets):
-        sub = None
-        if i == 0:
-            ind_begin = 0
-            ind_end = params[n_params - 1, i + 1]
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] < ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-        elif i == (n_parasets - 1):
-            ind_begin = params[n_params - 1, i - 1]
-            ind_end = numpy.max(data['ind'])
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] <= ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-        else:
-            ind_begin = params[n_params - 1, i - 1]
-            ind_end = params[n_params - 1, i + 1]
-            sub_mask = ((data['ind'] >= ind_begin) & (data['ind'] < ind_end))
-            sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
+        sub = windows.select(data=data, window=i)
 
         #print("sub['ind'].size")
         #print(sub['ind'].size)
@@ -772,18 +908,21 @@ def compute_var(data, params, whichmodel, JTJ_inv, res_cor):
     #end for i
 
     #### Weight the predicted values and sum the values
-    for j in range(n_set):
-        GPP_ind = numpy.where(var_GPP_mat[:, j] > NAN)[0]
-        count = len(GPP_ind)
-        if count > 1:
-            weight1 = (params[n_params - 1, GPP_ind[1]] - j) / (params[n_params - 1, GPP_ind[1]] - params[n_params - 1, GPP_ind[0]])
-            weight2 = (j - params[n_params - 1, GPP_ind[0]]) / (params[n_params - 1, GPP_ind[1]] - params[n_params - 1, GPP_ind[0]])
-            var_GPP[j] = var_GPP_mat[GPP_ind[0], j] * (weight1 * weight1) + var_GPP_mat[GPP_ind[1], j] * (weight2 * weight2)
-        elif count == 1:
-            var_GPP[j] = var_GPP_mat[GPP_ind[0], j]
-        else:
-            var_GPP[j] = NAN
-    #end for j
+    #### (for all data points at once)
+    GPP_ind0, GPP_ind1, count = get_covering_windows(values_mat=var_GPP_mat)
+    j_all = numpy.arange(n_set)
+    window_centers = params[n_params - 1, :].astype(DOUBLE_PREC)
+
+    j = j_all[count > 1]
+    ind0, ind1 = GPP_ind0[j], GPP_ind1[j]
+    weight1 = (window_centers[ind1] - j) / (window_centers[ind1] - window_centers[ind0])
+    weight2 = (j - window_centers[ind0]) / (window_centers[ind1] - window_centers[ind0])
+    var_GPP[j] = var_GPP_mat[ind0, j] * (weight1 * weight1) + var_GPP_mat[ind1, j] * (weight2 * weight2)
+
+    j = j_all[count == 1]
+    var_GPP[j] = var_GPP_mat[GPP_ind0[j], j]
+
+    var_GPP[count == 0] = NAN
 
     #print("var_GPP")
     #print(var_GPP)
@@ -794,6 +933,25 @@ def compute_var(data, params, whichmodel, JTJ_inv, res_cor):
     return var_GPP
 
 
+def get_covering_windows(values_mat):
+    """
+    Get the first two windows (rows) with valid values (> NAN) for each
+    data point (column), same as numpy.where(values_mat[:, j] > NAN)[0]
+    for all data points "j" at once
+
+    :param values_mat: values for each window (rows) and data point (columns)
+    :type values_mat: numpy.ndarray
+    :rtype: tuple (first windows, second windows, number of covering windows)
+    """
+    valid = (values_mat > NAN)
+    count = valid.sum(axis=0)
+    points = numpy.arange(values_mat.shape[1])
+    first = numpy.argmax(valid, axis=0)
+    valid[first, points] = False
+    second = numpy.argmax(valid, axis=0)
+    return first, second, count
+
+
 def varpred(func, data, JTJ_inv, optpara, res, params_filled_arr, params_filled_arr2=None):
     """
     :Task:  Get the predicted values of a variable.
@@ -867,7 +1025,7 @@ def varpred(func, data, JTJ_inv, optpara, res, params_filled_arr, params_filled_
     return varY
 
 
-def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir, site_id, ustar_type, percentile_num, year):
+def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir, site_id, ustar_type, percentile_num, year, windows=None, warm_start=DT_WARM_START):
     """
     :Task:  This function is responsible to find the best parameters to 
             represent the model that will fit the data the most.
@@ -889,6 +1047,11 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
                     Based on specified conditions, we decide which model function to 
                     use to come up with the proper parameters (e.g lloyd_taylor, hlrc_lloydvpd, etc).
 
+                    With warm_start, a single fit starting from the parameters accepted
+                    for the previous window is tried first; the 3 guesses are only
+                    tried if this fit doesn't pass the same tests (no fallback model
+                    needed and "check_parameters" ok). Results can differ slightly
+                    from the legacy 3 guesses, so this is disabled by default.
 
     :param data: data structure for partitioning
     :type data: numpy.ndarray
@@ -898,6 +1061,10 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
     :type fguess: array of floats
     :param trimperc: percentage to trim
     :type trimperc: float
+    :param windows: window partition of data (computed from data and winsize if None)
+    :type windows: DTWindowPartition
+    :param warm_start: if True, window fits start from parameters of previous window
+    :type warm_start: bool
     """
 
     _log.info("Starting estimate_parasets of daytime for nee_{u}_{p}_{s}_{y}".format(u=ustar_type, p=percentile_num, s=site_id, y=year))
@@ -908,8 +1075,11 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
     #### row and col and flipped in translation
     ###############################################
 
+    if windows is None:
+        windows = DTWindowPartition(data=data, winsize=winsize)
+
     #### Creating the arrays we're going to use
-    n_parasets = long(365 / winsize) * 2
+    n_parasets = windows.n_parasets
     params = numpy.zeros((3, 2 * len(fguess), n_parasets), dtype=FLOAT_PREC)
     params_ok = numpy.zeros((2 * len(fguess), n_parasets), dtype=FLOAT_PREC)
     params_nok = numpy.zeros((2 * len(fguess), n_parasets), dtype=FLOAT_PREC)
@@ -973,6 +1143,7 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
     #;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
     i_ok = 0
     i_nok = 0
+    i_warm = 0
     betafac = [0.5, 1, 2]
 
     lloydtemp_e0 = None
@@ -981,6 +1152,13 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
     #numpy.savetxt(fname='../dt_set_before_es_2013_y_python.csv', X=data, delimiter=',', fmt='%s', header=','.join(data.dtype.names), comments='')
     #exit()
 
+    #### Creating the masks of the data (once for all windows). We'll be
+    #### using these masks to select the data in each window that fits
+    #### certain conditions for processing
+    qc_mask = (data['nee_fqc'] == 0)
+    night_mask = qc_mask & (data['rg'] <= 4)
+    day_mask = qc_mask & (data['rg'] > 4)
+
     #### Iterate through each parameter set to create this set
     for i in range(n_parasets):
         JTJ_inv = numpy.zeros((3, len(fguess) - 1, len(fguess) - 1), dtype=DOUBLE_PREC)
@@ -988,16 +1166,12 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
 
         #### Defining the range of window of data we're going
         #### to use for optimization
-        day_begin = i * winsize / 2.0
-        day_end = day_begin + winsize
-
-        day_begin2 = 0
-        day_end2 = numpy.amax(data['julday'])
+        #### (offsets of windows in data from the window partition)
+        day_begin = windows.day_begins[i]
+        day_end = windows.day_ends[i]
 
-        if i > 1:
-            day_begin2 = (i - 2) * winsize / 2.0
-        if i < n_parasets - 2:
-            day_end2 = (i + 2) * winsize / 2.0 + winsize
+        day_begin2 = windows.day_begins2[i]
+        day_end2 = windows.day_ends2[i]
 
 #        print("#######################################################################")
 #        print("#######################################################################")
@@ -1017,17 +1191,11 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
 #        print(day_end2)
 
 
-        #### Creating the masks of the data. We'll be using
-        #### these masks to select the data that fits certain
-        #### conditions for processing
-        sub_mask = ((data['julday'] > day_begin) & (data['julday'] <= day_end) & (data['nee_fqc'] == 0))
-        subn_mask = ((data['julday'] > day_begin2) & (data['julday'] <= day_end2) & (data['nee_fqc'] == 0) & (data['rg'] <= 4))
-        subd_mask = ((data['julday'] > day_begin) & (data['julday'] <= day_end) & (data['nee_fqc'] == 0) & (data['rg'] > 4))
-
-        #### Get the data that correspond to the masks in the previous step
-        sub, _, _ = newselif(data=data, condition=sub_mask, drop=True)
-        subn, _, _ = newselif(data=data, condition=subn_mask, drop=True)
-        subd, _, _ = newselif(data=data, condition=subd_mask, drop=True)
+        #### Get the data in the windows that fit certain
+        #### conditions for processing (copies, only of window entries)
+        sub = windows.windows.select(data=data, window=i, valid_mask=qc_mask)
+        subn = windows.windows2.select(data=data, window=i, valid_mask=night_mask)
+        subd = windows.windows.select(data=data, window=i, valid_mask=day_mask)
 
 
         '''
@@ -1189,9 +1357,34 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
 
             subd['e0_1_from_tair'][:] = e0
 
+            #### Warm start: single fit starting from the parameters of the
+            #### previous valid window (same prior as the initial guess beta);
+            #### accepted if no fallback model is needed and parameters are valid
+            warm_started = False
+            if warm_start and i_ok > 0 and whichmodel_ok[i_ok - 1] == 0:
+                fguess[1] = beta
+                warm_guess = numpy.array(params_ok[0:3 + 1, i_ok - 1], dtype=FLOAT_PREC)
+                hlrclvpd_results = nlinlts2(data=subd, lts_func="HLRC_LloydVPD", depvar='nee_f', indepvar_arr=['rg_f', 'tair_f', 'e0_1_from_tair', 'vpd_f'], npara=4, xguess=warm_guess, mprior=numpy.array(fguess[0:3 + 1], dtype=FLOAT_PREC), sigm=numpy.array([10, 600, 50, 80]), sigd=subd['nee_fs_unc'])
+                hlrclvpd_residuals = hlrclvpd_results['residuals']
+                hlrclvpd_cov_matrix = hlrclvpd_results['cov_matrix']
+                hlrclvpd_cor_matrix = hlrclvpd_results['cor_matrix']
+
+                if hlrclvpd_cov_matrix is not None and hlrclvpd_cor_matrix is not None:
+                    params[0, :, i] = numpy.array([hlrclvpd_results['alpha'], hlrclvpd_results['beta'], hlrclvpd_results['k'], hlrclvpd_results['rref'], e0,
+                                                   hlrclvpd_results['alpha_std_error'], hlrclvpd_results['beta_std_error'], hlrclvpd_results['k_std_error'], hlrclvpd_results['rref_std_error'], e0_se])
+                    if params[0, 2, i] > 0 and params[0, 0, i] != warm_guess[0] and check_parameters(params=params[0, :, i], fguess=fguess) == 1:
+                        warm_started = True
+                        i_warm = i_warm + 1
+                        whichmodel[0] = 0
+                        res_cor[0] = (hlrclvpd_residuals ** 2).sum() / (len(hlrclvpd_residuals) * (1.0 - trimperc / 100.0) - 4)
+                        p_cor[0, :, i] = numpy.array([hlrclvpd_cor_matrix[0][1], hlrclvpd_cor_matrix[0][2], hlrclvpd_cor_matrix[0][3], hlrclvpd_cor_matrix[1][2], hlrclvpd_cor_matrix[1][3], hlrclvpd_cor_matrix[2][3]])
+                        rmse[0] = hlrclvpd_results['rmse']
+                        rmse[1:] = numpy.inf
+                        JTJ_inv[0, :, :] = numpy.copy(hlrclvpd_cov_matrix)
+
             #### Finding slope of three different initial guess values
-            #### and choose the best of three
-            for j in range(2 + 1):
+            #### and choose the best of three (skipped if warm start accepted)
+            for j in range(0 if warm_started else 2 + 1):
                 '''
                 print("===========")
                 print("j")
@@ -1806,6 +1999,7 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
         return nan_arr, None, None, None, None
 
     # My code (not in pvwave)
+    nee_f_qc = data['nee_f'][qc_mask]
     i_ok_temp = 0
     for i in range(n_parasets):
         if params_all_for_ranges['i_ok'][i] >= 0:
@@ -1817,10 +2011,10 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
                 params_all_for_ranges['subset_size'][i] = params_all_for_ranges['ind_end'][i] - params_all_for_ranges['ind_begin'][i]
                 ### populate variability (STD) for input data
 #                print("****STD [ 0]: ", index_begin, index_end, numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end]), numpy.nanstd(data['tair'][index_begin:index_end]), numpy.nanstd(data['rg'][index_begin:index_end]))
-                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_avg'][i] = numpy.nanmean(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_avg'][i] = numpy.nanmean(data['rg'][index_begin:index_end])
-                params_all_for_ranges['nee_std'][i] = numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_std'][i] = numpy.nanstd(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_std'][i] = numpy.nanstd(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_std'][i] = numpy.nanstd(data['rg'][index_begin:index_end])
             elif i_ok_temp == (i_ok - 1):
@@ -1831,10 +2025,10 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
                 params_all_for_ranges['subset_size'][i] = params_all_for_ranges['ind_end'][i] - params_all_for_ranges['ind_begin'][i]
                 ### populate variability (STD) for input data
 #                print("****STD [-1]: ", index_begin, index_end, numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end]), numpy.nanstd(data['tair'][index_begin:index_end]), numpy.nanstd(data['rg'][index_begin:index_end]))
-                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_avg'][i] = numpy.nanmean(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_avg'][i] = numpy.nanmean(data['rg'][index_begin:index_end])
-                params_all_for_ranges['nee_std'][i] = numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_std'][i] = numpy.nanstd(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_std'][i] = numpy.nanstd(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_std'][i] = numpy.nanstd(data['rg'][index_begin:index_end])
 
@@ -1860,10 +2054,10 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
                 params_all_for_ranges['subset_size'][i] = params_all_for_ranges['ind_end'][i] - params_all_for_ranges['ind_begin'][i]
                 ### populate variability (STD) for input data
 #                print("****STD [el]: ", index_begin, index_end, numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end]), numpy.nanstd(data['tair'][index_begin:index_end]), numpy.nanstd(data['rg'][index_begin:index_end]))
-                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_avg'][i] = numpy.nanmean(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_avg'][i] = numpy.nanmean(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_avg'][i] = numpy.nanmean(data['rg'][index_begin:index_end])
-                params_all_for_ranges['nee_std'][i] = numpy.nanstd(data['nee_f'][data['nee_fqc'] == 0][index_begin:index_end])
+                params_all_for_ranges['nee_std'][i] = numpy.nanstd(nee_f_qc[index_begin:index_end])
                 params_all_for_ranges['ta_std'][i] = numpy.nanstd(data['tair'][index_begin:index_end])
                 params_all_for_ranges['rg_std'][i] = numpy.nanstd(data['rg'][index_begin:index_end])
             i_ok_temp = i_ok_temp + 1
@@ -1886,10 +2080,12 @@ def estimate_parasets(data, winsize, fguess, trimperc, name_out, dt_output_dir,
     #numpy.savetxt('test_es_params_index_all_timestamp_python.csv', numpy.transpose(numpy.concatenate((params_all, ind_ok), axis=0)), delimiter=',', header=var_names_index, fmt='%s')
 
     filename_range = 'nee_' + ustar_type + '_' + str(percentile_num) + '_' + site_id + '_' + str(year) + '_params_after_es_python.csv'
-    numpy.savetxt(os.path.join(dt_output_dir, filename_range), params_all_for_ranges, delimiter=',', header=','.join(params_all_for_ranges.dtype.names), fmt='%s')
+    write_csv(filename=os.path.join(dt_output_dir, filename_range), data=params_all_for_ranges, delimiter=',', header=','.join(params_all_for_ranges.dtype.names), comments='# ')
     #exit()
     # end of code
 
+    if warm_start:
+        _log.info("Warm-started fits accepted for {w} of {n} windows".format(w=i_warm, n=n_parasets))
     _log.info("Finished estimate_parasets of daytime for nee_{u}_{p}_{s}_{y}".format(u=ustar_type, p=percentile_num, s=site_id, y=year))
 
     return numpy.concatenate((params_return, ind_return), axis=0), whichmodel_return, JTJ_inv_return, res_cor_return, p_correl_return
@@ -1954,6 +2150,239 @@ def percentiles_fn(data, columns, values=[0.0, 0.25, 0.5, 0.75, 1.0], remove_mis
 
 
 
+GAPFILL_INDEX_CHUNK_SIZE = 2000000      # max number of window entries evaluated at once while building neighbour candidates
+_GAPFILL_INDEX_CACHE = {}               # drivers key (one per site-year) -> neighbour index, kept until cleared at the end of DT partitioning of a site
+# UStar types are processed one after the other (each over all years), so the index of a
+# site-year is only reused by the second UStar type if all site-years are kept; candidates
+# take about 10MB per site-year (half-hourly), i.e., about 200MB for a 20-year site
+
+
+class GapFillNeighbourIndex(object):
+    """
+    Index of neighbour candidates for gap filling, which depend only on the
+    meteorological drivers (Rg, Tair, VPD) and time of day, and not on the
+    variable being filled. Candidates for each method, window size and index
+    are computed once and reused; the availability of the variable being
+    filled is then applied by the caller.
+
+    Methods: 'met' (look-up with Rg, Tair and VPD), 'rg' (look-up with Rg only),
+    'hr' (diurnal, time of day within 1.1 hour)
+    """
+
+    def __init__(self, rg, ta, vpd, hr, nperday, rg_tolerance=50.0, ta_tolerance=2.5, vpd_tolerance=5.0):
+        """
+        :param rg: incoming shortwave radiation
+        :type rg: numpy.ndarray
+        :param ta: air temperature
+        :type ta: numpy.ndarray
+        :param vpd: vapor pressure deficit
+        :type vpd: numpy.ndarray
+        :param hr: time of day (hours)
+        :type hr: numpy.ndarray
+        :param nperday: number of records per day (24 or 48)
+        :type nperday: int
+        :param rg_tolerance: tolerance for Rg in look-up methods
+        :type rg_tolerance: float
+        :param ta_tolerance: tolerance for Tair in look-up methods
+        :type ta_tolerance: float
+        :param vpd_tolerance: tolerance for VPD in look-up methods
+        :type vpd_tolerance: float
+        """
+        self.rg = rg
+        self.ta = ta
+        self.vpd = vpd
+        self.hr = hr
+        self.nperday = nperday
+        self.n = rg.size
+        self.rg_tolerance = rg_tolerance
+        self.ta_tolerance = ta_tolerance
+        self.vpd_tolerance = vpd_tolerance
+        self._candidates = {}
+
+    def window_offsets(self, t_window):
+        """
+        Offsets of window positions around an index, in the same order
+        used by the gap filling (index, backwards, then forwards)
+
+        :param t_window: window size (days)
+        :type t_window: float
+        :rtype: numpy.ndarray
+        """
+        return numpy.append(-numpy.arange(t_window / 2.0 * self.nperday), numpy.arange(t_window / 2.0 * self.nperday - 1) + 1).astype(int)
+
+    def window_count(self, available, t_window, indices):
+        """
+        Number of available entries in windows around indices, with positions
+        outside the limits clipped (and counted) as first/last entries
+
+        :param available: availability of variable being filled (1: available, 0: missing)
+        :type available: numpy.ndarray
+        :param t_window: window size (days)
+        :type t_window: float
+        :param indices: indices at center of windows
+        :type indices: numpy.ndarray
+        :rtype: numpy.ndarray
+        """
+        offsets = self.window_offsets(t_window)
+        first = indices + offsets.min()
+        last = indices + offsets.max()
+        cumulative = numpy.append(0, numpy.cumsum(available))
+        count = cumulative[numpy.clip(last, 0, self.n - 1) + 1] - cumulative[numpy.clip(first, 0, self.n - 1)]
+        count += numpy.maximum(0, -first) * available[0]
+        count += numpy.maximum(0, last - (self.n - 1)) * available[-1]
+        return count
+
+    def candidates(self, method, t_window, indices):
+        """
+        Neighbour candidates (window positions satisfying the method conditions)
+        for each index, computed for indices not yet in the index
+
+        :param method: 'met', 'rg' or 'hr'
+        :type method: str
+        :param t_window: window size (days)
+        :type t_window: float
+        :param indices: indices to be filled
+        :type indices: numpy.ndarray
+        :rtype: list (of numpy.ndarray)
+        """
+        candidates = self._candidates.setdefault((method, t_window), {})
+        missing = numpy.array([i for i in indices if i not in candidates], dtype=int)
+        if missing.size > 0:
+            offsets = self.window_offsets(t_window)
+            chunk_size = max(1, GAPFILL_INDEX_CHUNK_SIZE // offsets.size)
+            for chunk_start in range(0, missing.size, chunk_size):
+                chunk = missing[chunk_start:chunk_start + chunk_size]
+                w = numpy.clip(chunk[:, None] + offsets[None, :], 0, self.n - 1)
+                mask = self._conditions(method=method, indices=chunk, w=w)
+                positions = w[mask].astype('i4')
+                bounds = numpy.append(0, numpy.cumsum(mask.sum(axis=1)))
+                for k, index in enumerate(chunk):
+                    candidates[index] = positions[bounds[k]:bounds[k + 1]]
+        return [candidates[i] for i in indices]
+
+    def _conditions(self, method, indices, w):
+        """
+        Evaluates method conditions for windows (one per row) around indices
+
+        :param method: 'met', 'rg' or 'hr'
+        :type method: str
+        :param indices: indices at center of windows
+        :type indices: numpy.ndarray
+        :param w: window positions (one row per index)
+        :type w: numpy.ndarray
+        :rtype: numpy.ndarray
+        """
+        if method == 'hr':
+            return (abs(self.hr[w] - self.hr[indices][:, None]) < 1.1)
+
+        # equivalent to max(min(rg_tolerance, rg[index]), 20)
+        rg_index = self.rg[indices]
+        rg_tolerance = numpy.where(rg_index < self.rg_tolerance, rg_index, self.rg_tolerance).astype(self.rg.dtype)
+        rg_tolerance = numpy.where(20 > rg_tolerance, 20, rg_tolerance).astype(self.rg.dtype)
+        mask = (abs(self.rg[w] - rg_index[:, None]) < rg_tolerance[:, None]) & (self.rg[w] > NAN_TEST)
+        if method == 'met':
+            mask &= (abs(self.ta[w] - self.ta[indices][:, None]) < self.ta_tolerance)
+            mask &= (abs(self.vpd[w] - self.vpd[indices][:, None]) < self.vpd_tolerance)
+            mask &= (self.vpd[w] > NAN_TEST) & (self.ta[w] > NAN_TEST)
+        return mask
+
+
+def get_gapfill_neighbour_index(rg, ta, vpd, hr, nperday, rg_tolerance=50.0, ta_tolerance=2.5, vpd_tolerance=5.0):
+    """
+    Returns neighbour index for drivers, reusing a previously built index
+    if drivers are the same (e.g., different percentiles and UStar types of
+    the same site-year); indices are kept until cleared
+
+    :param rg: incoming shortwave radiation
+    :type rg: numpy.ndarray
+    :param ta: air temperature
+    :type ta: numpy.ndarray
+    :param vpd: vapor pressure deficit
+    :type vpd: numpy.ndarray
+    :param hr: time of day (hours)
+    :type hr: numpy.ndarray
+    :param nperday: number of records per day (24 or 48)
+    :type nperday: int
+    :rtype: GapFillNeighbourIndex
+    """
+    key = hashlib.sha1()
+    for array in (rg, ta, vpd, hr):
+        key.update(str(array.dtype))
+        key.update(numpy.ascontiguousarray(array).tobytes())
+    key.update(str((nperday, rg_tolerance, ta_tolerance, vpd_tolerance)))
+    key = key.hexdigest()
+
+    if key in _GAPFILL_INDEX_CACHE:
+        _log.debug("uncert_gap_fill: Reusing gap filling neighbour index")
+        return _GAPFILL_INDEX_CACHE[key]
+
+    _log.debug("uncert_gap_fill: Creating gap filling neighbour index")
+    index = GapFillNeighbourIndex(rg=rg, ta=ta, vpd=vpd, hr=hr, nperday=nperday, rg_tolerance=rg_tolerance, ta_tolerance=ta_tolerance, vpd_tolerance=vpd_tolerance)
+    _GAPFILL_INDEX_CACHE[key] = index
+    return index
+
+
+def clear_gapfill_neighbour_indices():
+    """
+    Releases cached neighbour indices (and their candidates), e.g., at the
+    beginning and end of DT partitioning of a site; worker processes
+    release theirs when the worker pool of a site ends
+    """
+    _GAPFILL_INDEX_CACHE.clear()
+
+
+def gapfill_window_stats(values, available, neighbours, min_count=9):
+    """
+    Statistics of available values among neighbours of all indices in a gap
+    filling pass at once (equivalent to stats.tmean, stats.tstd (sample std), numpy.median
+    and robust.scale.mad of each index's values). Indices with the same number
+    of values are computed together, one row per index, keeping the order of
+    the values so results are identical to computing each index separately.
+
+    :param values: values of variable being filled (original, not filled)
+    :type values: numpy.ndarray
+    :param available: mask of available (non gapped) values
+    :type available: numpy.ndarray
+    :param neighbours: neighbour candidates for each index
+    :type neighbours: list (of numpy.ndarray)
+    :param min_count: minimum number of available values (exclusive) for statistics to be computed
+    :type min_count: int
+    :rtype: tuple (mask of indices with statistics, mean, count, std, median, robust std)
+    """
+    n_indices = len(neighbours)
+    sizes = numpy.fromiter((w.size for w in neighbours), dtype=int, count=n_indices)
+    positions = numpy.concatenate(neighbours) if n_indices > 0 else numpy.empty(0, dtype=int)
+    rows = numpy.repeat(numpy.arange(n_indices), sizes)
+
+    # keep only available values, still grouped by index and in order
+    mask = available[positions]
+    positions = positions[mask]
+    rows = rows[mask]
+    counts = numpy.bincount(rows, minlength=n_indices)
+    starts = numpy.append(0, numpy.cumsum(counts)[:-1])
+
+    selected = (counts > min_count)
+    selected_rows = numpy.where(selected)[0]
+    selected_counts = counts[selected_rows]
+    mean_value = numpy.empty(selected_rows.size)
+    std_value = numpy.empty(selected_rows.size)
+    median_value = numpy.empty(selected_rows.size)
+    srob_value = numpy.empty(selected_rows.size)
+
+    for size in numpy.unique(selected_counts):
+        group = numpy.where(selected_counts == size)[0]
+        chunk_size = max(1, GAPFILL_INDEX_CHUNK_SIZE // size)
+        for chunk_start in range(0, group.size, chunk_size):
+            chunk = group[chunk_start:chunk_start + chunk_size]
+            block = values[positions[starts[selected_rows[chunk]][:, None] + numpy.arange(size)[None, :]]]
+            mean_value[chunk] = numpy.mean(block, axis=1)
+            std_value[chunk] = numpy.sqrt(block.astype(float).var(axis=1, ddof=1))
+            median_value[chunk] = numpy.median(block, axis=1)
+            srob_value[chunk] = robust.scale.mad(block, axis=1)
+
+    return selected, mean_value, selected_counts, std_value, median_value, srob_value
+
+
 def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0, longestMarginalgap=60):
     """
     :Task: fill gaps of the chosen varname or column (for day time)
@@ -1991,6 +2420,9 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
     hr = numpy.copy(data['hr'].astype(float))
     tofill = numpy.copy(data[var])
 
+    # neighbour candidates depend only on drivers, reused for all percentiles and UStar types of site-year
+    gapfill_index = get_gapfill_neighbour_index(rg=rg, ta=ta, vpd=vpd, hr=hr, nperday=nperday, rg_tolerance=RG_TOLERANCE, ta_tolerance=TA_TOLERANCE, vpd_tolerance=VPD_TOLERANCE)
+
     n = tofill.size
     filled_val = numpy.empty(n)
     filled_val.fill(NAN)
@@ -2020,6 +2452,7 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
     # "where" return 2 arrays, I am getting the 1st one with the indices
     # of the non null values
     oookkk = numpy.where(tofill_orig > NAN_TEST)[0]
+    available = (tofill_orig > NAN_TEST).astype(int)
     if oookkk.size == 0:
         firstvalid = -1
         lastvalid = -1
@@ -2088,62 +2521,26 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging
-                ok4avg = numpy.where(tofill_orig[w] > NAN_TEST)[0]
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the non gapped values only
-                    w = w[ok4avg]
-                    #### Get all the indices of the non gapped values that
-                    #### fit a certain condition or limits (e.g TA_TOLERANCE, etc)
-                    ok4avg = numpy.where((abs(ta[w] - ta[index]) < TA_TOLERANCE) &
-                                        (abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                        (abs(vpd[w] - vpd[index]) < VPD_TOLERANCE) &
-                                        (rg[w] > NAN_TEST) &
-                                        (vpd[w] > NAN_TEST) &
-                                        (ta[w] > NAN_TEST))[0]
-                    count2 = len(ok4avg)
-
-
-                    # ok4avg = numpy.where((abs(ta[w] - ta[index]) < TA_TOLERANCE) &
-                    #                     (~numpy.isclose(abs(ta[w] - ta[index]), TA_TOLERANCE, rtol=1e-07, atol=0.0)) &
-                    #                     (abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                    #                     (~numpy.isclose(abs(rg[w] - rg[index]), max(min(RG_TOLERANCE, rg[index]), 20), rtol=1e-07, atol=0.0)) &
-                    #                     (abs(vpd[w] - vpd[index]) < VPD_TOLERANCE) &
-                    #                     (~numpy.isclose(abs(vpd[w] - vpd[index]), VPD_TOLERANCE, rtol=1e-07, atol=0.0)) &
-                    #                     (rg[w] > NAN_TEST) &
-                    #                     (vpd[w] > NAN_TEST) &
-                    #                     (ta[w] > NAN_TEST))[0]
-
-                    #### Still checking if we have more than 9 non gapped values
-                    if count2 > 9:
-                        #### Get all the stats related to those non gapped values
-                        mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                        counts_value = tofill_orig[w[ok4avg]].size
-                        std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                        median_value = numpy.median(tofill_orig[w[ok4avg]])
-                        srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                        #### Fill the gaps with the mean of the non gapped values
-                        #### and save the other stats in new columns
-                        filled_val[index] = mean_value
-                        filled_n[index] = counts_value
-                        filled_s[index] = std_value
-                        filled_med[index] = median_value
-                        filled_srob[index] = srob_value
-                        fillMethod[index] = 1
-                        fillWindow[index] = (it_num + 1) * t_window_orig
+            #### Indices with more than 9 non gapped values in the window, and their
+            #### neighbour candidates (window entries within Rg, Tair and VPD tolerances)
+            window_counts = gapfill_index.window_count(available=available, t_window=t_window, indices=ko)
+            ko = ko[window_counts > 9]
+            neighbours = gapfill_index.candidates(method='met', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 1
+            fillWindow[index] = (it_num + 1) * t_window_orig
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -2178,47 +2575,23 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging.
-                #### Also get all the indices of the non gapped values that
-                #### fit a certain condition or limits (e.g TA_TOLERANCE, etc).
-                ok4avg = numpy.where((abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                    (tofill_orig[w] > NAN_TEST) &
-                                    (rg[w] > NAN_TEST))[0]
-
-                '''ok4avg = numpy.where((abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                    (~numpy.isclose(abs(rg[w] - rg[index]), max(min(RG_TOLERANCE, rg[index]), 20), rtol=1e-07, atol=0.0)) &
-                                    (tofill_orig[w] > NAN_TEST) &
-                                    (rg[w] > NAN_TEST))[0]
-                                    '''
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the stats related to those non gapped values
-                    mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                    counts_value = tofill_orig[w[ok4avg]].size
-                    std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                    median_value = numpy.median(tofill_orig[w[ok4avg]])
-                    srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                    #### Fill the gaps with the mean of the non gapped values
-                    #### and save the other stats in new columns
-                    filled_val[index] = mean_value
-                    filled_n[index] = counts_value
-                    filled_s[index] = std_value
-                    filled_med[index] = median_value
-                    filled_srob[index] = srob_value
-                    fillMethod[index] = 2
-                    fillWindow[index] = (it_num + 1) * t_window_orig
+            #### Neighbour candidates (window entries within Rg tolerance) for each index to be filled
+            neighbours = gapfill_index.candidates(method='rg', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 2
+            fillWindow[index] = (it_num + 1) * t_window_orig
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -2253,40 +2626,23 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging.
-                #### Also get all the indices of the non gapped values that
-                #### fit a certain condition or limits (e.g TA_TOLERANCE, etc).
-                ok4avg = numpy.where((abs(hr[w] - hr[index]) < 1.1) &
-                                    (tofill_orig[w] > NAN_TEST))[0]
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the stats related to those non gapped values
-                    mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                    counts_value = tofill_orig[w[ok4avg]].size
-                    std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                    median_value = numpy.median(tofill_orig[w[ok4avg]])
-                    srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                    #### Fill the gaps with the mean of the non gapped values
-                    #### and save the other stats in new columns
-                    filled_val[index] = mean_value
-                    filled_n[index] = counts_value
-                    filled_s[index] = std_value
-                    filled_med[index] = median_value
-                    filled_srob[index] = srob_value
-                    fillMethod[index] = 3
-                    fillWindow[index] = t_window
+            #### Neighbour candidates (window entries within 1.1 hour of time of day) for each index to be filled
+            neighbours = gapfill_index.candidates(method='hr', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 3
+            fillWindow[index] = t_window
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -2321,63 +2677,26 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging
-                ok4avg = numpy.where(tofill_orig[w] > NAN_TEST)[0]
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the non gapped values only
-                    w = w[ok4avg]
-                    #### Get all the indices of the non gapped values that
-                    #### fit a certain condition or limits (e.g TA_TOLERANCE, etc)
-                    ok4avg = numpy.where((abs(ta[w] - ta[index]) < TA_TOLERANCE) &
-                                        (abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                        (abs(vpd[w] - vpd[index]) < VPD_TOLERANCE) &
-                                        (rg[w] > NAN_TEST) &
-                                        (vpd[w] > NAN_TEST) &
-                                        (ta[w] > NAN_TEST))[0]
-
-                    '''ok4avg = numpy.where((abs(ta[w] - ta[index]) < TA_TOLERANCE) &
-                                        (~numpy.isclose(abs(ta[w] - ta[index]), TA_TOLERANCE, rtol=1e-07, atol=0.0)) &
-                                        (abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                        (~numpy.isclose(abs(rg[w] - rg[index]), max(min(RG_TOLERANCE, rg[index]), 20), rtol=1e-07, atol=0.0)) &
-                                        (abs(vpd[w] - vpd[index]) < VPD_TOLERANCE) &
-                                        (~numpy.isclose(abs(vpd[w] - vpd[index]), VPD_TOLERANCE, rtol=1e-07, atol=0.0)) &
-                                        (rg[w] > NAN_TEST) &
-                                        (vpd[w] > NAN_TEST) &
-                                        (ta[w] > NAN_TEST))[0]
-                                        '''
-
-                    count2 = len(ok4avg)
-
-                    #### Still checking if we have more than 9 non gapped values
-                    if count2 > 9:
-                        #### Get all the stats related to those non gapped values
-                        mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                        counts_value = tofill_orig[w[ok4avg]].size
-                        std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                        median_value = numpy.median(tofill_orig[w[ok4avg]])
-                        srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                        #### Fill the gaps with the mean of the non gapped values
-                        #### and save the other stats in new columns
-                        filled_val[index] = mean_value
-                        filled_n[index] = counts_value
-                        filled_s[index] = std_value
-                        filled_med[index] = median_value
-                        filled_srob[index] = srob_value
-                        fillMethod[index] = 1
-                        fillWindow[index] = (it_num + 1) * t_window_orig
+            #### Indices with more than 9 non gapped values in the window, and their
+            #### neighbour candidates (window entries within Rg, Tair and VPD tolerances)
+            window_counts = gapfill_index.window_count(available=available, t_window=t_window, indices=ko)
+            ko = ko[window_counts > 9]
+            neighbours = gapfill_index.candidates(method='met', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 1
+            fillWindow[index] = (it_num + 1) * t_window_orig
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -2411,46 +2730,23 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging.
-                #### Also get all the indices of the non gapped values that
-                #### fit a certain condition or limits (e.g TA_TOLERANCE, etc).
-                ok4avg = numpy.where((abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                    (tofill_orig[w] > NAN_TEST) &
-                                    (rg[w] > NAN_TEST))[0]
-
-                '''ok4avg = numpy.where((abs(rg[w] - rg[index]) < max(min(RG_TOLERANCE, rg[index]), 20)) &
-                                    (~numpy.isclose(abs(rg[w] - rg[index]), max(min(RG_TOLERANCE, rg[index]), 20), rtol=1e-07, atol=0.0)) &
-                                    (tofill_orig[w] > NAN_TEST) &
-                                    (rg[w] > NAN_TEST))[0]'''
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the stats related to those non gapped values
-                    mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                    counts_value = tofill_orig[w[ok4avg]].size
-                    std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                    median_value = numpy.median(tofill_orig[w[ok4avg]])
-                    srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                    #### Fill the gaps with the mean of the non gapped values
-                    #### and save the other stats in new columns
-                    filled_val[index] = mean_value
-                    filled_n[index] = counts_value
-                    filled_s[index] = std_value
-                    filled_med[index] = median_value
-                    filled_srob[index] = srob_value
-                    fillMethod[index] = 2
-                    fillWindow[index] = (it_num + 1) * t_window_orig
+            #### Neighbour candidates (window entries within Rg tolerance) for each index to be filled
+            neighbours = gapfill_index.candidates(method='rg', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 2
+            fillWindow[index] = (it_num + 1) * t_window_orig
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -2486,40 +2782,23 @@ def uncert_via_gapFill(data, var, del_flag=False , nomsg=False, maxMissFrac=1.0,
                 finalize_results()
                 return
 
-            #### Iterate through each index that needs to be filled
-            for index in ko:
-                #### w: Window of gaps to be covered
-                w = numpy.append(index - numpy.arange(t_window / 2.0 * nperday), index + numpy.arange(t_window / 2.0 * nperday - 1) + 1)
-                #### Clip all the indices in the window to be confined to the limits
-                numpy.clip(w, 0, n - 1, out=w)
-                w = w.astype(int)
-
-                #### Get all the indices of the non gapped values for averaging.
-                #### Also get all the indices of the non gapped values that
-                #### fit a certain condition or limits (e.g TA_TOLERANCE, etc).
-                ok4avg = numpy.where((abs(hr[w] - hr[index]) < 1.1) &
-                                    (tofill_orig[w] > NAN_TEST))[0]
-                count = len(ok4avg)
-
-                #### We need more than 9 non gapped values to be able to continue
-                #### this process of averaging
-                if count > 9:
-                    #### Get all the stats related to those non gapped values
-                    mean_value = stats.tmean(tofill_orig[w[ok4avg]])
-                    counts_value = tofill_orig[w[ok4avg]].size
-                    std_value = stats.tstd(tofill_orig[w[ok4avg]])
-                    median_value = numpy.median(tofill_orig[w[ok4avg]])
-                    srob_value = robust.scale.mad(tofill_orig[w[ok4avg]])
-
-                    #### Fill the gaps with the mean of the non gapped values
-                    #### and save the other stats in new columns
-                    filled_val[index] = mean_value
-                    filled_n[index] = counts_value
-                    filled_s[index] = std_value
-                    filled_med[index] = median_value
-                    filled_srob[index] = srob_value
-                    fillMethod[index] = 3
-                    fillWindow[index] = t_window
+            #### Neighbour candidates (window entries within 1.1 hour of time of day) for each index to be filled
+            neighbours = gapfill_index.candidates(method='hr', t_window=t_window, indices=ko)
+
+            #### Get all the stats related to the non gapped neighbour values, for all
+            #### indices at once, only if we have more than 9 non gapped values
+            filled, mean_value, counts_value, std_value, median_value, srob_value = gapfill_window_stats(values=tofill_orig, available=(available == 1), neighbours=neighbours)
+            index = ko[filled]
+
+            #### Fill the gaps with the mean of the non gapped values
+            #### and save the other stats in new columns
+            filled_val[index] = mean_value
+            filled_n[index] = counts_value
+            filled_s[index] = std_value
+            filled_med[index] = median_value
+            filled_srob[index] = srob_value
+            fillMethod[index] = 3
+            fillWindow[index] = t_window
 
             #### Update tofill with all the newly filled indices
             tofill[:] = filled_val
@@ -350,5 +350,156 @@ def gpp_vpd(rg_f, vpd_f, parameter):
     return gpp
 
 
+def _lloyd_taylor_terms(ta, rref, e0, tref, t0):
+    """
+    Lloyd-Taylor temperature term and respiration (used by Jacobians)
+
+    :rtype: tuple (temperature term, respiration)
+    """
+    temp_term = (1 / (tref - t0)) - (1 / (ta - t0))
+    return temp_term, rref * numpy.exp(e0 * temp_term)
+
+
+def _hyperbolic_lrc_derivatives(rg_f, alpha, beta, min_arr):
+    """
+    Derivatives of hyperbolic light response curve (GPP) term
+    alpha * beta * min_arr * rg_f / (alpha * rg_f + beta * min_arr)
+    with respect to alpha, beta, and min_arr (VPD limitation term)
+
+    :rtype: tuple (d/dalpha, d/dbeta, d/dmin_arr)
+    """
+    alpha_rg = alpha * rg_f
+    beta_min = beta * min_arr
+    denominator = (alpha_rg + beta_min) ** 2
+    return (beta_min ** 2 * rg_f / denominator,
+            alpha_rg ** 2 * min_arr / denominator,
+            beta * alpha_rg ** 2 / denominator)
+
+
+def _vpd_limitation(vpd_f, k):
+    """
+    VPD limitation term min(exp(-k * (vpd_f - 10)), 1) and its derivative
+    with respect to k (right-hand derivative at the kink, as forward
+    differences, so k can move away from 0)
+
+    :rtype: tuple (limitation term, d/dk)
+    """
+    vpd_diff = vpd_f - 10.0
+    exp_arr = numpy.exp(-1 * k * vpd_diff)
+    min_arr = numpy.minimum(exp_arr, 1.0)
+    limited_mask = ((k * vpd_diff) > 0.0) | ((k == 0.0) & (vpd_diff > 0.0))
+    return min_arr, numpy.where(limited_mask, -1 * vpd_diff * exp_arr, 0.0)
+
+
+def lloyd_taylor_jacobian(ta, rref, e0, tref=TREF, t0=T0):
+    """
+    Jacobian of lloyd_taylor with respect to parameters rref and e0
+    (same parameters as lloyd_taylor)
+
+    :rtype: numpy.ndarray (2 x len(ta))
+    """
+    temp_term, resp = _lloyd_taylor_terms(ta=ta, rref=rref, e0=e0, tref=tref, t0=t0)
+    return numpy.vstack((numpy.exp(e0 * temp_term), resp * temp_term))
+
+
+def lloyd_taylor_dt_jacobian(ta_f, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of lloyd_taylor_dt with respect to parameter (rd15, e0)
+    (same parameters as lloyd_taylor_dt)
+
+    :rtype: numpy.ndarray (2 x len(ta_f))
+    """
+    return lloyd_taylor_jacobian(ta=ta_f, rref=parameter[0], e0=parameter[1], tref=tref, t0=t0)
+
+
+def hlrc_lloyd_jacobian(rg_f, ta_f, e0, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of hlrc_lloyd with respect to parameter (alpha, beta, rd15)
+    (same parameters as hlrc_lloyd)
+
+    :rtype: numpy.ndarray (3 x len(rg_f))
+    """
+    alpha, beta, rd15 = parameter[0], parameter[1], parameter[2]
+    temp_term, _ = _lloyd_taylor_terms(ta=ta_f, rref=rd15, e0=e0, tref=tref, t0=t0)
+    d_alpha, d_beta, _ = _hyperbolic_lrc_derivatives(rg_f=rg_f, alpha=alpha, beta=beta, min_arr=1.0)
+    return numpy.vstack((-d_alpha, -d_beta, numpy.exp(e0 * temp_term)))
+
+
+def hlrc_lloydvpd_jacobian(rg_f, ta_f, e0, vpd_f, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of hlrc_lloydvpd with respect to parameter (alpha, beta, k, rd15)
+    (same parameters as hlrc_lloydvpd)
+
+    :rtype: numpy.ndarray (4 x len(rg_f))
+    """
+    alpha, beta, k, rd15 = parameter[0], parameter[1], parameter[2], parameter[3]
+    temp_term, _ = _lloyd_taylor_terms(ta=ta_f, rref=rd15, e0=e0, tref=tref, t0=t0)
+    min_arr, d_min_k = _vpd_limitation(vpd_f=vpd_f, k=k)
+    d_alpha, d_beta, d_min = _hyperbolic_lrc_derivatives(rg_f=rg_f, alpha=alpha, beta=beta, min_arr=min_arr)
+    return numpy.vstack((-d_alpha, -d_beta, -d_min * d_min_k, numpy.exp(e0 * temp_term)))
+
+
+def hlrc_lloyd_afix_jacobian(rg_f, ta_f, e0, alpha, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of hlrc_lloyd_afix with respect to parameter (beta, rd15)
+    (same parameters as hlrc_lloyd_afix)
+
+    :rtype: numpy.ndarray (2 x len(rg_f))
+    """
+    beta, rd15 = parameter[0], parameter[1]
+    temp_term, _ = _lloyd_taylor_terms(ta=ta_f, rref=rd15, e0=e0, tref=tref, t0=t0)
+    _, d_beta, _ = _hyperbolic_lrc_derivatives(rg_f=rg_f, alpha=alpha, beta=beta, min_arr=1.0)
+    return numpy.vstack((-d_beta, numpy.exp(e0 * temp_term)))
+
+
+def hlrc_lloydvpd_afix_jacobian(rg_f, ta_f, e0, vpd_f, alpha, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of hlrc_lloydvpd_afix with respect to parameter (beta, k, rd15)
+    (same parameters as hlrc_lloydvpd_afix)
+
+    :rtype: numpy.ndarray (3 x len(rg_f))
+    """
+    beta, k, rd15 = parameter[0], parameter[1], parameter[2]
+    temp_term, _ = _lloyd_taylor_terms(ta=ta_f, rref=rd15, e0=e0, tref=tref, t0=t0)
+    min_arr, d_min_k = _vpd_limitation(vpd_f=vpd_f, k=k)
+    _, d_beta, d_min = _hyperbolic_lrc_derivatives(rg_f=rg_f, alpha=alpha, beta=beta, min_arr=min_arr)
+    return numpy.vstack((-d_beta, -d_min * d_min_k, numpy.exp(e0 * temp_term)))
+
+
+def lloydt_e0fix_jacobian(ta_f, e0, parameter, tref=TREF, t0=T0):
+    """
+    Jacobian of lloydt_e0fix with respect to parameter (rd15)
+    (same parameters as lloydt_e0fix)
+
+    :rtype: numpy.ndarray (1 x len(ta_f))
+    """
+    temp_term = (1 / (tref - t0)) - (1 / (ta_f - t0))
+    return numpy.exp(e0 * temp_term).reshape(1, -1)
+
+
+# analytic Jacobians for models, called with the same parameters as model
+MODEL_JACOBIANS = {
+    lloyd_taylor: lloyd_taylor_jacobian,
+    lloyd_taylor_dt: lloyd_taylor_dt_jacobian,
+    hlrc_lloyd: hlrc_lloyd_jacobian,
+    hlrc_lloydvpd: hlrc_lloydvpd_jacobian,
+    hlrc_lloyd_afix: hlrc_lloyd_afix_jacobian,
+    hlrc_lloydvpd_afix: hlrc_lloydvpd_afix_jacobian,
+    lloydt_e0fix: lloydt_e0fix_jacobian,
+}
+
+def get_model_jacobian(func):
+    """
+    Returns analytic Jacobian function for model function func
+    (rows are derivatives with respect to each parameter), or None
+    if no analytic Jacobian is available
+
+    :param func: model function
+    :type func: function
+    :rtype: function
+    """
+    return MODEL_JACOBIANS.get(func, None)
+
+
 if __name__ == '__main__':
     raise ONEFluxError('Not executable')
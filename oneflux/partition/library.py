@@ -14,19 +14,21 @@ Library of optimization related functions
 import os
 import sys
 import logging
+import multiprocessing
 import numpy
 from datetime import datetime
 
 from scipy.optimize import leastsq
-from scipy.stats import rankdata
 
-from oneflux import ONEFluxError
+from oneflux import ONEFluxError, logging_locks_held
 from oneflux.partition.ecogeo import lloyd_taylor, lloyd_taylor_dt, hlrc_lloyd, hlrc_lloydvpd
-from oneflux.partition.ecogeo import hlrc_lloyd_afix, hlrc_lloydvpd_afix, lloydt_e0fix
+from oneflux.partition.ecogeo import hlrc_lloyd_afix, hlrc_lloydvpd_afix, lloydt_e0fix, get_model_jacobian
 from oneflux.partition.auxiliary import FLOAT_PREC, DOUBLE_PREC, NAN, nan, not_nan
 
 from oneflux.graph.compare import plot_comparison
-from oneflux.utils.files import file_exists_not_empty
+from oneflux.utils.strings import decode_timestamps, timestamps_to_datetime64
+from oneflux.utils.files import file_exists_not_empty, genfromtxt_cached
+from oneflux.utils.profiling import collect_phases, merge_phases
 
 _log = logging.getLogger(__name__)
 
@@ -60,12 +62,94 @@ class ONEFluxPartitionError(ONEFluxError):
     pass
 
 
-def load_output(filename, delimiter=',', skip_header=1):
+PARTITIONING_WORKERS = 1             # default number of worker processes for partitioning tasks (1 is serial execution)
+PARTITIONING_METEO_KEY = 'meteo'     # key for meteo dataset in shared task datasets (NEE datasets keyed by UStar threshold type)
+_PARTITIONING_TASK_DATASETS = {}     # datasets available to tasks in worker processes, set by worker initializer
+def _init_partitioning_worker(datasets):
+    """
+    Worker process initializer, makes (read-only) datasets available to tasks
+    without sending them along with each task
+
+    :param datasets: full datasets, meteo under PARTITIONING_METEO_KEY and NEE under UStar threshold type
+    :type datasets: dict
+    """
+    _PARTITIONING_TASK_DATASETS.clear()
+    _PARTITIONING_TASK_DATASETS.update(datasets)
+
+
+def get_task_dataset(key):
+    """
+    Retrieves dataset shared with partitioning tasks in current worker process
+
+    :param key: dataset key, PARTITIONING_METEO_KEY or UStar threshold type
+    :type key: str
+    :rtype: numpy.ndarray
+    """
+    return _PARTITIONING_TASK_DATASETS[key]
+
+
+def _run_profiled_task(func_task):
+    """
+    Worker process entry point wrapping partitioning task function,
+    returning phases recorded by the task along with its result
+
+    :param func_task: module level task function and task arguments
+    :type func_task: tuple
+    :rtype: tuple (result of func, phase statistics by label)
+    """
+    func, task = func_task
+    with collect_phases() as phases:
+        result = func(task)
+    return result, phases
+
+
+def run_partitioning_tasks(func, tasks, datasets, workers=PARTITIONING_WORKERS, label='partitioning'):
+    """
+    Runs independent partitioning tasks using a pool of worker processes;
+    phases recorded by tasks are added to phases collected by calling thread;
+    safe to call while other threads are logging (see logging_locks_held)
+
+    :param func: module level function (or partial of one) called with each task, uses get_task_dataset to access datasets
+    :type func: function
+    :param tasks: list of task arguments, each passed to func
+    :type tasks: list
+    :param datasets: full datasets, meteo under PARTITIONING_METEO_KEY and NEE under UStar threshold type
+    :type datasets: dict
+    :param workers: number of worker processes
+    :type workers: int
+    :param label: label for the type of tasks (logging only)
+    :type label: str
+    :rtype: list (results of func, same order as tasks)
+    """
+    workers = max(1, min(workers, len(tasks)))
+    _log.info("Started {l} of {n} tasks using {w} worker processes".format(l=label, n=len(tasks), w=workers))
+    results = []
+    # workers forked while no other thread (e.g., concurrent pipeline steps) holds logging locks
+    with logging_locks_held():
+        pool = multiprocessing.Pool(processes=workers, initializer=_init_partitioning_worker, initargs=(datasets,))
+    try:
+        for count, (result, phases) in enumerate(pool.imap(_run_profiled_task, [(func, task) for task in tasks], chunksize=1), start=1):
+            _log.info("Finished {l} task {c} of {n}".format(l=label, c=count, n=len(tasks)))
+            merge_phases(phases)
+            results.append(result)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    _log.info("Finished {l} of {n} tasks".format(l=label, n=len(tasks)))
+    return results
+
+
+def load_output(filename, delimiter=',', skip_header=1, cache_dir=None):
     """
     Loads 'output' formatted file (e.g., from output of nee_proc or meteo_proc)
     
     :param filename: Name of file to be loaded
     :type filename: str
+    :param cache_dir: columnar cache directory for parsed file (if None, no caching)
+    :type cache_dir: str
     """
     _log.info("Started loading '{f}'".format(f=filename))
 
@@ -78,7 +162,7 @@ def load_output(filename, delimiter=',', skip_header=1):
     _log.debug("Started loading data")
     dtype = [(i, ('a25' if i.lower() in STRING_HEADERS else FLOAT_PREC)) for i in headers]
     vfill = [('' if i.lower() in STRING_HEADERS else numpy.NaN) for i in headers]
-    data = numpy.genfromtxt(fname=filename, dtype=dtype, names=headers, delimiter=delimiter, skip_header=skip_header, missing_values='-9999,-9999.0,-6999,-6999.0, ', usemask=True)
+    data = genfromtxt_cached(fname=filename, cache_dir=cache_dir, dtype=dtype, names=headers, delimiter=delimiter, skip_header=skip_header, missing_values='-9999,-9999.0,-6999,-6999.0, ', usemask=True)
     data = numpy.ma.filled(data, vfill)
 
     new_dtype = dtype + [('year', FLOAT_PREC), ('month', FLOAT_PREC), ('day', FLOAT_PREC), ('hour', FLOAT_PREC), ('minute', FLOAT_PREC)]
@@ -88,31 +172,13 @@ def load_output(filename, delimiter=',', skip_header=1):
     _log.debug("Finished loading data")
 
     _log.debug("Started loading timestamps")
-    timestamp_list = []
-
-    # TODO: the arrays below were added as a workaround for slower performance for structured arrays in numpy 1.10.1;
-    #       once fixed (1.10.2?), array_* should be removed
-    #       see bug: https://github.com/numpy/numpy/issues/6467
-    array_year = numpy.empty(len(data), dtype='i4')
-    array_month = numpy.empty(len(data), dtype='i4')
-    array_day = numpy.empty(len(data), dtype='i4')
-    array_hour = numpy.empty(len(data), dtype='i4')
-    array_minute = numpy.empty(len(data), dtype='i4')
-    it = numpy.nditer(new_data['timestamp_end'], flags=['f_index'])
-    while not it.finished:
-        timestamp = datetime.strptime(str(it.value), "%Y%m%d%H%M")
-        array_year[it.index] = timestamp.year
-        array_month[it.index] = timestamp.month
-        array_day[it.index] = timestamp.day
-        array_hour[it.index] = timestamp.hour
-        array_minute[it.index] = timestamp.minute
-        timestamp_list.append(timestamp)
-        it.iternext()
-    new_data['year'][:] = array_year
-    new_data['month'][:] = array_month
-    new_data['day'][:] = array_day
-    new_data['hour'][:] = array_hour
-    new_data['minute'][:] = array_minute
+    timestamp_components = decode_timestamps(new_data['timestamp_end'], fmt='%Y%m%d%H%M')
+    new_data['year'][:] = timestamp_components['year']
+    new_data['month'][:] = timestamp_components['month']
+    new_data['day'][:] = timestamp_components['day']
+    new_data['hour'][:] = timestamp_components['hour']
+    new_data['minute'][:] = timestamp_components['minute']
+    timestamp_list = timestamps_to_datetime64(timestamp_components).tolist()
     year_array = numpy.unique(ar=new_data['year'])
 
     _log.debug("Finished loading timestamps: first(END)={f}, last(END)={l}, years={y}".format(f=new_data['timestamp_end'][0], l=new_data['timestamp_end'][-1], y=list(year_array)))
@@ -124,6 +190,117 @@ def load_output(filename, delimiter=',', skip_header=1):
     return new_data, headers, timestamp_list, year_list
 
 
+def load_output_columns(filename, columns, delimiter=','):
+    """
+    Loads only selected (numeric) columns from 'output' formatted file (e.g., from
+    output of partitioning), splitting each line only up to the last column needed;
+    values are the same as from numpy.genfromtxt with usecols (empty cells as NaN)
+
+    :param filename: Name of file to be loaded
+    :type filename: str
+    :param columns: labels of columns to be loaded (as in load_output headers)
+    :type columns: list
+    :param delimiter: cell delimiter character
+    :type delimiter: str
+    :rtype: dict (column label: numpy.ndarray)
+    """
+    with open(filename, 'r') as f:
+        header_line = f.readline()
+        headers = [i.strip().replace('.', HEADER_SEPARATOR).lower() for i in header_line.strip().split(delimiter)]
+        missing = [c for c in columns if c not in headers]
+        if missing:
+            msg = "Columns {c} not found in '{f}'".format(c=missing, f=filename)
+            _log.error(msg)
+            raise ONEFluxError(msg)
+        indices = [headers.index(c) for c in columns]
+        last_index = max(indices)
+        rows = [line.split(delimiter, last_index + 1) for line in f if line.strip()]
+
+    data = {}
+    for column, index in zip(columns, indices):
+        data[column] = numpy.array([(row[index].strip() or 'nan') for row in rows]).astype(DOUBLE_PREC)
+    return data
+
+
+_KEPT_RESULT_COLUMNS = {}    # kept columns by output file (full path): (file size and modification time, columns)
+
+def keep_result_columns(filename, data, columns=None):
+    """
+    Keeps in memory copies of selected columns from partitioning
+    results just saved to filename, for use later in the same process
+    without reloading the file (see get_result_columns)
+
+    :param filename: name of file results were saved to
+    :type filename: str
+    :param data: partitioning results
+    :type data: numpy.ndarray
+    :param columns: labels of columns to be kept (if None or empty, none kept)
+    :type columns: list
+    :rtype: dict (column label: numpy.ndarray)
+    """
+    kept = dict((c, numpy.array(data[c])) for c in (columns or []) if c in data.dtype.names)
+    if kept:
+        store_result_columns(filename=filename, columns=kept)
+    return kept
+
+
+def store_result_columns(filename, columns):
+    """
+    Stores columns of partitioning results saved to filename (e.g., kept
+    by a worker process and returned with the task result)
+
+    :param filename: name of file results were saved to
+    :type filename: str
+    :param columns: kept columns
+    :type columns: dict (column label: numpy.ndarray)
+    """
+    stat = os.stat(filename)
+    _KEPT_RESULT_COLUMNS[os.path.abspath(filename)] = ((stat.st_size, stat.st_mtime), columns)
+
+
+def pop_result_columns(filename):
+    """
+    Removes and returns columns kept for results saved to filename
+    (e.g., in a worker process, to be returned with the task result)
+
+    :param filename: name of file results were saved to
+    :type filename: str
+    :rtype: dict (column label: numpy.ndarray) or None if no columns kept
+    """
+    entry = _KEPT_RESULT_COLUMNS.pop(os.path.abspath(filename), None)
+    return (None if entry is None else entry[1])
+
+
+def get_result_columns(filename, columns):
+    """
+    Retrieves (and releases) kept columns of partitioning results saved to filename,
+    with the same values as loading them from the file (see load_output_columns)
+
+    :param filename: name of file results were saved to
+    :type filename: str
+    :param columns: labels of columns to be retrieved
+    :type columns: list
+    :rtype: dict (column label: numpy.ndarray) or None if not all columns kept or file changed since
+    """
+    entry = _KEPT_RESULT_COLUMNS.pop(os.path.abspath(filename), None)
+    if (entry is None) or (not os.path.isfile(filename)):
+        return None
+    file_signature, kept = entry
+    stat = os.stat(filename)
+    if ((stat.st_size, stat.st_mtime) != file_signature) or any(c not in kept for c in columns):
+        return None
+
+    # same text round trip as saving/loading file (e.g., single precision values written with str())
+    return dict((c, kept[c].astype('S32').astype(DOUBLE_PREC)) for c in columns)
+
+
+def clear_result_columns():
+    """
+    Releases all kept columns of partitioning results (e.g., not retrieved)
+    """
+    _KEPT_RESULT_COLUMNS.clear()
+
+
 def get_latitude(filename, delimiter=','):
     """
     Retrieves latitude from year 'input' formatted data file
@@ -271,7 +448,118 @@ def nomi(data, columns):
     return data[nonnan_mask], nonnan_mask, nan_mask
 
 
-def jacobian(func, data, params_filled_arr, params_filled_arr2, params):
+class WindowIndex(object):
+    """
+    Index of sliding day windows over a site-year, with first/last offsets of all
+    windows computed once; with sorted days (e.g., julday), each window
+    is a contiguous range of entries, so no full length masks are needed
+    """
+
+    def __init__(self, days, starts, size=None, ends=None, closed='left'):
+        """
+        :param days: day value for each entry (e.g., julday)
+        :type days: numpy.ndarray
+        :param starts: first day of each window
+        :type starts: list or numpy.ndarray
+        :param size: window size (in days), window ends at start + size (used if ends is None)
+        :type size: int or float
+        :param ends: last day of each window
+        :type ends: list or numpy.ndarray
+        :param closed: 'left' if windows include days in [start, end), 'right' if in (start, end]
+        :type closed: str
+        """
+        if closed not in ('left', 'right'):
+            msg = "Invalid window closed side '{c}'".format(c=closed)
+            _log.error(msg)
+            raise ONEFluxError(msg)
+        self.days = days
+        self.starts = numpy.asarray(starts)
+        self.size = size
+        self.window_ends = (self.starts + size if ends is None else numpy.asarray(ends))
+        self.closed = closed
+        self.is_sorted = bool(numpy.all(days[1:] >= days[:-1]))
+        if self.is_sorted:
+            self.begins = numpy.searchsorted(days, self.starts, side=closed)
+            self.ends = numpy.searchsorted(days, self.window_ends, side=closed)
+        else:
+            _log.warning("Days not sorted, window indices computed from masks")
+            self.begins, self.ends = None, None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _mask(self, window):
+        if self.closed == 'left':
+            return (self.days >= self.starts[window]) & (self.days < self.window_ends[window])
+        return (self.days > self.starts[window]) & (self.days <= self.window_ends[window])
+
+    def indices(self, window, valid_mask=None):
+        """
+        Indices of entries in window (in increasing order), same as
+        numpy.where((days >= start) & (days < end) & valid_mask)[0]
+        (or with start < days <= end, if closed on the right)
+
+        :param window: window number (position in starts)
+        :type window: int
+        :param valid_mask: mask of entries to be included (all if None)
+        :type valid_mask: numpy.ndarray
+        :rtype: numpy.ndarray
+        """
+        if self.is_sorted:
+            begin, end = self.begins[window], self.ends[window]
+            if valid_mask is None:
+                return numpy.arange(begin, end)
+            return begin + numpy.where(valid_mask[begin:end])[0]
+
+        mask = self._mask(window)
+        if valid_mask is not None:
+            mask = mask & valid_mask
+        return numpy.where(mask)[0]
+
+    def select(self, data, window, valid_mask=None):
+        """
+        Entries of data in window, same as newselif(data, window mask & valid_mask, drop=True),
+        including first entry of data returned if no entries selected;
+        zero-copy view of data for sorted days and no valid_mask, copy otherwise
+
+        :param data: data structure for partitioning (same entries as days)
+        :type data: numpy.ndarray
+        :param window: window number (position in starts)
+        :type window: int
+        :param valid_mask: mask of entries to be included (all if None)
+        :type valid_mask: numpy.ndarray
+        :rtype: numpy.ndarray
+        """
+        if not self.is_sorted:
+            condition = self._mask(window)
+            if valid_mask is not None:
+                condition = condition & valid_mask
+            return newselif(data=data, condition=condition, drop=True)[0]
+
+        begin, end = self.begins[window], self.ends[window]
+        if valid_mask is None:
+            if begin < end:
+                return data[begin:end]
+            return data[:1].copy()
+        condition = valid_mask[begin:end]
+        if not condition.any():
+            return data[:1].copy()
+        return data[begin:end][condition]
+
+
+ANALYTIC_JACOBIAN = True  # use analytic model Jacobians (False uses finite differences, as in original code)
+
+# model functions for non-linear least squares, and names of model inputs (in order of independent variables)
+LTS_MODELS = {
+    "LloydTemp": (lloyd_taylor_dt, ['ta_f']),
+    "HLRC_Lloyd": (hlrc_lloyd, ['rg_f', 'ta_f', 'e0']),
+    "HLRC_LloydVPD": (hlrc_lloydvpd, ['rg_f', 'ta_f', 'e0', 'vpd_f']),
+    "HLRC_Lloyd_afix": (hlrc_lloyd_afix, ['rg_f', 'ta_f', 'e0', 'alpha']),
+    "HLRC_LloydVPD_afix": (hlrc_lloydvpd_afix, ['rg_f', 'ta_f', 'e0', 'vpd_f', 'alpha']),
+    "LloydT_E0fix": (lloydt_e0fix, ['ta_f', 'e0']),
+}
+
+def jacobian(func, data, params_filled_arr, params_filled_arr2, params, analytic=ANALYTIC_JACOBIAN):
     '''
     :Task:  Calculate the jacobian matrix
 
@@ -285,35 +573,30 @@ def jacobian(func, data, params_filled_arr, params_filled_arr2, params):
     :type params_filled_arr2: numpy.ndarray
     :param params: optimized parameters to be applied to the model
     :type params: numpy.ndarray
+    :param analytic: if True, uses analytic Jacobian of model (finite differences otherwise)
+    :type analytic: bool
     '''
+    model, model_input_names = LTS_MODELS[func]
 
-    funcval = None
-    if func == "HLRC_Lloyd":
-        funcval = hlrc_lloyd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=params)
-    if func == "HLRC_LloydVPD":
-        funcval = hlrc_lloydvpd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), parameter=params)
-    if func == "HLRC_Lloyd_afix":
-        funcval = hlrc_lloyd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=params)
-    if func == "HLRC_LloydVPD_afix":
-        funcval = hlrc_lloydvpd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=params)
-    if func == "LloydT_E0fix":
-        funcval = lloydt_e0fix(ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=params)
+    # model inputs cast only once for all evaluations
+    model_input_sources = {'rg_f': data['rg_f'], 'ta_f': data['tair_f'], 'e0': params_filled_arr, 'alpha': params_filled_arr2}
+    model_inputs = {}
+    for name in model_input_names:
+        model_inputs[name] = (data['vpd_f'] if name == 'vpd_f' else model_input_sources[name]).astype(DOUBLE_PREC)
+
+    model_jacobian = (get_model_jacobian(model) if analytic else None)
+    if model_jacobian is not None:
+        return model_jacobian(parameter=numpy.atleast_1d(params), **model_inputs).astype(FLOAT_PREC)
+
+    funcval = model(parameter=params, **model_inputs)
 
     if isinstance(params, numpy.float32) or isinstance(params, numpy.float64) \
         or isinstance(params, numpy.int32) or isinstance(params, numpy.int64):
-        #print("params = [params]")
         params = [params]
 
     nf = funcval.size
     np = len(params)
 
-    '''
-    print("nf")
-    print(nf)
-    print("np")
-    print(np)
-    '''
-
     j = numpy.zeros((np, nf), dtype=FLOAT_PREC)
     deltaRel = 1.e-3
     for p in range(np):
@@ -321,27 +604,8 @@ def jacobian(func, data, params_filled_arr, params_filled_arr2, params):
         paramsPlus[p] = params[p] + deltaRel * numpy.abs(params[p])
         paramsMinus = numpy.copy(params)
         paramsMinus[p] = params[p] - deltaRel * numpy.abs(params[p])
-        fplus = None
-        fminus = None
-        #print("func")
-        #print(func)
-        if func == "HLRC_Lloyd":
-            fplus = hlrc_lloyd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=paramsPlus)
-            fminus = hlrc_lloyd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=paramsMinus)
-        if func == "HLRC_LloydVPD":
-            #print("paramsPlus")
-            #print(paramsPlus)
-            fplus = hlrc_lloydvpd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), parameter=paramsPlus)
-            fminus = hlrc_lloydvpd(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), parameter=paramsMinus)
-        if func == "HLRC_Lloyd_afix":
-            fplus = hlrc_lloyd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=paramsPlus)
-            fminus = hlrc_lloyd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=paramsMinus)
-        if func == "HLRC_LloydVPD_afix":
-            fplus = hlrc_lloydvpd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=paramsPlus)
-            fminus = hlrc_lloydvpd_afix(rg_f=data['rg_f'].astype(DOUBLE_PREC), ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), vpd_f=data['vpd_f'].astype(DOUBLE_PREC), alpha=params_filled_arr2.astype(DOUBLE_PREC), parameter=paramsMinus)
-        if func == "LloydT_E0fix":
-            fplus = lloydt_e0fix(ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=paramsPlus)
-            fminus = lloydt_e0fix(ta_f=data['tair_f'].astype(DOUBLE_PREC), e0=params_filled_arr.astype(DOUBLE_PREC), parameter=paramsMinus)
+        fplus = model(parameter=paramsPlus, **model_inputs)
+        fminus = model(parameter=paramsMinus, **model_inputs)
 
         j[p, :] = (fplus - fminus) / (paramsPlus[p] - paramsMinus[p])
 
@@ -376,6 +640,11 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
         _log.critical(msg)
         raise ONEFluxError(msg)
 
+    if lts_func not in LTS_MODELS:
+        msg = "Unknown non-linear least squares function '{f}'".format(f=lts_func)
+        _log.critical(msg)
+        raise ONEFluxError(msg)
+
     status = 0 # status of execution; 0 optimization executed successfully, -1 problem with execution of optimization
     first_ts, last_ts = get_first_last_ts(data=data)
 #    _log.debug("Starting optimization step for period '{ts1}' - '{ts2}'".format(ts1=first_ts.strftime('%Y-%m-%d %H:%M'), ts2=last_ts.strftime('%Y-%m-%d %H:%M')))
@@ -452,7 +721,11 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
     clean_dep = data[depvar].copy()
     clean_dep[~nonnan_indep_mask] = NAN
 
-    leastsq_count = [1]
+    # model and its inputs (cast only once for all iterations)
+    model, model_input_names = LTS_MODELS[lts_func]
+    model_inputs = {}
+    for name, indepvar in zip(model_input_names, indepvar_arr):
+        model_inputs[name] = data[indepvar].astype(DOUBLE_PREC)
 
     # define inner function to be used for optimization
     def trimmed_bayes_res(par, nee=clean_dep, trim_perc=trim_perc):
@@ -464,66 +737,12 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
 
         :param nee: array with (non-cleaned) nee values (dependent variable)
         :type nee: numpy.ndarray
-        :param temp: array with (cleaned, no NAs) temperature (independent variable)
-        :type temp: numpy.ndarray
-        :param rref: reference respiration (1st parameter to be optimized)
-        :type rref: float
-        :param e0: temperature sensitivity (2nd parameter to be optimized)
-        :type e0: float
+        :param par: parameters to be optimized
+        :type par: numpy.ndarray
         :param trim_perc: percentiled to be trimmed off
         :type trim_perc: float
         """
-        prediction = None
-
-        #print("leastsq_count")
-        #print(leastsq_count)
-
-        if lts_func == "LloydTemp":
-            prediction = lloyd_taylor_dt(ta_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), parameter=par)
-            '''
-            print("par")
-            print(par)
-            print("mprior")
-            print(mprior)
-            print("sigm")
-            print(sigm)
-            print("sigd")
-            print(sigd)
-            #print("indepvar[0]")
-            #print(indepvar[0])
-            #print("data[indepvar[0]]")
-            #print(data[indepvar[0]])
-            #print("prediction")
-            #print(prediction)
-            '''
-        if lts_func == "HLRC_Lloyd":
-            prediction = hlrc_lloyd(rg_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), ta_f=data[indepvar_arr[1]].astype(DOUBLE_PREC), e0=data[indepvar_arr[2]].astype(DOUBLE_PREC), parameter=par)
-        if lts_func == "HLRC_LloydVPD":
-            #if leastsq_count[0] == 6:
-            #    par = numpy.array([-0.020768575, 1.9603746, 0.0, 0.40222415], dtype=DOUBLE_PREC)
-            prediction = hlrc_lloydvpd(rg_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), ta_f=data[indepvar_arr[1]].astype(DOUBLE_PREC), e0=data[indepvar_arr[2]].astype(DOUBLE_PREC), vpd_f=data[indepvar_arr[3]].astype(DOUBLE_PREC), parameter=par)
-            #print("par")
-            #print(par)
-            #if leastsq_count[0] == 1:
-            #    print("mprior")
-            #    print(mprior)
-            #    print("sigm")
-            #    print(sigm)
-            #    print("sigd")
-            #    print(sigd)
-            #print("indepvar[0]")
-            #print(indepvar[0])
-            #print("data[indepvar[0]]")
-            #print(data[indepvar[0]])
-            #print("prediction")
-            #print(prediction)
-        if lts_func == "HLRC_Lloyd_afix":
-            prediction = hlrc_lloyd_afix(rg_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), ta_f=data[indepvar_arr[1]].astype(DOUBLE_PREC), e0=data[indepvar_arr[2]].astype(DOUBLE_PREC), alpha=data[indepvar_arr[3]].astype(DOUBLE_PREC), parameter=par)
-        if lts_func == "HLRC_LloydVPD_afix":
-            prediction = hlrc_lloydvpd_afix(rg_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), ta_f=data[indepvar_arr[1]].astype(DOUBLE_PREC), e0=data[indepvar_arr[2]].astype(DOUBLE_PREC), vpd_f=data[indepvar_arr[3]].astype(DOUBLE_PREC), alpha=data[indepvar_arr[4]].astype(DOUBLE_PREC), parameter=par)
-        if lts_func == "LloydT_E0fix":
-            prediction = lloydt_e0fix(ta_f=data[indepvar_arr[0]].astype(DOUBLE_PREC), e0=data[indepvar_arr[1]].astype(DOUBLE_PREC), parameter=par)
-
+        prediction = model(parameter=par, **model_inputs)
 
         residuals = (nee - prediction) / sigd
         nonnan_nee_mask = not_nan(nee)
@@ -531,44 +750,8 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
 
         pres = (par - mprior) / sigm
 
-
-        #print("residuals")
-        #print(residuals)
-        #print("pres")
-        #print(pres)
-        #print("numpy.append(residuals, pres)")
-        #print(numpy.append(residuals, pres))
-
-
-        #print("par.dtype")
-        #print(par.dtype)
-        #print("data[indepvar[0]].dtype")
-        #print(data[indepvar[0]].dtype)
-        #print("prediction.dtype")
-        #print(prediction.dtype)
-        #print("nee.dtype")
-        #print(nee.dtype)
-        #print("sigm.dtype")
-        #print(sigm.dtype)
-        #print("sigd.dtype")
-        #print(sigd.dtype)
-        #print("mprior.dtype")
-        #print(mprior.dtype)
-        #print("residuals.dtype")
-        #print(residuals.dtype)
-        #print("pres.dtype")
-        #print(pres.dtype)
-        #print("(par - mprior).dtype")
-        #print((par - mprior).dtype)
-
-
         # NOTE: compareIndex and compindex not used in NT partitioning code
 
-        #if leastsq_count[0] == 10 and lts_func == "HLRC_LloydVPD":
-        #    exit()
-        leastsq_count[0] += 1
-
-
         if trim_perc == 0.0:
             return numpy.append(residuals, pres)
 
@@ -581,12 +764,38 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
 
         return numpy.append(residuals, pres)
 
-    #print("starting least_squares")
+    model_jacobian = (get_model_jacobian(model) if ANALYTIC_JACOBIAN else None)
+
+    def trimmed_bayes_jac(par, nee=clean_dep, trim_perc=trim_perc):
+        """
+        (inner) Jacobian of trimmed_bayes_res, from analytic Jacobian of
+        model (NAs and trimmed residuals have zero derivatives)
+
+        :param nee: array with (non-cleaned) nee values (dependent variable)
+        :type nee: numpy.ndarray
+        :param par: parameters to be optimized
+        :type par: numpy.ndarray
+        :param trim_perc: percentiled to be trimmed off
+        :type trim_perc: float
+        """
+        nonnan_nee_mask = not_nan(nee)
+        jac = -1 * model_jacobian(parameter=par, **model_inputs).T / sigd[:, numpy.newaxis]
+        jac[~nonnan_nee_mask] = 0.0
+
+        if trim_perc != 0.0:
+            residuals = (nee - model(parameter=par, **model_inputs)) / sigd
+            residuals[~nonnan_nee_mask] = 0.0
+            absolute_residuals = numpy.abs(residuals)
+            jac[absolute_residuals > pct(absolute_residuals, 100.0 - trim_perc)] = 0.0
+
+        return numpy.vstack((jac, numpy.diag(1.0 / sigm)))
+
     parameters, std_devs, ls_status, residuals, covariance_matrix, cor_matrix = least_squares(func=trimmed_bayes_res,
                                                                                   initial_guess=xguess,
                                                                                   entries=len(clean_dep),
                                                                                   iterations=1000 * (len(clean_dep) + 1),
-                                                                                  return_residuals_cov_mat=True)
+                                                                                  return_residuals_cov_mat=True,
+                                                                                  dfunc=(trimmed_bayes_jac if model_jacobian is not None else None))
     '''
     print("ending least_squares")
     print("ls_status")
@@ -829,8 +1038,10 @@ def nlinlts2(data, lts_func, depvar, indepvar_arr, npara, xguess,
 def pct(array, percent):
     """
     Calculates "percent" percentile of array -- not really a percentile,
-    but similar intention. Following implementation in original code.
-    
+    but similar intention. Following implementation in original code
+    (ordinal ranking of entries), with order statistics found by selection
+    (numpy.partition, linear time) instead of full ranking (sort)
+
     :param array: 1-d array to be used in calculation
     :type array: numpy.ndarray
     :param percent: target percent value for percentile
@@ -845,30 +1056,29 @@ def pct(array, percent):
         _log.critical(msg)
         raise ONEFluxError(msg)
 
-    # indices of ascending ranking of entries in array
-    rank_idx_array = rankdata(nonnan_array, method='ordinal')
+    # ranks (ordinal) are 1 to len(nonnan_array)
     critical_rank = len(nonnan_array) * percent / 100.
-    over_critical_rank_mask = (rank_idx_array > critical_rank)
 
     # if no index over critical rank, return max values
-    if numpy.sum(over_critical_rank_mask) == 0.0:
+    if critical_rank >= len(nonnan_array):
         return numpy.max(nonnan_array)
 
-    ### smallest rank that is greater than critical rank (or SM-RK-GT-CR)
-    critical_rank_idx = numpy.where(rank_idx_array == numpy.min(rank_idx_array[over_critical_rank_mask]))
+    ### position (0-based, in ascending order) of smallest rank that is greater than critical rank (or SM-RK-GT-CR)
+    critical_pos = max(int(numpy.floor(critical_rank)) + 1, 1) - 1
 
-    ### rank immediately before (SM-RK-GT-CR)
-    critical_rank_idx_previous = numpy.where(rank_idx_array == (numpy.min(rank_idx_array[over_critical_rank_mask]) - 1))
-
-    if critical_rank.is_integer() and (numpy.sum(critical_rank_idx_previous) != 0):
-        return numpy.average([nonnan_array[critical_rank_idx[0]], nonnan_array[critical_rank_idx_previous[0]]])
+    ### rank immediately before (SM-RK-GT-CR) only used if it exists and its entry is not the first
+    ### in array (original code tests sum of its indices), i.e., ordinal rank of first entry (first
+    ### among ties) not the rank before (SM-RK-GT-CR)
+    if critical_rank.is_integer() and (critical_pos > 0) and (numpy.sum(nonnan_array < nonnan_array[0]) != critical_pos - 1):
+        partitioned = numpy.partition(nonnan_array, [critical_pos - 1, critical_pos])
+        return numpy.average([partitioned[critical_pos:critical_pos + 1], partitioned[critical_pos - 1:critical_pos]])
     else:
-        return nonnan_array[critical_rank_idx[0]][0]
+        return numpy.partition(nonnan_array, critical_pos)[critical_pos]
 
 
 STEP_BOUND_FACTOR = 0.25    # factor to restrict initial step  (default in scipy is 100.0, but PV-Wave seems to be closer to 0.1)
 NO_CONVERGENCE_RETRY = 20  # multiplicative factor to increase number of iterations allowed for retrying optimization that did not converge
-def least_squares(func, initial_guess, entries, iterations=None, stop=False, return_residuals_cov_mat=False):
+def least_squares(func, initial_guess, entries, iterations=None, stop=False, return_residuals_cov_mat=False, dfunc=None):
     """
     Wrapper for least squares paramater optimization
     
@@ -891,19 +1101,21 @@ def least_squares(func, initial_guess, entries, iterations=None, stop=False, ret
     :type stop: bool
     :param return_residuals_cov_mat: returns residuals and covariance matrix if True
     :type return_residuals_cov_mat: bool
+    :param dfunc: Jacobian of func (one row per entry of func result), if None uses finite differences
+    :type dfunc: function
     :rtype: 4-tuple (of tuple estimated parameters and corresponding std_devs), or 6-tuple
     """
     if iterations is None:
         iterations = 1000 * (len(entries) + 1)
 
     # call to scipy.optimize.leastsq (implementation of the Levenberg-Marquardt algorithm)
-    pars, cov_x, info, msg, success = leastsq(func=func, x0=initial_guess, full_output=True, maxfev=iterations, factor=STEP_BOUND_FACTOR) #ftol=1.11e-16
+    pars, cov_x, info, msg, success = leastsq(func=func, x0=initial_guess, Dfun=dfunc, full_output=True, maxfev=iterations, factor=STEP_BOUND_FACTOR) #ftol=1.11e-16
 
     if success != 1:# and (info['nfev'] == iterations):
         if info['nfev'] >= iterations:
             if not stop:
                 _log.warning("No convergence (code '{p}'), retrying ({r}-fold limit increase). Least squares message: [[{m}]]".format(p=success, r=NO_CONVERGENCE_RETRY, m=msg.replace('\r', '').replace('\n', ' ')))
-                return least_squares(func=func, initial_guess=initial_guess, entries=entries, iterations=iterations * NO_CONVERGENCE_RETRY, stop=True, return_residuals_cov_mat=return_residuals_cov_mat)
+                return least_squares(func=func, initial_guess=initial_guess, entries=entries, iterations=iterations * NO_CONVERGENCE_RETRY, stop=True, return_residuals_cov_mat=return_residuals_cov_mat, dfunc=dfunc)
             else:
                 _log.warning("No convergence (code '{p}'), stopping. Least squares message: [[{m}]]".format(p=success, m=msg.replace('\r', '').replace('\n', ' ')))
         else:
@@ -985,27 +1197,10 @@ def cov2cor(covmatr):
     #print(covmatr.shape)
 
     n = covmatr.shape[0]
+    variances = numpy.diagonal(covmatr)
 
     cormatr = numpy.zeros((n, n), dtype=FLOAT_PREC)
-    for i in range(n):
-        for j in range(n):
-            cormatr[j][i] = covmatr[j][i] / numpy.sqrt(covmatr[i][i] * covmatr[j][j])
-
-    '''
-    print("covmatr")
-    print(covmatr)
-    print("cormatr")
-    print(cormatr)
-
-    print("(covmatr[j][i] / numpy.sqrt(covmatr[i][i] * covmatr[j][j])).dtype")
-    print((covmatr[0][0] / numpy.sqrt(covmatr[0][0] * covmatr[0][0])).dtype)
-    print("covmatr.dtype")
-    print(covmatr.dtype)
-    print("cormatr.dtype")
-    print(cormatr.dtype)
-
-    exit()
-    '''
+    cormatr[:, :] = covmatr / numpy.sqrt(numpy.outer(variances, variances))
 
     return cormatr
 
@@ -1084,6 +1279,55 @@ def remove_errored_entries(ustar_type, site, site_dir, year, working_year_data):
 
     return working_year_data
 
+def get_time_columns(year, month, day, hour, minute):
+    """
+    Computes days-of-year (julday) and time of day in hours (Hr) for all entries at once;
+    Hr is only set for entries at full or half hours (NAN otherwise)
+
+    :param year: year of each entry
+    :type year: numpy.ndarray
+    :param month: month of each entry
+    :type month: numpy.ndarray
+    :param day: day of each entry
+    :type day: numpy.ndarray
+    :param hour: hour of each entry
+    :type hour: numpy.ndarray
+    :param minute: minute of each entry
+    :type minute: numpy.ndarray
+    :rtype: tuple (julday, hr)
+    """
+    year = numpy.asarray(year).astype(int)
+    days = timestamps_to_datetime64({'year': year, 'month': numpy.asarray(month).astype(int), 'day': numpy.asarray(day).astype(int)}).astype('M8[D]')
+    julday = (days - (year - 1970).astype('M8[Y]').astype('M8[D]')).astype(int) + 1
+
+    hr = numpy.empty(len(year), dtype=FLOAT_PREC)
+    hr[:] = NAN
+    hour_mask = (minute == 0.)
+    halfhour_mask = (minute == 30.)
+    hr[hour_mask] = hour[hour_mask]
+    hr[halfhour_mask] = hour[halfhour_mask] + 0.5
+
+    return julday, hr
+
+
+def add_time_columns(dataset):
+    """
+    Returns copy of dataset (e.g., from load_output) with days-of-year (julday) and
+    time of day (Hr) columns, computed once for whole dataset and then reused
+    by create_data_structures for each site-year
+
+    :param dataset: dataset with year, month, day, hour, and minute columns
+    :type dataset: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    new_data = numpy.zeros(len(dataset), dtype=dataset.dtype.descr + [('julday', FLOAT_PREC), ('hr', FLOAT_PREC)])
+    for h in dataset.dtype.names:
+        new_data[h] = dataset[h]
+    new_data['julday'][:], new_data['hr'][:] = get_time_columns(year=dataset['year'], month=dataset['month'], day=dataset['day'],
+                                                                hour=dataset['hour'], minute=dataset['minute'])
+    return new_data
+
+
 def create_data_structures(ustar_type, whole_dataset_nee, whole_dataset_meteo, percentile, year_mask_nee, year_mask_meteo, latitude, part_type=NT_STR):
     """
     :Task:  Creates data structure needed for partitioning; return working copy of populated input data array
@@ -1169,23 +1413,20 @@ def create_data_structures(ustar_type, whole_dataset_nee, whole_dataset_meteo, p
     working_year_data['hour'][:] = whole_dataset_nee['hour'][year_mask_nee]
     working_year_data['minute'][:] = whole_dataset_nee['minute'][year_mask_nee]
 
-    # compute julday
+    # compute julday and Hr (reused if already computed for whole dataset, see add_time_columns)
     _log.debug("Computing days-of-year (julday)")
-    time_array = working_year_data[['year', 'month', 'day', 'hour', 'minute']]
-    for i, time_record in enumerate(time_array):
-        time_record_int = [int(t) for t in time_record]
-        working_year_data['julday'][i] = int(datetime(*time_record_int).strftime("%j"))
+    if ('julday' in whole_dataset_nee.dtype.names) and ('hr' in whole_dataset_nee.dtype.names):
+        working_year_data['julday'][:] = whole_dataset_nee['julday'][year_mask_nee]
+        working_year_data['hr'][:] = whole_dataset_nee['hr'][year_mask_nee]
+    else:
+        working_year_data['julday'][:], working_year_data['hr'][:] = get_time_columns(year=working_year_data['year'], month=working_year_data['month'],
+                                                                                      day=working_year_data['day'], hour=working_year_data['hour'],
+                                                                                      minute=working_year_data['minute'])
     if (working_year_data['julday'][-1] == 1) and (working_year_data['julday'][-2] == 365):
         working_year_data['julday'][-1] = 366
     elif (working_year_data['julday'][-1] == 1) and (working_year_data['julday'][-2] == 366):
         working_year_data['julday'][-1] = 367
 
-    # computr Hr
-    hour_mask = (whole_dataset_nee['minute'][year_mask_nee] == 0.)
-    halfhour_mask = (whole_dataset_nee['minute'][year_mask_nee] == 30.)
-    working_year_data['hr'][hour_mask] = whole_dataset_nee['hour'][year_mask_nee][hour_mask]
-    working_year_data['hr'][halfhour_mask] = whole_dataset_nee['hour'][year_mask_nee][halfhour_mask] + 0.5
-
 
     # NEE, removing non-measured values using percentile_qc (0: measured)
     working_year_data['nee'][:] = whole_dataset_nee[percentile][year_mask_nee]
@@ -16,23 +16,31 @@ import logging
 import numpy
 
 from datetime import datetime
+from functools import partial
 from scipy.optimize import leastsq
-from scipy.stats import rankdata, ttest_ind, f_oneway
+from scipy.stats import ttest_ind, f_oneway
 from scipy.interpolate import splev, splrep, interp1d, LSQUnivariateSpline
 
-from oneflux import ONEFluxError
+from oneflux import ONEFluxError, log_trace
 
 from oneflux.partition.compu import compu_qcnee_filter, compu_daylight, compu_daylight_zero, compu_sunrise, compu_sunset, compu_nee_night
-from oneflux.partition.ecogeo import lloyd_taylor
+from oneflux.partition.ecogeo import lloyd_taylor, get_model_jacobian
 from oneflux.partition.auxiliary import compare_col_to_pvwave, FLOAT_PREC, NAN, NAN_TEST, nan, not_nan
 from oneflux.partition.library import QC_AUTO_DIR, METEO_PROC_DIR, NEE_PROC_DIR, NT_OUTPUT_DIR, HEADER_SEPARATOR, EXTRA_FILENAME, NT_STR
-from oneflux.partition.library import load_output, get_latitude, var, varnum, add_empty_vars, create_data_structures, nomi, newselif, ONEFluxPartitionError
+from oneflux.partition.library import load_output, get_latitude, var, varnum, add_empty_vars, add_time_columns, create_data_structures, nomi, newselif, pct, ONEFluxPartitionError, WindowIndex
+from oneflux.partition.library import run_partitioning_tasks, get_task_dataset, PARTITIONING_METEO_KEY, ANALYTIC_JACOBIAN
+from oneflux.partition.library import keep_result_columns, store_result_columns, pop_result_columns
 from oneflux.utils.files import check_create_directory
+from oneflux.utils.writers import write_csv
+from oneflux.utils.profiling import resource_usage, record_phase, profile_phase
 
 _log = logging.getLogger(__name__)
 
 
-def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare):
+NT_WORKERS = 1  # default number of worker processes (1 is serial execution)
+
+
+def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare, workers=NT_WORKERS, cache_dir=None, keep_columns=None):
     """
     NT partitioning wrapper function.
     Handles all "versions" (percentiles, CUT/VUT, years, etc)
@@ -49,6 +57,12 @@ def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
     :type perc_to_compare: list (of str)
     :param years_to_compare: list of years to compare - [1996, 1997, ... , 2014]
     :type years_to_compare: list (of int)
+    :param workers: number of worker processes for (ustar_type, year, percentile) tasks, 1 runs serially
+    :type workers: int
+    :param cache_dir: columnar cache directory for parsed inputs (if None, no caching)
+    :type cache_dir: str
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
     """
 
     _log.info("Started NT partitioning of {s}".format(s=siteid))
@@ -73,7 +87,12 @@ def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
             _log.critical(msg)
             raise ONEFluxError(msg)
     _log.info("Will now load meteo file '{f}'".format(f=meteo_proc_f))
-    whole_dataset_meteo, headers_meteo, timestamp_list_meteo, year_list_meteo = load_output(meteo_proc_f)
+    with profile_phase(label='load'):
+        whole_dataset_meteo, headers_meteo, timestamp_list_meteo, year_list_meteo = load_output(meteo_proc_f, cache_dir=cache_dir)
+
+    # datasets shared (read-only) by all tasks, and list of pending tasks for parallel execution
+    datasets = {PARTITIONING_METEO_KEY: whole_dataset_meteo}
+    tasks = []
 
     # iterate through UStar threshold types
     for ustar_type in prod_to_compare:
@@ -100,7 +119,10 @@ def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
                     msg = "Invalid USTAR type '{u}'".format(u=ustar_type)
                     raise ONEFluxError(msg)
         _log.info("Will now load nee percentiles file '{f}'".format(f=nee_proc_percentiles_f))
-        whole_dataset_nee, headers_nee, timestamp_list_nee, year_list_nee = load_output(nee_proc_percentiles_f)
+        with profile_phase(label='load'):
+            whole_dataset_nee, headers_nee, timestamp_list_nee, year_list_nee = load_output(nee_proc_percentiles_f, cache_dir=cache_dir)
+            whole_dataset_nee = add_time_columns(whole_dataset_nee)
+        datasets[ustar_type] = whole_dataset_nee
 
         # iterate through each year
         for iteration, year in enumerate(year_list_nee):
@@ -116,70 +138,164 @@ def partitioning_nt(datadir, siteid, sitedir, prod_to_compare, perc_to_compare,
 
             # iterate through UStar threshold values
             for percentile in percentiles_data_columns:
-                _log.info("Started processing percentile '{p}'".format(p=percentile))
                 percentile_print = percentile.replace(HEADER_SEPARATOR, '.')
                 output_filename = os.path.join(nt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra=EXTRA_FILENAME))
-                temp_output_filename = os.path.join(nt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra='{extra}'))
                 if os.path.isfile(output_filename):
                     _log.info("Output file found, skipping: '{f}'".format(f=output_filename))
                     continue
                 else:
                     _log.debug("Output file missing, will be processed: '{f}'".format(f=output_filename))
 
-                # create masks for current year for both nee and meteo
-                year_mask_nee = (whole_dataset_nee['year'] == year)
-                year_mask_meteo = (whole_dataset_meteo['year'] == year)
-
-                # account for first entry being from previous year
-                if iteration == 0:
-                    _log.debug("First site-year available ({y}), removing first midnight entry from meteo only".format(y=year))
-                    first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
-                    first_nee = None
-                    year_mask_meteo[first_meteo] = 0
+                task = (siteid, nt_output_dir, ustar_type, iteration, year, percentile, latitude)
+                if workers > 1:
+                    tasks.append(task)
                 else:
-                    _log.debug("Regular site-year ({y}), removing first midnight entry from meteo and nee".format(y=year))
-                    first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
-                    first_nee = numpy.where(year_mask_nee == 1)[0][0]
-                    year_mask_meteo[first_meteo] = 0
-                    year_mask_nee[first_nee] = 0
-
-                # account for last entry being from next year
-                _log.debug("Site-year ({y}), adding first midnight entry from next year for meteo and nee".format(y=year))
-                last_meteo = numpy.where(year_mask_meteo == 1)[0][-1] + 1
-                last_nee = numpy.where(year_mask_nee == 1)[0][-1] + 1
-                year_mask_meteo[last_meteo] = 1
-                year_mask_nee[last_nee] = 1
-
-                _log.debug("Site-year {y}: first NEE '{tn}' and first meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][0]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][0]['timestamp_end']))
-                _log.debug("Site-year {y}:  last NEE '{tn}' and  last meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][-1]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][-1]['timestamp_end']))
-
-                if numpy.sum(year_mask_nee) != numpy.sum(year_mask_meteo):
-                    msg = "Incompatible array sizes (nee={n}, meteo={m}) for year '{y}' while processing '{f}'".format(y=year, f=output_filename, n=numpy.sum(year_mask_nee), m=numpy.sum(year_mask_meteo))
-                    _log.error(msg)
-                    raise ONEFluxError(msg)
+                    partitioning_nt_task(whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo, keep_columns=keep_columns, *task)
+            _log.info("Finished processing year '{y}'".format(y=year))
+        _log.info("Finished processing UStar threshold type '{u}'".format(u=ustar_type))
+
+    if tasks:
+        results = run_partitioning_tasks(func=partial(_partitioning_nt_worker, keep_columns=keep_columns), tasks=tasks, datasets=datasets, workers=workers, label='NT partitioning')
+        merge_nt_task_results(results=results)
+
+    _log.info("Finished NT partitioning of {s}".format(s=siteid))
+
 
-                working_year_data = create_data_structures(ustar_type=ustar_type, whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo,
-                                                           percentile=percentile, year_mask_nee=year_mask_nee, year_mask_meteo=year_mask_meteo, latitude=latitude, part_type=NT_STR)
+def partitioning_nt_task(siteid, nt_output_dir, ustar_type, iteration, year, percentile, latitude, whole_dataset_nee, whole_dataset_meteo, keep_columns=None):
+    """
+    NT partitioning of a single (ustar_type, year, percentile) task,
+    saving results to its output file
 
-                # corresponds to partitnioning_nt.pro, line:  compu, set, "QCNEE=0"   # NOTE: removes all information of missing data records!
-                compu(data=working_year_data, func=compu_qcnee_filter, columns=['qcnee']) # equivalent to: working_year_data['qcnee'][:] = 0
+    :param siteid: site flux id to be processed - in format CC-SSS
+    :type siteid: str
+    :param nt_output_dir: NT partitioning output directory (full path)
+    :type nt_output_dir: str
+    :param ustar_type: UStar threshold type - 'c' or 'y'
+    :type ustar_type: str
+    :param iteration: index of year in list of years of the NEE dataset (0 for first site-year)
+    :type iteration: int
+    :param year: year to be processed
+    :type year: int
+    :param percentile: percentile data column label - e.g., '1__25'
+    :type percentile: str
+    :param latitude: site latitude
+    :type latitude: float
+    :param whole_dataset_nee: full NEE percentiles dataset for UStar threshold type
+    :type whole_dataset_nee: numpy.ndarray
+    :param whole_dataset_meteo: full meteo dataset
+    :type whole_dataset_meteo: numpy.ndarray
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
+    :rtype: str
+    """
+    _log.info("Started processing percentile '{p}'".format(p=percentile))
+    percentile_print = percentile.replace(HEADER_SEPARATOR, '.')
+    output_filename = os.path.join(nt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra=EXTRA_FILENAME))
+    temp_output_filename = os.path.join(nt_output_dir, "nee_{t}_{p}_{s}_{y}{extra}.csv".format(t=ustar_type, p=percentile_print, s=siteid, y=year, extra='{extra}'))
+
+    # create masks for current year for both nee and meteo
+    year_mask_nee = (whole_dataset_nee['year'] == year)
+    year_mask_meteo = (whole_dataset_meteo['year'] == year)
+
+    # account for first entry being from previous year
+    if iteration == 0:
+        _log.debug("First site-year available ({y}), removing first midnight entry from meteo only".format(y=year))
+        first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
+        first_nee = None
+        year_mask_meteo[first_meteo] = 0
+    else:
+        _log.debug("Regular site-year ({y}), removing first midnight entry from meteo and nee".format(y=year))
+        first_meteo = numpy.where(year_mask_meteo == 1)[0][0]
+        first_nee = numpy.where(year_mask_nee == 1)[0][0]
+        year_mask_meteo[first_meteo] = 0
+        year_mask_nee[first_nee] = 0
+
+    # account for last entry being from next year
+    _log.debug("Site-year ({y}), adding first midnight entry from next year for meteo and nee".format(y=year))
+    last_meteo = numpy.where(year_mask_meteo == 1)[0][-1] + 1
+    last_nee = numpy.where(year_mask_nee == 1)[0][-1] + 1
+    year_mask_meteo[last_meteo] = 1
+    year_mask_nee[last_nee] = 1
+
+    _log.debug("Site-year {y}: first NEE '{tn}' and first meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][0]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][0]['timestamp_end']))
+    _log.debug("Site-year {y}:  last NEE '{tn}' and  last meteo '{tm}'".format(y=year, tn=whole_dataset_nee[year_mask_nee][-1]['timestamp_end'], tm=whole_dataset_meteo[year_mask_meteo][-1]['timestamp_end']))
+
+    if numpy.sum(year_mask_nee) != numpy.sum(year_mask_meteo):
+        msg = "Incompatible array sizes (nee={n}, meteo={m}) for year '{y}' while processing '{f}'".format(y=year, f=output_filename, n=numpy.sum(year_mask_nee), m=numpy.sum(year_mask_meteo))
+        _log.error(msg)
+        raise ONEFluxError(msg)
 
-                # get latitude from data structure
-                lat = var(working_year_data, 'lat')
+    working_year_data = create_data_structures(ustar_type=ustar_type, whole_dataset_nee=whole_dataset_nee, whole_dataset_meteo=whole_dataset_meteo,
+                                               percentile=percentile, year_mask_nee=year_mask_nee, year_mask_meteo=year_mask_meteo, latitude=latitude, part_type=NT_STR)
 
-                # call flux_partition
-                result_year_data = flux_partition(data=working_year_data, lat=lat[0], tempvar='tair', temp_output_filename=temp_output_filename)
+    # corresponds to partitnioning_nt.pro, line:  compu, set, "QCNEE=0"   # NOTE: removes all information of missing data records!
+    compu(data=working_year_data, func=compu_qcnee_filter, columns=['qcnee']) # equivalent to: working_year_data['qcnee'][:] = 0
 
-                # save output data file
-                _log.debug("Saving output file '{f}".format(f=output_filename))
-                numpy.savetxt(fname=output_filename, X=result_year_data, delimiter=',', fmt='%s', header=','.join(result_year_data.dtype.names), comments='')
-                _log.debug("Saved output file '{f}".format(f=output_filename))
+    # get latitude from data structure
+    lat = var(working_year_data, 'lat')
 
-                _log.info("Finished processing percentile '{p}'".format(p=percentile))
-#                sys.exit('EXIT') # TODO: testing only, remove
-            _log.info("Finished processing year '{y}'".format(y=year))
-        _log.info("Finished processing UStar threshold type '{u}'".format(u=ustar_type))
-    _log.info("Finished NT partitioning of {s}".format(s=siteid))
+    # call flux_partition
+    result_year_data = flux_partition(data=working_year_data, lat=lat[0], tempvar='tair', temp_output_filename=temp_output_filename)
+
+    # save output data file
+    _log.debug("Saving output file '{f}".format(f=output_filename))
+    with profile_phase(label='write'):
+        write_csv(filename=output_filename, data=result_year_data, delimiter=',', header=','.join(result_year_data.dtype.names))
+        keep_result_columns(filename=output_filename, data=result_year_data, columns=keep_columns)
+    _log.debug("Saved output file '{f}".format(f=output_filename))
+
+    _log.info("Finished processing percentile '{p}'".format(p=percentile))
+    return output_filename
+
+
+NT_TASK_OK = 'ok'        # task finished, details are output filename and result columns kept (see keep_result_columns)
+NT_TASK_ERROR = 'error'  # task stopped by error, details are error message (trace logged by worker)
+
+
+def _partitioning_nt_worker(task, keep_columns=None):
+    """
+    Worker process entry point for a single (ustar_type, year, percentile) task.
+    Exceptions are logged with their trace and returned as status and message,
+    to be merged by merge_nt_task_results
+
+    :param task: arguments for partitioning_nt_task (siteid, nt_output_dir, ustar_type, iteration, year, percentile, latitude)
+    :type task: tuple
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process (see keep_result_columns)
+    :type keep_columns: list
+    :rtype: tuple (status, details)
+    """
+    ustar_type = task[2]
+    try:
+        output_filename = partitioning_nt_task(whole_dataset_nee=get_task_dataset(ustar_type), whole_dataset_meteo=get_task_dataset(PARTITIONING_METEO_KEY), keep_columns=keep_columns, *task)
+        return NT_TASK_OK, (output_filename, pop_result_columns(filename=output_filename))
+    except Exception as e:
+        msg = "NT partitioning task failed (ustar_type={u}, year={y}, percentile={p}): {t}: {e}".format(u=ustar_type, y=task[4], p=task[5], t=type(e).__name__, e=e)
+        log_trace(exception=e, level=logging.CRITICAL, log=_log)
+        _log.critical(msg)
+        return NT_TASK_ERROR, msg
+
+
+def merge_nt_task_results(results):
+    """
+    Merges results from NT partitioning tasks run in parallel: result columns
+    of all finished tasks are kept, then the first failed task (in serial order)
+    determines the exception raised
+
+    :param results: list of (status, details) results from _partitioning_nt_worker, same order as tasks
+    :type results: list (of tuple)
+    """
+    first_error = None
+    for status, details in results:
+        if status == NT_TASK_ERROR:
+            if first_error is None:
+                first_error = details
+        else:
+            output_filename, kept = details
+            if kept:
+                store_result_columns(filename=output_filename, columns=kept)
+
+    if first_error is not None:
+        raise ONEFluxPartitionError(first_error)
 
 
 
@@ -223,6 +339,7 @@ def flux_partition(data, lat, tempvar='tair', nomsg=False, temp_output_filename=
     data, _, _ = newselif(data=data, condition=neenight_mask, drop=False, columns=['neenight'])
 
 
+    phase_begin = resource_usage(children=False)
     ###############################################################################################
     ### FIRST OPTIMIZATION FOR FULL YEAR ##########################################################
     # estimate parameters using optimization on full year of data
@@ -247,6 +364,8 @@ def flux_partition(data, lat, tempvar='tair', nomsg=False, temp_output_filename=
     n_regr = 0                                                 ### counter of number of regressions/optimizations
 
     window_steps = range(julmin, julmax + 1, STEP_SIZE)
+    window_index = WindowIndex(days=juldays, starts=window_steps, size=WINDOW_SIZE)
+    window_valid_mask = not_nan(fcn) & not_nan(tair)
 
     # TODO: (potential) add e0_1_list, e0_2_list, e0_3_list, and corresponding se and idx to track individual
 
@@ -256,19 +375,18 @@ def flux_partition(data, lat, tempvar='tair', nomsg=False, temp_output_filename=
     # lists of entry indices for each step/window with successful execution
     indices_half_list, indices_first_list, indices_last_list, indices_len_list = [], [], [], []
 
-    for jday in window_steps:
+    for window, jday in enumerate(window_steps):
 #        print                                  # TODO: remove
 #        print '--- jday start: ', jday, ' ---' # TODO: remove
         jday_all_list.append(jday)
         pvalue, nee_std, ta_std, ls_status, ls_msg = 'nan', 'nan', 'nan', -10, '' # selected non-execution status flag and message
-        # window (days interval) and non-NA mask to be used in current step
-        w_mask = (juldays >= jday) & (juldays < jday + WINDOW_SIZE) & not_nan(fcn) & not_nan(tair) #*****************************
-        w_where = numpy.where(w_mask)[0]
-        w_len = numpy.sum(w_mask)
+        # indices of window (days interval) entries with non-NA values to be used in current step
+        w_where = window_index.indices(window=window, valid_mask=window_valid_mask)
+        w_len = len(w_where)
 
         if w_len > MIN_ENTRIES:
-            subdata = data[w_mask]
-            temp_range = numpy.max(tair[w_mask]) - numpy.min(tair[w_mask])
+            subdata = data[w_where]
+            temp_range = numpy.max(tair[w_where]) - numpy.min(tair[w_where])
             if temp_range >= MIN_TRANGE:
                 status, rref, e0, rref_se, e0_se, residuals, covariance_matrix, ls_status, ls_msg, pvalue, nee_std, ta_std = nlinlts1(data=subdata)
 
@@ -334,6 +452,8 @@ def flux_partition(data, lat, tempvar='tair', nomsg=False, temp_output_filename=
     stats['indices_len'][:] = indices_len_list
 
     _log.debug('Finished windowed/short term paramater optimization')
+    record_phase(label='window_fits', begin=phase_begin)
+    phase_begin = resource_usage(children=False)
     #### SECOND OPTIMIZATION FOR 5 DAY STEPS, 14 DAY WINDOWS ######################################
     ###############################################################################################
 
@@ -486,11 +606,68 @@ def flux_partition(data, lat, tempvar='tair', nomsg=False, temp_output_filename=
 
 
     result = data
+    record_phase(label='flux', begin=phase_begin)
 
     _log.debug('Finished NT flux partition main function')
     return result
 
-def reanalyse_rref(data, e0, tempvar='tair', step=4, moving_window=8):
+RREF_LINEAR_SOLVER = True  # use closed-form solution for rref refit (False uses iterative least squares only)
+
+def rref_linear_fit(lloyd_fac, reco):
+    """
+    Closed-form least squares estimate of reference respiration (rref)
+    for fixed temperature sensitivity (model reco = rref * lloyd_fac is
+    linear in rref), and its standard error
+
+    :param lloyd_fac: Lloyd-Taylor temperature factor (model with rref=1.0)
+    :type lloyd_fac: numpy.ndarray
+    :param reco: observed ecosystem respiration (night-time NEE)
+    :type reco: numpy.ndarray
+    :rtype: tuple (rref, standard error), or None if no solution can be computed
+    """
+    lloyd_fac = numpy.asarray(lloyd_fac, dtype=numpy.float64)
+    reco = numpy.asarray(reco, dtype=numpy.float64)
+    entries = reco.size
+
+    sum_fac_squared = numpy.dot(lloyd_fac, lloyd_fac)
+    if entries < 1 or not numpy.isfinite(sum_fac_squared) or sum_fac_squared <= 0.0:
+        return None
+
+    rref = numpy.dot(lloyd_fac, reco) / sum_fac_squared
+    if not numpy.isfinite(rref):
+        return None
+
+    if entries > 1:
+        residuals = rref * lloyd_fac - reco
+        rref_se = numpy.sqrt(numpy.dot(residuals, residuals) / (entries - 1) / sum_fac_squared)
+    else:
+        rref_se = numpy.nan
+
+    return rref, rref_se
+
+
+def rref_iterative_fit(lloyd_fac, reco):
+    """
+    Iterative least squares estimate of reference respiration (rref)
+    for fixed temperature sensitivity (original implementation, used
+    as fallback if closed-form solution cannot be computed)
+
+    :param lloyd_fac: Lloyd-Taylor temperature factor (model with rref=1.0)
+    :type lloyd_fac: numpy.ndarray
+    :param reco: observed ecosystem respiration (night-time NEE)
+    :type reco: numpy.ndarray
+    :rtype: tuple (rref, standard error)
+    """
+    parameters, std_devs, ls_status, ls_msg, residuals, covariance_matrix = least_squares(func=lambda b: ((b * lloyd_fac - reco) ** 2).sum(),
+                                                                                          initial_guess=(0.1,),
+                                                                                          entries=len(reco),
+                                                                                          iterations=1000 * (len(reco) + 1),
+                                                                                          return_residuals_cov_mat=True)
+    # TODO: compute correct values of SEs (maybe single variable least_squares optimization works differently?)
+    return parameters[0], numpy.sqrt(std_devs[0])
+
+
+def reanalyse_rref(data, e0, tempvar='tair', step=4, moving_window=8, linear=RREF_LINEAR_SOLVER):
     """
     Estimates reference respiration (rref) values based on fixed
     temperature sensitivity value (e0)  
@@ -505,6 +682,8 @@ def reanalyse_rref(data, e0, tempvar='tair', step=4, moving_window=8):
     :type step: int
     :param moving_window: window size for each iteration (in days)
     :type moving_window: int
+    :param linear: if True, uses closed-form solution (iterative least squares as fallback)
+    :type linear: bool
     """
     julday = data['julday'] + (data['hr'] / 24.0)
 
@@ -520,44 +699,38 @@ def reanalyse_rref(data, e0, tempvar='tair', step=4, moving_window=8):
 
     # compute and iterate over integer day-of-year
     julday_int = (julday + 0.5).astype('i8')
-    for j in range(1, int(julday[-1]), step):
-        mask = (julday_int >= j) & (julday_int < (j + moving_window)) & (data[tempvar] > -1000.) & (data['neenight'] > -1000.)
-        idx = numpy.where(mask)[0]
-        count = numpy.sum(mask)
+    window_index = WindowIndex(days=julday_int, starts=range(1, int(julday[-1]), step), size=moving_window)
+    window_valid_mask = (data[tempvar] > -1000.) & (data['neenight'] > -1000.)
+    for window in range(len(window_index)):
+        # indices of entries with valid values in window
+        idx = window_index.indices(window=window, valid_mask=window_valid_mask)
+        count = len(idx)
 
         if count > 2:
-            mask2 = (julday_int >= j) & (julday_int < (j + moving_window))
-            idx2 = numpy.where(mask2)[0]
-            count2 = numpy.sum(mask2)
-            #mid = idx2[count2 / 2] # unused step (?)
+            #mid = idx2[count2 / 2] # unused step (?), idx2 were all window entries
             mid = int(numpy.average(idx))
-            e0_average = numpy.average(e0_array[mask])
-            tair_average = numpy.average(data[tempvar][mask])
-            reco_average = numpy.average(data['neenight'][mask])
-            lloyd_fac = lloyd_taylor(ta=data[tempvar][mask], rref=1.0, e0=e0_average)
+            e0_average = numpy.average(e0_array[idx])
+            tair_average = numpy.average(data[tempvar][idx])
+            reco_average = numpy.average(data['neenight'][idx])
+            lloyd_fac = lloyd_taylor(ta=data[tempvar][idx], rref=1.0, e0=e0_average)
 
-            parameters, std_devs, ls_status, ls_msg, residuals, covariance_matrix = least_squares(func=lambda b: ((b * lloyd_fac - data['neenight'][mask]) ** 2).sum(),
-                                                                                                  initial_guess=(0.1,),
-                                                                                                  entries=len(data['neenight'][mask]),
-                                                                                                  iterations=1000 * (len(data['neenight'][mask]) + 1),
-                                                                                                  return_residuals_cov_mat=True)
+            reco = data['neenight'][idx]
 
             # oktrim = where(abs(NEENight(ok) - recoAvg) LT pct(abs(NEENight(ok) - recoAvg), 95.) )
-            mask_trim = numpy.absolute(data['neenight'][mask] - reco_average) < pct(array=numpy.absolute(data['neenight'][mask] - reco_average), percent=95.0)
-            idx_trim = numpy.where(mask_trim)[0]
-            parameters_trim, std_devs_trim, ls_status_trim, ls_msg_trim, residuals_trim, covariance_matrix_trim = least_squares(func=lambda b: ((b * lloyd_fac[mask_trim] - data['neenight'][mask][mask_trim]) ** 2).sum(),
-                                                                                                                                initial_guess=(0.1,),
-                                                                                                                                entries=len(data['neenight'][mask][mask_trim]),
-                                                                                                                                iterations=1000 * (len(data['neenight'][mask][mask_trim]) + 1),
-                                                                                                                                return_residuals_cov_mat=True)
+            mask_trim = numpy.absolute(reco - reco_average) < pct(array=numpy.absolute(reco - reco_average), percent=95.0)
+
+            # rref is linear on lloyd_fac for fixed e0, closed-form solution used if possible
+            fit = (rref_linear_fit(lloyd_fac=lloyd_fac, reco=reco) if linear else None)
+            rref, rref_se = (fit if fit is not None else rref_iterative_fit(lloyd_fac=lloyd_fac, reco=reco))
+            fit_trim = (rref_linear_fit(lloyd_fac=lloyd_fac[mask_trim], reco=reco[mask_trim]) if linear else None)
+            rref_trim, rref_trim_se = (fit_trim if fit_trim is not None else rref_iterative_fit(lloyd_fac=lloyd_fac[mask_trim], reco=reco[mask_trim]))
 
             # assign calculated rref and rref se, non-trimmed and trimmed, to mid point timestamp
             # also replaces assign_empty_vars calls
-            # TODO: compute correct values of SEs (maybe single variable least_squares optimization works differently?)
-            data['rrefoptord'][mid] = (parameters[0] if parameters[0] > 1e-6 else 1e-6)
-            data['rrefoptord_se'][mid] = numpy.sqrt(std_devs[0])
-            data['rrefopttrim'][mid] = (parameters_trim[0] if parameters_trim[0] > 1e-6 else 1e-6)
-            data['rrefopttrim_se'][mid] = numpy.sqrt(std_devs_trim[0])
+            data['rrefoptord'][mid] = (rref if rref > 1e-6 else 1e-6)
+            data['rrefoptord_se'][mid] = rref_se
+            data['rrefopttrim'][mid] = (rref_trim if rref_trim > 1e-6 else 1e-6)
+            data['rrefopttrim_se'][mid] = rref_trim_se
 
     # start interpolation of all computed variables
     ipolmiss(data=data, variable='rrefoptord')
@@ -767,11 +940,39 @@ def nlinlts1(data, func=lloyd_taylor, depvar='neenight', indepvar='tair', npara=
 
         return residuals
 
+    model_jacobian = (get_model_jacobian(lloyd_taylor) if ANALYTIC_JACOBIAN else None)
+
+    def trimmed_residuals_jac(par, nee=clean_dep, temp=data[indepvar], trim_perc=trim_perc):
+        """
+        (inner) Jacobian of trimmed_residuals, from analytic Jacobian of
+        model (NAs and trimmed residuals have zero derivatives)
+
+        :param nee: array with (non-cleaned) nee values (dependent variable)
+        :type nee: numpy.ndarray
+        :param temp: array with (cleaned, no NAs) temperature (independent variable)
+        :type temp: numpy.ndarray
+        :param trim_perc: percentiled to be trimmed off
+        :type trim_perc: float
+        """
+        rref, e0 = par
+        nonnan_nee_mask = not_nan(nee)
+        jac = -1 * model_jacobian(ta=temp, rref=rref, e0=e0).T
+        jac[~nonnan_nee_mask] = 0.0
+
+        if trim_perc != 0.0:
+            residuals = nee - lloyd_taylor(ta=temp, rref=rref, e0=e0)
+            residuals[~nonnan_nee_mask] = 0.0
+            absolute_residuals = numpy.abs(residuals)
+            jac[absolute_residuals > pct(absolute_residuals, 100.0 - trim_perc)] = 0.0
+
+        return jac
+
     parameters, std_devs, ls_status, ls_msg, residuals, covariance_matrix = least_squares(func=trimmed_residuals,
                                                                                           initial_guess=xguess,
                                                                                           entries=len(clean_dep),
                                                                                           iterations=1000 * (len(clean_dep) + 1),
-                                                                                          return_residuals_cov_mat=True)
+                                                                                          return_residuals_cov_mat=True,
+                                                                                          dfunc=(trimmed_residuals_jac if model_jacobian is not None else None))
     est_rref, est_e0 = parameters
     est_rref_std, est_e0_std = std_devs
 
@@ -807,50 +1008,9 @@ def nlinlts1(data, func=lloyd_taylor, depvar='neenight', indepvar='tair', npara=
     return status, est_rref, est_e0, est_rref_std, est_e0_std, new_residuals, covariance_matrix, ls_status, ls_msg, pvalue, nee_std, ta_std
 
 
-
-def pct(array, percent):
-    """
-    Calculates "percent" percentile of array -- not really a percentile,
-    but similar intention. Following implementation in original code.
-    
-    :param array: 1-d array to be used in calculation
-    :type array: numpy.ndarray
-    :param percent: target percent value for percentile
-    :type percent: float
-    """
-
-    nonnan_mask = not_nan(array)
-    if numpy.sum(nonnan_mask) > 1:
-        nonnan_array = array[nonnan_mask]
-    else:
-        msg = "No non-NA value in percentile calculation"
-        _log.critical(msg)
-        raise ONEFluxError(msg)
-
-    # indices of ascending ranking of entries in array
-    rank_idx_array = rankdata(nonnan_array, method='ordinal')
-    critical_rank = len(nonnan_array) * percent / 100.
-    over_critical_rank_mask = (rank_idx_array > critical_rank)
-
-    # if no index over critical rank, return max values
-    if numpy.sum(over_critical_rank_mask) == 0.0:
-        return numpy.max(nonnan_array)
-
-    ### smallest rank that is greater than critical rank (or SM-RK-GT-CR)
-    critical_rank_idx = numpy.where(rank_idx_array == numpy.min(rank_idx_array[over_critical_rank_mask]))
-
-    ### rank immediately before (SM-RK-GT-CR)
-    critical_rank_idx_previous = numpy.where(rank_idx_array == (numpy.min(rank_idx_array[over_critical_rank_mask]) - 1))
-
-    if critical_rank.is_integer() and (numpy.sum(critical_rank_idx_previous) != 0):
-        return numpy.average([nonnan_array[critical_rank_idx[0]], nonnan_array[critical_rank_idx_previous[0]]])
-    else:
-        return nonnan_array[critical_rank_idx[0]][0]
-
-
 STEP_BOUND_FACTOR = 0.25    # factor to restrict initial step  (default in scipy is 100.0, but PV-Wave seems to be closer to 0.1)
 NO_CONVERGENCE_RETRY = 20  # multiplicative factor to increase number of iterations allowed for retrying optimization that did not converge
-def least_squares(func, initial_guess, entries, iterations=None, stop=False, return_residuals_cov_mat=False):
+def least_squares(func, initial_guess, entries, iterations=None, stop=False, return_residuals_cov_mat=False, dfunc=None):
     """
     Wrapper for least squares paramater optimization
     
@@ -873,19 +1033,21 @@ def least_squares(func, initial_guess, entries, iterations=None, stop=False, ret
     :type stop: bool
     :param return_residuals_cov_mat: returns residuals and covariance matrix if True
     :type return_residuals_cov_mat: bool
+    :param dfunc: Jacobian of func (one row per entry of func result), if None uses finite differences
+    :type dfunc: function
     :rtype: 4-tuple (of tuple estimated parameters and corresponding std_devs), or 6-tuple
     """
     if iterations is None:
         iterations = 1000 * (len(entries) + 1)
 
     # call to scipy.optimize.leastsq (implementation of the Levenberg-Marquardt algorithm)
-    pars, cov_x, info, msg, success = leastsq(func=func, x0=initial_guess, full_output=True, maxfev=iterations, factor=STEP_BOUND_FACTOR)
+    pars, cov_x, info, msg, success = leastsq(func=func, x0=initial_guess, Dfun=dfunc, full_output=True, maxfev=iterations, factor=STEP_BOUND_FACTOR)
 
     if success != 1:# and (info['nfev'] == iterations):
         if info['nfev'] >= iterations:
             if not stop:
                 _log.warning("No convergence (code '{p}'), retrying ({r}-fold limit increase). Least squares message: [[{m}]]".format(p=success, r=NO_CONVERGENCE_RETRY, m=msg.replace('\r', ' ').replace('\n', ' ')))
-                return least_squares(func=func, initial_guess=initial_guess, entries=entries, iterations=iterations * NO_CONVERGENCE_RETRY, stop=True, return_residuals_cov_mat=return_residuals_cov_mat)
+                return least_squares(func=func, initial_guess=initial_guess, entries=entries, iterations=iterations * NO_CONVERGENCE_RETRY, stop=True, return_residuals_cov_mat=return_residuals_cov_mat, dfunc=dfunc)
             else:
                 _log.warning("No convergence (code '{p}'), stopping. Least squares message: [[{m}]]".format(p=success, m=msg.replace('\r', ' ').replace('\n', ' ')))
         else:
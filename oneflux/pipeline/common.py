@@ -22,11 +22,16 @@ import numpy
 import socket
 import shutil
 import fnmatch
+import time
+import signal
+import threading
+import subprocess
 
 from datetime import datetime, date, timedelta
 
 from oneflux import ONEFluxError
 from oneflux.utils.strings import is_int
+from oneflux.utils.files import block_md5
 from oneflux.pipeline.variables_codes import VARIABLE_LIST_MUST_BE_PRESENT, VARIABLE_LIST_SHOULD_BE_PRESENT, VARIABLE_LIST_COULD_BE_PRESENT
 
 log = logging.getLogger(__name__)
@@ -152,6 +157,12 @@ class ONEFluxPipelineError(ONEFluxError):
     """
     pass
 
+class ONEFluxPipelineTimeoutError(ONEFluxPipelineError):
+    """
+    Pipeline external tool did not finish within timeout
+    """
+    pass
+
 def run_command(cmd):
     """
     Runs command and tests return value, raises exception if failed
@@ -176,6 +187,150 @@ def run_command(cmd):
         log.error(msg)
         raise ONEFluxPipelineError(msg)
 
+TOOL_TIMEOUT = None       # default timeout in seconds for external tools (None waits indefinitely)
+TOOL_POLL_INTERVAL = 0.5  # maximum seconds between checks for tool completion (starts at 0.01, doubling)
+TOOL_KILL_WAIT = 10.0     # seconds between terminating tool (after timeout) and killing it
+def run_tool(args, label, cwd=None, output_log=None, timeout=TOOL_TIMEOUT, env=None):
+    """
+    Runs external tool from argument list (no shell), streaming its output
+    (stdout and stderr) into output_log and into log (DEBUG level);
+    raises exception if tool fails or does not finish within timeout.
+    On POSIX systems, tool runs in its own process group, so processes it
+    starts are also terminated; resource usage is for the tool process and
+    its children (not available on Windows)
+
+    :param args: tool executable followed by its arguments
+    :type args: list
+    :param label: label for tool being run (logging only)
+    :type label: str
+    :param cwd: working directory for tool (current if None)
+    :type cwd: str
+    :param output_log: file receiving tool output (not saved if None)
+    :type output_log: str
+    :param timeout: seconds until tool is terminated (None waits indefinitely)
+    :type timeout: float
+    :param env: environment variables for tool (same as current if None)
+    :type env: dict
+    :rtype: dict (label, args, returncode, elapsed, cpu_user, cpu_system, and max_rss (KiB on Linux) of the tool)
+    """
+    # PRI 2020/10/21 - change forward slash to back slash (Windows)
+    if platform.system() == "Windows":
+        args = [a.replace("/", "\\") for a in args]
+    log.debug("Pipeline {l} running: {a} (in '{d}')".format(l=label, a=args, d=cwd))
+    output = (open(output_log, 'w') if output_log is not None else None)
+    ts_begin = time.time()
+    try:
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   close_fds=(os.name == 'posix'), preexec_fn=(os.setsid if os.name == 'posix' else None))
+    except OSError as e:
+        if output is not None:
+            output.close()
+        msg = "Pipeline {l} could not start '{c}': {e}".format(l=label, c=args[0], e=str(e))
+        log.critical(msg)
+        raise ONEFluxPipelineError(msg)
+
+    def stream_output():
+        for line in iter(process.stdout.readline, ''):
+            if output is not None:
+                output.write(line)
+            log.debug("Pipeline {l} output: {o}".format(l=label, o=line.rstrip()))
+        process.stdout.close()
+    reader = threading.Thread(target=stream_output, name='{l}_output'.format(l=label))
+    reader.daemon = True
+    reader.start()
+
+    def signal_tool(kill=False):
+        if os.name == 'posix':
+            try:
+                os.killpg(process.pid, (signal.SIGKILL if kill else signal.SIGTERM))
+            except OSError:
+                pass
+        elif kill:
+            process.kill()
+        else:
+            process.terminate()
+
+    # wait4 (POSIX) reaps the tool process and returns its own resource usage
+    usage, timed_out, terminated_at, interval = None, False, None, 0.01
+    try:
+        while process.returncode is None:
+            if hasattr(os, 'wait4'):
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                if pid != 0:
+                    usage = rusage
+                    process.returncode = (-os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status))
+                    break
+            elif process.poll() is not None:
+                break
+            now = time.time()
+            if (timeout is not None) and (not timed_out) and (now - ts_begin > timeout):
+                log.error("Pipeline {l} timed out after {t}s, terminating".format(l=label, t=timeout))
+                timed_out, terminated_at = True, now
+                signal_tool()
+            elif timed_out and (now - terminated_at > TOOL_KILL_WAIT):
+                signal_tool(kill=True)
+            time.sleep(interval)
+            interval = min(interval * 2, TOOL_POLL_INTERVAL)
+    except BaseException:
+        # interrupted while waiting (e.g., KeyboardInterrupt), tool not left running
+        signal_tool(kill=True)
+        raise
+    elapsed = time.time() - ts_begin
+    if timed_out:
+        # processes started by tool may still hold its output open
+        signal_tool(kill=True)
+    reader.join()
+    if output is not None:
+        output.close()
+
+    stats = {'label': label,
+             'args': list(args),
+             'returncode': process.returncode,
+             'elapsed': elapsed,
+             'cpu_user': (usage.ru_utime if usage is not None else None),
+             'cpu_system': (usage.ru_stime if usage is not None else None),
+             'max_rss': (usage.ru_maxrss if usage is not None else None),
+            }
+    log.info("Pipeline {l} finished: exit code {r}, elapsed {e:.1f}s, CPU user {u}s, CPU system {s}s, peak RSS {m} KiB".format(
+        l=label, r=stats['returncode'], e=elapsed, u=stats['cpu_user'], s=stats['cpu_system'], m=stats['max_rss']))
+
+    if timed_out:
+        msg = "Pipeline {l} did not finish within {t}s: {c}".format(l=label, t=timeout, c=args)
+        log.critical(msg)
+        raise ONEFluxPipelineTimeoutError(msg)
+    if process.returncode != 0:
+        msg = "Non-clean execution of : {c} (exit code {r})".format(c=args, r=process.returncode)
+        log.error(msg)
+        raise ONEFluxPipelineError(msg)
+    return stats
+
+def copy_files(tdir, pattern, destination, label):
+    """
+    Copies files matching pattern in directory into destination directory,
+    raises exception if no files match
+
+    :param tdir: path to directory with files to be copied
+    :type tdir: str
+    :param pattern: file name pattern (fnmatch) of files to be copied
+    :type pattern: str
+    :param destination: path to destination directory
+    :type destination: str
+    :param label: label for type of files being copied
+    :type label: str
+    :rtype: list (of copied file paths)
+    """
+    filenames = sorted(fnmatch.filter(os.listdir(tdir), pattern))
+    if not filenames:
+        msg = "Pipeline {l} no files with pattern '{p}' in '{d}'".format(l=label, p=pattern, d=tdir)
+        log.critical(msg)
+        raise ONEFluxPipelineError(msg)
+    copied = []
+    for f in filenames:
+        shutil.copy2(os.path.join(tdir, f), destination)
+        copied.append(os.path.join(destination, f))
+    log.debug("Pipeline {l} copied {n} files '{p}' from '{o}' to '{d}'".format(l=label, n=len(copied), p=pattern, o=tdir, d=destination))
+    return copied
+
 def test_dir(tdir, label, log_only=False):
     """
     Tests if directory exists, if not logs error and raises exception
@@ -447,6 +602,47 @@ def create_and_empty_dir(tdir, label, suffix=datetime.now().strftime("%Y%m%d%H%M
         log.debug("Created '{d}'".format(d=tdir))
         return True
 
+def list_dir_files(tdir):
+    """
+    Lists all files in directory and its subdirectories
+
+    :param tdir: path to directory
+    :type tdir: str
+    :rtype: list (of paths relative to tdir, sorted)
+    """
+    filenames = []
+    for root, _, files in os.walk(tdir):
+        for f in files:
+            filenames.append(os.path.relpath(os.path.join(root, f), tdir))
+    return sorted(filenames)
+
+def hash_files(filenames, cache=None):
+    """
+    Computes md5sum of contents of files; if cache is provided,
+    files unchanged (same size and modification time) since they
+    were last hashed are not read again
+
+    :param filenames: paths to files
+    :type filenames: list
+    :param cache: md5sums keyed by (path, size, modification time), updated in place
+    :type cache: dict
+    :rtype: dict (md5sum by path)
+    """
+    hashes = {}
+    for filename in filenames:
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        if cache is not None and key in cache:
+            hashes[filename] = cache[key]
+            continue
+        hashes[filename] = block_md5(filename=filename)
+        if cache is not None:
+            cache[key] = hashes[filename]
+    return hashes
+
+FINGERPRINT_FILENAME = 'fingerprint_{s}.json' # site step fingerprints manifest (incremental mode), in site directory
+CHECKPOINT_FILENAME = 'checkpoint_{s}.json' # site checkpoint manifest (steps completed and validated), in site directory
+
 def get_headers(filename):
     """
     Parse headers from FPFileV2 format and returns list
@@ -24,7 +24,9 @@ from datetime import datetime, timedelta
 from math import ceil
 
 from oneflux import ONEFluxError
-from oneflux.utils.files import check_create_directory, file_stat, zip_file_list
+from oneflux.utils.files import check_create_directory, file_stat, zip_file_list, genfromtxt_cached
+from oneflux.utils.strings import decode_timestamps, timestamps_to_datetime64
+from oneflux.utils.writers import write_csv
 
 from oneflux.pipeline.variables_codes import VARIABLE_LIST_FULL, VARIABLE_LIST_SUB, PERC_LABEL, \
                                               TIMESTAMP_VARIABLE_LIST, FULL_D, QC_FULL_D
@@ -137,6 +139,8 @@ def add_year_records(data, res, year):
     return new_data
 
 
+SAVE_MISSING_VALUES = (-9999.0, -9999.9) # values written as '-9999' in product files
+
 def save_csv_txt(filename, data, delimiter=',', newline='\n', header=None):
     """
     Save procedure for properly handling missing values (from fpp.formats.common.py)
@@ -155,13 +159,8 @@ def save_csv_txt(filename, data, delimiter=',', newline='\n', header=None):
     if header is None:
         header = delimiter.join(data.dtype.names)
 
-    with open(filename, 'w') as f:
-        f.write(header + newline)
-        for i, row in enumerate(data):
-            if i % 1000 == 0:
-                log.debug("Writing {f}: line {l}".format(f=filename, l=i))
-            line = delimiter.join("-9999" if (value == -9999.0 or value == -9999.9)  else str(value) for value in row)
-            f.write(line + newline)
+    log.debug("Writing {f}: {l} lines".format(f=filename, l=len(data)))
+    write_csv(filename=filename, data=data, delimiter=delimiter, newline=newline, header=header, missing='-9999', missing_values=SAVE_MISSING_VALUES)
 
 
 def get_headers_qc(filename, delimiter=','):
@@ -219,11 +218,11 @@ def get_dtype(variable, resolution):
             return 'i8'
     return 'f8'
 
-def _load_data(filename, resolution, headers=None, skip_header=0):
+def _load_data(filename, resolution, headers=None, skip_header=0, cache_dir=None):
     if headers is None:
         headers = get_headers(filename=filename)
     dtype = [(h, get_dtype(h, resolution)) for h in headers]
-    data = numpy.genfromtxt(fname=filename, dtype=dtype, names=True, delimiter=",", skip_header=skip_header, usemask=False)
+    data = genfromtxt_cached(fname=filename, cache_dir=cache_dir, dtype=dtype, names=True, delimiter=",", skip_header=skip_header, usemask=False)
     data = numpy.atleast_1d(data)
 
     if resolution == 'hh':
@@ -312,7 +311,7 @@ def _load_data(filename, resolution, headers=None, skip_header=0):
     return data
 
 
-def load_qcdata(siteid, ddir, firsty, lasty, output_resolution='HH'):
+def load_qcdata(siteid, ddir, firsty, lasty, output_resolution='HH', cache_dir=None):
 
     filelist = test_pattern(tdir=ddir, tpattern="*_qcv_*.csv", label='gen_data_products_site')
 
@@ -353,7 +352,7 @@ def load_qcdata(siteid, ddir, firsty, lasty, output_resolution='HH'):
 
             log.debug("Loading qc-data/{r} file: {f}".format(r=resolution, f=filename))
             headers, first_numeric_line, _, headers_line, first_lines = get_headers_qc(filename=filename)
-            data = _load_data(filename=filename, resolution=resolution, headers=headers, skip_header=first_numeric_line - 1)
+            data = _load_data(filename=filename, resolution=resolution, headers=headers, skip_header=first_numeric_line - 1, cache_dir=cache_dir)
             header_list = header_list + [entry for entry in data.dtype.names if entry not in header_list]
         data_list.append(data)
         line_count += data.size
@@ -445,9 +444,99 @@ def merge_qcdata_res(qcdata, output, res):
 
     return d
 
+def group_sums(values, groups, n_groups):
+    """
+    Sums values by group index, same as numpy.sum(values[groups == g]) for each
+    group g (same order of entries and same pairwise summation, so results are
+    identical); entries with negative group index are ignored
+
+    :param values: values to be summed
+    :type values: numpy.ndarray
+    :param groups: group index for each value (-1 to ignore value)
+    :type groups: numpy.ndarray
+    :param n_groups: number of groups
+    :type n_groups: int
+    :rtype: tuple (numpy.ndarray of sums, numpy.ndarray of counts)
+    """
+    order = numpy.argsort(groups, kind='mergesort')
+    order = order[groups[order] >= 0]
+    counts = numpy.bincount(groups[order], minlength=n_groups)
+    starts = numpy.cumsum(counts) - counts
+    sorted_values = values[order]
+    sums = numpy.zeros(n_groups, dtype=sorted_values.dtype)
+
+    # summation depends only on number of entries, so groups of same size are reduced together as rows
+    for size in numpy.unique(counts[counts > 0]):
+        size_groups = numpy.flatnonzero(counts == size)
+        sums[size_groups] = numpy.add.reduce(sorted_values[starts[size_groups][:, numpy.newaxis] + numpy.arange(size)], axis=1)
+
+    return sums, counts
+
+def group_means(values, groups, n_groups):
+    """
+    Means of values by group index, same as numpy.mean(values[groups == g]) for each
+    group g; entries with negative group index are ignored, empty groups set to NaN
+
+    :param values: values to be averaged
+    :type values: numpy.ndarray
+    :param groups: group index for each value (-1 to ignore value)
+    :type groups: numpy.ndarray
+    :param n_groups: number of groups
+    :type n_groups: int
+    :rtype: tuple (numpy.ndarray of means, numpy.ndarray of counts)
+    """
+    sums, counts = group_sums(values=values, groups=groups, n_groups=n_groups)
+    means = numpy.empty(n_groups, dtype=sums.dtype)
+    means.fill(numpy.nan)
+    nonempty = (counts > 0)
+    means[nonempty] = sums[nonempty] / counts[nonempty]
+    return means, counts
+
+def aggregate_group_means(values, groups, n_groups, perc=None):
+    """
+    Aggregates values by group index into means of valid (> -9999) values
+    and fraction of valid values, with aggregation set to missing (-9999)
+    if fraction of valid values is not above 0.5; if perc (fraction of valid
+    values for each entry) is given, fraction is the average of perc
+    (with missing set to zero), otherwise the fraction of valid entries
+
+    :param values: values to be aggregated
+    :type values: numpy.ndarray
+    :param groups: group index for each value (-1 to ignore value)
+    :type groups: numpy.ndarray
+    :param n_groups: number of groups
+    :type n_groups: int
+    :param perc: fraction of valid values for each entry (finer resolution)
+    :type perc: numpy.ndarray
+    :rtype: tuple (numpy.ndarray of means, numpy.ndarray of fractions)
+    """
+    valid = (values > -9999)
+    means, _ = group_means(values=values, groups=numpy.where(valid, groups, -1), n_groups=n_groups)
+    if perc is None:
+        counts_valid = numpy.bincount(groups[valid & (groups >= 0)], minlength=n_groups)
+        counts_all = numpy.bincount(groups[groups >= 0], minlength=n_groups)
+        fraction = counts_valid.astype('f8') / counts_all
+    else:
+        fraction, _ = group_means(values=numpy.where(perc <= -9999, 0.0, perc), groups=groups, n_groups=n_groups)
+
+    above = (fraction > 0.5)
+    return numpy.where(above, means, -9999), numpy.where(above, fraction, -9999)
+
+def date_labels(days):
+    """
+    Formats dates as YYYYMMDD labels
+
+    :param days: dates
+    :type days: numpy.ndarray (dtype datetime64[D])
+    :rtype: numpy.ndarray (dtype str)
+    """
+    return numpy.char.replace(numpy.datetime_as_string(days, unit='D'), '-', '')
+
 def aggregate_qcdata(qcdata):
     """
-    Create DD, WW, MM, and YY aggregations for QC Data from HH
+    Create DD, WW, MM, and YY aggregations for QC Data from HH;
+    integer day/week/month/year indices are computed once from timestamps
+    and all aggregations are grouped reductions over these indices
     
     :param qcdata: QC Data array
     :type qcdata: numpy.recarray
@@ -455,38 +544,29 @@ def aggregate_qcdata(qcdata):
 
     # DD
     log.debug('Aggregating daily DD QC Data')
-    curr_ts, last_ts = datetime.strptime(qcdata['TIMESTAMP_START'][0], '%Y%m%d%H%M'), datetime.strptime(qcdata['TIMESTAMP_START'][-1], '%Y%m%d%H%M')
-    curr_y, first_y, last_y = curr_ts.year, curr_ts.year, last_ts.year
-    entries_dd = 0
-    while curr_y <= last_y:
-        days_in_year = 366 if calendar.isleap(curr_y) else 365
-        entries_dd += days_in_year
-        curr_y += 1
+    timestamps = timestamps_to_datetime64(decode_timestamps(qcdata['TIMESTAMP_START'], '%Y%m%d%H%M'))
+    first_day = timestamps[0].astype('M8[D]')
+    first_y, last_y = timestamps[0].astype('M8[Y]').astype(int) + 1970, timestamps[-1].astype('M8[Y]').astype(int) + 1970
+    entries_dd = sum((366 if calendar.isleap(y) else 365) for y in range(first_y, last_y + 1))
     dtype = [(vlabel, 'f8') for vlabel in NEW_METEO_VARS if vlabel in qcdata.dtype.names]
     dtype_ext = dtype + [(vlabel + PERC_LABEL, 'f8') for vlabel, _ in dtype]
     dtype_dd = TIMESTAMP_DTYPE_BY_RESOLUTION['dd'] + dtype_ext
     data_dd = numpy.empty(entries_dd, dtype=dtype_dd)
     data_dd.fill(-9999)
-    day_diff = timedelta(hours=24)
-    curr_idx = 0
-    while curr_ts <= last_ts:
-        if curr_idx % 300 == 0:
-            log.debug("Aggregating day {d}".format(d=curr_idx))
-        dd = curr_ts.strftime('%Y%m%d')
-        data_dd['TIMESTAMP'][curr_idx] = dd
-        mask_dd = numpy.char.startswith(qcdata['TIMESTAMP_START'], dd)
-        for vlabel, _ in dtype:
-            values = qcdata[vlabel][mask_dd]
-            perc = float(values[values > -9999].size) / float(values.size)
-            if perc > 0.5:
-                mean = numpy.mean(values[values > -9999])
-            else:
-                mean = -9999
-                perc = -9999
-            data_dd[vlabel][curr_idx] = mean
-            data_dd[vlabel + PERC_LABEL][curr_idx] = perc
-        curr_idx += 1
-        curr_ts += day_diff
+
+    # days from first timestamp, in steps of 24 hours up to last timestamp
+    n_days = int((timestamps[-1] - timestamps[0]).astype(int) // (24 * 60)) + 1
+    days = first_day + numpy.arange(n_days)
+    data_dd['TIMESTAMP'][:n_days] = date_labels(days)
+    hh_day = (timestamps.astype('M8[D]') - first_day).astype(int)
+    hh_day[(hh_day < 0) | (hh_day >= n_days)] = -1
+    empty_days = (numpy.bincount(hh_day[hh_day >= 0], minlength=n_days) == 0)
+    if numpy.any(empty_days):
+        msg = "QC-Data aggregation: no HH records for day {d}".format(d=data_dd['TIMESTAMP'][:n_days][empty_days][0])
+        log.error(msg)
+        raise ONEFluxError(msg)
+    for vlabel, _ in dtype:
+        data_dd[vlabel][:n_days], data_dd[vlabel + PERC_LABEL][:n_days] = aggregate_group_means(values=qcdata[vlabel], groups=hh_day, n_groups=n_days)
 
     # WW
     log.debug('Aggregating weekly WW QC Data')
@@ -494,30 +574,28 @@ def aggregate_qcdata(qcdata):
     dtype_ww = TIMESTAMP_DTYPE_BY_RESOLUTION['ww'] + dtype_ext
     data_ww = numpy.empty((last_y - first_y + 1) * recs_ww, dtype=dtype_ww)
     data_ww.fill(-9999)
-    for idx, year in enumerate(range(first_y, last_y + 1)):
-        first_rec = idx * recs_ww
-        curr_rec = first_rec
-        last_rec = first_rec + recs_ww
-        f = datetime(year, 1, 1, 0, 0)
-        data_ww['TIMESTAMP_START'][first_rec:last_rec] = [(f + timedelta(days=i * 7)).strftime('%Y%m%d') for i in xrange(0, recs_ww)]
-        data_ww['TIMESTAMP_END'][first_rec:last_rec] = [(datetime.strptime(i, '%Y%m%d') + timedelta(days=6)).strftime('%Y%m%d') for i in data_ww['TIMESTAMP_START'][first_rec:last_rec]]
-        data_ww['TIMESTAMP_END'][last_rec - 1] = datetime(year, 12, 31, 0, 0).strftime('%Y%m%d')
-        while curr_rec < last_rec:
-            first_idx, last_idx = numpy.where(data_dd['TIMESTAMP'] == data_ww['TIMESTAMP_START'][curr_rec])[0][0], numpy.where(data_dd['TIMESTAMP'] == data_ww['TIMESTAMP_END'][curr_rec])[0][0]
-            for vlabel, _ in dtype:
-                values = data_dd[vlabel][first_idx:last_idx]
-                values_perc = data_dd[vlabel + PERC_LABEL][first_idx:last_idx]
-                values_perc[values_perc <= -9999] = 0.0
-                perc = numpy.mean(values_perc)
-                if perc > 0.5:
-                    mean = numpy.mean(values[values > -9999])
-                else:
-                    mean = -9999
-                    perc = -9999
-                data_ww[vlabel][curr_rec] = mean
-                data_ww[vlabel + PERC_LABEL][curr_rec] = perc
-            curr_rec += 1
+    year_starts = (numpy.arange(first_y, last_y + 1) - 1970).astype('M8[Y]').astype('M8[D]')
+    week_starts = (year_starts[:, numpy.newaxis] + 7 * numpy.arange(recs_ww)).ravel()
+    week_ends = week_starts + 6
+    week_ends[recs_ww - 1::recs_ww] = (numpy.arange(first_y + 1, last_y + 2) - 1970).astype('M8[Y]').astype('M8[D]') - 1
+    data_ww['TIMESTAMP_START'] = date_labels(week_starts)
+    data_ww['TIMESTAMP_END'] = date_labels(week_ends)
+    first_idx, last_idx = (week_starts - first_day).astype(int), (week_ends - first_day).astype(int)
+    outside = (first_idx < 0) | (first_idx >= n_days) | (last_idx < 0) | (last_idx >= n_days)
+    if numpy.any(outside):
+        msg = "QC-Data aggregation: week {s}-{e} not within daily records".format(s=data_ww['TIMESTAMP_START'][outside][0], e=data_ww['TIMESTAMP_END'][outside][0])
+        log.error(msg)
+        raise ONEFluxError(msg)
 
+    # each week includes days from its first day up to (not including) its last day
+    day_idx = numpy.arange(n_days)
+    dd_week = numpy.searchsorted(first_idx, day_idx, side='right') - 1
+    dd_week[(dd_week < 0) | (day_idx >= last_idx[numpy.maximum(dd_week, 0)])] = -1
+    for vlabel, _ in dtype:
+        # missing daily fractions within weeks are set to zero (also in DD output)
+        dd_perc = data_dd[vlabel + PERC_LABEL][:n_days]
+        dd_perc[(dd_week >= 0) & (dd_perc <= -9999)] = 0.0
+        data_ww[vlabel], data_ww[vlabel + PERC_LABEL] = aggregate_group_means(values=data_dd[vlabel][:n_days], groups=dd_week, n_groups=data_ww.size, perc=dd_perc)
 
     # MM
     log.debug('Aggregating monthly MM QC Data')
@@ -526,20 +604,9 @@ def aggregate_qcdata(qcdata):
     data_mm = numpy.empty((last_y - first_y + 1) * recs_mm, dtype=dtype_mm)
     data_mm.fill(-9999)
     data_mm['TIMESTAMP'] = [str(y) + str(m).zfill(2) for y in range(first_y, last_y + 1) for m in range(1, recs_mm + 1)]
-    for idx, mm in enumerate(data_mm['TIMESTAMP']):
-        mask_mm = numpy.char.startswith(data_dd['TIMESTAMP'], mm)
-        for vlabel, _ in dtype:
-            values = data_dd[vlabel][mask_mm]
-            values_perc = data_dd[vlabel + PERC_LABEL][mask_mm]
-            values_perc[values_perc <= -9999] = 0.0
-            perc = numpy.mean(values_perc)
-            if perc > 0.5:
-                mean = numpy.mean(values[values > -9999])
-            else:
-                mean = -9999
-                perc = -9999
-            data_mm[vlabel][idx] = mean
-            data_mm[vlabel + PERC_LABEL][idx] = perc
+    dd_month = days.astype('M8[M]').astype(int) - (first_y - 1970) * recs_mm
+    for vlabel, _ in dtype:
+        data_mm[vlabel], data_mm[vlabel + PERC_LABEL] = aggregate_group_means(values=data_dd[vlabel][:n_days], groups=dd_month, n_groups=data_mm.size, perc=data_dd[vlabel + PERC_LABEL][:n_days])
 
     # YY
     log.debug('Aggregating yearly YY QC Data')
@@ -547,30 +614,19 @@ def aggregate_qcdata(qcdata):
     data_yy = numpy.empty((last_y - first_y + 1), dtype=dtype_yy)
     data_yy.fill(-9999)
     data_yy['TIMESTAMP'] = [str(y) for y in range(first_y, last_y + 1)]
-    for idx, yy in enumerate(data_yy['TIMESTAMP']):
-        mask_yy = numpy.char.startswith(data_dd['TIMESTAMP'], yy)
-        for vlabel, _ in dtype:
-            values = data_dd[vlabel][mask_yy]
-            values_perc = data_dd[vlabel + PERC_LABEL][mask_yy]
-            values_perc[values_perc <= -9999] = 0.0
-            perc = numpy.mean(values_perc)
-            if perc > 0.5:
-                mean = numpy.mean(values[values > -9999])
-            else:
-                mean = -9999
-                perc = -9999
-            data_yy[vlabel][idx] = mean
-            data_yy[vlabel + PERC_LABEL][idx] = perc
+    dd_year = days.astype('M8[Y]').astype(int) - (first_y - 1970)
+    for vlabel, _ in dtype:
+        data_yy[vlabel], data_yy[vlabel + PERC_LABEL] = aggregate_group_means(values=data_dd[vlabel][:n_days], groups=dd_year, n_groups=data_yy.size, perc=data_dd[vlabel + PERC_LABEL][:n_days])
 
     return data_dd, data_ww, data_mm, data_yy
 
-def load_meteo(siteid, ddir, resolution):
+def load_meteo(siteid, ddir, resolution, cache_dir=None):
     filename = os.path.join(ddir, "{s}_meteo_{r}.csv".format(s=siteid, r=resolution))
     if not os.path.isfile(filename):
         raise ONEFluxError("METEO file not found: {f}".format(f=filename))
 
     log.debug("Loading meteo/{r} file: {f}".format(r=resolution, f=filename))
-    data = _load_data(filename=filename, resolution=resolution)
+    data = _load_data(filename=filename, resolution=resolution, cache_dir=cache_dir)
 
     new_names = list(data.dtype.names)
     for i, l in enumerate(data.dtype.names):
@@ -621,7 +677,7 @@ def load_meteo(siteid, ddir, resolution):
 
     return data
 
-def load_nee(siteid, ddir, resolution):
+def load_nee(siteid, ddir, resolution, cache_dir=None):
     filename = os.path.join(ddir, "{s}_NEE_{r}.csv".format(s=siteid, r=resolution))
     if not os.path.isfile(filename):
         f1 = filename
@@ -630,7 +686,7 @@ def load_nee(siteid, ddir, resolution):
             raise ONEFluxError("NEE file(s) not found: 1st={f1}, 2nd={f2}".format(f1=f1, f2=filename))
 
     log.debug("Loading nee/{r} file: {f}".format(r=resolution, f=filename))
-    nee = _load_data(filename=filename, resolution=resolution)
+    nee = _load_data(filename=filename, resolution=resolution, cache_dir=cache_dir)
 
     # checking and fixing timestamps for dd files
     if resolution == 'dd':
@@ -639,22 +695,25 @@ def load_nee(siteid, ddir, resolution):
         elif 'doy' in nee.dtype.names: doy_str = 'doy'
         elif 'DoY'  in nee.dtype.names: doy_str = 'DoY'
         else: raise ONEFluxError('Cannot find doy_str: {t}'.format(t=nee.dtype.names))
-        timestamp_ts = [datetime.strptime(i, "%Y%m%d") for i in nee['TIMESTAMP']]
-        year_ls = [str(i.year) for i in timestamp_ts]
-        timestamp_doy = [datetime.strptime(year_ls[i] + str(nee[doy_str][i]), "%Y%j") for i in xrange(nee.size)]
-        if timestamp_ts != timestamp_doy:
+        timestamp_components = decode_timestamps(nee['TIMESTAMP'], fmt='%Y%m%d')
+        timestamp_ts = timestamps_to_datetime64(timestamp_components).astype('M8[D]')
+        doy = nee[doy_str].astype(int)
+        if numpy.any((doy < 1) | (doy > 366)):
+            raise ONEFluxError('Invalid {d} entries in: {f}'.format(d=doy_str, f=filename))
+        timestamp_doy = timestamps_to_datetime64({'year': timestamp_components['year']}).astype('M8[D]') + (doy - 1).astype('m8[D]')
+        if numpy.any(timestamp_ts != timestamp_doy):
             log.info("Fixing DD timestamp bug for: {f}".format(f=filename))
-            nee['TIMESTAMP'][:] = [i.strftime("%Y%m%d") for i in timestamp_doy]
+            nee['TIMESTAMP'][:] = numpy.char.replace(numpy.datetime_as_string(timestamp_doy, unit='D'), '-', '')
 
     return nee
 
-def load_energy(siteid, ddir, resolution):
+def load_energy(siteid, ddir, resolution, cache_dir=None):
     filename = os.path.join(ddir, "{s}_energy_{r}.csv".format(s=siteid, r=resolution))
     if not os.path.isfile(filename):
         raise ONEFluxError("ENERGY file not found: {f}".format(f=filename))
 
     log.debug("Loading energy/{r} file: {f}".format(r=resolution, f=filename))
-    return _load_data(filename=filename, resolution=resolution)
+    return _load_data(filename=filename, resolution=resolution, cache_dir=cache_dir)
 
 def merge_unc(dt_reco, dt_gpp, nt_reco, nt_gpp, sr_reco, resolution):
     dtype_ts = TIMESTAMP_DTYPE_BY_RESOLUTION_IN[resolution]
@@ -715,7 +774,7 @@ def merge_unc(dt_reco, dt_gpp, nt_reco, nt_gpp, sr_reco, resolution):
     log.debug("Merged UNC headers: {h}".format(h=d.dtype.names))
     return d
 
-def load_unc(siteid, ddir, resolution):
+def load_unc(siteid, ddir, resolution, cache_dir=None):
     dt_reco_filename = os.path.join(ddir, "{s}_DT_RECO_{r}.csv".format(s=siteid, r=resolution))
     dt_gpp_filename = os.path.join(ddir, "{s}_DT_GPP_{r}.csv".format(s=siteid, r=resolution))
     nt_reco_filename = os.path.join(ddir, "{s}_NT_RECO_{r}.csv".format(s=siteid, r=resolution))
@@ -735,31 +794,31 @@ def load_unc(siteid, ddir, resolution):
 
     # DT RECO
     log.debug("Loading partitioning/{r} file: {f}".format(r=resolution, f=dt_reco_filename))
-    dt_reco = _load_data(filename=dt_reco_filename, resolution=resolution)
+    dt_reco = _load_data(filename=dt_reco_filename, resolution=resolution, cache_dir=cache_dir)
     nrecords = dt_reco.size
 
     # DT GPP
     log.debug("Loading partitioning/{r} file: {f}".format(r=resolution, f=dt_gpp_filename))
-    dt_gpp = _load_data(filename=dt_gpp_filename, resolution=resolution)
+    dt_gpp = _load_data(filename=dt_gpp_filename, resolution=resolution, cache_dir=cache_dir)
     if dt_gpp.size != nrecords:
         raise ONEFluxError("Incompatible number of records DT_RECO={p}  and  DT_GPP={s}".format(p=nrecords, s=dt_gpp.size))
 
     # NT RECO
     log.debug("Loading partitioning/{r} file: {f}".format(r=resolution, f=nt_reco_filename))
-    nt_reco = _load_data(filename=nt_reco_filename, resolution=resolution)
+    nt_reco = _load_data(filename=nt_reco_filename, resolution=resolution, cache_dir=cache_dir)
     if nt_reco.size != nrecords:
         raise ONEFluxError("Incompatible number of records DT_RECO={p}  and  NT_RECO={s}".format(p=nrecords, s=nt_reco.size))
 
     # NT GPP
     log.debug("Loading partitioning/{r} file: {f}".format(r=resolution, f=nt_gpp_filename))
-    nt_gpp = _load_data(filename=nt_gpp_filename, resolution=resolution)
+    nt_gpp = _load_data(filename=nt_gpp_filename, resolution=resolution, cache_dir=cache_dir)
     if nt_gpp.size != nrecords:
         raise ONEFluxError("Incompatible number of records DT_RECO={p}  and  NT_GPP={s}".format(p=nrecords, s=nt_gpp.size))
 
     # SR RECO
     if os.path.isfile(sr_reco_filename):
         log.debug("Loading partitioning/{r} file: {f}".format(r=resolution, f=sr_reco_filename))
-        sr_reco = _load_data(filename=sr_reco_filename, resolution=resolution)
+        sr_reco = _load_data(filename=sr_reco_filename, resolution=resolution, cache_dir=cache_dir)
         if  sr_reco.size != nrecords:
             if sr_reco.size < nrecords:
                 # TODO: incompatible, check range, allocate array of correct size, fill with -9999, find ts indices, copy non-NA part to new array
@@ -1058,6 +1117,7 @@ def run_site(siteid, sitedir, first_t1, last_t1, version_processing=1, version_d
         prodfile_template = PRODFILE_TEMPLATE
         zipfile_template = ZIPFILE_TEMPLATE
         prodfile_years_template = PRODFILE_YEARS_TEMPLATE
+        cache_dir = None
     else:
         datadir = pipeline.data_dir_main
         meteo = pipeline.meteo_proc.meteo_proc_dir
@@ -1068,6 +1128,7 @@ def run_site(siteid, sitedir, first_t1, last_t1, version_processing=1, version_d
         prodfile_template = pipeline.prodfile_template
         zipfile_template = pipeline.zipfile_template
         prodfile_years_template = pipeline.prodfile_years_template
+        cache_dir = pipeline.columnar_cache_dir
 
     check_create_directory(prod)
 
@@ -1083,10 +1144,10 @@ def run_site(siteid, sitedir, first_t1, last_t1, version_processing=1, version_d
     qcdata_yy = None # NEW FOR APRIL2016
     for resolution in RESOLUTION_LIST:
         log.debug("Processing '{r}' resolution".format(r=resolution))
-        meteo_data = load_meteo(siteid=siteid, ddir=meteo, resolution=resolution)
-        nee_data = load_nee(siteid=siteid, ddir=nee, resolution=resolution)
-        energy_data = load_energy(siteid=siteid, ddir=energy, resolution=resolution)
-        unc_data = load_unc(siteid=siteid, ddir=unc, resolution=resolution)
+        meteo_data = load_meteo(siteid=siteid, ddir=meteo, resolution=resolution, cache_dir=cache_dir)
+        nee_data = load_nee(siteid=siteid, ddir=nee, resolution=resolution, cache_dir=cache_dir)
+        energy_data = load_energy(siteid=siteid, ddir=energy, resolution=resolution, cache_dir=cache_dir)
+        unc_data = load_unc(siteid=siteid, ddir=unc, resolution=resolution, cache_dir=cache_dir)
 
         # make duplicate of full meteo data
         dt = copy.deepcopy(meteo_data.dtype)
@@ -1137,7 +1198,7 @@ def run_site(siteid, sitedir, first_t1, last_t1, version_processing=1, version_d
         # NEW FOR APRIL2016: process additional met variables
         if resolution == 'hh':
             qcdir_prep = (QCDIR.format(sd=sitedir) if pipeline is None else pipeline.qc_visual.qc_visual_dir_inner)
-            qcdata = load_qcdata(siteid=siteid, ddir=qcdir_prep, firsty=first_year, lasty=last_year, output_resolution=output_resolution)
+            qcdata = load_qcdata(siteid=siteid, ddir=qcdir_prep, firsty=first_year, lasty=last_year, output_resolution=output_resolution, cache_dir=cache_dir)
             log.debug("{s}: updating names for qc data".format(s=siteid))
             qcdata = update_names_qc(data=qcdata)
             output_data = merge_qcdata(qcdata=qcdata, output=output_data)
@@ -18,30 +18,45 @@ import numpy
 import socket
 import fnmatch
 import platform
+import shutil
+import threading
+import Queue
 
 from datetime import datetime
 
+import oneflux
 from oneflux import add_file_log, ONEFluxError, log_trace
-from oneflux.pipeline import CMD_SEP, COPY, DELETE, DELETE_DIR, HOMEDIR, DATA_DIR, TOOL_DIR, OUTPUT_LOG_TEMPLATE
+from oneflux.pipeline import DATA_DIR, TOOL_DIR, OUTPUT_LOG_TEMPLATE
 from oneflux.pipeline.site_data_product import run_site, get_headers_qc, _load_data, update_names_qc, save_csv_txt
 from oneflux.pipeline.variables_codes import QC_FULL_DIRECT_D
+from oneflux.utils.writers import write_csv
+from oneflux.utils.files import COLUMNAR_CACHE_DIRNAME, load_json_manifest, save_json_manifest
+from oneflux.utils.profiling import resource_usage, usage_difference, collect_phases, save_report
 from oneflux.pipeline.common import CSVMANIFEST_HEADER, ZIPMANIFEST_HEADER, ONEFluxPipelineError, \
-                                     run_command, test_dir, test_file, test_file_list, test_file_list_or, \
+                                     run_tool, copy_files, test_dir, test_file, test_file_list, test_file_list_or, \
                                      test_create_dir, create_replace_dir, create_and_empty_dir, test_pattern, \
                                      check_headers_fluxnet2015, get_empty_array_year, \
                                      PRODFILE_TEMPLATE_F, PRODFILE_AUX_TEMPLATE_F, PRODFILE_YEARS_TEMPLATE_F, \
                                      PRODFILE_FIGURE_TEMPLATE_F, ZIPFILE_TEMPLATE_F, NEE_PERC_USTAR_VUT_PATTERN, \
                                      NEE_PERC_USTAR_CUT_PATTERN, UNC_INFO_F, UNC_INFO_ALT_F, NEE_PERC_NEE_F, \
                                      METEO_INFO_F, NEE_INFO_F, \
-                                     HOSTNAME, NOW_TS
-from oneflux.partition.library import PARTITIONING_DT_ERROR_FILE, EXTRA_FILENAME
+                                     HOSTNAME, NOW_TS, FINGERPRINT_FILENAME, TOOL_TIMEOUT, CHECKPOINT_FILENAME, \
+                                     list_dir_files, hash_files
+from oneflux.partition.library import PARTITIONING_DT_ERROR_FILE, EXTRA_FILENAME, get_result_columns, clear_result_columns, load_output_columns
 from oneflux.partition.auxiliary import nan, nan_ext, NAN, NAN_TEST
 from oneflux.partition.daytime import ONEFluxPartitionBrokenOptError
 from oneflux.pipeline.site_plots import gen_site_plots
-from oneflux.tools.partition_nt import run_partition_nt, PROD_TO_COMPARE, PERC_TO_COMPARE
+from oneflux.tools.partition_nt import run_partition_nt, PROD_TO_COMPARE, PERC_TO_COMPARE, FILENAME_TEMPLATE
 from oneflux.tools.partition_dt import run_partition_dt
 
 DEFAULT_LOGGING_FILENAME = 'report_{s}_{h}_{t}.log'.format(h=HOSTNAME, t=NOW_TS, s='{s}')
+PERFORMANCE_REPORT_FILENAME = 'performance_{s}_{h}_{t}.json'.format(h=HOSTNAME, t=NOW_TS, s='{s}')
+STEP_STATUS_OK = 'ok'           # step executed successfully
+STEP_STATUS_SKIPPED = 'skipped' # step up to date, skipped in incremental mode
+STEP_STATUS_FAILED = 'failed'   # step execution failed
+STEP_POLL_INTERVAL = 1.0 # seconds between checks for finished steps (waits can be interrupted)
+FINGERPRINT_IGNORED_CONFIGS = ['data_dir_main', 'site_dir', 'simulation', 'validate_on_create', 'step_workers', 'incremental', 'resume', 'prepare_ure_in_memory', 'columnar_cache', 'columnar_cache_dir'] # configs not affecting step outputs
+FINGERPRINT_IGNORED_SUFFIXES = ('_execute', '_workers', '_dir', '_ex', '_timeout') # suffixes of configs not affecting step outputs (tools are hashed)
 
 log = logging.getLogger(__name__)
 
@@ -53,6 +68,11 @@ class Pipeline(object):
     RECORD_INTERVAL = 'hh'
     VALIDATE_ON_CREATE = False
     SIMULATION = False
+    STEP_WORKERS = 1 # maximum number of steps running concurrently (1 runs steps serially, in order)
+    INCREMENTAL = False # True: steps with fingerprint matching current config, tools, inputs and outputs are skipped
+    RESUME = False # True: steps completed in previous runs (checkpoint manifest) before first incomplete step are skipped
+    TOOL_TIMEOUT = TOOL_TIMEOUT # seconds until external tools are terminated (None waits indefinitely), unless set for step
+    COLUMNAR_CACHE = False # True: parsed text inputs are cached as binary columns (see genfromtxt_cached) for faster reruns
 
     def __init__(self, siteid, timestamp=datetime.now().strftime("%Y%m%d%H%M%S"), *args, **kwargs):
         '''
@@ -155,6 +175,38 @@ class Pipeline(object):
         self.simulation = self.configs.get('simulation', self.SIMULATION)
         log.debug("ONEFlux Pipeline: using simulation '{v}'".format(v=self.simulation))
 
+        # maximum number of independent steps running concurrently
+        self.step_workers = self.configs.get('step_workers', self.STEP_WORKERS)
+        log.debug("ONEFlux Pipeline: using step workers '{v}'".format(v=self.step_workers))
+
+        # True: skips steps whose outputs are up to date (fingerprints manifest only recorded in incremental mode)
+        self.incremental = self.configs.get('incremental', self.INCREMENTAL)
+        log.debug("ONEFlux Pipeline: using incremental '{v}'".format(v=self.incremental))
+        self.fingerprint_filename = os.path.join(self.data_dir, FINGERPRINT_FILENAME.format(s=self.siteid))
+        self.fingerprints = {'steps': {}}
+        self._fingerprint_lock = threading.Lock()
+        self._file_hashes = {}
+
+        # True: resumes from first step not completed in previous runs (checkpoint manifest always recorded)
+        self.resume = self.configs.get('resume', self.RESUME)
+        log.debug("ONEFlux Pipeline: using resume '{v}'".format(v=self.resume))
+        self.checkpoint_filename = os.path.join(self.data_dir, CHECKPOINT_FILENAME.format(s=self.siteid))
+        self.checkpoint = {'steps': {}}
+        self.resume_steps = []
+        self._checkpoint_lock = threading.Lock()
+
+        # performance records of steps run (see run_step), saved to site directory by run
+        self.performance = []
+
+        # default timeout for external tools run by steps
+        self.tool_timeout = self.configs.get('tool_timeout', self.TOOL_TIMEOUT)
+        log.debug("ONEFlux Pipeline: using tool timeout '{v}'".format(v=self.tool_timeout))
+
+        # cache directory for parsed text inputs (None if caching disabled)
+        self.columnar_cache = self.configs.get('columnar_cache', self.COLUMNAR_CACHE)
+        self.columnar_cache_dir = (self.configs.get('columnar_cache_dir', os.path.join(self.data_dir, COLUMNAR_CACHE_DIRNAME)) if self.columnar_cache else None)
+        log.debug("ONEFlux Pipeline: using columnar cache dir '{v}'".format(v=self.columnar_cache_dir))
+
 
         ### create drivers for individual steps
         self.fp_creator = PipelineFPCreator(pipeline=self)
@@ -243,10 +295,13 @@ class Pipeline(object):
             # start site pipeline log
             logger_file, log_file_handler = add_file_log(filename=os.path.join(self.data_dir, DEFAULT_LOGGING_FILENAME.format(s=self.siteid)))
             ts_begin = datetime.now()
+            usage_begin = resource_usage()
+            self.performance = []
 
-            for driver in self.drivers:
-                if driver.execute:
-                    driver.run()
+            self.checkpoint = load_json_manifest(filename=self.checkpoint_filename, default={'steps': {}})
+            self.fingerprints = (load_json_manifest(filename=self.fingerprint_filename, default={'steps': {}}) if self.incremental else {'steps': {}})
+            self.resume_steps = (self.get_resume_steps() if self.resume else [])
+            self.run_steps()
             self.post_validate()
 
         except Exception as e:
@@ -260,6 +315,7 @@ class Pipeline(object):
             ts_end = datetime.now()
             ts_duration = ts_end - ts_begin
             log.info('{s} Pipeline run time {d} ({b} --- {e})'.format(s=self.siteid, d=ts_duration, b=ts_begin, e=ts_end))
+            self.save_performance_report(begin=ts_begin, end=ts_end, usage=usage_difference(begin=usage_begin, end=resource_usage()))
             log_file_handler.flush()
             log_file_handler.close()
             logger_file.removeHandler(log_file_handler)
@@ -267,11 +323,411 @@ class Pipeline(object):
         log.info("{s} Pipeline: execution finished".format(s=self.siteid))
 
 
+    def get_step_dependencies(self):
+        '''
+        Upstream steps of each step set to be run, from the _UPSTREAM_STEPS
+        attribute of each driver (labels of pipeline attributes for steps
+        that must finish before the step runs), resolved through steps not
+        set to be run: each step waits for all its direct or indirect
+        upstream steps set to be run (see get_upstream_steps)
+
+        :rtype: dict (driver: list of upstream drivers, in pipeline order)
+        '''
+        steps = [driver for driver in self.drivers if driver.execute]
+        dependencies = {}
+        for driver in steps:
+            upstream = self.get_upstream_steps(driver)
+            dependencies[driver] = [d for d in steps if d in upstream]
+        return dependencies
+
+
+    def run_steps(self):
+        '''
+        Runs steps set to be run, starting each step once all its upstream
+        steps finished, with up to step_workers steps running concurrently
+        (threads, since steps mostly wait on external executables or their
+        own worker processes); ready steps start in pipeline order, so a
+        single worker runs steps serially in the same order as the list of
+        drivers. After a failure no new steps start, and the exception of
+        the first failed step (in pipeline order) is raised once running
+        steps finish
+        '''
+        dependencies = self.get_step_dependencies()
+        pending = [driver for driver in self.drivers if driver in dependencies]
+
+        if self.step_workers <= 1:
+            for driver in pending:
+                self.run_step(driver)
+            return
+
+        finished = Queue.Queue()
+        def run_step_thread(driver):
+            try:
+                self.run_step(driver)
+                finished.put((driver, None))
+            except Exception as e:
+                log_trace(exception=e, level=logging.CRITICAL)
+                finished.put((driver, e))
+
+        running, done, errors = [], [], {}
+        while pending or running:
+            if not errors:
+                ready = [driver for driver in pending if all((upstream in done) for upstream in dependencies[driver])]
+                for driver in ready[:max(0, self.step_workers - len(running))]:
+                    log.debug("{s} Pipeline: starting step {d}".format(s=self.siteid, d=type(driver).__name__))
+                    pending.remove(driver)
+                    running.append(driver)
+                    thread = threading.Thread(target=run_step_thread, args=(driver,), name=type(driver).__name__)
+                    thread.daemon = True
+                    thread.start()
+            if not running:
+                if not errors:
+                    msg = "{s} Pipeline: unresolved step dependencies: {d}".format(s=self.siteid, d=[type(driver).__name__ for driver in pending])
+                    log.critical(msg)
+                    raise ONEFluxPipelineError(msg)
+                break
+            while True:
+                try:
+                    driver, error = finished.get(timeout=STEP_POLL_INTERVAL)
+                    break
+                except Queue.Empty:
+                    continue
+            running.remove(driver)
+            if error is None:
+                done.append(driver)
+            else:
+                errors[driver] = error
+
+        if errors:
+            raise errors[[driver for driver in self.drivers if driver in errors][0]]
+
+
+    def run_step(self, driver):
+        '''
+        Runs single step and records its fingerprint, performance and
+        checkpoint; when resuming, steps completed in previous runs (see
+        get_resume_steps) are skipped; in incremental mode, step is skipped
+        if its recorded fingerprint matches current config, tools, inputs
+        and outputs (and outputs pass post_validate); skipped steps are
+        recorded as completed in checkpoint manifest
+
+        :param driver: step driver
+        :type driver: object
+        '''
+        usage_begin = resource_usage()
+        status = STEP_STATUS_FAILED
+        with collect_phases() as phases:
+            try:
+                # skipped steps are recorded as completed, so a later resume also skips them
+                fingerprint, skip_reason = None, None
+                if driver in self.resume_steps:
+                    skip_reason = 'completed in previous run'
+                elif self.incremental:
+                    fingerprint = self.get_step_fingerprint(driver)
+                    if (fingerprint is not None) and self.check_step_fingerprint(driver, fingerprint):
+                        skip_reason = 'up to date'
+                if skip_reason is not None:
+                    log.info("{s} Pipeline: step {d} {r}, skipped".format(s=self.siteid, d=type(driver).__name__, r=skip_reason))
+                    self.update_checkpoint(driver=driver, completed=True)
+                    status = STEP_STATUS_SKIPPED
+                    return
+                self.update_checkpoint(driver=driver, completed=False)
+                driver.run()
+                if fingerprint is not None:
+                    self.update_fingerprint(driver=driver, fingerprint=fingerprint)
+                self.update_checkpoint(driver=driver, completed=True)
+                status = STEP_STATUS_OK
+            finally:
+                usage = usage_difference(begin=usage_begin, end=resource_usage())
+                self.performance.append(self.get_step_performance(driver=driver, status=status, usage=usage, phases=phases))
+
+
+    def get_step_performance(self, driver, status, usage, phases):
+        '''
+        Performance record of step run: resource usage (wall time, CPU
+        time, peak memory, storage I/O of pipeline process and its terminated
+        children -- shared by steps running concurrently), output files,
+        external tools runs, and sub-phases (e.g., NT/DT partitioning load,
+        gap fill, window fits, flux, write; summed over tasks)
+
+        :param driver: step driver
+        :type driver: object
+        :param status: step status (STEP_STATUS_OK, STEP_STATUS_SKIPPED or STEP_STATUS_FAILED)
+        :type status: str
+        :param usage: resource usage while running step (from usage_difference)
+        :type usage: dict
+        :param phases: statistics of sub-phases recorded by step, by phase label
+        :type phases: dict
+        :rtype: dict
+        '''
+        label = self.get_step_label(driver)
+        step_dir = self.get_step_dir(driver)
+        output_files, output_bytes = None, None
+        if (step_dir is not None) and os.path.isdir(step_dir):
+            filenames = [os.path.join(step_dir, f) for f in list_dir_files(tdir=step_dir)]
+            output_files, output_bytes = len(filenames), sum(os.path.getsize(f) for f in filenames)
+        log.info("{s} Pipeline: step {l} {t}: elapsed {e:.2f}s, CPU user {u}s, CPU system {y}s, max RSS {m}, storage read {r}B, written {w}B, {n} output files".format(
+                 s=self.siteid, l=label, t=status, e=usage['elapsed'], u=usage['cpu_user'], y=usage['cpu_system'], m=usage['max_rss'],
+                 r=usage['bytes_read'], w=usage['bytes_written'], n=output_files))
+        performance = {'step': label, 'driver': type(driver).__name__, 'status': status,
+                       'output_files': output_files, 'output_bytes': output_bytes,
+                       'tools': list(getattr(driver, 'tool_runs', [])), 'phases': phases}
+        performance.update(usage)
+        return performance
+
+
+    def save_performance_report(self, begin, end, usage):
+        '''
+        Saves performance report of pipeline run (steps run, in pipeline
+        order) to site directory; failures are logged only, so they never
+        mask errors from the pipeline run
+
+        :param begin: timestamp of beginning of run
+        :type begin: datetime
+        :param end: timestamp of end of run
+        :type end: datetime
+        :param usage: resource usage of whole run (from usage_difference)
+        :type usage: dict
+        '''
+        steps = sorted(self.performance, key=lambda p: self.drivers.index(getattr(self, p['step'])))
+        report = {'siteid': self.siteid, 'hostname': HOSTNAME, 'oneflux_version': oneflux.VERSION,
+                  'begin': begin.isoformat(), 'end': end.isoformat(), 'step_workers': self.step_workers,
+                  'incremental': self.incremental, 'simulation': self.simulation, 'steps': steps}
+        report.update(usage)
+        try:
+            save_report(filename=os.path.join(self.data_dir, PERFORMANCE_REPORT_FILENAME.format(s=self.siteid)), report=report)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            log.error("{s} Pipeline: unable to save performance report: {e}".format(s=self.siteid, e=str(e)))
+
+
+    def get_step_label(self, driver):
+        '''
+        Label of step: name of pipeline attribute for driver (same labels used in _UPSTREAM_STEPS)
+
+        :param driver: step driver
+        :type driver: object
+        :rtype: str
+        '''
+        for label, value in self.__dict__.iteritems():
+            if value is driver:
+                return label
+        return None
+
+
+    def get_step_dir(self, driver):
+        '''
+        Output directory of step (<label>_dir attribute of driver), None if step has no output directory
+
+        :param driver: step driver
+        :type driver: object
+        :rtype: str
+        '''
+        return getattr(driver, '{l}_dir'.format(l=self.get_step_label(driver)), None)
+
+
+    def get_step_outputs(self, driver):
+        '''
+        Contents hashes of all files in step output directory
+
+        :param driver: step driver
+        :type driver: object
+        :rtype: dict (md5sum by path relative to step output directory)
+        '''
+        step_dir = self.get_step_dir(driver)
+        if not os.path.isdir(step_dir):
+            return {}
+        filenames = list_dir_files(tdir=step_dir)
+        hashes = hash_files(filenames=[os.path.join(step_dir, f) for f in filenames], cache=self._file_hashes)
+        return dict((f, hashes[os.path.join(step_dir, f)]) for f in filenames)
+
+
+    def get_upstream_steps(self, driver):
+        '''
+        Steps upstream of step, directly or indirectly (from _UPSTREAM_STEPS), run or not
+
+        :param driver: step driver
+        :type driver: object
+        :rtype: list (of drivers)
+        '''
+        upstream, to_visit = [], list(driver._UPSTREAM_STEPS)
+        while to_visit:
+            upstream_driver = getattr(self, to_visit.pop(0))
+            if upstream_driver not in upstream:
+                upstream.append(upstream_driver)
+                to_visit.extend(upstream_driver._UPSTREAM_STEPS)
+        return upstream
+
+
+    def get_resume_steps(self):
+        '''
+        Steps set to be run that are skipped when resuming: steps before
+        first incomplete step (in pipeline order) that completed in
+        previous runs (recorded in checkpoint manifest) and whose outputs
+        still pass post_validate
+
+        :rtype: list (of drivers)
+        '''
+        steps = []
+        for driver in self.drivers:
+            if not driver.execute:
+                continue
+            label = self.get_step_label(driver)
+            if label not in self.checkpoint['steps']:
+                log.info("{s} Pipeline: resuming from step {d} (not completed in previous runs)".format(s=self.siteid, d=type(driver).__name__))
+                break
+            try:
+                driver.post_validate()
+            except ONEFluxError as e:
+                log.info("{s} Pipeline: resuming from step {d} (outputs not valid: {e})".format(s=self.siteid, d=type(driver).__name__, e=str(e)))
+                break
+            steps.append(driver)
+        return steps
+
+
+    def update_checkpoint(self, driver, completed):
+        '''
+        Records step as completed in checkpoint manifest, or, when step
+        starts, removes it and all steps downstream from it (their outputs
+        are no longer consistent with the outputs of the step)
+
+        :param driver: step driver
+        :type driver: object
+        :param completed: True if step completed (outputs passed post_validate)
+        :type completed: bool
+        '''
+        if self.simulation:
+            return
+        label = self.get_step_label(driver)
+        with self._checkpoint_lock:
+            steps = self.checkpoint['steps']
+            if completed:
+                steps[label] = {'driver': type(driver).__name__, 'completed': datetime.now().isoformat(),
+                                'run_id': self.run_id, 'oneflux_version': oneflux.VERSION}
+            else:
+                invalid = [label] + [self.get_step_label(d) for d in self.drivers if driver in self.get_upstream_steps(d)]
+                if not any((l in steps) for l in invalid):
+                    return
+                for l in invalid:
+                    steps.pop(l, None)
+            self.checkpoint['siteid'] = self.siteid
+            save_json_manifest(filename=self.checkpoint_filename, manifest=self.checkpoint)
+
+
+    def get_step_fingerprint(self, driver):
+        '''
+        Fingerprint of step before execution: configs (pipeline wide and
+        specific to step), tools (executables, or oneflux sources for
+        Python steps), and inputs (files in output directories of all
+        steps upstream, directly or indirectly, run or not)
+
+        :param driver: step driver
+        :type driver: object
+        :rtype: dict (None if step has no output directory)
+        '''
+        label = self.get_step_label(driver)
+        if self.get_step_dir(driver) is None:
+            return None
+
+        # configs not specific to other steps (longest label prefix decides owner step)
+        labels = [self.get_step_label(d) for d in self.drivers + [self.ustar_cp]]
+        config = {'siteid': self.siteid}
+        for key, value in self.configs.iteritems():
+            if (key in FINGERPRINT_IGNORED_CONFIGS) or key.endswith(FINGERPRINT_IGNORED_SUFFIXES):
+                continue
+            owners = [l for l in labels if key.startswith(l + '_')]
+            if (not owners) or (max(owners, key=len) == label):
+                config[key] = repr(value)
+        for key, value in driver.__dict__.iteritems():
+            if key.startswith('cmd') and key.endswith(('_txt', '_args')):
+                config[key] = repr(value)
+
+        # executables, or oneflux sources for Python steps
+        executables = [v for k, v in driver.__dict__.iteritems() if k.endswith('_ex') and isinstance(v, basestring) and os.path.isfile(v)]
+        if executables:
+            tools = dict((os.path.basename(f), h) for f, h in hash_files(filenames=executables, cache=self._file_hashes).iteritems())
+        else:
+            oneflux_dir = os.path.dirname(os.path.abspath(oneflux.__file__))
+            sources = [os.path.join(oneflux_dir, f) for f in list_dir_files(tdir=oneflux_dir) if f.endswith('.py')]
+            tools = dict((os.path.relpath(f, oneflux_dir), h) for f, h in hash_files(filenames=sources, cache=self._file_hashes).iteritems())
+        tools['oneflux_version'] = oneflux.VERSION
+
+        # files in output directories of upstream steps (directory shared with step checked as its outputs)
+        inputs = {}
+        step_dir = self.get_step_dir(driver)
+        for upstream_driver in self.get_upstream_steps(driver):
+            upstream_dir = self.get_step_dir(upstream_driver)
+            if (upstream_dir is None) or (upstream_dir == step_dir) or (not os.path.isdir(upstream_dir)):
+                continue
+            filenames = [os.path.join(upstream_dir, f) for f in list_dir_files(tdir=upstream_dir)]
+            for f, h in hash_files(filenames=filenames, cache=self._file_hashes).iteritems():
+                inputs[os.path.relpath(f, self.data_dir)] = h
+
+        return {'step': label, 'config': config, 'tools': tools, 'inputs': inputs}
+
+
+    def check_step_fingerprint(self, driver, fingerprint):
+        '''
+        Checks if step fingerprint recorded in its last execution matches
+        current fingerprint, and current outputs match recorded outputs and pass post_validate
+
+        :param driver: step driver
+        :type driver: object
+        :param fingerprint: current step fingerprint (from get_step_fingerprint)
+        :type fingerprint: dict
+        :rtype: bool
+        '''
+        label = self.get_step_label(driver)
+        recorded = self.fingerprints['steps'].get(label)
+        if recorded is None:
+            log.debug("{s} Pipeline: no fingerprint recorded for step {l}".format(s=self.siteid, l=label))
+            return False
+        for key in ['config', 'tools', 'inputs']:
+            if recorded.get(key) != fingerprint[key]:
+                log.info("{s} Pipeline: step {l} {k} changed".format(s=self.siteid, l=label, k=key))
+                return False
+        if recorded.get('outputs') != self.get_step_outputs(driver):
+            log.info("{s} Pipeline: step {l} outputs changed".format(s=self.siteid, l=label))
+            return False
+        try:
+            driver.post_validate()
+        except ONEFluxError as e:
+            log.info("{s} Pipeline: step {l} outputs not valid: {e}".format(s=self.siteid, l=label, e=str(e)))
+            return False
+        return True
+
+
+    def update_fingerprint(self, driver, fingerprint):
+        '''
+        Records fingerprint of step just run, with its outputs, in fingerprints manifest
+        (site directory); for steps upstream sharing its output directory (e.g., qc_auto
+        and qc_auto_convert), recorded outputs are updated to the directory as left by this step
+
+        :param driver: step driver
+        :type driver: object
+        :param fingerprint: step fingerprint before execution (from get_step_fingerprint)
+        :type fingerprint: dict
+        '''
+        step_dir = self.get_step_dir(driver)
+        if self.simulation or (not os.path.isdir(step_dir)):
+            return
+        fingerprint['outputs'] = self.get_step_outputs(driver)
+        with self._fingerprint_lock:
+            steps = self.fingerprints['steps']
+            steps[self.get_step_label(driver)] = fingerprint
+            for upstream_driver in self.get_upstream_steps(driver):
+                upstream_label = self.get_step_label(upstream_driver)
+                if (self.get_step_dir(upstream_driver) == step_dir) and (upstream_label in steps):
+                    steps[upstream_label]['outputs'] = fingerprint['outputs']
+            self.fingerprints['siteid'] = self.siteid
+            save_json_manifest(filename=self.fingerprint_filename, manifest=self.fingerprints)
+
+
 class PipelineFPCreator(object):
     '''
     Class to control execution of fp_creator step
     '''
     FP_CREATOR_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = []
     ORIGINAL_DATASET_DIR = "00_original_dataset"
     FP_DATASET_DIR = "00_fp_dataset"
 
@@ -348,6 +804,7 @@ class PipelineQCVisual(object):
     Class to control execution of qc_visual step
     '''
     QC_VISUAL_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = ['fp_creator']
     QC_VISUAL_DIR = "01_qc_visual"
     QC_VISUAL_DIR_INNER = "qcv_files"
     _OUTPUT_FILE_PATTERNS = [
@@ -413,6 +870,7 @@ class PipelineQCAuto(object):
     Executes QC Automated Quality Flagging step.
     '''
     QC_AUTO_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_visual']
     # PRI 2020/10/20 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -420,6 +878,7 @@ class PipelineQCAuto(object):
     else:
         QC_AUTO_EX = 'qc_auto'
     QC_AUTO_DIR = '02_qc_auto'
+    QC_AUTO_TIMEOUT = None # seconds until qc_auto is terminated (None uses pipeline tool_timeout)
     _OUTPUT_FILE_PATTERNS = [
         '{s}_qca_energy_????.csv',
         '{s}_qca_meteo_????.csv',
@@ -444,8 +903,11 @@ class PipelineQCAuto(object):
         self.output_file_patterns = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS]
         self.input_qc_visual_dir = '..' + os.sep + os.path.basename(self.pipeline.qc_visual.qc_visual_dir) + os.sep + os.path.basename(self.pipeline.qc_visual.qc_visual_dir_inner) + os.sep
         self.output_log = os.path.join(self.qc_auto_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
-        self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -input_path="{i}" -output_path=. -ustar -graph -nee -energy -meteo -solar > "{log}"'
-        self.cmd = self.cmd_txt.format(c=self.qc_auto_ex, i=self.input_qc_visual_dir, o=self.qc_auto_dir_fmt, log=self.output_log, cmd_sep=CMD_SEP)
+        self.qc_auto_timeout = self.pipeline.configs.get('qc_auto_timeout', self.QC_AUTO_TIMEOUT)
+        self.qc_auto_timeout = (self.pipeline.tool_timeout if self.qc_auto_timeout is None else self.qc_auto_timeout)
+        self.tool_runs = []
+        self.cmd_args = ['-input_path={i}', '-output_path=.', '-ustar', '-graph', '-nee', '-energy', '-meteo', '-solar']
+        self.cmd = [self.qc_auto_ex] + [a.format(i=self.input_qc_visual_dir) for a in self.cmd_args]
 
     def pre_validate(self):
         '''
@@ -483,7 +945,7 @@ class PipelineQCAuto(object):
         if self.pipeline.simulation:
             log.info('Simulation only, {s} execution command skipped'.format(s=self.label))
         else:
-            run_command(self.cmd)
+            self.tool_runs.append(run_tool(args=self.cmd, label=self.label, cwd=self.qc_auto_dir, output_log=self.output_log, timeout=self.qc_auto_timeout))
             self.post_validate()
 
         log.info('Pipeline {s} execution finished'.format(s=self.label))
@@ -498,6 +960,7 @@ class PipelineQCAutoConvert(object):
     This is a legacy step and should not be needed on any new run.
     '''
     QC_AUTO_CONVERT_EXECUTE = False # Legacy step, default is not to run
+    _UPSTREAM_STEPS = ['qc_auto']
     QC_AUTO_CONVERT_DIR = "02_qc_auto"
     _QC_AUTO_CONVERT_ORIGINAL = '.original'
     _OUTPUT_FILE_PATTERNS = [
@@ -593,6 +1056,7 @@ class PipelineQCVisualCross(object):
     This is an external step and is only necessary for extended QA/QC activities.
     '''
     QC_VISUAL_CROSS_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert']
     QC_VISUAL_CROSS_DIR = "03_qc_visual_cross"
 
     def __init__(self, pipeline):
@@ -641,6 +1105,7 @@ class PipelineUstarMP(object):
     Executes USTAR Moving Point Threshold estimation.
     '''
     USTAR_MP_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert']
     # PRI 2020/10/20 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -648,6 +1113,7 @@ class PipelineUstarMP(object):
     else:
         USTAR_MP_EX = 'ustar_mp'
     USTAR_MP_DIR = '04_ustar_mp'
+    USTAR_MP_TIMEOUT = None # seconds until ustar_mp is terminated (None uses pipeline tool_timeout)
     _OUTPUT_FILE_PATTERNS = [
         "{s}_usmp_????.txt",
         OUTPUT_LOG_TEMPLATE.format(t='*'),
@@ -668,9 +1134,14 @@ class PipelineUstarMP(object):
         self.ustar_mp_dir_fmt = self.ustar_mp_dir + os.sep
         self.output_file_patterns = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS]
         self.input_qc_auto_dir = self.pipeline.qc_auto.qc_auto_dir + os.sep
+        self.ustar_mp_input_dir = os.path.join(self.ustar_mp_dir, 'input')
         self.output_log = os.path.join(self.ustar_mp_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
-        self.cmd_txt = 'cd "{o}" {cmd_sep} mkdir input {cmd_sep} {cp} "{i}"*_ustar_*.csv ./input/ {cmd_sep} {c} -input_path=./input/ -output_path=./ > "{log}"'
-        self.cmd = self.cmd_txt.format(c=self.ustar_mp_ex, i=self.input_qc_auto_dir, o=self.ustar_mp_dir_fmt, log=self.output_log, cmd_sep=CMD_SEP, cp=COPY)
+        self.ustar_mp_timeout = self.pipeline.configs.get('ustar_mp_timeout', self.USTAR_MP_TIMEOUT)
+        self.ustar_mp_timeout = (self.pipeline.tool_timeout if self.ustar_mp_timeout is None else self.ustar_mp_timeout)
+        self.tool_runs = []
+        self.input_pattern = '*_ustar_*.csv'
+        self.cmd_args = ['-input_path=./input/', '-output_path=./']
+        self.cmd = [self.ustar_mp_ex] + self.cmd_args
 
     def pre_validate(self):
         '''
@@ -708,7 +1179,9 @@ class PipelineUstarMP(object):
         if self.pipeline.simulation:
             log.info('Simulation only, {s} execution command skipped'.format(s=self.label))
         else:
-            run_command(self.cmd)
+            test_create_dir(tdir=self.ustar_mp_input_dir, label='{s}.run'.format(s=self.label))
+            copy_files(tdir=self.pipeline.qc_auto.qc_auto_dir, pattern=self.input_pattern, destination=self.ustar_mp_input_dir, label='{s}.run'.format(s=self.label))
+            self.tool_runs.append(run_tool(args=self.cmd, label=self.label, cwd=self.ustar_mp_dir, output_log=self.output_log, timeout=self.ustar_mp_timeout))
             self.post_validate()
         log.info('Pipeline {s} execution finished'.format(s=self.label))
 
@@ -719,6 +1192,7 @@ class PipelineUstarCP(object):
     Executes Ustar Changing Point threshold estimation.
     '''
     USTAR_CP_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert']
     # PRI 2020/10/20 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -731,6 +1205,7 @@ class PipelineUstarCP(object):
         OUTPUT_LOG_TEMPLATE.format(t='*'),
     ]
     USTAR_CP_MCR_DIR = None
+    USTAR_CP_TIMEOUT = None # seconds until ustar_cp is terminated (None uses pipeline tool_timeout)
 
     def __init__(self, pipeline):
         '''
@@ -748,24 +1223,16 @@ class PipelineUstarCP(object):
         self.output_file_patterns = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS]
         self.input_qc_auto_dir = self.pipeline.qc_auto.qc_auto_dir + os.sep
         self.ustar_cp_mcr_dir = self.pipeline.configs.get('ustar_cp_mcr_dir', self.USTAR_CP_MCR_DIR)
+        self.ustar_cp_input_dir = os.path.join(self.ustar_cp_dir, 'input')
+        self.ustar_cp_local_ex = os.path.join(self.ustar_cp_dir, os.path.basename(self.ustar_cp_ex))
         self.output_log = os.path.join(self.ustar_cp_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
-        self.cmd_txt = ''
-        self.cmd_txt += 'cd "{o}"' + ' {cmd_sep} '
-        self.cmd_txt += 'mkdir input' + ' {cmd_sep} '
-        self.cmd_txt += '{cp} "{i}"*_ustar_*.csv ./input/' + ' {cmd_sep} '
-#        self.cmd_txt += '{cp} "{i}"*_ustar_*.csv .' + ' {cmd_sep} '
-        self.cmd_txt += '{cp} {c} .' + ' {cmd_sep} '
-#        self.cmd_txt += './{clocal} input/ > "{log}"' + ' {cmd_sep} '
-        self.cmd_txt += 'cd "{o}" {cmd_sep} ./{clocal} "{o}input/" "{o}"> "{log}"' + ' {cmd_sep} '
-        self.cmd_txt += '{dl} {clocal}'
-        self.cmd = self.cmd_txt.format(c=self.ustar_cp_ex,
-                                       clocal=os.path.basename(self.ustar_cp_ex),
-                                       i=self.input_qc_auto_dir,
-                                       o=self.ustar_cp_dir_fmt,
-                                       log=self.output_log,
-                                       cmd_sep=CMD_SEP,
-                                       cp=COPY,
-                                       dl=DELETE)
+        self.ustar_cp_timeout = self.pipeline.configs.get('ustar_cp_timeout', self.USTAR_CP_TIMEOUT)
+        self.ustar_cp_timeout = (self.pipeline.tool_timeout if self.ustar_cp_timeout is None else self.ustar_cp_timeout)
+        self.tool_runs = []
+        self.input_pattern = '*_ustar_*.csv'
+        # tool runs from a copy in the output directory
+        self.cmd_args = ['{o}input/', '{o}']
+        self.cmd = [self.ustar_cp_local_ex] + [a.format(o=self.ustar_cp_dir_fmt) for a in self.cmd_args]
 
     def pre_validate(self):
         '''
@@ -819,6 +1286,7 @@ class PipelineUstarCP(object):
 
     def run_ustarcp(self):
         # on Unix systems, the MATLAB Compiler Runtime has to be configured first
+        env = dict(os.environ)
         if (os.name == 'posix'):
             log.debug("Unix-based system detected, setting environment variables")
             if (self.ustar_cp_mcr_dir is None) or (not os.path.isdir(self.ustar_cp_mcr_dir)):
@@ -826,7 +1294,7 @@ class PipelineUstarCP(object):
                 log.error(msg)
                 return False
 
-            ldlib = os.environ.get("LD_LIBRARY_PATH")
+            ldlib = env.get("LD_LIBRARY_PATH")
             ldlib = ('' if ldlib is None else ldlib)
             #mcr_jre_dir = "{h}/sys/java/jre/glnxa64/jre/lib/amd64".format(h=self.ustar_cp_mcr_dir) # MATLAB2012a only
             new_ldlib = ":".join([os.path.join(self.ustar_cp_mcr_dir, "runtime/glnxa64"),
@@ -842,8 +1310,8 @@ class PipelineUstarCP(object):
             ### MATLAB2018a
             log.debug("Setting MCR_ROOT environment variable to '{d}'".format(d=self.ustar_cp_mcr_dir))
             log.debug("Setting LD_LIBRARY_PATH environment variable to '{d}'".format(d=new_ldlib))
-            os.environ["MCR_ROOT"] = self.ustar_cp_mcr_dir
-            os.environ["LD_LIBRARY_PATH"] = new_ldlib
+            env["MCR_ROOT"] = self.ustar_cp_mcr_dir
+            env["LD_LIBRARY_PATH"] = new_ldlib
 
             # ### MATLAB2012a
             #log.debug("Setting MCR_HOME environment variable to '{d}'".format(d=self.ustar_cp_mcr_dir))
@@ -853,7 +1321,13 @@ class PipelineUstarCP(object):
             #os.environ["MCR_JRE"] = mcr_jre_dir
             #os.environ["LD_LIBRARY_PATH"] = new_ldlib
 
-        run_command(self.cmd)
+        test_create_dir(tdir=self.ustar_cp_input_dir, label='{s}.run'.format(s=self.label))
+        copy_files(tdir=self.pipeline.qc_auto.qc_auto_dir, pattern=self.input_pattern, destination=self.ustar_cp_input_dir, label='{s}.run'.format(s=self.label))
+        shutil.copy2(self.ustar_cp_ex, self.ustar_cp_local_ex)
+        try:
+            self.tool_runs.append(run_tool(args=self.cmd, label=self.label, cwd=self.ustar_cp_dir, output_log=self.output_log, timeout=self.ustar_cp_timeout, env=env))
+        finally:
+            os.remove(self.ustar_cp_local_ex)
         return True
 
 
@@ -864,6 +1338,7 @@ class PipelineMeteoERA(object):
     N.B.: Step dependent on external Python code to be integrated in future releases.
     '''
     METEO_ERA_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert']
     METEO_ERA_DIR = "06_meteo_era"
     _OUTPUT_FILE_PATTERNS = [
         "{s}_????.csv",
@@ -1006,6 +1481,7 @@ class PipelineMeteoMDS(object):
     Step not used in ONEFlux Pipeline (MDS method applied within meteo_proc, nee_proc, energy_proc steps.
     '''
     METEO_MDS_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert', 'meteo_era']
     METEO_MDS_DIR = "07a_meteo_mds"
     METEO_NARR_DIR = "07b_meteo_narr"
     # PRI 2020/10/21 - trap OS type and change EXE name as required
@@ -1058,52 +1534,38 @@ class PipelineMeteoMDS(object):
         log.info("Pipeline meteo_mds execution finished")
 
     def run_meteomds(self):
-        einput = self.qcauto + os.sep
-        eoutput = self.meteomds + os.sep
-        eoutput_log = os.path.join(self.meteomds, 'results.txt')
+        output_log = os.path.join(self.meteo_mds_dir, 'results.txt')
+        input_dir = os.path.join(self.meteo_mds_dir, 'input')
+        input_nee_dir = os.path.join(self.meteo_mds_dir, 'input_nee')
 
-        for tdir in [os.path.join(self.meteomds, i) for i in ['input', 'input_nee', 'ta', 'swin', 'vpd', 'rh', 'nee']]:
-            self.test_create_dir(tdir=tdir, label='MeteoMDS')
+        for tdir in [os.path.join(self.meteo_mds_dir, i) for i in ['input', 'input_nee', 'ta', 'swin', 'vpd', 'rh', 'nee']]:
+            test_create_dir(tdir=tdir, label='meteo_mds.run', simulation=self.pipeline.simulation)
 
-        cp_data = "{copy} {i}*_meteo_*.csv {o}".format(copy=COPY, i=einput, o=os.path.join(eoutput, 'input') + os.sep)
-        cp_data_nee = "{copy} {i}*_nee_*.csv {o}".format(copy=COPY, i=einput, o=os.path.join(eoutput, 'input_nee') + os.sep)
-        #log.info("Data copy command '{c}'".format(c=cp_data))
         # PRI 2020/10/23 - system commands to DEBUG level
-        log.debug("Data copy command '{c}'".format(c=cp_data))
-        log.debug("Data copy command '{c}' (NEE)".format(c=cp_data_nee))
-        if not self.simulation:
-            os.system(cp_data)
-            os.system(cp_data_nee)
+        log.debug("Data copy: '*_meteo_*.csv' and '*_nee_*.csv' from '{i}' to '{o}'".format(i=self.pipeline.qc_auto.qc_auto_dir, o=self.meteo_mds_dir))
+        if not self.pipeline.simulation:
+            copy_files(tdir=self.pipeline.qc_auto.qc_auto_dir, pattern='*_meteo_*.csv', destination=input_dir, label='meteo_mds.run')
+            copy_files(tdir=self.pipeline.qc_auto.qc_auto_dir, pattern='*_nee_*.csv', destination=input_nee_dir, label='meteo_mds.run')
 
-        input_filenames = [ os.path.join(i[0], j) for i in os.walk(os.path.join(self.meteomds, 'input')) for j in i[2] ]
+        input_filenames = [ os.path.join(i[0], j) for i in os.walk(input_dir) for j in i[2] ]
         input_filenames = ','.join([ i for i in input_filenames if '_meteo_' in i])
-        input_filenames_nee = [ os.path.join(i[0], j) for i in os.walk(os.path.join(self.meteomds, 'input_nee')) for j in i[2] ]
+        input_filenames_nee = [ os.path.join(i[0], j) for i in os.walk(input_nee_dir) for j in i[2] ]
         input_filenames_nee = ','.join([ i for i in input_filenames_nee if '_nee_' in i])
 
-        cp_tool = "{copy} {c} {o}".format(copy=COPY, c=self.ex_meteomds, o=eoutput)
-        cmd_ta = "cd {o} {cmd_sep} ./{c} -input={f} -output={n} -tofill=Ta > {l}".format(cmd_sep=CMD_SEP, o=eoutput, c=os.path.basename(self.ex_meteomds), f=input_filenames, n=os.path.join(self.meteomds, 'ta') + os.sep, l=eoutput_log[:-4] + '_ta.txt')
-        cmd_swin = "cd {o} {cmd_sep} ./{c} -input={f} -output={n} -tofill=SWin > {l}".format(cmd_sep=CMD_SEP, o=eoutput, c=os.path.basename(self.ex_meteomds), f=input_filenames, n=os.path.join(self.meteomds, 'swin') + os.sep, l=eoutput_log[:-4] + '_swin.txt')
-        cmd_vpd = "cd {o} {cmd_sep} ./{c} -input={f} -output={n} -tofill=VPD > {l}".format(cmd_sep=CMD_SEP, o=eoutput, c=os.path.basename(self.ex_meteomds), f=input_filenames, n=os.path.join(self.meteomds, 'vpd') + os.sep, l=eoutput_log[:-4] + '_vpd.txt')
-        cmd_rh = "cd {o} {cmd_sep} ./{c} -input={f} -output={n} -tofill=RH > {l}".format(cmd_sep=CMD_SEP, o=eoutput, c=os.path.basename(self.ex_meteomds), f=input_filenames, n=os.path.join(self.meteomds, 'rh') + os.sep, l=eoutput_log[:-4] + '_rh.txt')
-        cmd_nee = "cd {o} {cmd_sep} ./{c} -input={f} -output={n} -tofill=NEE > {l}".format(cmd_sep=CMD_SEP, o=eoutput, c=os.path.basename(self.ex_meteomds), f=input_filenames_nee, n=os.path.join(self.meteomds, 'nee') + os.sep, l=eoutput_log[:-4] + '_nee.txt')
-        del_tool = "{delete} {o}{c}".format(delete=DELETE, o=eoutput, c=os.path.basename(self.ex_meteomds))
-
-        # PRI 2020/10/23 - system commands to DEBUG level
-        log.debug("Tool copy command '{c}'".format(c=cp_tool))
-        log.debug("Execution Ta   command '{c}'".format(c=cmd_ta))
-        log.debug("Execution SWin command '{c}'".format(c=cmd_swin))
-        log.debug("Execution VPD  command '{c}'".format(c=cmd_vpd))
-        log.debug("Execution RH   command '{c}'".format(c=cmd_rh))
-        log.debug("Execution NEE  command '{c}'".format(c=cmd_nee))
-        log.debug("Tool delete command '{c}'".format(c=del_tool))
-        if not self.simulation:
-            os.system(cp_tool)
-            os.system(cmd_ta)
-            os.system(cmd_swin)
-            os.system(cmd_vpd)
-            os.system(cmd_rh)
-            os.system(cmd_nee)
-            os.system(del_tool)
+        # tool runs from a copy in the output directory, once per variable
+        local_ex = os.path.join(self.meteo_mds_dir, os.path.basename(self.meteo_mds_ex))
+        cmds = []
+        for variable, filenames in [('Ta', input_filenames), ('SWin', input_filenames), ('VPD', input_filenames), ('RH', input_filenames), ('NEE', input_filenames_nee)]:
+            cmd = [local_ex, '-input={f}'.format(f=filenames), '-output={n}'.format(n=os.path.join(self.meteo_mds_dir, variable.lower()) + os.sep), '-tofill={v}'.format(v=variable)]
+            log.debug("Execution {v} command '{c}'".format(v=variable, c=cmd))
+            cmds.append((cmd, output_log[:-4] + '_{v}.txt'.format(v=variable.lower())))
+        if not self.pipeline.simulation:
+            shutil.copy2(self.meteo_mds_ex, local_ex)
+            try:
+                for cmd, cmd_log in cmds:
+                    run_tool(args=cmd, label='meteo_mds', cwd=self.meteo_mds_dir, output_log=cmd_log)
+            finally:
+                os.remove(local_ex)
 
 
 class PipelineMeteoProc(object):
@@ -1113,7 +1575,9 @@ class PipelineMeteoProc(object):
     the ECMWF ERA interim downscaled data product.
     '''
     METEO_PROC_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert', 'meteo_era', 'meteo_mds']
     METEO_PROC_DIR = "07_meteo_proc"
+    METEO_PROC_TIMEOUT = None # seconds until meteo_proc is terminated (None uses pipeline tool_timeout)
     # PRI 2020/10/21 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -1158,16 +1622,16 @@ class PipelineMeteoProc(object):
             self.input_qc_auto_dir = '..' + os.sep + os.path.basename(self.pipeline.qc_auto.qc_auto_dir) + os.sep
         self.output_meteo_proc_dir = self.meteo_proc_dir + os.sep
         self.output_log = os.path.join(self.meteo_proc_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
+        self.meteo_proc_timeout = self.pipeline.configs.get('meteo_proc_timeout', self.METEO_PROC_TIMEOUT)
+        self.meteo_proc_timeout = (self.pipeline.tool_timeout if self.meteo_proc_timeout is None else self.meteo_proc_timeout)
+        self.tool_runs = []
         if platform.system() == "Windows":
-            self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -qc_auto_path="{q}" -era_path="{e}" -output_path="{o}" > "{log}"'
+            self.cmd_args = ['-qc_auto_path={q}', '-era_path={e}', '-output_path={o}']
         else:
-            self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -qc_auto_path="{q}" -era_path="{e}" -output_path=. > "{log}"'
-        self.cmd = self.cmd_txt.format(o=self.output_meteo_proc_dir,
-                                       cmd_sep=CMD_SEP,
-                                       c=self.meteo_proc_ex,
-                                       q=self.input_qc_auto_dir,
-                                       e=self.input_meteo_era_dir,
-                                       log=self.output_log)
+            self.cmd_args = ['-qc_auto_path={q}', '-era_path={e}', '-output_path=.']
+        self.cmd = [self.meteo_proc_ex] + [a.format(o=self.output_meteo_proc_dir,
+                                                    q=self.input_qc_auto_dir,
+                                                    e=self.input_meteo_era_dir) for a in self.cmd_args]
         # PRI 2020/10/21 - added to provide a statement for breakpoint
         return
 
@@ -1209,7 +1673,7 @@ class PipelineMeteoProc(object):
         if self.pipeline.simulation:
             log.info("Simulation only, meteo_proc execution command skipped")
         else:
-            run_command(self.cmd)
+            self.tool_runs.append(run_tool(args=self.cmd, label='meteo_proc', cwd=self.meteo_proc_dir, output_log=self.output_log, timeout=self.meteo_proc_timeout))
             self.post_validate()
 
         log.info("Pipeline meteo_proc execution finished")
@@ -1222,7 +1686,9 @@ class PipelineNEEProc(object):
     and reference model selection.
     '''
     NEE_PROC_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert', 'ustar_mp', 'ustar_cp', 'meteo_proc']
     NEE_PROC_DIR = "08_nee_proc"
+    NEE_PROC_TIMEOUT = None # seconds until nee_proc is terminated (None uses pipeline tool_timeout)
     # PRI 2020/10/20 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -1289,18 +1755,18 @@ class PipelineNEEProc(object):
             self.input_meteo_proc_dir = '..' + os.sep + os.path.basename(self.pipeline.meteo_proc.meteo_proc_dir) + os.sep
         self.output_nee_proc_dir = self.nee_proc_dir + os.sep
         self.output_log = os.path.join(self.nee_proc_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
+        self.nee_proc_timeout = self.pipeline.configs.get('nee_proc_timeout', self.NEE_PROC_TIMEOUT)
+        self.nee_proc_timeout = (self.pipeline.tool_timeout if self.nee_proc_timeout is None else self.nee_proc_timeout)
+        self.tool_runs = []
         if platform.system() == "Windows":
-            self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -qc_auto_path="{q}" -ustar_mp_path="{ump}" -ustar_cp_path="{ucp}" -meteo_path="{m}" -output_path="{o}" > "{log}"'
+            self.cmd_args = ['-qc_auto_path={q}', '-ustar_mp_path={ump}', '-ustar_cp_path={ucp}', '-meteo_path={m}', '-output_path={o}']
         else:
-            self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -qc_auto_path="{q}" -ustar_mp_path="{ump}" -ustar_cp_path="{ucp}" -meteo_path="{m}" -output_path=. > "{log}"'
-        self.cmd = self.cmd_txt.format(o=self.output_nee_proc_dir,
-                                       cmd_sep=CMD_SEP,
-                                       c=self.nee_proc_ex,
-                                       q=self.input_qc_auto_dir,
-                                       ump=self.input_ustar_mp_dir,
-                                       ucp=self.input_ustar_cp_dir,
-                                       m=self.input_meteo_proc_dir,
-                                       log=self.output_log)
+            self.cmd_args = ['-qc_auto_path={q}', '-ustar_mp_path={ump}', '-ustar_cp_path={ucp}', '-meteo_path={m}', '-output_path=.']
+        self.cmd = [self.nee_proc_ex] + [a.format(o=self.output_nee_proc_dir,
+                                                  q=self.input_qc_auto_dir,
+                                                  ump=self.input_ustar_mp_dir,
+                                                  ucp=self.input_ustar_cp_dir,
+                                                  m=self.input_meteo_proc_dir) for a in self.cmd_args]
 
     def pre_validate(self):
         '''
@@ -1346,7 +1812,7 @@ class PipelineNEEProc(object):
         if self.pipeline.simulation:
             log.info("Simulation only, nee_proc execution command skipped")
         else:
-            run_command(self.cmd)
+            self.tool_runs.append(run_tool(args=self.cmd, label='nee_proc', cwd=self.nee_proc_dir, output_log=self.output_log, timeout=self.nee_proc_timeout))
             self.post_validate()
 
         log.info("Pipeline nee_proc execution finished")
@@ -1358,6 +1824,7 @@ class PipelineEnergyProc(object):
     Executes the LE and H filtering, gapfilling, and corrections.
     '''
     ENERGY_PROC_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_auto', 'qc_auto_convert']
     # PRI 2020/10/21 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -1365,6 +1832,7 @@ class PipelineEnergyProc(object):
     else:
         ENERGY_PROC_EX = "energy_proc"
     ENERGY_PROC_DIR = "09_energy_proc"
+    ENERGY_PROC_TIMEOUT = None # seconds until energy_proc is terminated (None uses pipeline tool_timeout)
     _OUTPUT_FILE_PATTERNS = [
         "{s}_energy_hh_info.txt",
         "{s}_energy_dd_info.txt",
@@ -1396,14 +1864,14 @@ class PipelineEnergyProc(object):
         self.output_energy_proc_dir = self.energy_proc_dir + os.sep
         self.output_energy_proc_input_dir = self.energy_proc_input_dir + os.sep
         self.output_log = os.path.join(self.energy_proc_dir, OUTPUT_LOG_TEMPLATE.format(t=self.pipeline.run_id))
-        self.cmd_cp_data_txt = '{copy} "{i}"/*_qca_energy*.csv "{o}"'
-        self.cmd_cp_data = self.cmd_cp_data_txt.format(copy=COPY, i=self.pipeline.qc_auto.qc_auto_dir, o=self.output_energy_proc_input_dir)
-        self.cmd_cp_tool_txt = '{copy} {c} "{o}"'
-        self.cmd_cp_tool = self.cmd_cp_tool_txt.format(copy=COPY, c=self.energy_proc_ex, o=self.output_energy_proc_dir)
-        self.cmd_execute_txt = 'cd "{o}" {cmd_sep} ./{c} -input_path="input" -output_path="." > "{log}"'
-        self.cmd_execute = self.cmd_execute_txt.format(cmd_sep=CMD_SEP, o=self.output_energy_proc_dir, c=os.path.basename(self.energy_proc_ex), log=self.output_log)
-        self.cmd_del_tool_txt = '{delete} "{o}{c}"'
-        self.cmd_del_tool = self.cmd_del_tool_txt.format(delete=DELETE, o=self.output_energy_proc_dir, c=os.path.basename(self.energy_proc_ex))
+        self.energy_proc_timeout = self.pipeline.configs.get('energy_proc_timeout', self.ENERGY_PROC_TIMEOUT)
+        self.energy_proc_timeout = (self.pipeline.tool_timeout if self.energy_proc_timeout is None else self.energy_proc_timeout)
+        self.tool_runs = []
+        self.input_pattern = '*_qca_energy*.csv'
+        # tool runs from a copy in the output directory
+        self.energy_proc_local_ex = os.path.join(self.energy_proc_dir, os.path.basename(self.energy_proc_ex))
+        self.cmd_execute_args = ['-input_path=input', '-output_path=.']
+        self.cmd_execute = [self.energy_proc_local_ex] + self.cmd_execute_args
 
     def pre_validate(self):
         '''
@@ -1436,24 +1904,18 @@ class PipelineEnergyProc(object):
         create_replace_dir(tdir=self.energy_proc_dir, label='energy_proc.run', suffix=self.pipeline.run_id, simulation=self.pipeline.simulation)
         test_create_dir(tdir=self.energy_proc_input_dir, label='energy_proc.run', simulation=self.pipeline.simulation)
 
-        #log.info("Data copy command '{c}'".format(c=self.cmd_cp_data))
-        # PRI 2020/10/23 - system commands to DEBUG level
-        log.debug("Data copy command '{c}'".format(c=self.cmd_cp_data))
-        #log.info("Tool copy command '{c}'".format(c=self.cmd_cp_tool))
         # PRI 2020/10/23 - system commands to DEBUG level
-        log.debug("Tool copy command '{c}'".format(c=self.cmd_cp_tool))
-        #log.info("Execution command '{c}'".format(c=self.cmd_execute))
+        log.debug("Tool copy: '{c}' to '{o}'".format(c=self.energy_proc_ex, o=self.energy_proc_local_ex))
         log.debug("Execution command '{c}'".format(c=self.cmd_execute))
-        #log.info("Tool delete command '{c}'".format(c=self.cmd_del_tool))
-        # PRI 2020/10/23 - system commands to DEBUG level
-        log.debug("Tool delete command '{c}'".format(c=self.cmd_del_tool))
         if self.pipeline.simulation:
             log.info("Simulation only, energy_proc execution command skipped")
         else:
-            run_command(self.cmd_cp_data)
-            run_command(self.cmd_cp_tool)
-            run_command(self.cmd_execute)
-            run_command(self.cmd_del_tool)
+            copy_files(tdir=self.pipeline.qc_auto.qc_auto_dir, pattern=self.input_pattern, destination=self.energy_proc_input_dir, label='energy_proc.run')
+            shutil.copy2(self.energy_proc_ex, self.energy_proc_local_ex)
+            try:
+                self.tool_runs.append(run_tool(args=self.cmd_execute, label='energy_proc', cwd=self.energy_proc_dir, output_log=self.output_log, timeout=self.energy_proc_timeout))
+            finally:
+                os.remove(self.energy_proc_local_ex)
             self.post_validate()
 
         log.info("Pipeline energy_proc execution finished")
@@ -1465,7 +1927,9 @@ class PipelineNEEPartitionNT(object):
     Class to control execution of nee_partition_nt step
     '''
     NEE_PARTITION_NT_EXECUTE = True
+    _UPSTREAM_STEPS = ['nee_proc']
     NEE_PARTITION_NT_DIR = "10_nee_partition_nt"
+    NEE_PARTITION_NT_WORKERS = 1
     _OUTPUT_FILE_PATTERNS_Y = [
         "nee_y_?.??_{s}_????{extra}.csv".format(s='{s}', extra=EXTRA_FILENAME), # 1.25, 3.75, 8.75
         "nee_y_??.??_{s}_????{extra}.csv".format(s='{s}', extra=EXTRA_FILENAME), # 11.25, ..., 98.75
@@ -1492,6 +1956,7 @@ class PipelineNEEPartitionNT(object):
         self.output_file_patterns_c = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS_C]
         self.prod_to_compare = self.pipeline.configs.get('prod_to_compare', PROD_TO_COMPARE)
         self.perc_to_compare = self.pipeline.configs.get('perc_to_compare', PERC_TO_COMPARE)
+        self.nee_partition_nt_workers = self.pipeline.configs.get('nee_partition_nt_workers', self.NEE_PARTITION_NT_WORKERS)
 
     def pre_validate(self):
         '''
@@ -1534,7 +1999,10 @@ class PipelineNEEPartitionNT(object):
                              years_to_compare=range(self.pipeline.first_year, self.pipeline.last_year + 1),
                              py_remove_old=False,
                              prod_to_compare=self.prod_to_compare,
-                             perc_to_compare=self.perc_to_compare,)
+                             perc_to_compare=self.perc_to_compare,
+                             workers=self.nee_partition_nt_workers,
+                             cache_dir=self.pipeline.columnar_cache_dir,
+                             keep_columns=self.pipeline.prepare_ure.get_keep_columns(columns=PipelinePrepareURE.NT_COLUMNS))
             self.post_validate()
 
         log.info("Pipeline {s} execution finished".format(s=self.label))
@@ -1545,7 +2013,10 @@ class PipelineNEEPartitionDT(object):
     Class to control execution of nee_partition_dt step
     '''
     NEE_PARTITION_DT_EXECUTE = True
+    _UPSTREAM_STEPS = ['nee_proc']
     NEE_PARTITION_DT_DIR = "11_nee_partition_dt"
+    NEE_PARTITION_DT_WORKERS = 1
+    NEE_PARTITION_DT_WARM_START = False
     _OUTPUT_FILE_PATTERNS_Y = [
         "nee_y_?.??_{s}_????{extra}.csv".format(s='{s}', extra=EXTRA_FILENAME),  # 1.25, 3.75, 8.75
         "nee_y_??.??_{s}_????{extra}.csv".format(s='{s}', extra=EXTRA_FILENAME),  # 11.25, ..., 98.75
@@ -1572,6 +2043,9 @@ class PipelineNEEPartitionDT(object):
         self.output_file_patterns_c = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS_C]
         self.prod_to_compare = self.pipeline.configs.get('prod_to_compare', PROD_TO_COMPARE)
         self.perc_to_compare = self.pipeline.configs.get('perc_to_compare', PERC_TO_COMPARE)
+        self.nee_partition_dt_workers = self.pipeline.configs.get('nee_partition_dt_workers', self.NEE_PARTITION_DT_WORKERS)
+        self.nee_partition_dt_warm_start = self.pipeline.configs.get('nee_partition_dt_warm_start', self.NEE_PARTITION_DT_WARM_START)
+        self.broken_tasks = [] # tasks with broken optimization windows, excluded and re-run
 
     def pre_validate(self):
         '''
@@ -1592,27 +2066,18 @@ class PipelineNEEPartitionDT(object):
         test_file_list(file_list=self.output_file_patterns_y, tdir=self.nee_partition_dt_dir, label='{s}.post_validate'.format(s=self.label), log_only=True)
         test_file_list(file_list=self.output_file_patterns_c, tdir=self.nee_partition_dt_dir, label='{s}.post_validate'.format(s=self.label), log_only=True)
 
-    def run(self, count=0, rerun=False):
+    def run(self):
         '''
-        Executes nee_partition_dt
+        Executes nee_partition_dt; if optimization fails on a window, the
+        window is added to the error file (excluded from its site-year-product),
+        and only the site-year-products with broken windows are re-run
         '''
 
         log.info("Pipeline {s} execution started".format(s=self.label))
         self.pre_validate()
 
-        # if execution fails on optimization step, add window to exclusion and restart with count+1
-        suffix = (self.pipeline.run_id if (count == 0) else self.pipeline.run_id + '_{c}'.format(c=count))
-
-        # either first execution or final execution after all windows found, so previous files can be removed
-        if not rerun:
-            # removes original intermediate files from re-runs
-            create_and_empty_dir(tdir=self.nee_partition_dt_dir, label='{s}.run'.format(s=self.label), suffix=suffix, simulation=self.pipeline.simulation)
-
-            # # keeping original intermediate files from re-runs
-            # create_replace_dir(tdir=self.nee_partition_dt_dir, label='{s}.run'.format(s=self.label), suffix=suffix, simulation=self.pipeline.simulation)
-
-        # changed to true if a call with rerun=True made in this iteration
-        rerun_call = False
+        # removes intermediate files from previous executions
+        create_and_empty_dir(tdir=self.nee_partition_dt_dir, label='{s}.run'.format(s=self.label), suffix=self.pipeline.run_id, simulation=self.pipeline.simulation)
 
         # call partitioning and catches optimization fail exceptions
         #log.info('Execution command: oneflux.tools.partition_dt.run_partition_dt()')
@@ -1621,38 +2086,68 @@ class PipelineNEEPartitionDT(object):
         if self.pipeline.simulation:
             log.info('Simulation only, {s} execution command skipped'.format(s=self.label))
         else:
-            try:
-                run_partition_dt(datadir=self.pipeline.data_dir_main,
-                                 siteid=self.pipeline.siteid,
-                                 sitedir=self.pipeline.site_dir,
-                                 years_to_compare=range(self.pipeline.first_year, self.pipeline.last_year + 1),
-                                 py_remove_old=False,
-                                 prod_to_compare=self.prod_to_compare,
-                                 perc_to_compare=self.perc_to_compare,)
-            except ONEFluxPartitionBrokenOptError as e:
-                error_filename = os.path.join(self.pipeline.data_dir, PARTITIONING_DT_ERROR_FILE.format(s=self.pipeline.siteid))
-                lines2append = ''
-                if not os.path.isfile(error_filename):
-                    lines2append += 'site_year_nee_des,begin,end\n'
-                lines2append += e.line2add + '\n'
-                with open(error_filename, "a") as f:
-                    f.write(lines2append)
-                log.warning('Added line "{line}" to error file "{f}"'.format(line=e.line2add, f=error_filename))
-
-                # if not alredy in rerun mode, marks as rerun, when returning from next call knows rerun for all versions required
-                if not rerun:
-                    log.warning('Will re-run all years/perc/prod for site {s} with {n} restarts'.format(s=self.pipeline.siteid, n=count + 10000))
-                    rerun_call = True
-                log.warning('Restarting DT partitioning for site {s} with {n} restarts'.format(s=self.pipeline.siteid, n=count))
-                self.run(count=count + 1, rerun=True)
-
-            if rerun_call:
-                self.run(count=count + 10000, rerun=False)
+            # existing outputs are skipped by run_partition_dt, so re-runs only compute removed outputs
+            self.broken_tasks = []
+            while True:
+                try:
+                    run_partition_dt(datadir=self.pipeline.data_dir_main,
+                                     siteid=self.pipeline.siteid,
+                                     sitedir=self.pipeline.site_dir,
+                                     years_to_compare=range(self.pipeline.first_year, self.pipeline.last_year + 1),
+                                     py_remove_old=False,
+                                     prod_to_compare=self.prod_to_compare,
+                                     perc_to_compare=self.perc_to_compare,
+                                     workers=self.nee_partition_dt_workers,
+                                     warm_start=self.nee_partition_dt_warm_start,
+                                     cache_dir=self.pipeline.columnar_cache_dir,
+                                     keep_columns=self.pipeline.prepare_ure.get_keep_columns(columns=PipelinePrepareURE.DT_COLUMNS))
+                    break
+                except ONEFluxPartitionBrokenOptError as e:
+                    self.add_broken_windows(e)
+                    log.warning('Re-running DT partitioning for site {s}, {n} broken windows so far'.format(s=self.pipeline.siteid, n=len(self.broken_tasks)))
 
             self.post_validate()
 
         log.info("Pipeline {s} execution finished".format(s=self.label))
 
+    def add_broken_windows(self, error):
+        '''
+        Adds broken windows to error file and removes outputs of their
+        site-year-products (all percentiles), computed without the windows excluded
+
+        :param error: broken optimization error (from run_partition_dt)
+        :type error: ONEFluxPartitionBrokenOptError
+        '''
+        error_filename = os.path.join(self.pipeline.data_dir, PARTITIONING_DT_ERROR_FILE.format(s=self.pipeline.siteid))
+        lines2append = ''
+        if not os.path.isfile(error_filename):
+            lines2append += 'site_year_nee_des,begin,end\n'
+        else:
+            # same window broken again would re-run indefinitely
+            with open(error_filename, 'r') as f:
+                existing_lines = [line.strip() for line in f]
+            repeated = [line2add for line2add in error.lines2add if line2add in existing_lines]
+            if repeated:
+                msg = "{s} broken windows already excluded: {l}".format(s=self.label, l=repeated)
+                log.critical(msg)
+                raise ONEFluxPipelineError(msg)
+        # parallel execution can report broken windows for multiple site-year-products at once
+        for line2add in error.lines2add:
+            lines2append += line2add + '\n'
+        with open(error_filename, "a") as f:
+            f.write(lines2append)
+        for line2add in error.lines2add:
+            log.warning('Added line "{line}" to error file "{f}"'.format(line=line2add, f=error_filename))
+
+        for prod, year, perc, day_begin, day_end in error.broken_tasks:
+            log.warning('Broken DT optimization for product {u}, year {y}, percentile {p}, window {b:.0f}-{e:.0f}'.format(u=prod, y=year, p=perc, b=day_begin, e=day_end))
+            self.broken_tasks.append({'ustar_type': prod, 'year': year, 'percentile': perc, 'day_begin': day_begin, 'day_end': day_end})
+            for percentile in self.perc_to_compare:
+                output_filename = os.path.join(self.nee_partition_dt_dir, FILENAME_TEMPLATE.format(prod=prod, perc=percentile, s=self.pipeline.siteid, y=year, add=EXTRA_FILENAME, e='csv'))
+                if os.path.isfile(output_filename):
+                    log.debug("Removing output computed before broken window excluded: '{f}'".format(f=output_filename))
+                    os.remove(output_filename)
+
 
 
 class PipelineNEEPartitionSR(object):
@@ -1660,6 +2155,7 @@ class PipelineNEEPartitionSR(object):
     Class to control execution of nee_partition_nt step
     '''
     NEE_PARTITION_SR_EXECUTE = False # TODO: change default when method implemented
+    _UPSTREAM_STEPS = ['nee_proc']
     NEE_PARTITION_SR_DIR = os.path.join("13_nee_partition_sr", "reco")
     _OUTPUT_FILE_PATTERNS = [
         "{s}_????_sr_reco.csv",
@@ -1721,6 +2217,7 @@ class PipelinePrepareUREPW(object):
     creates input files for URE.
     '''
     PREPARE_URE_EXECUTE = True
+    _UPSTREAM_STEPS = ['nee_partition_nt', 'nee_partition_dt', 'nee_partition_sr']
     PREPARE_URE_DIR = os.path.join("12_ure", "input")
     _OUTPUT_FILE_PATTERNS_NT_DT = [
         "{s}_????_DT_GPP.csv",
@@ -1808,7 +2305,15 @@ class PipelinePrepareURE(object):
     creates input files for URE.
     '''
     PREPARE_URE_EXECUTE = True
+    _UPSTREAM_STEPS = ['nee_partition_nt', 'nee_partition_dt', 'nee_partition_sr']
+    # use partitioning results kept in memory (same process), instead of reloading files; costs memory
+    # until prepare_ure runs: float32 reco/gpp columns of all NT and DT outputs, about 140KB per
+    # output (17520 half-hours x 2 columns), 82 outputs per method and year, about 23MB per
+    # site-year for NT and DT (460MB for a 20 year site, multiplied by concurrent sites in batch runs)
+    PREPARE_URE_IN_MEMORY = False
     PREPARE_URE_DIR = os.path.join("12_ure_input")
+    NT_COLUMNS = ['reco_2', 'gpp_2']
+    DT_COLUMNS = ['reco_hblr', 'gpp_hblr']
     DT_GPP_TEMPLATE = "{s}_{y}_DT_GPP.csv"
     DT_RECO_TEMPLATE = "{s}_{y}_DT_RECO.csv"
     NT_GPP_TEMPLATE = "{s}_{y}_NT_GPP.csv"
@@ -1835,12 +2340,27 @@ class PipelinePrepareURE(object):
         self.perc = perc
         self.prod = prod
         self.execute = self.pipeline.configs.get('prepare_ure_execute', self.PREPARE_URE_EXECUTE)
+        self.in_memory = self.pipeline.configs.get('prepare_ure_in_memory', self.PREPARE_URE_IN_MEMORY)
         self.prepare_ure_dir = self.pipeline.configs.get('prepare_ure_dir', os.path.join(self.pipeline.data_dir, self.PREPARE_URE_DIR))
         self.prepare_ure_dir_fmt = self.prepare_ure_dir + os.sep
         self.output_file_patterns_nt_dt = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS_NT_DT]
         self.output_file_patterns_sr = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS_SR]
 
 
+    def get_keep_columns(self, columns):
+        '''
+        Columns partitioning steps should keep in memory for this step,
+        only if this step will run in the same process (not disabled or resumed past)
+
+        :param columns: labels of columns used from partitioning results (NT_COLUMNS or DT_COLUMNS)
+        :type columns: list
+        :rtype: list or None if no columns to be kept
+        '''
+        if self.execute and self.in_memory and (self not in self.pipeline.resume_steps):
+            return columns
+        return None
+
+
     def pre_validate(self):
         '''
         Validate pre-execution requirements
@@ -1974,6 +2494,25 @@ class PipelinePrepareURE(object):
         return reco, gpp
 
 
+    def load_columns(self, filename, columns):
+        '''
+        Loads columns from partitioning results, from memory if kept
+        by partitioning in the same process or only needed columns from file
+
+        :param filename: name of partitioning results file
+        :type filename: str
+        :param columns: labels of columns to be loaded
+        :type columns: list
+        :rtype: dict (column label: numpy.ndarray)
+        '''
+        data = (get_result_columns(filename=filename, columns=columns) if self.in_memory else None)
+        if data is None:
+            data = load_output_columns(filename=filename, columns=columns)
+        else:
+            log.debug("Pipeline prepare_ure: using results kept in memory for '{f}'".format(f=filename))
+        return data
+
+
     def convert_files(self):
         '''
         Runs the actual conversion of partitioning outputs into URE inputs
@@ -2006,34 +2545,26 @@ class PipelinePrepareURE(object):
 
                     # load NT
                     if test_file(tfile=nt_filename, label='ure.run', log_only=True):
-                        with open(nt_filename, 'r') as f:
-                            header_line = f.readline()
-                            input_headers = [i.strip().replace('.', '__').lower() for i in header_line.strip().split(',')]
-                        reco_idx, gpp_idx = input_headers.index('reco_2'), input_headers.index('gpp_2'),
-                        data = numpy.genfromtxt(fname=nt_filename, names=True, delimiter=',', skip_header=0, usemask=False, usecols=(reco_idx, gpp_idx,))
+                        data = self.load_columns(filename=nt_filename, columns=self.NT_COLUMNS)
                         reco_nt_data[var][:], gpp_nt_data[var][:] = self.check_cleanup_nt(reco=data['reco_2'], gpp=data['gpp_2'], filename=nt_filename)
 
                     # load DT
                     dt_filename = os.path.join(self.pipeline.nee_partition_dt.nee_partition_dt_dir, generic_filename)
                     if test_file(tfile=dt_filename, label='ure.run', log_only=True):
-                        with open(dt_filename, 'r') as f:
-                            header_line = f.readline()
-                            input_headers = [i.strip().replace('.', '__').lower() for i in header_line.strip().split(',')]
-                        reco_idx, gpp_idx = input_headers.index('reco_hblr'), input_headers.index('gpp_hblr'),
-                        data = numpy.genfromtxt(fname=dt_filename, names=True, delimiter=',', skip_header=0, usemask=False, usecols=(reco_idx, gpp_idx,))
+                        data = self.load_columns(filename=dt_filename, columns=self.DT_COLUMNS)
                         reco_dt_data[var][:], gpp_dt_data[var][:] = self.check_cleanup_dt(reco=data['reco_hblr'], gpp=data['gpp_hblr'], filename=dt_filename)
 
-                # save NT
-                numpy.savetxt(fname=gpp_nt_output_filename, X=gpp_nt_data, delimiter=',', fmt='%s', header=','.join([i.replace('__', '.') for i in gpp_nt_data.dtype.names]), comments='')
-                log.info("Pipeline prepare_ure: saved '{s}'".format(s=gpp_nt_output_filename))
-                numpy.savetxt(fname=reco_nt_output_filename, X=reco_nt_data, delimiter=',', fmt='%s', header=','.join([i.replace('__', '.') for i in reco_nt_data.dtype.names]), comments='')
-                log.info("Pipeline prepare_ure: saved '{s}'".format(s=reco_nt_output_filename))
+            # save NT (once per year, after all products and percentiles loaded)
+            write_csv(filename=gpp_nt_output_filename, data=gpp_nt_data, delimiter=',', header=','.join([i.replace('__', '.') for i in gpp_nt_data.dtype.names]))
+            log.info("Pipeline prepare_ure: saved '{s}'".format(s=gpp_nt_output_filename))
+            write_csv(filename=reco_nt_output_filename, data=reco_nt_data, delimiter=',', header=','.join([i.replace('__', '.') for i in reco_nt_data.dtype.names]))
+            log.info("Pipeline prepare_ure: saved '{s}'".format(s=reco_nt_output_filename))
 
-                # save DT
-                numpy.savetxt(fname=gpp_dt_output_filename, X=gpp_dt_data, delimiter=',', fmt='%s', header=','.join([i.replace('__', '.') for i in gpp_dt_data.dtype.names]), comments='')
-                log.info("Pipeline prepare_ure: saved '{s}'".format(s=gpp_dt_output_filename))
-                numpy.savetxt(fname=reco_dt_output_filename, X=reco_dt_data, delimiter=',', fmt='%s', header=','.join([i.replace('__', '.') for i in reco_dt_data.dtype.names]), comments='')
-                log.info("Pipeline prepare_ure: saved '{s}'".format(s=reco_dt_output_filename))
+            # save DT
+            write_csv(filename=gpp_dt_output_filename, data=gpp_dt_data, delimiter=',', header=','.join([i.replace('__', '.') for i in gpp_dt_data.dtype.names]))
+            log.info("Pipeline prepare_ure: saved '{s}'".format(s=gpp_dt_output_filename))
+            write_csv(filename=reco_dt_output_filename, data=reco_dt_data, delimiter=',', header=','.join([i.replace('__', '.') for i in reco_dt_data.dtype.names]))
+            log.info("Pipeline prepare_ure: saved '{s}'".format(s=reco_dt_output_filename))
 
 
     def run(self):
@@ -2049,7 +2580,11 @@ class PipelinePrepareURE(object):
         if self.pipeline.simulation:
             log.info('Simulation only, {s} execution command skipped'.format(s=self.label))
         else:
-            self.convert_files()
+            try:
+                self.convert_files()
+            finally:
+                # release partitioning results kept in memory, used or not
+                clear_result_columns()
             self.post_validate()
 
         log.info("Pipeline prepare_ure execution finished")
@@ -2061,6 +2596,7 @@ class PipelineURE(object):
     Executes the Uncertainty and References Estimations/calculations.
     '''
     URE_EXECUTE = True
+    _UPSTREAM_STEPS = ['prepare_ure']
     # PRI 2020/10/20 - trap OS type and change EXE name as required
     # there is a better way to do this ...
     if platform.system() == "Windows":
@@ -2068,6 +2604,7 @@ class PipelineURE(object):
     else:
         URE_EX = "ure"
     URE_DIR = "12_ure"
+    URE_TIMEOUT = None # seconds until ure is terminated (None uses pipeline tool_timeout)
     _OUTPUT_FILE_PATTERNS = [
         "{s}_DT_GPP_dd.csv",
         "{s}_DT_GPP_hh.csv",
@@ -2174,8 +2711,11 @@ class PipelineURE(object):
         self.output_file_patterns_mef = [i.format(s=self.pipeline.siteid) for i in self._OUTPUT_FILE_PATTERNS_MEF]
         self.input_prepare_ure_dir = self.pipeline.prepare_ure.prepare_ure_dir_fmt
         self.output_log = os.path.join(self.ure_dir, 'report_{t}.txt'.format(t=self.pipeline.run_id))
-        self.cmd_txt = 'cd "{o}" {cmd_sep} {c} -input_path={i} -output_path={o} > "{log}"'
-        self.cmd = self.cmd_txt.format(c=self.ure_ex, i=self.input_prepare_ure_dir, o=self.ure_dir_fmt, log=self.output_log, cmd_sep=CMD_SEP, cp=COPY)
+        self.ure_timeout = self.pipeline.configs.get('ure_timeout', self.URE_TIMEOUT)
+        self.ure_timeout = (self.pipeline.tool_timeout if self.ure_timeout is None else self.ure_timeout)
+        self.tool_runs = []
+        self.cmd_args = ['-input_path={i}', '-output_path={o}']
+        self.cmd = [self.ure_ex] + [a.format(i=self.input_prepare_ure_dir, o=self.ure_dir_fmt) for a in self.cmd_args]
 
     def pre_validate(self):
         '''
@@ -2214,7 +2754,7 @@ class PipelineURE(object):
         if self.pipeline.simulation:
             log.info('Simulation only, {s} execution command skipped'.format(s=self.label))
         else:
-            run_command(self.cmd)
+            self.tool_runs.append(run_tool(args=self.cmd, label=self.label, cwd=self.ure_dir, output_log=self.output_log, timeout=self.ure_timeout))
             self.post_validate()
         log.info('Pipeline {s} execution finished'.format(s=self.label))
 
@@ -2225,6 +2765,7 @@ class PipelineFLUXNET2015(object):
     Step to generate FLUXNET2015 data product
     '''
     FLUXNET2015_EXECUTE = True
+    _UPSTREAM_STEPS = ['qc_visual', 'meteo_proc', 'nee_proc', 'energy_proc', 'ure']
     FLUXNET2015_DIR = '99_fluxnet2015'
     FLUXNET2015_SITE_PLOTS = True
     FLUXNET2015_FIRST_T1 = None
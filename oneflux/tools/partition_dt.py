@@ -21,7 +21,7 @@ import socket
 
 from datetime import datetime, timedelta
 from oneflux import ONEFluxError
-from oneflux.partition.daytime import partitioning_dt, PARAM_DTYPE
+from oneflux.partition.daytime import partitioning_dt, PARAM_DTYPE, DT_WORKERS, DT_WARM_START
 from oneflux.partition.auxiliary import FLOAT_PREC, NAN, NAN_TEST, nan, not_nan
 from oneflux.partition.library import STRING_HEADERS, DT_OUTPUT_DIR, EXTRA_FILENAME
 from oneflux.graph.compare import plot_comparison, compute_plot_param_diffs
@@ -64,9 +64,9 @@ def remove_previous_run(datadir, siteid, sitedir, prod_to_compare, perc_to_compa
     return
 
 
-def run_python(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare):
+def run_python(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare, workers=DT_WORKERS, warm_start=DT_WARM_START, cache_dir=None, keep_columns=None):
     log.debug("Python partitioning execution started")
-    partitioning_dt(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
+    partitioning_dt(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare, workers=workers, warm_start=warm_start, cache_dir=cache_dir, keep_columns=keep_columns)
     log.debug("Python partitioning execution finished")
     return
 
@@ -119,7 +119,7 @@ PERC_TO_COMPARE = ['1.25', '3.75', '6.25', '8.75', '11.25', '13.75', '16.25', '1
 def run_partition_dt(datadir, siteid, sitedir, years_to_compare,
                      dt_dir=DT_OUTPUT_DIR, filename_template=FILENAME_TEMPLATE,
                      prod_to_compare=PROD_TO_COMPARE, perc_to_compare=PERC_TO_COMPARE,
-                     py_remove_old=False):
+                     py_remove_old=False, workers=DT_WORKERS, warm_start=DT_WARM_START, cache_dir=None, keep_columns=None):
     """
     Runs daytime partitioning
 
@@ -142,9 +142,17 @@ def run_partition_dt(datadir, siteid, sitedir, years_to_compare,
     :type perc_to_compare: list
     :param py_remove_old: if True, removes old python partitioning results (after backup), file has to be missing for run
     :type py_remove_old: bool
+    :param workers: number of worker processes for partitioning tasks (1 runs serially)
+    :type workers: int
+    :param warm_start: if True, window fits start from parameters of previous window (False reproduces legacy results)
+    :type warm_start: bool
+    :param cache_dir: columnar cache directory for parsed inputs (if None, no caching)
+    :type cache_dir: str
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process
+    :type keep_columns: list
     """
     remove_previous_run(datadir=datadir, siteid=siteid, sitedir=sitedir, python=py_remove_old, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
-    run_python(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
+    run_python(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare, workers=workers, warm_start=warm_start, cache_dir=cache_dir, keep_columns=keep_columns)
 
 
 if __name__ == '__main__':
@@ -23,11 +23,12 @@ import calendar
 from datetime import datetime
 from io import StringIO
 from oneflux import ONEFluxError
-from oneflux.partition.nighttime import partitioning_nt, STEP_SIZE
+from oneflux.partition.nighttime import partitioning_nt, STEP_SIZE, NT_WORKERS
 from oneflux.partition.library import STRING_HEADERS, NT_OUTPUT_DIR, EXTRA_FILENAME
 from oneflux.partition.auxiliary import FLOAT_PREC, NAN, NAN_TEST, nan, not_nan
 from oneflux.graph.compare import plot_comparison, plot_e0_comparison, plot_param_diff_vs, compute_plot_e0_diffs
 from oneflux.utils.files import file_exists_not_empty, check_create_directory
+from oneflux.utils.strings import timestamps_to_datetime64
 
 
 log = logging.getLogger(__name__)
@@ -67,9 +68,9 @@ def remove_previous_run(datadir, siteid, sitedir, prod_to_compare, perc_to_compa
     return
 
 
-def run_python(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare):
+def run_python(datadir, siteid, sitedir, prod_to_compare, perc_to_compare, years_to_compare, workers=NT_WORKERS, cache_dir=None, keep_columns=None):
     log.debug("Python partitioning execution started")
-    partitioning_nt(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
+    partitioning_nt(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare, workers=workers, cache_dir=cache_dir, keep_columns=keep_columns)
     log.debug("Python partitioning execution finished")
     return
 
@@ -89,7 +90,7 @@ def load_outputs(filename, delimiter=',', skip_header=1):
     data = numpy.genfromtxt(fname=filename, dtype=dtype, names=headers, delimiter=delimiter, skip_header=skip_header, missing_values='-9999,-9999.0,-6999,-6999.0, ', usemask=True)
     data = numpy.ma.filled(data, vfill)
 
-    timestamp_list = [datetime(int(i['year']), int(i['month']), int(i['day']), int(i['hour']), int(i['minute'])) for i in data]
+    timestamp_list = timestamps_to_datetime64(dict((c, data[c].astype(int)) for c in ['year', 'month', 'day', 'hour', 'minute'])).tolist()
 
     log.debug("Finished loading {f}".format(f=filename))
     return data, headers, timestamp_list
@@ -106,7 +107,7 @@ PERC_TO_COMPARE = ['1.25', '3.75', '6.25', '8.75', '11.25', '13.75', '16.25', '1
 def run_partition_nt(datadir, siteid, sitedir, years_to_compare,
                      nt_dir=NT_OUTPUT_DIR, filename_template=FILENAME_TEMPLATE,
                      prod_to_compare=PROD_TO_COMPARE, perc_to_compare=PERC_TO_COMPARE,
-                     py_remove_old=False):
+                     py_remove_old=False, workers=NT_WORKERS, cache_dir=None, keep_columns=None):
     """
     Runs nighttime partitioning
 
@@ -129,9 +130,15 @@ def run_partition_nt(datadir, siteid, sitedir, years_to_compare,
     :type perc_to_compare: list
     :param py_remove_old: if True, removes old python partitioning results (after backup), file has to be missing for run
     :type py_remove_old: bool
+    :param workers: number of worker processes for partitioning tasks (1 runs serially)
+    :type workers: int
+    :param cache_dir: columnar cache directory for parsed inputs (if None, no caching)
+    :type cache_dir: str
+    :param keep_columns: labels of result columns kept in memory for later steps in the same process
+    :type keep_columns: list
     """
     remove_previous_run(datadir=datadir, siteid=siteid, sitedir=sitedir, python=py_remove_old, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
-    run_python(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare)
+    run_python(datadir=datadir, siteid=siteid, sitedir=sitedir, prod_to_compare=prod_to_compare, perc_to_compare=perc_to_compare, years_to_compare=years_to_compare, workers=workers, cache_dir=cache_dir, keep_columns=keep_columns)
 
 
 if __name__ == '__main__':
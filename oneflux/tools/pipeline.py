@@ -12,12 +12,16 @@ Execution controller module for full pipeline runs
 '''
 import sys
 import os
+import csv
+import time
+import Queue
 import logging
 import argparse
+import multiprocessing
 
 from datetime import datetime
 
-from oneflux import ONEFluxError, log_trace, VERSION_METADATA, VERSION_PROCESSING
+from oneflux import ONEFluxError, add_file_log, log_trace, VERSION_METADATA, VERSION_PROCESSING
 from oneflux.pipeline.wrappers import Pipeline
 from oneflux.pipeline.common import TOOL_DIRECTORY, MCR_DIRECTORY, ONEFluxPipelineError, NOW_TS
 from oneflux.tools.partition_nt import PROD_TO_COMPARE, PERC_TO_COMPARE
@@ -28,7 +32,8 @@ log = logging.getLogger(__name__)
 def run_pipeline(datadir, siteid, sitedir, firstyear, lastyear, version_data=VERSION_METADATA,
                  version_proc=VERSION_PROCESSING, prod_to_compare=PROD_TO_COMPARE,
                  perc_to_compare=PERC_TO_COMPARE, mcr_directory=None, timestamp=NOW_TS,
-                 record_interval='hh', pipeline_steps=None):
+                 record_interval='hh', pipeline_steps=None, workers=1, step_workers=1, incremental=False,
+                 tool_timeout=None, resume=False, columnar_cache=False, in_memory_results=False):
 
     sitedir_full = os.path.abspath(os.path.join(datadir, sitedir))
     if not sitedir or not os.path.isdir(sitedir_full):
@@ -63,6 +68,14 @@ def run_pipeline(datadir, siteid, sitedir, firstyear, lastyear, version_data=VER
                     energy_proc_execute=pipeline_steps["energy_proc_execute"],
                     nee_partition_nt_execute=pipeline_steps["nee_partition_nt_execute"],
                     nee_partition_dt_execute=pipeline_steps["nee_partition_dt_execute"],
+                    nee_partition_nt_workers=workers,
+                    nee_partition_dt_workers=workers,
+                    step_workers=step_workers,
+                    incremental=incremental,
+                    resume=resume,
+                    columnar_cache=columnar_cache,
+                    prepare_ure_in_memory=in_memory_results,
+                    tool_timeout=tool_timeout,
                     prepare_ure_execute=pipeline_steps["prepare_ure_execute"],
                     ure_execute=pipeline_steps["ure_execute"],
                     fluxnet2015_execute=pipeline_steps["fluxnet2015_execute"],
@@ -84,5 +97,183 @@ def run_pipeline(datadir, siteid, sitedir, firstyear, lastyear, version_data=VER
         log_trace(exception=e, level=logging.CRITICAL, log=log)
         raise
 
+
+BATCH_MANIFEST_COLUMNS = ['site_id', 'site_dir', 'first_year', 'last_year'] # required columns in site manifest files
+BATCH_SITE_LOG_FILENAME = 'batch_{s}_{t}.log'                               # per-site log file name in batch runs
+BATCH_POLL_INTERVAL = 1.0                                                    # seconds between checks on running site processes
+BATCH_SITE_OK = 'OK'                                                         # status of sites processed successfully
+BATCH_SITE_FAILED = 'FAILED'                                                 # status of sites with errors
+def load_site_manifest(filename):
+    """
+    Loads site manifest for batch runs: comma separated file with header line
+    including BATCH_MANIFEST_COLUMNS (other columns ignored), one site per line;
+    empty lines and lines starting with '#' are skipped
+
+    :param filename: name of manifest file
+    :type filename: str
+    :rtype: list (of dicts, one per site, keys from BATCH_MANIFEST_COLUMNS)
+    """
+    log.debug("Started loading site manifest '{f}'".format(f=filename))
+    if not os.path.isfile(filename):
+        msg = "Site manifest not found: '{f}'".format(f=filename)
+        log.critical(msg)
+        raise ONEFluxError(msg)
+
+    with open(filename, 'r') as f:
+        lines = [l for l in f if l.strip() and not l.lstrip().startswith('#')]
+    reader = csv.DictReader(lines, skipinitialspace=True)
+    missing = [c for c in BATCH_MANIFEST_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        msg = "Site manifest '{f}' missing columns: {c}".format(f=filename, c=missing)
+        log.critical(msg)
+        raise ONEFluxError(msg)
+
+    sites, siteids = [], set()
+    for line_number, row in enumerate(reader, start=2):
+        try:
+            site = {'site_id': row['site_id'].strip(),
+                    'site_dir': row['site_dir'].strip(),
+                    'first_year': int(row['first_year']),
+                    'last_year': int(row['last_year'])}
+        except (AttributeError, TypeError, ValueError) as e:
+            msg = "Site manifest '{f}' invalid entry {n}: {e}".format(f=filename, n=line_number, e=str(e))
+            log.critical(msg)
+            raise ONEFluxError(msg)
+        if site['site_id'] in siteids:
+            msg = "Site manifest '{f}' duplicate site: {s}".format(f=filename, s=site['site_id'])
+            log.critical(msg)
+            raise ONEFluxError(msg)
+        siteids.add(site['site_id'])
+        sites.append(site)
+
+    log.debug("Finished loading site manifest '{f}': {n} sites".format(f=filename, n=len(sites)))
+    return sites
+
+
+def _run_batch_site(site, log_filename, pipeline_kwargs, results):
+    """
+    Runs pipeline for single site of batch run (target of site process),
+    logging only into site log file; puts (site_id, status, message) into results
+
+    :param site: site entry, from load_site_manifest
+    :type site: dict
+    :param log_filename: name of site log file
+    :type log_filename: str
+    :param pipeline_kwargs: keyword arguments for run_pipeline shared by all sites
+    :type pipeline_kwargs: dict
+    :param results: queue for site result
+    :type results: multiprocessing.Queue
+    """
+    # handlers inherited from batch process would interleave all sites
+    logger_root = logging.getLogger()
+    for handler in list(logger_root.handlers):
+        logger_root.removeHandler(handler)
+    add_file_log(filename=log_filename)
+
+    status, message = BATCH_SITE_OK, ''
+    try:
+        run_pipeline(siteid=site['site_id'], sitedir=site['site_dir'],
+                     firstyear=site['first_year'], lastyear=site['last_year'], **pipeline_kwargs)
+    except Exception as e:
+        status, message = BATCH_SITE_FAILED, str(e)
+    logging.shutdown()
+    results.put((site['site_id'], status, message))
+
+
+def run_pipeline_batch(datadir, sites, log_dir=None, site_workers=1, timestamp=NOW_TS, **pipeline_kwargs):
+    """
+    Runs pipeline for multiple independent sites, up to site_workers sites at a time,
+    each in its own process and with its own log file (in log_dir);
+    errors in one site do not interrupt others
+
+    Site processes are not daemonic, so sites can still use worker
+    processes for partitioning (workers parameter of run_pipeline)
+
+    :param datadir: general data directory (site directories relative to it)
+    :type datadir: str
+    :param sites: site entries, from load_site_manifest
+    :type sites: list
+    :param log_dir: directory for site log files (datadir if None)
+    :type log_dir: str
+    :param site_workers: number of sites processed concurrently
+    :type site_workers: int
+    :param timestamp: timestamp used in processing IDs and log file names
+    :type timestamp: str
+    :param pipeline_kwargs: other keyword arguments for run_pipeline, shared by all sites
+    :type pipeline_kwargs: dict
+    :rtype: list (of dicts with site_id, status, elapsed seconds, message and log file; same order as sites)
+    """
+    log_dir = os.path.abspath(datadir if log_dir is None else log_dir)
+    if not os.path.isdir(log_dir):
+        msg = "Batch log directory not found: '{d}'".format(d=log_dir)
+        log.critical(msg)
+        raise ONEFluxError(msg)
+    site_workers = max(1, min(site_workers, len(sites)))
+    pipeline_kwargs.update(datadir=datadir, timestamp=timestamp)
+
+    log.info("Started batch of {n} sites using {w} site processes".format(n=len(sites), w=site_workers))
+    summary = {}
+    for site in sites:
+        summary[site['site_id']] = {'site_id': site['site_id'], 'status': None, 'elapsed': None, 'message': '',
+                                    'log_file': os.path.join(log_dir, BATCH_SITE_LOG_FILENAME.format(s=site['site_id'], t=timestamp))}
+
+    results = multiprocessing.Queue()
+    pending, running = list(sites), {}
+    try:
+        while pending or running:
+            while pending and len(running) < site_workers:
+                site = pending.pop(0)
+                process = multiprocessing.Process(target=_run_batch_site, name=site['site_id'],
+                                                  args=(site, summary[site['site_id']]['log_file'], pipeline_kwargs, results))
+                process.start()
+                running[site['site_id']] = (process, time.time())
+                log.info("Started site {s} ({d})".format(s=site['site_id'], d=site['site_dir']))
+
+            try:
+                siteid, status, message = results.get(timeout=BATCH_POLL_INTERVAL)
+            except Queue.Empty:
+                # sites whose process ended without result (e.g., killed)
+                for siteid, (process, _) in running.items():
+                    if not process.is_alive() and results.empty():
+                        process.join()
+                        finished = running.pop(siteid)
+                        summary[siteid].update(status=BATCH_SITE_FAILED, elapsed=time.time() - finished[1],
+                                               message="site process exited with code {c}".format(c=process.exitcode))
+                        log.error("Finished site {s}: {t} ({m})".format(s=siteid, t=BATCH_SITE_FAILED, m=summary[siteid]['message']))
+                continue
+
+            process, started = running.pop(siteid)
+            process.join()
+            summary[siteid].update(status=status, elapsed=time.time() - started, message=message)
+            if status == BATCH_SITE_OK:
+                log.info("Finished site {s}: {t} in {e:.1f}s".format(s=siteid, t=status, e=summary[siteid]['elapsed']))
+            else:
+                log.error("Finished site {s}: {t} in {e:.1f}s ({m})".format(s=siteid, t=status, e=summary[siteid]['elapsed'], m=message))
+    except:
+        for process, _ in running.values():
+            process.terminate()
+            process.join()
+        raise
+
+    summary = [summary[site['site_id']] for site in sites]
+    log_batch_summary(summary)
+    return summary
+
+
+def log_batch_summary(summary):
+    """
+    Logs summary of batch run: status and elapsed time for each site,
+    totals of successful and failed sites
+
+    :param summary: site results, from run_pipeline_batch
+    :type summary: list
+    """
+    failed = [s for s in summary if s['status'] != BATCH_SITE_OK]
+    log.info("Batch summary: {o} sites OK, {f} sites FAILED".format(o=len(summary) - len(failed), f=len(failed)))
+    for s in summary:
+        log.info("Batch summary: {s} {t} {e:.1f}s log '{l}'".format(s=s['site_id'], t=s['status'], e=s['elapsed'], l=s['log_file']))
+    for s in failed:
+        log.error("Batch summary: {s} FAILED: {m}".format(s=s['site_id'], m=s['message']))
+
 if __name__ == '__main__':
     sys.exit("ERROR: cannot run independently")
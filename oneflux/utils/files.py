@@ -12,11 +12,17 @@ File manipulation utilities
 '''
 import os
 import sys
+import copy
 import logging
+import platform
 import subprocess
 import zipfile
 import hashlib
 import fnmatch
+import json
+import shutil
+import tempfile
+import numpy
 
 from datetime import datetime
 
@@ -330,6 +336,197 @@ def file_stat(filename):
     return (size, md5sum, timestamp_change)
 
 
+def load_json_manifest(filename, default=None):
+    """
+    Loads JSON manifest (dictionary), returns copy of default
+    (updated with manifest contents) if not found or invalid
+
+    :param filename: path to manifest file
+    :type filename: str
+    :param default: default manifest contents (empty if None)
+    :type default: dict
+    :rtype: dict
+    """
+    manifest = copy.deepcopy(default if default is not None else {})
+    if not os.path.isfile(filename):
+        return manifest
+    try:
+        with open(filename, 'r') as f:
+            manifest.update(json.load(f))
+    except (IOError, ValueError, TypeError) as e:
+        _log.warning("Invalid manifest '{f}', ignoring: {e}".format(f=filename, e=str(e)))
+    return manifest
+
+
+def save_json_manifest(filename, manifest, indent=1):
+    """
+    Saves JSON manifest, written to temporary file and renamed, so partial
+    files are never loaded; on Windows, existing file is removed before
+    renaming (os.rename does not replace existing files)
+
+    :param filename: path to manifest file
+    :type filename: str
+    :param manifest: manifest contents
+    :type manifest: dict
+    :param indent: JSON indentation
+    :type indent: int
+    """
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as f:
+        json.dump(manifest, f, indent=indent, sort_keys=True)
+    if platform.system() == "Windows" and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temp_filename, filename)
+    _log.debug("Saved manifest '{f}'".format(f=filename))
+
+
+COLUMNAR_CACHE_DIRNAME = '.columnar_cache'  # default cache directory name, created under pipeline data directory when enabled
+COLUMNAR_CACHE_META = 'columns.json'        # cache entry metadata (names, shape, masked)
+COLUMNAR_CACHE_MAX_SIZE = 2 ** 30           # 1GiB, total size of cache entries kept after pruning
+
+def genfromtxt_cached(fname, cache_dir=None, max_size=COLUMNAR_CACHE_MAX_SIZE, **kwargs):
+    """
+    Loads text file using numpy.genfromtxt, with optional on-disk columnar cache:
+    parsed columns are saved as .npy files (one per column, plus masks for masked arrays)
+    and later loaded instead of parsing text again.
+    Cache entries are keyed by source file path, size, modification time
+    and genfromtxt parameters, so rewritten files are re-parsed;
+    least recently used entries are pruned when cache grows beyond max_size;
+    cache directory can be removed at any time
+
+    :param fname: path to text file
+    :type fname: str
+    :param cache_dir: cache directory (if None, no caching)
+    :type cache_dir: str
+    :param max_size: maximum total size of cache entries in bytes (if None, no pruning)
+    :type max_size: int
+    :param kwargs: parameters for numpy.genfromtxt
+    :type kwargs: dict
+    :rtype: numpy.ndarray or numpy.ma.MaskedArray
+    """
+    if cache_dir is None:
+        return numpy.genfromtxt(fname=fname, **kwargs)
+
+    stat = os.stat(fname)
+    key = repr((os.path.abspath(fname), stat.st_size, repr(stat.st_mtime), sorted(kwargs.items())))
+    entry_dir = os.path.join(cache_dir, hashlib.md5(key).hexdigest())
+
+    if os.path.isdir(entry_dir):
+        try:
+            data = _load_columnar(entry_dir=entry_dir)
+            os.utime(os.path.join(entry_dir, COLUMNAR_CACHE_META), None)
+            _log.debug("Loaded '{f}' from columnar cache '{c}'".format(f=fname, c=entry_dir))
+            return data
+        except (IOError, OSError, ValueError, KeyError) as e:
+            _log.warning("Invalid columnar cache entry '{c}', parsing '{f}': {e}".format(c=entry_dir, f=fname, e=e))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    data = numpy.genfromtxt(fname=fname, **kwargs)
+    if data.dtype.names is not None:
+        try:
+            _save_columnar(data=data, cache_dir=cache_dir, entry_dir=entry_dir)
+            _log.debug("Saved '{f}' to columnar cache '{c}'".format(f=fname, c=entry_dir))
+            if max_size is not None:
+                prune_columnar_cache(cache_dir=cache_dir, max_size=max_size, keep=entry_dir)
+        except (IOError, OSError) as e:
+            _log.warning("Unable to save '{f}' to columnar cache '{c}': {e}".format(f=fname, c=entry_dir, e=e))
+    return data
+
+
+def prune_columnar_cache(cache_dir, max_size=COLUMNAR_CACHE_MAX_SIZE, keep=None):
+    """
+    Removes least recently used columnar cache entries
+    until total size of remaining entries is at most max_size
+
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :param max_size: maximum total size of cache entries in bytes
+    :type max_size: int
+    :param keep: cache entry directory never removed (e.g., entry just saved)
+    :type keep: str
+    :rtype: list
+    """
+    entries = []
+    for entry in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, entry)
+        meta = os.path.join(entry_dir, COLUMNAR_CACHE_META)
+        if not os.path.isfile(meta):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+        entries.append((os.path.getmtime(meta), size, entry_dir))
+
+    total_size = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, entry_dir in sorted(entries):
+        if total_size <= max_size:
+            break
+        if keep is not None and os.path.abspath(entry_dir) == os.path.abspath(keep):
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_size -= size
+        removed.append(entry_dir)
+    if removed:
+        _log.debug("Pruned {n} entries from columnar cache '{c}'".format(n=len(removed), c=cache_dir))
+    return removed
+
+
+def _save_columnar(data, cache_dir, entry_dir):
+    """
+    Saves structured (or masked structured) array as columnar cache entry;
+    entry is written to temporary directory and then renamed (atomic)
+
+    :param data: data to be saved
+    :type data: numpy.ndarray or numpy.ma.MaskedArray
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :param entry_dir: cache entry directory
+    :type entry_dir: str
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    masked = isinstance(data, numpy.ma.MaskedArray)
+    temp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=cache_dir)
+    try:
+        for i, name in enumerate(data.dtype.names):
+            numpy.save(os.path.join(temp_dir, 'c{i}.npy'.format(i=i)), numpy.ma.getdata(data[name]))
+            if masked:
+                numpy.save(os.path.join(temp_dir, 'm{i}.npy'.format(i=i)), numpy.ma.getmaskarray(data[name]))
+        with open(os.path.join(temp_dir, COLUMNAR_CACHE_META), 'w') as f:
+            json.dump({'names': list(data.dtype.names), 'shape': list(data.shape), 'masked': masked}, f)
+        os.rename(temp_dir, entry_dir)
+    except OSError:
+        # entry saved concurrently by another process
+        if not os.path.isdir(entry_dir):
+            raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _load_columnar(entry_dir):
+    """
+    Loads structured (or masked structured) array from columnar cache entry;
+    columns are read into a new (writable) array, as callers update loaded data in place
+
+    :param entry_dir: cache entry directory
+    :type entry_dir: str
+    :rtype: numpy.ndarray or numpy.ma.MaskedArray
+    """
+    with open(os.path.join(entry_dir, COLUMNAR_CACHE_META), 'r') as f:
+        meta = json.load(f)
+    names = [str(name) for name in meta['names']]
+    columns = [numpy.load(os.path.join(entry_dir, 'c{i}.npy'.format(i=i))) for i in range(len(names))]
+    data = numpy.empty(tuple(meta['shape']), dtype=[(name, column.dtype) for name, column in zip(names, columns)])
+    for name, column in zip(names, columns):
+        data[name] = column
+    if not meta['masked']:
+        return data
+
+    mask = numpy.empty(data.shape, dtype=[(name, bool) for name in names])
+    for i, name in enumerate(names):
+        mask[name] = numpy.load(os.path.join(entry_dir, 'm{i}.npy'.format(i=i)))
+    return numpy.ma.array(data, mask=mask)
+
+
 def join_paths(a, *p):
     """
     Similar to os.path.join, but always includes preceding paths,
@@ -0,0 +1,156 @@
+'''
+oneflux.utils.profiling
+
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Resource usage profiling utilities (wall time, CPU time, peak memory,
+storage I/O) for pipeline steps and their sub-phases
+'''
+import time
+import logging
+import threading
+
+from contextlib import contextmanager
+
+from oneflux.utils.files import save_json_manifest
+
+try:
+    import resource # not available on Windows, only wall time is recorded
+except ImportError:
+    resource = None
+
+_log = logging.getLogger(__name__)
+
+IO_BLOCK_SIZE = 512 # bytes per block in ru_inblock/ru_oublock counters
+USAGE_COUNTERS = ['elapsed', 'cpu_user', 'cpu_system', 'bytes_read', 'bytes_written'] # counters accumulated by usage differences
+_PHASES = threading.local() # phase statistics collected by each thread (see collect_phases)
+
+
+def resource_usage(children=True):
+    """
+    Snapshot of resource usage of current process: wall clock time,
+    CPU time, peak resident memory and storage I/O (blocks actually
+    read from or written to storage, as accounted by getrusage);
+    CPU time and I/O of children include only terminated (reaped) children
+
+    :param children: if True, includes usage of terminated children processes
+    :type children: bool
+    :rtype: dict
+    """
+    usage = {'elapsed': time.time(), 'cpu_user': None, 'cpu_system': None, 'max_rss': None, 'bytes_read': None, 'bytes_written': None}
+    if resource is None:
+        return usage
+    usages = [resource.getrusage(resource.RUSAGE_SELF)]
+    if children:
+        usages.append(resource.getrusage(resource.RUSAGE_CHILDREN))
+    usage['cpu_user'] = sum(u.ru_utime for u in usages)
+    usage['cpu_system'] = sum(u.ru_stime for u in usages)
+    usage['max_rss'] = max(u.ru_maxrss for u in usages)
+    usage['bytes_read'] = sum(u.ru_inblock for u in usages) * IO_BLOCK_SIZE
+    usage['bytes_written'] = sum(u.ru_oublock for u in usages) * IO_BLOCK_SIZE
+    return usage
+
+
+def usage_difference(begin, end):
+    """
+    Resource usage between two snapshots (from resource_usage);
+    peak resident memory (max_rss, kilobytes on Linux) is the
+    high-water mark at the end snapshot, not a difference
+
+    :param begin: snapshot at beginning of interval
+    :type begin: dict
+    :param end: snapshot at end of interval
+    :type end: dict
+    :rtype: dict
+    """
+    usage = {'max_rss': end['max_rss']}
+    for key in USAGE_COUNTERS:
+        usage[key] = ((end[key] - begin[key]) if ((begin[key] is not None) and (end[key] is not None)) else None)
+    return usage
+
+
+@contextmanager
+def collect_phases():
+    """
+    Collects statistics of phases recorded by current thread (see
+    profile_phase) while active; yields dict updated with statistics
+    by phase label (counts and counters are summed, max_rss is the maximum)
+    """
+    previous = getattr(_PHASES, 'phases', None)
+    phases = {}
+    _PHASES.phases = phases
+    try:
+        yield phases
+    finally:
+        _PHASES.phases = previous
+
+
+def merge_phases(phases):
+    """
+    Adds phase statistics (e.g., returned by worker processes)
+    to phases being collected by current thread, if any
+
+    :param phases: statistics by phase label
+    :type phases: dict
+    """
+    collected = getattr(_PHASES, 'phases', None)
+    if collected is None:
+        return
+    for label, usage in phases.iteritems():
+        if label not in collected:
+            collected[label] = dict(usage)
+            continue
+        current = collected[label]
+        current['count'] += usage['count']
+        for key in USAGE_COUNTERS:
+            current[key] = ((current[key] + usage[key]) if ((current[key] is not None) and (usage[key] is not None)) else None)
+        current['max_rss'] = max(current['max_rss'], usage['max_rss'])
+
+
+def record_phase(label, begin):
+    """
+    Records phase that started at begin snapshot and ends now,
+    if phases are being collected by current thread
+
+    :param label: phase label (e.g., 'load', 'write')
+    :type label: str
+    :param begin: snapshot at beginning of phase (from resource_usage with children=False)
+    :type begin: dict
+    """
+    if getattr(_PHASES, 'phases', None) is None:
+        return
+    usage = usage_difference(begin=begin, end=resource_usage(children=False))
+    usage['count'] = 1
+    merge_phases({label: usage})
+
+
+@contextmanager
+def profile_phase(label):
+    """
+    Records usage of enclosed block as phase, if phases are being
+    collected by current thread (see collect_phases); CPU time and
+    I/O are for the whole process, so they include other threads
+
+    :param label: phase label (e.g., 'load', 'write')
+    :type label: str
+    """
+    begin = resource_usage(children=False)
+    try:
+        yield
+    finally:
+        record_phase(label=label, begin=begin)
+
+
+def save_report(filename, report):
+    """
+    Saves performance report as JSON file (see save_json_manifest,
+    readers never see partial reports)
+
+    :param filename: path to report file
+    :type filename: str
+    :param report: report contents
+    :type report: dict
+    """
+    save_json_manifest(filename=filename, manifest=report, indent=2)
+    _log.info("Saved performance report '{f}'".format(f=filename))
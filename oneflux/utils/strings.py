@@ -13,6 +13,9 @@ String parsing utilities
 import os
 import sys
 import logging
+import numpy
+
+from oneflux import ONEFluxError
 
 _log = logging.getLogger(__name__)
 
@@ -110,6 +113,107 @@ def longest_substring(str_list):
     return lstr.strip('1234567890_- \t\n\r\'"')[1:] # removes digits at the end of line
 
 
+# components (and number of digits) of supported compact timestamp formats
+TIMESTAMP_FIELDS = {
+    '%Y%m%d%H%M': [('year', 4), ('month', 2), ('day', 2), ('hour', 2), ('minute', 2)],
+    '%Y%m%d': [('year', 4), ('month', 2), ('day', 2)],
+    '%Y%m': [('year', 4), ('month', 2)],
+    '%Y': [('year', 4)],
+}
+
+def decode_timestamps(timestamps, fmt='%Y%m%d%H%M'):
+    """
+    Decodes compact timestamps (e.g., TIMESTAMP_START/TIMESTAMP_END, YYYYMMDDHHMM)
+    into integer arrays of components, for all entries at once (integer division/modulo
+    of digits, instead of datetime.strptime for each entry)
+
+    :param timestamps: timestamps (strings or integers)
+    :type timestamps: numpy.ndarray
+    :param fmt: timestamp format (one of TIMESTAMP_FIELDS)
+    :type fmt: str
+    :rtype: dict (component name: numpy.ndarray)
+    """
+    if fmt not in TIMESTAMP_FIELDS:
+        msg = "Unsupported timestamp format '{f}'".format(f=fmt)
+        _log.error(msg)
+        raise ONEFluxError(msg)
+    fields = TIMESTAMP_FIELDS[fmt]
+    width = sum(digits for _, digits in fields)
+
+    timestamps = numpy.asarray(timestamps).ravel()
+    if timestamps.dtype.kind in 'iu':
+        values = timestamps.astype(numpy.int64)
+        valid = (values >= 10 ** (width - 1)) & (values < 10 ** width)
+    else:
+        if timestamps.dtype.kind != 'S':
+            timestamps = timestamps.astype('S')
+        itemsize = timestamps.dtype.itemsize
+        chars = numpy.ascontiguousarray(timestamps).view(numpy.uint8).reshape(timestamps.size, itemsize)
+        if itemsize < width:
+            chars = numpy.hstack((chars, numpy.zeros((timestamps.size, width - itemsize + 1), dtype=numpy.uint8)))
+        digits = chars[:, :width].astype(numpy.int64) - ord('0')
+        valid = numpy.all((digits >= 0) & (digits <= 9), axis=1)
+        if chars.shape[1] > width:
+            valid &= (chars[:, width] == 0)
+        values = numpy.dot(numpy.where(valid[:, numpy.newaxis], digits, 0), 10 ** numpy.arange(width - 1, -1, -1, dtype=numpy.int64))
+
+    components = {}
+    divisor = 10 ** width
+    for name, digits in fields:
+        divisor //= 10 ** digits
+        components[name] = (values // divisor) % (10 ** digits)
+
+    valid &= valid_timestamp_components(components)
+    if not numpy.all(valid):
+        msg = "Invalid timestamp '{t}' for format '{f}'".format(t=timestamps[~valid][0], f=fmt)
+        _log.error(msg)
+        raise ONEFluxError(msg)
+
+    return components
+
+def valid_timestamp_components(components):
+    """
+    Checks ranges of timestamp components (including number of days in month)
+
+    :param components: timestamp components (year, and optionally month, day, hour, minute)
+    :type components: dict (component name: numpy.ndarray)
+    :rtype: numpy.ndarray (dtype bool)
+    """
+    year = components['year']
+    month = components.get('month', 1)
+    valid = (year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12)
+    if 'day' in components:
+        months = (numpy.where(valid, year, 1970) - 1970).astype('M8[Y]') + (numpy.where(valid, month, 1) - 1).astype('m8[M]')
+        days_in_month = ((months + 1).astype('M8[D]') - months.astype('M8[D]')).astype(numpy.int64)
+        valid &= (components['day'] >= 1) & (components['day'] <= days_in_month)
+    if 'hour' in components:
+        valid &= (components['hour'] >= 0) & (components['hour'] <= 23)
+    if 'minute' in components:
+        valid &= (components['minute'] >= 0) & (components['minute'] <= 59)
+    return valid
+
+def timestamps_to_datetime64(components):
+    """
+    Converts timestamp components into array of numpy.datetime64 (minute resolution);
+    use tolist() for a list of datetime objects
+
+    :param components: timestamp components (year, and optionally month, day, hour, minute)
+    :type components: dict (component name: numpy.ndarray)
+    :rtype: numpy.ndarray (dtype datetime64[m])
+    """
+    components = dict((k, numpy.asarray(v).astype(numpy.int64)) for k, v in components.items())
+    if not numpy.all(valid_timestamp_components(components)):
+        msg = "Invalid timestamp components"
+        _log.error(msg)
+        raise ONEFluxError(msg)
+    year = components['year']
+    month, day = components.get('month', numpy.ones_like(year)), components.get('day', numpy.ones_like(year))
+    hour, minute = components.get('hour', numpy.zeros_like(year)), components.get('minute', numpy.zeros_like(year))
+    months = (year - 1970).astype('M8[Y]') + (month - 1).astype('m8[M]')
+    days = months.astype('M8[D]') + (day - 1).astype('m8[D]')
+    return days.astype('M8[m]') + (hour * 60 + minute).astype('m8[m]')
+
+
 if __name__ == '__main__':
 
     _log.critical(msg="Error: cannot be executed directly")
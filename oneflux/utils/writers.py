@@ -0,0 +1,129 @@
+'''
+oneflux.utils.writers
+
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Bulk text (CSV) writing utilities
+
+@date: 2026-10-17
+'''
+import logging
+import numpy
+
+from oneflux import ONEFluxError
+
+_log = logging.getLogger(__name__)
+
+WRITE_BLOCK_ROWS = 50000  # number of rows formatted and written at a time
+STR_DTYPE = 'S32'         # string dtype wide enough for str() of any numeric scalar
+
+
+def format_column(values, fmt=None, missing=None, missing_values=None):
+    """
+    Formats array of values as list of strings, same as (fmt % value) for
+    each value, or str(value) if fmt is None; each distinct value is
+    formatted only once
+
+    :param values: values to be formatted (1-d)
+    :type values: numpy.ndarray
+    :param fmt: format string (e.g., '%.4f'), None for str()
+    :type fmt: str
+    :param missing: text for missing values (entries equal to any of missing_values)
+    :type missing: str
+    :param missing_values: values to be written as missing
+    :type missing_values: list
+    :rtype: list (of str)
+    """
+    values = numpy.ascontiguousarray(values)
+    if values.size == 0:
+        return []
+
+    # distinct values (by bit pattern for numbers, so -0.0, NaNs, etc. are kept as is)
+    if values.dtype.kind in 'biuf':
+        unique_bits, inverse = numpy.unique(values.view('u{s}'.format(s=values.dtype.itemsize)), return_inverse=True)
+        unique_values = unique_bits.view(values.dtype)
+    elif values.dtype.kind == 'S':
+        unique_values, inverse = numpy.unique(values, return_inverse=True)
+    else:
+        unique_values, inverse = values, numpy.arange(values.size)
+
+    if fmt is not None:
+        texts = numpy.array([fmt % v for v in unique_values], dtype=object)
+    elif unique_values.dtype.kind in 'biuf':
+        texts = unique_values.astype(STR_DTYPE).astype(object)
+    elif unique_values.dtype.kind == 'S':
+        texts = unique_values.astype(object)
+    else:
+        texts = numpy.array([str(v) for v in unique_values], dtype=object)
+
+    # same scalar comparison as (value == m) for each value, done once per distinct value
+    if (missing is not None) and missing_values and (unique_values.dtype.kind in 'biuf'):
+        missing_mask = numpy.array([any(v == m for m in missing_values) for v in unique_values], dtype=bool)
+        texts[missing_mask] = missing
+
+    return texts[inverse].tolist()
+
+
+def write_csv(filename, data, delimiter=',', newline='\n', header=None, comments='', formats=None, missing=None, missing_values=None, block_size=WRITE_BLOCK_ROWS):
+    """
+    Writes array to text file, one line per row, formatting whole column
+    blocks at a time; with default parameters, writes same text as
+    numpy.savetxt(fname=filename, X=data, delimiter=delimiter, fmt='%s',
+    newline=newline, header=header, comments=comments)
+
+    :param filename: name of file to be written (overwrites if exists)
+    :type filename: str
+    :param data: data array (structured 1-d, or 1-d/2-d non-structured)
+    :type data: numpy.ndarray
+    :param delimiter: cell delimiter character
+    :type delimiter: str
+    :param newline: new line character
+    :type newline: str
+    :param header: header to be written before data (not written if None)
+    :type header: str
+    :param comments: string prepended to header lines
+    :type comments: str
+    :param formats: format string (or None for str()) for columns, single value for all columns, or by column name (structured arrays) or number
+    :type formats: str or dict
+    :param missing: text for missing values (see format_column)
+    :type missing: str
+    :param missing_values: values to be written as missing (see format_column)
+    :type missing_values: list
+    :param block_size: number of rows formatted and written at a time
+    :type block_size: int
+    """
+    data = numpy.asarray(data)
+    if data.dtype.names:
+        if data.ndim != 1:
+            msg = "Structured array must be 1-d, found {n} dimensions, writing '{f}'".format(n=data.ndim, f=filename)
+            _log.error(msg)
+            raise ONEFluxError(msg)
+        columns = list(data.dtype.names)
+        get_column = lambda block, c: block[c]
+    else:
+        if data.ndim == 1:
+            data = data[:, numpy.newaxis]
+        elif data.ndim != 2:
+            msg = "Array must be 1-d or 2-d, found {n} dimensions, writing '{f}'".format(n=data.ndim, f=filename)
+            _log.error(msg)
+            raise ONEFluxError(msg)
+        columns = range(data.shape[1])
+        get_column = lambda block, c: block[:, c]
+
+    if isinstance(formats, dict):
+        column_formats = [formats.get(c, None) for c in columns]
+    else:
+        column_formats = [formats] * len(columns)
+
+    with open(filename, 'w') as f:
+        if header is not None:
+            f.write(comments + header.replace('\n', '\n' + comments) + newline)
+        for first in xrange(0, len(data), block_size):
+            block = data[first:first + block_size]
+            texts = [format_column(values=get_column(block, c), fmt=column_formats[i], missing=missing, missing_values=missing_values) for i, c in enumerate(columns)]
+            f.write(newline.join(delimiter.join(row) for row in zip(*texts)) + newline)
+
+
+if __name__ == '__main__':
+    raise ONEFluxError('Not executable')
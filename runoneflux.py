@@ -22,13 +22,31 @@ import datetime
 from oneflux import ONEFluxError, log_config, log_trace, VERSION_PROCESSING, VERSION_METADATA
 from oneflux.tools.partition_nt import run_partition_nt, PROD_TO_COMPARE, PERC_TO_COMPARE
 from oneflux.tools.partition_dt import run_partition_dt
-from oneflux.tools.pipeline import run_pipeline, NOW_TS
+from oneflux.tools.pipeline import run_pipeline, run_pipeline_batch, load_site_manifest, BATCH_SITE_OK, NOW_TS
 
 log = logging.getLogger(__name__)
 
 DEFAULT_LOGGING_FILENAME = 'oneflux.log'
 # PRI 2020/10/22 - add gap_fill to command list
 COMMAND_LIST = ['partition_nt', 'partition_dt', 'all', 'gap_fill']
+BATCH_COMMAND = 'batch' # runs 'all' for each site in a site manifest
+
+# PRI 2020/10/22
+# dictionary of logicals to control which pipeline steps will be executed
+PIPELINE_STEPS_ALL = {"qc_auto_execute": True, "ustar_mp_execute": True,
+                      "ustar_cp_execute": False, "meteo_proc_execute": True,
+                      "nee_proc_execute": True, "energy_proc_execute": True,
+                      "nee_partition_nt_execute": True, "nee_partition_dt_execute": True,
+                      "prepare_ure_execute": True, "ure_execute": True,
+                      "fluxnet2015_execute": True, "fluxnet2015_site_plots": True,
+                      "simulation": False}
+PIPELINE_STEPS_GAP_FILL = {"qc_auto_execute": True, "ustar_mp_execute": True,
+                           "ustar_cp_execute": False, "meteo_proc_execute": True,
+                           "nee_proc_execute": True, "energy_proc_execute": True,
+                           "nee_partition_nt_execute": False, "nee_partition_dt_execute": False,
+                           "prepare_ure_execute": False, "ure_execute": False,
+                           "fluxnet2015_execute": False, "fluxnet2015_site_plots": False,
+                           "simulation": False}
 
 # main function
 if __name__ == '__main__':
@@ -41,10 +59,16 @@ if __name__ == '__main__':
                     "versiond": str(VERSION_METADATA), "versionp": str(VERSION_PROCESSING)}
             args["command"] = cfg["Run"]["command"]
             args["datadir"] = cfg["Files"]["data_dir"]
-            args["siteid"] = cfg["Site"]["site_id"]
-            args["sitedir"] = cfg["Files"]["site_dir"]
-            args["firstyear"] = int(cfg["Run"]["first_year"])
-            args["lastyear"] = int(cfg["Run"]["last_year"])
+            if args["command"] == BATCH_COMMAND:
+                # sites, directories and years from site manifest
+                args["manifest"] = cfg["Files"]["site_manifest"]
+                args["batch_log_dir"] = cfg["Files"].get("batch_log_dir", None)
+                args["site_workers"] = int(cfg["Options"].get("site_workers", 1))
+            else:
+                args["siteid"] = cfg["Site"]["site_id"]
+                args["sitedir"] = cfg["Files"]["site_dir"]
+                args["firstyear"] = int(cfg["Run"]["first_year"])
+                args["lastyear"] = int(cfg["Run"]["last_year"])
             if cfg["Options"]["percentiles"].lower() == "default":
                 args["perc"] = None
             else:
@@ -60,6 +84,38 @@ if __name__ == '__main__':
             args["mcr_directory"] = cfg["Files"]["mcr_dir"]
             args["recint"] = cfg["Options"]["recint"]
             args["logging_level"] = cfg["Options"]["logging_level"]
+            args["workers"] = int(cfg["Options"].get("workers", 1))
+            args["step_workers"] = int(cfg["Options"].get("step_workers", 1))
+            args["incremental"] = (cfg["Options"].get("incremental", "no").lower() == "yes")
+            args["resume"] = (cfg["Options"].get("resume", "no").lower() == "yes")
+            args["columnar_cache"] = (cfg["Options"].get("columnar_cache", "no").lower() == "yes")
+            args["in_memory_results"] = (cfg["Options"].get("in_memory_results", "no").lower() == "yes")
+            args["tool_timeout"] = (float(cfg["Options"]["tool_timeout"]) if "tool_timeout" in cfg["Options"] else None)
+    elif len(sys.argv) > 1 and sys.argv[1] == BATCH_COMMAND:
+        # batch cli arguments
+        parser = argparse.ArgumentParser()
+        parser.add_argument('command', metavar="COMMAND", help="ONEFlux batch command", type=str, choices=[BATCH_COMMAND])
+        parser.add_argument('datadir', metavar="DATA-DIR", help="Absolute path to general data directory", type=str)
+        parser.add_argument('manifest', metavar="MANIFEST", help="Site manifest file (columns site_id, site_dir, first_year, last_year)", type=str)
+        parser.add_argument('--perc', metavar="PERC", help="List of percentiles to be processed", dest='perc', type=str, choices=PERC_TO_COMPARE, action='append', nargs='*')
+        parser.add_argument('--prod', metavar="PROD", help="List of products to be processed", dest='prod', type=str, choices=PROD_TO_COMPARE, action='append', nargs='*')
+        parser.add_argument('-l', '--logfile', help="Logging file path", type=str, dest='logfile', default=DEFAULT_LOGGING_FILENAME)
+        parser.add_argument('--batch-log-dir', help="Directory for per-site log files (data-dir if not set)", type=str, dest='batch_log_dir', default=None)
+        parser.add_argument('--mcr', help="Path to MCR directory", type=str, dest='mcr_directory', default=None)
+        parser.add_argument('--ts', help="Timestamp to be used in processing IDs", type=str, dest='timestamp', default=NOW_TS)
+        parser.add_argument('--recint', help="Record interval for sites", type=str, choices=['hh', 'hr'], dest='recint', default='hh')
+        parser.add_argument('--versionp', help="Version of processing (hardcoded default)", type=str, dest='versionp', default=str(VERSION_PROCESSING))
+        parser.add_argument('--versiond', help="Version of data (hardcoded default)", type=str, dest='versiond', default=str(VERSION_METADATA))
+        parser.add_argument('--site-workers', help="Number of sites processed concurrently (1 runs serially)", type=int, dest='site_workers', default=1)
+        parser.add_argument('--workers', help="Number of worker processes for partitioning in each site (1 runs serially)", type=int, dest='workers', default=1)
+        parser.add_argument('--step-workers', help="Number of independent pipeline steps run concurrently in each site (1 runs serially)", type=int, dest='step_workers', default=1)
+        parser.add_argument('--incremental', help="Skip pipeline steps with outputs up to date (matching fingerprints)", action='store_true', dest='incremental', default=False)
+        parser.add_argument('--resume', help="Resume from first pipeline step not completed in previous runs (checkpoint manifest)", action='store_true', dest='resume', default=False)
+        parser.add_argument('--columnar-cache', help="Cache parsed input files as columnar binary files in site data directory (faster reruns)", action='store_true', dest='columnar_cache', default=False)
+        parser.add_argument('--in-memory-results', help="Keep NT/DT partitioning results in memory for prepare_ure instead of reloading files (about 23MB per site-year)", action='store_true', dest='in_memory_results', default=False)
+        parser.add_argument('--tool-timeout', help="Seconds until external tools are terminated (no timeout if not set)", type=float, dest='tool_timeout', default=None)
+        args = vars(parser.parse_args())
+        args["forcepy"] = False
     else:
         # cli arguments
         parser = argparse.ArgumentParser()
@@ -78,6 +134,13 @@ if __name__ == '__main__':
         parser.add_argument('--recint', help="Record interval for site", type=str, choices=['hh', 'hr'], dest='recint', default='hh')
         parser.add_argument('--versionp', help="Version of processing (hardcoded default)", type=str, dest='versionp', default=str(VERSION_PROCESSING))
         parser.add_argument('--versiond', help="Version of data (hardcoded default)", type=str, dest='versiond', default=str(VERSION_METADATA))
+        parser.add_argument('--workers', help="Number of worker processes for partitioning (1 runs serially)", type=int, dest='workers', default=1)
+        parser.add_argument('--step-workers', help="Number of independent pipeline steps run concurrently (1 runs serially)", type=int, dest='step_workers', default=1)
+        parser.add_argument('--incremental', help="Skip pipeline steps with outputs up to date (matching fingerprints)", action='store_true', dest='incremental', default=False)
+        parser.add_argument('--resume', help="Resume from first pipeline step not completed in previous runs (checkpoint manifest)", action='store_true', dest='resume', default=False)
+        parser.add_argument('--columnar-cache', help="Cache parsed input files as columnar binary files in site data directory (faster reruns)", action='store_true', dest='columnar_cache', default=False)
+        parser.add_argument('--in-memory-results', help="Keep NT/DT partitioning results in memory for prepare_ure instead of reloading files (about 23MB per site-year)", action='store_true', dest='in_memory_results', default=False)
+        parser.add_argument('--tool-timeout', help="Seconds until external tools are terminated (no timeout if not set)", type=float, dest='tool_timeout', default=None)
         args = parser.parse_args()
         # PRI 2020/10/23 - convert to dictionary to be compatible with use of ConfigObj
         args = vars(args)
@@ -96,74 +159,95 @@ if __name__ == '__main__':
     perc = (PERC_TO_COMPARE if args["perc"] is None else args["perc[0]"])
     prod = (PROD_TO_COMPARE if args["prod"] is None else args["prod[0]"])
 
-    firstyear = args["firstyear"]
-    lastyear = args["lastyear"]
-
     msg = "Using:"
     msg += "command ({c})".format(c=args["command"])
     msg += ", data-dir ({i})".format(i=args["datadir"])
-    msg += ", site-id ({i})".format(i=args["siteid"])
-    msg += ", site-dir ({d})".format(d=args["sitedir"])
-    msg += ", first-year ({y})".format(y=firstyear)
-    msg += ", last-year ({y})".format(y=lastyear)
+    if args["command"] == BATCH_COMMAND:
+        msg += ", manifest ({f})".format(f=args["manifest"])
+        msg += ", batch-log-dir ({d})".format(d=args["batch_log_dir"])
+        msg += ", site-workers ({i})".format(i=args["site_workers"])
+    else:
+        firstyear = args["firstyear"]
+        lastyear = args["lastyear"]
+        msg += ", site-id ({i})".format(i=args["siteid"])
+        msg += ", site-dir ({d})".format(d=args["sitedir"])
+        msg += ", first-year ({y})".format(y=firstyear)
+        msg += ", last-year ({y})".format(y=lastyear)
     msg += ", perc ({i})".format(i=perc)
     msg += ", prod ({i})".format(i=prod)
     msg += ", log-file ({f})".format(f=args["logfile"])
     msg += ", force-py ({i})".format(i=args["forcepy"])
+    msg += ", workers ({i})".format(i=args["workers"])
+    msg += ", step-workers ({i})".format(i=args["step_workers"])
+    msg += ", incremental ({i})".format(i=args["incremental"])
+    msg += ", resume ({i})".format(i=args["resume"])
+    msg += ", columnar-cache ({i})".format(i=args["columnar_cache"])
+    msg += ", in-memory-results ({i})".format(i=args["in_memory_results"])
+    msg += ", tool-timeout ({i})".format(i=args["tool_timeout"])
     log.debug(msg)
 
     # start execution
     try:
         # check arguments
         # PRI 2020/10/23 - changed use of args to dictionary syntax
-        print os.path.join(args["datadir"], args["sitedir"])
-        if not os.path.isdir(os.path.join(args["datadir"], args["sitedir"])):
-            raise ONEFluxError("Site dir not found: {d}".format(d=args["sitedir"]))
+        if args["command"] == BATCH_COMMAND:
+            if not os.path.isdir(args["datadir"]):
+                raise ONEFluxError("Data dir not found: {d}".format(d=args["datadir"]))
+        else:
+            print os.path.join(args["datadir"], args["sitedir"])
+            if not os.path.isdir(os.path.join(args["datadir"], args["sitedir"])):
+                raise ONEFluxError("Site dir not found: {d}".format(d=args["sitedir"]))
 
         # run command
         # PRI 2020/10/23 - changed use of args to dictionary syntax
         log.info("Starting execution: {c}".format(c=args["command"]))
-        if args["command"] == 'all':
-            # PRI 2020/10/22
-            # dictionary of logicals to control which pipeline steps will be executed
-            pipeline_steps = {"qc_auto_execute": True, "ustar_mp_execute": True,
-                              "ustar_cp_execute": False, "meteo_proc_execute": True,
-                              "nee_proc_execute": True, "energy_proc_execute": True,
-                              "nee_partition_nt_execute": True, "nee_partition_dt_execute": True,
-                              "prepare_ure_execute": True, "ure_execute": True,
-                              "fluxnet2015_execute": True, "fluxnet2015_site_plots": True,
-                              "simulation": False}
+        if args["command"] == BATCH_COMMAND:
+            summary = run_pipeline_batch(datadir=args["datadir"], sites=load_site_manifest(args["manifest"]),
+                                         log_dir=args["batch_log_dir"], site_workers=args["site_workers"],
+                                         timestamp=args["timestamp"], prod_to_compare=prod,
+                                         perc_to_compare=perc, mcr_directory=args["mcr_directory"],
+                                         record_interval=args["recint"],
+                                         version_data=args["versiond"], version_proc=args["versionp"],
+                                         pipeline_steps=PIPELINE_STEPS_ALL, workers=args["workers"],
+                                         step_workers=args["step_workers"], incremental=args["incremental"],
+                                         tool_timeout=args["tool_timeout"], resume=args["resume"],
+                                         columnar_cache=args["columnar_cache"], in_memory_results=args["in_memory_results"])
+            failed = [s['site_id'] for s in summary if s['status'] != BATCH_SITE_OK]
+            if failed:
+                raise ONEFluxError("Batch sites with errors: {s}".format(s=', '.join(failed)))
+        elif args["command"] == 'all':
+            pipeline_steps = PIPELINE_STEPS_ALL
             # PRI 2020/10/23 - changed use of args to dictionary syntax
             run_pipeline(datadir=args["datadir"], siteid=args["siteid"], sitedir=args["sitedir"],
                          firstyear=firstyear, lastyear=lastyear, prod_to_compare=prod,
                          perc_to_compare=perc, mcr_directory=args["mcr_directory"],
                          timestamp=args["timestamp"], record_interval=args["recint"],
                          version_data=args["versiond"], version_proc=args["versionp"],
-                         pipeline_steps=pipeline_steps)
+                         pipeline_steps=pipeline_steps, workers=args["workers"],
+                         step_workers=args["step_workers"], incremental=args["incremental"],
+                         tool_timeout=args["tool_timeout"], resume=args["resume"],
+                         columnar_cache=args["columnar_cache"], in_memory_results=args["in_memory_results"])
         elif args["command"] == 'gap_fill':
-            # PRI 2020/10/22
-            # dictionary of logicals to control which pipeline steps will be executed
-            pipeline_steps = {"qc_auto_execute": True, "ustar_mp_execute": True,
-                              "ustar_cp_execute": False, "meteo_proc_execute": True,
-                              "nee_proc_execute": True, "energy_proc_execute": True,
-                              "nee_partition_nt_execute": False, "nee_partition_dt_execute": False,
-                              "prepare_ure_execute": False, "ure_execute": False,
-                              "fluxnet2015_execute": False, "fluxnet2015_site_plots": False,
-                              "simulation": False}
+            pipeline_steps = PIPELINE_STEPS_GAP_FILL
             run_pipeline(datadir=args["datadir"], siteid=args["siteid"], sitedir=args["sitedir"],
                          firstyear=firstyear, lastyear=lastyear, prod_to_compare=prod,
                          perc_to_compare=perc, mcr_directory=args["mcr_directory"],
                          timestamp=args["timestamp"], record_interval=args["recint"],
                          version_data=args["versiond"], version_proc=args["versionp"],
-                         pipeline_steps=pipeline_steps)
+                         pipeline_steps=pipeline_steps, workers=args["workers"],
+                         step_workers=args["step_workers"], incremental=args["incremental"],
+                         tool_timeout=args["tool_timeout"], resume=args["resume"],
+                         columnar_cache=args["columnar_cache"], in_memory_results=args["in_memory_results"])
         elif args["command"] == 'partition_nt':
             run_partition_nt(datadir=args["datadir"], siteid=args["siteid"], sitedir=args["sitedir"],
                              years_to_compare=range(firstyear, lastyear + 1),
-                             py_remove_old=args["forcepy"], prod_to_compare=prod, perc_to_compare=perc)
+                             py_remove_old=args["forcepy"], prod_to_compare=prod, perc_to_compare=perc,
+                             workers=args["workers"])
         elif args["command"] == 'partition_dt':
             run_partition_dt(datadir=args["datadir"], siteid=args["siteid"], sitedir=args["sitedir"],
                              years_to_compare=range(firstyear, lastyear + 1),
-                             py_remove_old=args["forcepy"], prod_to_compare=prod, perc_to_compare=perc)
+                             py_remove_old=args["forcepy"], prod_to_compare=prod, perc_to_compare=perc,
+                             workers=args["workers"])
         else:
             raise ONEFluxError("Unknown command: {c}".format(c=args["command"]))
         log.info("Finished execution: {c}".format(c=args["command"]))
@@ -0,0 +1,289 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for daytime partitioning task execution (worker processes)
+'''
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+import numpy
+
+from datetime import datetime, timedelta
+
+from scipy import stats
+from statsmodels import robust
+
+from context import oneflux
+from oneflux.partition import daytime
+from oneflux.partition.library import ONEFluxPartitionError, newselif
+from oneflux.partition.auxiliary import FLOAT_PREC
+from oneflux.partition.daytime import _partitioning_dt_worker, merge_dt_task_results, ONEFluxPartitionBrokenOptError, DT_TASK_OK, DT_TASK_BROKEN_OPT, DT_TASK_ERROR
+
+
+class DTWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        logging.getLogger().setLevel(self.root_level)
+        shutil.rmtree(self.tdir)
+
+    def task(self, year, percentile, ustar_type='y'):
+        return ('US-Xxx', self.tdir, self.tdir, ustar_type, 0, year, percentile, 45.0)
+
+    def output(self, year, percentile):
+        filename = os.path.join(self.tdir, 'nee_y_{p}_US-Xxx_{y}.csv'.format(p=percentile, y=year))
+        with open(filename, 'w') as f:
+            f.write('reco_hblr\n1.0\n')
+        return filename
+
+    def test_worker_restores_log_level(self):
+        """Test failed task is returned as error status and root logger level is restored"""
+        logging.getLogger().setLevel(logging.WARNING)
+        status, details = _partitioning_dt_worker(self.task(year=2005, percentile='50'))
+        self.assertEqual(status, DT_TASK_ERROR)
+        self.assertEqual(logging.getLogger().level, logging.WARNING)
+        self.assertTrue(os.path.isfile(os.path.join(self.tdir, 'nee_y_50_US-Xxx_2005.log')))
+
+    def test_merge_broken_then_error(self):
+        """Test broken window raised first and stale outputs removed even after a later error"""
+        stale_before_error = self.output(year=2005, percentile='3.75')
+        stale_after_error = self.output(year=2005, percentile='8.75')
+        other_year = self.output(year=2006, percentile='1.25')
+        broken = ('HLRC_LloydVPD', 'US-Xxx', 2005, 10, 14, 'y', '1.25')
+        tasks = [self.task(2005, '1__25'), self.task(2005, '3__75'), self.task(2005, '6__25'), self.task(2005, '8__75'), self.task(2006, '1__25')]
+        results = [(DT_TASK_BROKEN_OPT, broken),
+                   (DT_TASK_OK, (stale_before_error, None)),
+                   (DT_TASK_ERROR, 'failed'),
+                   (DT_TASK_OK, (stale_after_error, None)),
+                   (DT_TASK_OK, (other_year, None))]
+        with self.assertRaises(ONEFluxPartitionBrokenOptError) as context:
+            merge_dt_task_results(tasks=tasks, results=results)
+        self.assertEqual(context.exception.lines2add, ['US-Xxx_2005_y,10,14'])
+        self.assertEqual(context.exception.broken_tasks, [('y', 2005, '1.25', 10, 14)])
+        self.assertFalse(os.path.isfile(stale_before_error))
+        self.assertFalse(os.path.isfile(stale_after_error))
+        self.assertTrue(os.path.isfile(other_year))
+
+    def test_merge_error_then_broken(self):
+        """Test error before any broken window is raised after cleanup"""
+        stale = self.output(year=2005, percentile='3.75')
+        broken = ('HLRC_LloydVPD', 'US-Xxx', 2005, 10, 14, 'y', '1.25')
+        tasks = [self.task(2006, '1__25'), self.task(2005, '1__25'), self.task(2005, '3__75')]
+        results = [(DT_TASK_ERROR, 'failed'), (DT_TASK_BROKEN_OPT, broken), (DT_TASK_OK, (stale, None))]
+        with self.assertRaises(ONEFluxPartitionError) as context:
+            merge_dt_task_results(tasks=tasks, results=results)
+        self.assertNotIsInstance(context.exception, ONEFluxPartitionBrokenOptError)
+        self.assertEqual(str(context.exception), 'failed')
+        self.assertFalse(os.path.isfile(stale))
+
+
+class GapFillNeighbourIndexTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(42)
+        self.n = 480
+        self.rg = random.uniform(0, 800, self.n)
+        self.ta = random.uniform(-5, 30, self.n)
+        self.vpd = random.uniform(0, 30, self.n)
+        self.rg[::17] = -9999.0
+        self.vpd[::23] = -9999.0
+        self.hr = numpy.tile(numpy.arange(48) / 2.0, self.n // 48)
+        self.chunk_size = daytime.GAPFILL_INDEX_CHUNK_SIZE
+        daytime.clear_gapfill_neighbour_indices()
+
+    def tearDown(self):
+        daytime.GAPFILL_INDEX_CHUNK_SIZE = self.chunk_size
+        daytime.clear_gapfill_neighbour_indices()
+
+    def expected_candidates(self, method, t_window, index):
+        """Candidates for a single index, evaluated position by position"""
+        offsets = numpy.append(-numpy.arange(t_window / 2.0 * 48), numpy.arange(t_window / 2.0 * 48 - 1) + 1).astype(int)
+        result = []
+        for offset in offsets:
+            w = min(max(index + offset, 0), self.n - 1)
+            if method == 'hr':
+                ok = abs(self.hr[w] - self.hr[index]) < 1.1
+            else:
+                rg_tolerance = max(min(50.0, self.rg[index]), 20)
+                ok = (abs(self.rg[w] - self.rg[index]) < rg_tolerance) and (self.rg[w] > -9990)
+                if method == 'met':
+                    ok = ok and (abs(self.ta[w] - self.ta[index]) < 2.5) and (abs(self.vpd[w] - self.vpd[index]) < 5.0)
+                    ok = ok and (self.vpd[w] > -9990) and (self.ta[w] > -9990)
+            if ok:
+                result.append(w)
+        return result
+
+    def test_candidates(self):
+        """Test candidates computed in chunks match conditions evaluated position by position"""
+        daytime.GAPFILL_INDEX_CHUNK_SIZE = 500
+        index = daytime.GapFillNeighbourIndex(rg=self.rg, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48)
+        indices = numpy.array([0, 1, 100, 250, 478, 479])
+        for method in ('met', 'rg', 'hr'):
+            for t_window in (7, 14):
+                candidates = index.candidates(method=method, t_window=t_window, indices=indices)
+                for i, c in zip(indices, candidates):
+                    self.assertEqual(list(c), self.expected_candidates(method=method, t_window=t_window, index=i))
+
+    def test_index_reuse_and_release(self):
+        """Test index reused for the same drivers after other site-years (e.g., next UStar type), until released"""
+        first = daytime.get_gapfill_neighbour_index(rg=self.rg, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48)
+        self.assertIs(daytime.get_gapfill_neighbour_index(rg=self.rg.copy(), ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48), first)
+        others = [daytime.get_gapfill_neighbour_index(rg=self.rg + shift + 1, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48) for shift in range(3)]
+        self.assertEqual(len(daytime._GAPFILL_INDEX_CACHE), 4)
+        self.assertIs(daytime.get_gapfill_neighbour_index(rg=self.rg, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48), first)
+        self.assertIs(daytime.get_gapfill_neighbour_index(rg=self.rg + 1, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48), others[0])
+        daytime.clear_gapfill_neighbour_indices()
+        self.assertEqual(daytime._GAPFILL_INDEX_CACHE, {})
+        self.assertIsNot(daytime.get_gapfill_neighbour_index(rg=self.rg, ta=self.ta, vpd=self.vpd, hr=self.hr, nperday=48), first)
+
+
+class GapFillWindowStatsTest(unittest.TestCase):
+    def test_window_stats(self):
+        """Test statistics of all indices at once match statistics computed index by index"""
+        random = numpy.random.RandomState(7)
+        values = random.normal(2.0, 5.0, 300).astype('f4')
+        available = (random.uniform(size=300) > 0.2)
+        neighbours = [random.randint(0, 300, size).astype('i4') for size in (5, 40, 40, 12, 0, 25, 11)]
+        selected, mean_value, count_value, std_value, median_value, srob_value = daytime.gapfill_window_stats(values=values, available=available, neighbours=neighbours)
+
+        k = 0
+        for i, w in enumerate(neighbours):
+            ok = values[w[available[w]]]
+            self.assertEqual(selected[i], ok.size > 9)
+            if not selected[i]:
+                continue
+            self.assertEqual(count_value[k], ok.size)
+            self.assertEqual(mean_value[k], stats.tmean(ok))
+            self.assertAlmostEqual(std_value[k], stats.tstd(ok), places=12)
+            self.assertEqual(median_value[k], numpy.median(ok))
+            self.assertEqual(srob_value[k], robust.scale.mad(ok))
+            k += 1
+        self.assertEqual(k, mean_value.size)
+
+
+class DTWindowPartitionTest(unittest.TestCase):
+    def setUp(self):
+        # half-hourly site-year with a gap of two weeks (some windows without entries)
+        julday = numpy.repeat(numpy.arange(1, 366), 48) + numpy.tile(numpy.arange(48) / 48.0, 365)
+        julday = julday[(julday < 100) | (julday >= 114)]
+        self.data = numpy.zeros(julday.size, dtype=[('julday', 'f8'), ('ind', 'f8'), ('nee', 'f4')])
+        self.data['julday'] = julday
+        self.data['ind'] = numpy.arange(julday.size)
+        self.data['nee'] = numpy.random.RandomState(1).normal(size=julday.size)
+        self.valid_mask = (self.data['nee'] > 0.5)
+
+    def test_windows(self):
+        """Test window selections match selections with per-window masks (as in original code)"""
+        windows = daytime.DTWindowPartition(data=self.data, winsize=4)
+        self.assertEqual(windows.n_parasets, 182)
+        julday = self.data['julday']
+        for i in range(windows.n_parasets):
+            for index, begin, end in ((windows.windows, i * 2.0, i * 2.0 + 4),
+                                      (windows.windows2, (i - 2) * 2.0 if i > 1 else 0, (i + 2) * 2.0 + 4 if i < 180 else numpy.amax(julday))):
+                condition = (julday > begin) & (julday <= end)
+                numpy.testing.assert_array_equal(index.select(data=self.data, window=i), newselif(data=self.data, condition=condition.copy(), drop=True)[0])
+                expected = newselif(data=self.data, condition=(condition & self.valid_mask), drop=True)[0]
+                numpy.testing.assert_array_equal(index.select(data=self.data, window=i, valid_mask=self.valid_mask), expected)
+
+    def test_parameter_windows(self):
+        """Test windows of parameter sets go from center of previous to center of next window"""
+        centers = numpy.array([100.0, 500.0, 900.0, 2000.0])
+        params = numpy.vstack((numpy.zeros((12, centers.size)), centers))
+        windows = daytime.get_parameter_windows(data=self.data, params=params)
+        numpy.testing.assert_array_equal(windows.indices(0), numpy.arange(0, 500))
+        numpy.testing.assert_array_equal(windows.indices(1), numpy.arange(100, 900))
+        numpy.testing.assert_array_equal(windows.indices(3), numpy.arange(900, self.data.size))
+
+
+class CoveringWindowsTest(unittest.TestCase):
+    def test_covering_windows(self):
+        """Test first two covering windows of all data points match per-point search"""
+        random = numpy.random.RandomState(9)
+        values_mat = random.normal(size=(6, 200))
+        values_mat[random.uniform(size=values_mat.shape) < 0.6] = -9999.0
+        first, second, count = daytime.get_covering_windows(values_mat)
+        for j in range(values_mat.shape[1]):
+            windows = numpy.where(values_mat[:, j] > -9999.0)[0]
+            self.assertEqual(count[j], windows.size)
+            if windows.size > 0:
+                self.assertEqual(first[j], windows[0])
+            if windows.size > 1:
+                self.assertEqual(second[j], windows[1])
+
+
+class EstimateParasetsWarmStartTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.nlinlts2 = daytime.nlinlts2
+        self.guesses = []
+        def nlinlts2(**kwargs):
+            if kwargs['lts_func'] == 'HLRC_LloydVPD':
+                self.guesses.append(numpy.array(kwargs['xguess'], dtype=FLOAT_PREC))
+            return self.nlinlts2(**kwargs)
+        daytime.nlinlts2 = nlinlts2
+
+    def tearDown(self):
+        daytime.nlinlts2 = self.nlinlts2
+        shutil.rmtree(self.tdir)
+
+    def get_data(self, days=40):
+        """Half-hourly synthetic site data (light response and Lloyd-Taylor respiration) for part of a year"""
+        random = numpy.random.RandomState(3)
+        n = days * 48
+        julday = 100 + (numpy.arange(n) + 1) / 48.0
+        hour = (numpy.arange(n) % 48) / 2.0
+        names = ['year', 'month', 'day', 'hour', 'minute', 'julday', 'ind', 'nee_f', 'nee_fqc', 'rg', 'rg_f', 'tair', 'tair_f', 'vpd_f', 'nee_fs_unc', 'e0_1_from_tair', 'alpha_1_from_tair']
+        data = numpy.zeros(n, dtype=[(name, FLOAT_PREC) for name in names])
+        for i, j in enumerate(julday):
+            timestamp = datetime(2005, 1, 1) + timedelta(days=j - 1.0 / 48 - 1)
+            data['year'][i], data['month'][i], data['day'][i], data['hour'][i], data['minute'][i] = timestamp.year, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute
+        data['julday'] = julday
+        data['ind'] = numpy.arange(n)
+        data['rg'] = data['rg_f'] = numpy.maximum(0.0, 800 * numpy.sin(numpy.pi * (hour - 6) / 12.0)) * random.uniform(0.6, 1.0, n)
+        data['tair'] = data['tair_f'] = 15 + 8 * numpy.sin(numpy.pi * (hour - 9) / 12.0) + random.normal(0, 1, n)
+        data['vpd_f'] = numpy.maximum(0.5, 10 + 8 * numpy.sin(numpy.pi * (hour - 9) / 12.0) + random.normal(0, 1, n))
+        reco = 3.0 * numpy.exp(150 * (1 / (15 + 46.02) - 1 / (data['tair'] + 46.02)))
+        gpp = 0.03 * data['rg'] * 25 / (0.03 * data['rg'] + 25)
+        data['nee_f'] = reco - gpp + random.normal(0, 1.0, n)
+        data['nee_fs_unc'] = 1.0
+        return data
+
+    def estimate_parasets(self, **kwargs):
+        del self.guesses[:]
+        return daytime.estimate_parasets(data=self.get_data(), winsize=4, fguess=[0.01, 30.0, 0.0, 5.0, 100.0], trimperc=0.0, name_out='nee_y_50_US-Xxx_2005', dt_output_dir=self.tdir,
+                                         site_id='US-Xxx', ustar_type='y', percentile_num='50', year=2005, **kwargs)
+
+    def test_warm_start_off(self):
+        """Test warm start is off by default, and fits then start only from the 3 legacy initial guesses"""
+        self.assertFalse(daytime.DT_WARM_START)
+        results = self.estimate_parasets(warm_start=False)
+        self.assertTrue(self.guesses)
+        self.assertEqual(len(self.guesses) % 3, 0)
+        for i in range(0, len(self.guesses), 3):
+            half, initial, double = self.guesses[i:i + 3]
+            self.assertEqual(initial[0], numpy.array(0.01, dtype=FLOAT_PREC))
+            numpy.testing.assert_array_equal(half, numpy.array([initial[0], initial[1] * 0.5, initial[2], initial[3]], dtype=FLOAT_PREC))
+            numpy.testing.assert_array_equal(double, numpy.array([initial[0], initial[1] * 2, initial[2], initial[3]], dtype=FLOAT_PREC))
+        guesses = list(self.guesses)
+        default_results = self.estimate_parasets()
+        self.assertEqual(len(self.guesses), len(guesses))
+        for result, default_result in zip(results, default_results):
+            numpy.testing.assert_array_equal(result, default_result)
+
+    def test_warm_start_on(self):
+        """Test warm start replaces the 3 initial guesses with the previous window parameters in some windows"""
+        self.estimate_parasets(warm_start=False)
+        legacy_fits = len(self.guesses)
+        self.estimate_parasets(warm_start=True)
+        warm_guesses = [g for g in self.guesses if g[0] != numpy.array(0.01, dtype=FLOAT_PREC)]
+        self.assertTrue(warm_guesses)
+        self.assertLess(len(self.guesses), legacy_fits)
+
+
+if __name__ == '__main__':
+    unittest.main()
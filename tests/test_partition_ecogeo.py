@@ -0,0 +1,64 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for analytic Jacobians of partitioning models
+'''
+import unittest
+
+import numpy
+
+from context import oneflux
+from oneflux.partition import ecogeo
+
+
+class ModelJacobianTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(11)
+        n = 50
+        self.rg_f = random.uniform(5.0, 900.0, n)
+        self.ta_f = random.uniform(-5.0, 30.0, n)
+        self.vpd_f = random.uniform(0.0, 25.0, n) # both sides of VPD limitation threshold (10 hPa)
+
+    def check_jacobian(self, func, parameter, **kwargs):
+        """Compares analytic Jacobian of func with central finite differences"""
+        jacobian = ecogeo.get_model_jacobian(func)(parameter=parameter, **kwargs)
+        self.assertEqual(jacobian.shape, (len(parameter), self.rg_f.size))
+        for i in range(len(parameter)):
+            step = 1e-6 * max(1.0, abs(parameter[i]))
+            upper, lower = numpy.array(parameter, dtype=float), numpy.array(parameter, dtype=float)
+            upper[i] += step
+            lower[i] -= step
+            expected = (func(parameter=upper, **kwargs) - func(parameter=lower, **kwargs)) / (2 * step)
+            numpy.testing.assert_allclose(jacobian[i], expected, rtol=1e-5, atol=1e-7)
+
+    def test_lloyd_taylor(self):
+        jacobian = ecogeo.get_model_jacobian(ecogeo.lloyd_taylor)(ta=self.ta_f, rref=2.0, e0=150.0)
+        step = 1e-4
+        numpy.testing.assert_allclose(jacobian[0], (ecogeo.lloyd_taylor(ta=self.ta_f, rref=2.0 + step, e0=150.0) - ecogeo.lloyd_taylor(ta=self.ta_f, rref=2.0 - step, e0=150.0)) / (2 * step), rtol=1e-6)
+        numpy.testing.assert_allclose(jacobian[1], (ecogeo.lloyd_taylor(ta=self.ta_f, rref=2.0, e0=150.0 + step) - ecogeo.lloyd_taylor(ta=self.ta_f, rref=2.0, e0=150.0 - step)) / (2 * step), rtol=1e-6)
+
+    def test_lloyd_taylor_dt(self):
+        self.check_jacobian(ecogeo.lloyd_taylor_dt, parameter=[2.0, 150.0], ta_f=self.ta_f)
+
+    def test_hlrc_lloyd(self):
+        self.check_jacobian(ecogeo.hlrc_lloyd, parameter=[0.05, 30.0, 2.0], rg_f=self.rg_f, ta_f=self.ta_f, e0=150.0)
+
+    def test_hlrc_lloydvpd(self):
+        self.check_jacobian(ecogeo.hlrc_lloydvpd, parameter=[0.05, 30.0, 0.1, 2.0], rg_f=self.rg_f, ta_f=self.ta_f, e0=150.0, vpd_f=self.vpd_f)
+
+    def test_hlrc_lloyd_afix(self):
+        self.check_jacobian(ecogeo.hlrc_lloyd_afix, parameter=[30.0, 2.0], rg_f=self.rg_f, ta_f=self.ta_f, e0=150.0, alpha=0.05)
+
+    def test_hlrc_lloydvpd_afix(self):
+        self.check_jacobian(ecogeo.hlrc_lloydvpd_afix, parameter=[30.0, 0.1, 2.0], rg_f=self.rg_f, ta_f=self.ta_f, e0=150.0, vpd_f=self.vpd_f, alpha=0.05)
+
+    def test_lloydt_e0fix(self):
+        self.check_jacobian(ecogeo.lloydt_e0fix, parameter=[2.0], ta_f=self.ta_f, e0=150.0)
+
+    def test_unknown_model(self):
+        self.assertIsNone(ecogeo.get_model_jacobian(ecogeo.gpp_vpd))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for partitioning library functions
+'''
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from datetime import datetime, timedelta
+from scipy.stats import rankdata
+
+from context import oneflux
+from oneflux import ONEFluxError
+from oneflux.partition.auxiliary import NAN, not_nan
+from oneflux.partition.library import WindowIndex, pct, get_time_columns, add_time_columns
+from oneflux.partition.library import keep_result_columns, get_result_columns, clear_result_columns, load_output_columns
+from oneflux.partition.library import run_partitioning_tasks, get_task_dataset
+from oneflux.utils.writers import write_csv
+
+
+class WindowIndexTest(unittest.TestCase):
+    def setUp(self):
+        # half-hourly julday for 20 days, with a missing day
+        julday = numpy.repeat(numpy.arange(1, 21), 48) + numpy.tile(numpy.arange(48) / 48.0, 20)
+        self.days = julday[(julday < 9) | (julday >= 10)]
+        self.valid_mask = (numpy.arange(self.days.size) % 3 != 0)
+        self.starts = numpy.arange(-2, 22, 5)
+
+    def expected(self, window, size, valid_mask=None):
+        mask = (self.days >= self.starts[window]) & (self.days < self.starts[window] + size)
+        if valid_mask is not None:
+            mask &= valid_mask
+        return numpy.where(mask)[0]
+
+    def test_indices(self):
+        """Test window indices from offsets match indices from full length masks"""
+        index = WindowIndex(days=self.days, starts=self.starts, size=14)
+        self.assertTrue(index.is_sorted)
+        self.assertEqual(len(index), self.starts.size)
+        for window in range(len(index)):
+            numpy.testing.assert_array_equal(index.indices(window), self.expected(window, size=14))
+            numpy.testing.assert_array_equal(index.indices(window, valid_mask=self.valid_mask), self.expected(window, size=14, valid_mask=self.valid_mask))
+
+    def test_indices_unsorted(self):
+        """Test window indices for unsorted days (computed from masks)"""
+        order = numpy.random.RandomState(5).permutation(self.days.size)
+        self.days = self.days[order]
+        index = WindowIndex(days=self.days, starts=self.starts, size=4)
+        self.assertFalse(index.is_sorted)
+        for window in range(len(index)):
+            numpy.testing.assert_array_equal(index.indices(window, valid_mask=self.valid_mask), self.expected(window, size=4, valid_mask=self.valid_mask))
+
+
+def pct_ranking(array, percent):
+    """Percentile by full ordinal ranking (original implementation of pct)"""
+    nonnan_array = array[not_nan(array)]
+    rank_idx_array = rankdata(nonnan_array, method='ordinal')
+    critical_rank = len(nonnan_array) * percent / 100.
+    over_critical_rank_mask = (rank_idx_array > critical_rank)
+    if numpy.sum(over_critical_rank_mask) == 0.0:
+        return numpy.max(nonnan_array)
+    critical_rank_idx = numpy.where(rank_idx_array == numpy.min(rank_idx_array[over_critical_rank_mask]))
+    critical_rank_idx_previous = numpy.where(rank_idx_array == (numpy.min(rank_idx_array[over_critical_rank_mask]) - 1))
+    if critical_rank.is_integer() and (numpy.sum(critical_rank_idx_previous) != 0):
+        return numpy.average([nonnan_array[critical_rank_idx[0]], nonnan_array[critical_rank_idx_previous[0]]])
+    else:
+        return nonnan_array[critical_rank_idx[0]][0]
+
+
+class PctTest(unittest.TestCase):
+    def test_pct_matches_ranking(self):
+        """Test selection based percentile matches full ranking (values and types), with ties and missing values"""
+        random = numpy.random.RandomState(13)
+        for size in (2, 3, 10, 20, 40, 97):
+            for _ in range(20):
+                array = random.randint(0, 6, size).astype('f4')
+                array[random.uniform(size=size) < 0.1] = NAN
+                if numpy.sum(not_nan(array)) < 2:
+                    continue
+                for percent in (0.0, 5.0, 10.0, 25.0, 50.0, 90.0, 95.0, 100.0):
+                    expected = pct_ranking(array, percent)
+                    result = pct(array=array, percent=percent)
+                    self.assertEqual(result, expected)
+                    self.assertEqual(type(result), type(expected))
+
+    def test_pct_missing(self):
+        """Test error for less than two non-missing values"""
+        self.assertRaises(ONEFluxError, pct, array=numpy.array([1.0, NAN]), percent=50.0)
+
+
+class TimeColumnsTest(unittest.TestCase):
+    def test_time_columns(self):
+        """Test julday and Hr for all entries match per-record datetime computation"""
+        first = datetime(2003, 12, 31, 0, 0)
+        datetimes = [first + timedelta(minutes=30 * i) for i in range(0, 48 * 800, 5)] + [datetime(2004, 5, 1, 10, 15)]
+        dataset = numpy.zeros(len(datetimes), dtype=[('year', 'f8'), ('month', 'f8'), ('day', 'f8'), ('hour', 'f8'), ('minute', 'f8'), ('nee', 'f8')])
+        for name in ('year', 'month', 'day', 'hour', 'minute'):
+            dataset[name] = [getattr(d, name) for d in datetimes]
+        new_data = add_time_columns(dataset)
+        numpy.testing.assert_array_equal(new_data['julday'], [int(d.strftime('%j')) for d in datetimes])
+        expected_hr = [(d.hour + d.minute / 60.0 if d.minute in (0, 30) else NAN) for d in datetimes]
+        numpy.testing.assert_array_equal(new_data['hr'], expected_hr)
+        numpy.testing.assert_array_equal(new_data['nee'], dataset['nee'])
+        julday, hr = get_time_columns(year=dataset['year'], month=dataset['month'], day=dataset['day'], hour=dataset['hour'], minute=dataset['minute'])
+        numpy.testing.assert_array_equal(julday, new_data['julday'])
+
+
+class ResultColumnsTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tdir, 'nee_y_50_US-Xxx_2005.csv')
+        self.data = numpy.zeros(5, dtype=[('reco_2', 'f4'), ('gpp_2', 'f8'), ('nee', 'f8')])
+        self.data['reco_2'] = [1.1, 2.2, 3.3, numpy.nan, 5.5]
+        self.data['gpp_2'] = [0.1, 0.2, 0.3, 0.4, 0.5]
+        write_csv(filename=self.filename, data=self.data, delimiter=',', header=','.join(self.data.dtype.names))
+
+    def tearDown(self):
+        clear_result_columns()
+        shutil.rmtree(self.tdir)
+
+    def test_none_kept(self):
+        """Test no columns are kept unless requested"""
+        self.assertEqual(keep_result_columns(filename=self.filename, data=self.data), {})
+        self.assertIsNone(get_result_columns(filename=self.filename, columns=['reco_2']))
+
+    def test_kept_same_as_file(self):
+        """Test kept columns match loading from file and are released when retrieved"""
+        columns = ['reco_2', 'gpp_2']
+        keep_result_columns(filename=self.filename, data=self.data, columns=columns)
+        kept = get_result_columns(filename=self.filename, columns=columns)
+        loaded = load_output_columns(filename=self.filename, columns=columns)
+        for c in columns:
+            numpy.testing.assert_array_equal(kept[c], loaded[c])
+        self.assertIsNone(get_result_columns(filename=self.filename, columns=columns))
+
+    def test_missing_column_or_changed_file(self):
+        """Test columns not kept or for file changed since are not used"""
+        keep_result_columns(filename=self.filename, data=self.data, columns=['reco_2'])
+        self.assertIsNone(get_result_columns(filename=self.filename, columns=['reco_2', 'gpp_2']))
+        keep_result_columns(filename=self.filename, data=self.data, columns=['reco_2'])
+        os.utime(self.filename, (time.time() + 10, time.time() + 10))
+        self.assertIsNone(get_result_columns(filename=self.filename, columns=['reco_2']))
+
+    def test_clear(self):
+        """Test clearing releases all kept columns"""
+        keep_result_columns(filename=self.filename, data=self.data, columns=['reco_2'])
+        clear_result_columns()
+        self.assertIsNone(get_result_columns(filename=self.filename, columns=['reco_2']))
+
+
+class SlowHandler(logging.Handler):
+    """Handler holding its lock for a while on each entry (e.g., slow storage)"""
+    def emit(self, record):
+        time.sleep(0.01)
+
+
+def logging_task(task):
+    """Partitioning task logging its first entry in worker process"""
+    logging.getLogger(__name__).warning("task {t}".format(t=task))
+    return task + get_task_dataset('meteo')
+
+
+class RunPartitioningTasksTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = SlowHandler()
+        self.logger = logging.getLogger(__name__)
+        self.logger.addHandler(self.handler)
+        self.logging = True
+
+    def tearDown(self):
+        self.logging = False
+        self.logger.removeHandler(self.handler)
+
+    def log(self):
+        while self.logging:
+            self.logger.warning("logging while pools are created")
+
+    def test_pool_while_logging(self):
+        """Test worker processes forked while another thread is logging do not hang on their first log entry"""
+        logger_thread = threading.Thread(target=self.log)
+        logger_thread.daemon = True
+        logger_thread.start()
+        results = []
+        def run():
+            for _ in range(5):
+                results.append(run_partitioning_tasks(func=logging_task, tasks=range(4), datasets={'meteo': 10}, workers=4))
+        runner = threading.Thread(target=run)
+        runner.daemon = True
+        runner.start()
+        runner.join(60)
+        self.logging = False
+        logger_thread.join()
+        self.assertFalse(runner.is_alive(), 'partitioning tasks did not finish')
+        self.assertEqual(results, [[10, 11, 12, 13]] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
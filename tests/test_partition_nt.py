@@ -0,0 +1,83 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for nighttime partitioning task execution (worker processes)
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from context import oneflux
+from oneflux.partition.library import ONEFluxPartitionError, pop_result_columns
+from oneflux.partition.nighttime import _partitioning_nt_worker, merge_nt_task_results, NT_TASK_OK, NT_TASK_ERROR
+from oneflux.partition.nighttime import rref_linear_fit, rref_iterative_fit
+from oneflux.partition.ecogeo import lloyd_taylor
+
+
+class NTWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_worker_error_status(self):
+        """Test failed task is returned as error status with original exception type (no datasets available)"""
+        task = ('US-Xxx', self.tdir, 'y', 0, 2005, '50', 45.0)
+        status, details = _partitioning_nt_worker(task)
+        self.assertEqual(status, NT_TASK_ERROR)
+        self.assertIn('KeyError', details)
+        self.assertIn('year=2005', details)
+
+    def test_merge_stores_results_before_raising(self):
+        """Test results from finished tasks are kept and first error (in task order) is raised"""
+        filename = os.path.join(self.tdir, 'nee_y_50_US-Xxx_2005.csv')
+        with open(filename, 'w') as f:
+            f.write('reco_2\n1.0\n')
+        kept = {'reco_2': numpy.array([1.0])}
+        results = [(NT_TASK_ERROR, 'first'), (NT_TASK_OK, (filename, kept)), (NT_TASK_ERROR, 'second')]
+        with self.assertRaises(ONEFluxPartitionError) as context:
+            merge_nt_task_results(results=results)
+        self.assertEqual(str(context.exception), 'first')
+        self.assertIs(pop_result_columns(filename=filename), kept)
+
+    def test_merge_all_ok(self):
+        """Test merging finished tasks without kept columns does not raise"""
+        merge_nt_task_results(results=[(NT_TASK_OK, ('missing.csv', None))])
+
+
+class RrefFitTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(3)
+        self.ta = random.uniform(-5.0, 25.0, 60).astype('f4')
+        self.lloyd_fac = lloyd_taylor(ta=self.ta, rref=1.0, e0=150.0)
+        self.reco = (2.5 * self.lloyd_fac + random.normal(0.0, 0.3, 60)).astype('f4')
+
+    def test_linear_fit_exact(self):
+        """Test closed-form rref is the least squares solution"""
+        rref, rref_se = rref_linear_fit(lloyd_fac=self.lloyd_fac, reco=self.reco)
+        expected = numpy.linalg.lstsq(numpy.asarray(self.lloyd_fac, dtype='f8')[:, None], numpy.asarray(self.reco, dtype='f8'), rcond=-1)[0][0]
+        self.assertAlmostEqual(rref, expected, places=10)
+        self.assertTrue(rref_se > 0)
+
+    def test_linear_fit_matches_iterative(self):
+        """Test closed-form rref matches iterative least squares within its convergence tolerance"""
+        rref, _ = rref_linear_fit(lloyd_fac=self.lloyd_fac, reco=self.reco)
+        rref_iterative, _ = rref_iterative_fit(lloyd_fac=self.lloyd_fac, reco=self.reco)
+        self.assertAlmostEqual(rref / rref_iterative, 1.0, places=4)
+
+    def test_linear_fit_degenerate(self):
+        """Test no closed-form solution for empty or zero temperature factor (iterative fallback used)"""
+        self.assertIsNone(rref_linear_fit(lloyd_fac=numpy.array([]), reco=numpy.array([])))
+        self.assertIsNone(rref_linear_fit(lloyd_fac=numpy.zeros(5), reco=numpy.ones(5)))
+        rref, rref_se = rref_linear_fit(lloyd_fac=numpy.array([2.0]), reco=numpy.array([3.0]))
+        self.assertEqual(rref, 1.5)
+        self.assertTrue(numpy.isnan(rref_se))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for running external pipeline tools
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+from context import oneflux
+from oneflux.pipeline.common import run_tool, ONEFluxPipelineError, ONEFluxPipelineTimeoutError
+
+
+class RunToolTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.output_log = os.path.join(self.tdir, 'report.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_output_and_stats(self):
+        """Test tool output (stdout and stderr) is saved into output log, run in working directory, with stats returned"""
+        code = "import os, sys; print(os.getcwd()); sys.stderr.write('error line\\n')"
+        stats = run_tool(args=[sys.executable, '-c', code], label='tool', cwd=self.tdir, output_log=self.output_log)
+        self.assertEqual(stats['returncode'], 0)
+        self.assertEqual(stats['label'], 'tool')
+        self.assertGreaterEqual(stats['elapsed'], 0.0)
+        with open(self.output_log, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(sorted(lines), sorted([os.path.realpath(self.tdir), 'error line']))
+
+    def test_exit_code(self):
+        """Test non-zero exit code is raised"""
+        self.assertRaises(ONEFluxPipelineError, run_tool, args=[sys.executable, '-c', 'import sys; sys.exit(3)'], label='tool')
+
+    def test_timeout(self):
+        """Test tool not finished within timeout is terminated and raised"""
+        ts_begin = time.time()
+        self.assertRaises(ONEFluxPipelineTimeoutError, run_tool, args=[sys.executable, '-c', 'import time; time.sleep(30)'], label='tool', timeout=0.5)
+        self.assertLess(time.time() - ts_begin, 10)
+
+    def test_missing_executable(self):
+        """Test tool that cannot be started is raised"""
+        self.assertRaises(ONEFluxPipelineError, run_tool, args=[os.path.join(self.tdir, 'missing')], label='tool', output_log=self.output_log)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for pipeline step scheduling and execution
+'''
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from context import oneflux
+from oneflux.pipeline.wrappers import Pipeline, PipelinePrepareURE
+from oneflux.pipeline.common import FINGERPRINT_FILENAME, ONEFluxPipelineError
+from oneflux.partition.library import PARTITIONING_DT_ERROR_FILE
+from oneflux.partition.daytime import merge_dt_task_results, ONEFluxPartitionBrokenOptError, DT_TASK_OK, DT_TASK_BROKEN_OPT
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def get_pipeline(self, fail=None, duration=0.0, **configs):
+        """Pipeline with step executions replaced by recording start and end of each step (fail is label of failing step)"""
+        pipeline = Pipeline(siteid='US-Xxx', data_dir=self.tdir, tool_dir=self.tdir, first_year=2005, last_year=2006, **configs)
+        for driver in pipeline.drivers:
+            def run(driver=driver):
+                with self.lock:
+                    self.events.append(('start', driver))
+                time.sleep(duration)
+                if (fail is not None) and (driver is getattr(pipeline, fail)):
+                    raise ValueError('failed')
+                with self.lock:
+                    self.events.append(('end', driver))
+            driver.run = run
+        return pipeline
+
+    def started(self):
+        return [driver for event, driver in self.events if event == 'start']
+
+
+class StepDependenciesTest(PipelineTestCase):
+    def test_resolved_through_disabled_steps(self):
+        """Test steps wait for steps set to be run upstream of disabled steps"""
+        pipeline = self.get_pipeline(nee_proc_execute=False)
+        dependencies = pipeline.get_step_dependencies()
+        for driver in (pipeline.nee_partition_nt, pipeline.nee_partition_dt):
+            self.assertIn(pipeline.meteo_proc, dependencies[driver])
+            self.assertIn(pipeline.qc_auto, dependencies[driver])
+            self.assertNotIn(pipeline.nee_proc, dependencies[driver])
+        self.assertNotIn(pipeline.nee_proc, dependencies)
+
+    def test_all_upstream_waited(self):
+        """Test direct and indirect upstream steps are waited for"""
+        pipeline = self.get_pipeline()
+        dependencies = pipeline.get_step_dependencies()
+        self.assertEqual(dependencies[pipeline.qc_auto], [])
+        self.assertIn(pipeline.nee_proc, dependencies[pipeline.ure])
+        self.assertIn(pipeline.prepare_ure, dependencies[pipeline.ure])
+
+
+class RunStepsTest(PipelineTestCase):
+    def test_serial_order(self):
+        """Test single worker runs steps in pipeline order"""
+        pipeline = self.get_pipeline(step_workers=1)
+        pipeline.run_steps()
+        self.assertEqual(self.started(), [d for d in pipeline.drivers if d.execute])
+
+    def test_concurrent_dependencies(self):
+        """Test concurrent steps start only after all their upstream steps finished"""
+        pipeline = self.get_pipeline(step_workers=4, duration=0.05, nee_proc_execute=False)
+        pipeline.run_steps()
+        self.assertEqual(sorted(self.started()), sorted(d for d in pipeline.drivers if d.execute))
+        for driver, upstream in pipeline.get_step_dependencies().items():
+            start = self.events.index(('start', driver))
+            for upstream_driver in upstream:
+                self.assertLess(self.events.index(('end', upstream_driver)), start)
+
+    def test_failure(self):
+        """Test failed step is raised and no steps downstream of it start"""
+        for step_workers in (1, 4):
+            del self.events[:]
+            pipeline = self.get_pipeline(fail='nee_partition_nt', step_workers=step_workers, duration=0.02)
+            self.assertRaises(ValueError, pipeline.run_steps)
+            self.assertIn(pipeline.nee_partition_nt, self.started())
+            self.assertNotIn(pipeline.prepare_ure, self.started())
+            self.assertNotIn(pipeline.ure, self.started())
+            self.assertNotIn(pipeline.fluxnet2015, self.started())
+
+
+class KeepColumnsTest(PipelineTestCase):
+    def test_opt_in(self):
+        """Test partitioning results are kept in memory for prepare_ure only if enabled and prepare_ure runs"""
+        self.assertIsNone(self.get_pipeline().prepare_ure.get_keep_columns(columns=PipelinePrepareURE.NT_COLUMNS))
+        pipeline = self.get_pipeline(prepare_ure_in_memory=True)
+        self.assertEqual(pipeline.prepare_ure.get_keep_columns(columns=PipelinePrepareURE.NT_COLUMNS), PipelinePrepareURE.NT_COLUMNS)
+        pipeline.resume_steps = [pipeline.prepare_ure]
+        self.assertIsNone(pipeline.prepare_ure.get_keep_columns(columns=PipelinePrepareURE.NT_COLUMNS))
+        pipeline = self.get_pipeline(prepare_ure_in_memory=True, prepare_ure_execute=False)
+        self.assertIsNone(pipeline.prepare_ure.get_keep_columns(columns=PipelinePrepareURE.DT_COLUMNS))
+
+
+class FingerprintTest(PipelineTestCase):
+    def get_pipeline(self, **configs):
+        """Pipeline with step executions replaced by writing one file per step in its output directory"""
+        pipeline = super(FingerprintTest, self).get_pipeline(**configs)
+        pipeline.pre_validate = lambda: None
+        for driver in pipeline.drivers:
+            def run(driver=driver, record=driver.run):
+                record()
+                step_dir = pipeline.get_step_dir(driver)
+                if step_dir is None:
+                    return
+                if not os.path.isdir(step_dir):
+                    os.makedirs(step_dir)
+                with open(os.path.join(step_dir, pipeline.get_step_label(driver) + '.txt'), 'a') as f:
+                    f.write('run {n}\n'.format(n=len(self.events)))
+            driver.run = run
+            driver.post_validate = lambda: None
+        return pipeline
+
+    def run_pipeline(self, **configs):
+        del self.events[:]
+        pipeline = self.get_pipeline(**configs)
+        pipeline.run()
+        return pipeline
+
+    def test_not_incremental(self):
+        """Test no fingerprints are computed or recorded if not in incremental mode"""
+        self.run_pipeline()
+        del self.events[:]
+        pipeline = self.get_pipeline()
+        pipeline.get_step_fingerprint = None
+        pipeline.run()
+        self.assertEqual(self.started(), [d for d in pipeline.drivers if d.execute])
+        self.assertFalse(os.path.exists(pipeline.fingerprint_filename))
+        for root, dirs, files in os.walk(self.tdir):
+            self.assertFalse([f for f in files if 'fingerprint' in f])
+
+    def test_incremental(self):
+        """Test manifest recorded in site directory, up to date steps skipped and changed steps run with downstream steps"""
+        pipeline = self.run_pipeline(incremental=True)
+        self.assertEqual(pipeline.fingerprint_filename, os.path.join(self.tdir, FINGERPRINT_FILENAME.format(s='US-Xxx')))
+        self.assertTrue(os.path.isfile(pipeline.fingerprint_filename))
+        self.assertEqual(len(self.started()), len([d for d in pipeline.drivers if d.execute]))
+        pipeline = self.run_pipeline(incremental=True)
+        self.assertEqual(self.started(), [])
+        with open(os.path.join(pipeline.ure.ure_dir, 'ure.txt'), 'a') as f:
+            f.write('changed\n')
+        pipeline = self.run_pipeline(incremental=True)
+        self.assertEqual(self.started(), [pipeline.ure, pipeline.fluxnet2015])
+
+    def test_shared_directory(self):
+        """Test steps sharing output directory (qc_auto and qc_auto_convert) are both skipped when up to date"""
+        self.run_pipeline(incremental=True, qc_auto_convert_execute=True)
+        pipeline = self.run_pipeline(incremental=True, qc_auto_convert_execute=True)
+        self.assertEqual(pipeline.get_step_dir(pipeline.qc_auto), pipeline.get_step_dir(pipeline.qc_auto_convert))
+        self.assertEqual(self.started(), [])
+
+    def test_incremental_resume(self):
+        """Test steps skipped as up to date are recorded as completed, so resume continues from failed step"""
+        self.run_pipeline(incremental=True)
+        self.run_pipeline(incremental=True)
+        pipeline = self.run_pipeline(resume=True)
+        self.assertEqual(self.started(), [])
+        with open(os.path.join(pipeline.ure.ure_dir, 'ure.txt'), 'a') as f:
+            f.write('changed\n')
+        self.assertRaises(ValueError, self.run_pipeline, incremental=True, fail='ure')
+        self.assertEqual([type(d) for d in self.started()], [type(pipeline.ure)])
+        pipeline = self.run_pipeline(resume=True)
+        self.assertEqual(self.started(), [pipeline.ure, pipeline.fluxnet2015])
+
+
+class AddBrokenWindowsTest(PipelineTestCase):
+    def setUp(self):
+        super(AddBrokenWindowsTest, self).setUp()
+        self.pipeline = self.get_pipeline(perc_to_compare=['1.25', '3.75'])
+        self.driver = self.pipeline.nee_partition_dt
+        os.makedirs(self.driver.nee_partition_dt_dir)
+        self.error_filename = os.path.join(self.tdir, PARTITIONING_DT_ERROR_FILE.format(s='US-Xxx'))
+
+    def output(self, ustar_type, year, percentile):
+        filename = os.path.join(self.driver.nee_partition_dt_dir, 'nee_{u}_{p}_US-Xxx_{y}.csv'.format(u=ustar_type, p=percentile, y=year))
+        with open(filename, 'w') as f:
+            f.write('reco_hblr\n1.0\n')
+        return filename
+
+    def get_error(self, broken):
+        """Broken optimization error merged from parallel task results, with broken (ustar_type, year, begin, end) windows"""
+        tasks, results = [], []
+        for ustar_type, year, day_begin, day_end in broken:
+            tasks.append(('US-Xxx', self.tdir, self.driver.nee_partition_dt_dir, ustar_type, 0, year, '1__25', 45.0))
+            results.append((DT_TASK_BROKEN_OPT, ('HLRC_LloydVPD', 'US-Xxx', year, day_begin, day_end, ustar_type, '1.25')))
+        tasks.append(('US-Xxx', self.tdir, self.driver.nee_partition_dt_dir, 'y', 0, 2006, '1__25', 45.0))
+        results.append((DT_TASK_OK, (self.output('y', 2006, '1.25'), None)))
+        try:
+            merge_dt_task_results(tasks=tasks, results=results)
+        except ONEFluxPartitionBrokenOptError as e:
+            return e
+        self.fail('broken optimization not raised')
+
+    def test_broken_windows(self):
+        """Test windows of all broken site-year-products added to error file and their outputs removed"""
+        removed = [self.output(u, 2005, p) for u in ('y', 'c') for p in ('1.25', '3.75')]
+        error = self.get_error(broken=[('y', 2005, 10, 14), ('c', 2005, 30, 34)])
+        self.driver.add_broken_windows(error)
+        with open(self.error_filename, 'r') as f:
+            self.assertEqual(f.read(), 'site_year_nee_des,begin,end\nUS-Xxx_2005_y,10,14\nUS-Xxx_2005_c,30,34\n')
+        self.assertEqual([(t['ustar_type'], t['year'], t['day_begin']) for t in self.driver.broken_tasks], [('y', 2005, 10), ('c', 2005, 30)])
+        for filename in removed:
+            self.assertFalse(os.path.isfile(filename))
+        self.assertTrue(os.path.isfile(os.path.join(self.driver.nee_partition_dt_dir, 'nee_y_1.25_US-Xxx_2006.csv')))
+
+        # later broken window appended, same window broken again rejected
+        self.driver.add_broken_windows(self.get_error(broken=[('y', 2005, 50, 54)]))
+        with open(self.error_filename, 'r') as f:
+            self.assertEqual(f.read().splitlines()[-1], 'US-Xxx_2005_y,50,54')
+        self.assertRaises(ONEFluxPipelineError, self.driver.add_broken_windows, self.get_error(broken=[('c', 2005, 30, 34)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
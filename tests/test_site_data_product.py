@@ -0,0 +1,218 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for site data product loading and saving functions
+'''
+import os
+import shutil
+import calendar
+import tempfile
+import unittest
+
+import numpy
+
+from datetime import datetime, timedelta
+
+from context import oneflux
+from oneflux.pipeline.site_data_product import load_nee, save_csv_txt, aggregate_qcdata
+from oneflux.pipeline.variables_codes import PERC_LABEL
+from oneflux.pipeline.common import TIMESTAMP_DTYPE_BY_RESOLUTION, NEW_METEO_VARS
+
+
+def aggregate_qcdata_reference(qcdata):
+    """
+    Per-day loop implementation previously used by aggregate_qcdata
+    """
+
+    # DD
+    curr_ts, last_ts = datetime.strptime(qcdata['TIMESTAMP_START'][0], '%Y%m%d%H%M'), datetime.strptime(qcdata['TIMESTAMP_START'][-1], '%Y%m%d%H%M')
+    curr_y, first_y, last_y = curr_ts.year, curr_ts.year, last_ts.year
+    entries_dd = 0
+    while curr_y <= last_y:
+        days_in_year = 366 if calendar.isleap(curr_y) else 365
+        entries_dd += days_in_year
+        curr_y += 1
+    dtype = [(vlabel, 'f8') for vlabel in NEW_METEO_VARS if vlabel in qcdata.dtype.names]
+    dtype_ext = dtype + [(vlabel + PERC_LABEL, 'f8') for vlabel, _ in dtype]
+    dtype_dd = TIMESTAMP_DTYPE_BY_RESOLUTION['dd'] + dtype_ext
+    data_dd = numpy.empty(entries_dd, dtype=dtype_dd)
+    data_dd.fill(-9999)
+    day_diff = timedelta(hours=24)
+    curr_idx = 0
+    while curr_ts <= last_ts:
+        dd = curr_ts.strftime('%Y%m%d')
+        data_dd['TIMESTAMP'][curr_idx] = dd
+        mask_dd = numpy.char.startswith(qcdata['TIMESTAMP_START'], dd)
+        for vlabel, _ in dtype:
+            values = qcdata[vlabel][mask_dd]
+            perc = float(values[values > -9999].size) / float(values.size)
+            if perc > 0.5:
+                mean = numpy.mean(values[values > -9999])
+            else:
+                mean = -9999
+                perc = -9999
+            data_dd[vlabel][curr_idx] = mean
+            data_dd[vlabel + PERC_LABEL][curr_idx] = perc
+        curr_idx += 1
+        curr_ts += day_diff
+
+    # WW
+    recs_ww = 52
+    dtype_ww = TIMESTAMP_DTYPE_BY_RESOLUTION['ww'] + dtype_ext
+    data_ww = numpy.empty((last_y - first_y + 1) * recs_ww, dtype=dtype_ww)
+    data_ww.fill(-9999)
+    for idx, year in enumerate(range(first_y, last_y + 1)):
+        first_rec = idx * recs_ww
+        curr_rec = first_rec
+        last_rec = first_rec + recs_ww
+        f = datetime(year, 1, 1, 0, 0)
+        data_ww['TIMESTAMP_START'][first_rec:last_rec] = [(f + timedelta(days=i * 7)).strftime('%Y%m%d') for i in xrange(0, recs_ww)]
+        data_ww['TIMESTAMP_END'][first_rec:last_rec] = [(datetime.strptime(i, '%Y%m%d') + timedelta(days=6)).strftime('%Y%m%d') for i in data_ww['TIMESTAMP_START'][first_rec:last_rec]]
+        data_ww['TIMESTAMP_END'][last_rec - 1] = datetime(year, 12, 31, 0, 0).strftime('%Y%m%d')
+        while curr_rec < last_rec:
+            first_idx, last_idx = numpy.where(data_dd['TIMESTAMP'] == data_ww['TIMESTAMP_START'][curr_rec])[0][0], numpy.where(data_dd['TIMESTAMP'] == data_ww['TIMESTAMP_END'][curr_rec])[0][0]
+            for vlabel, _ in dtype:
+                values = data_dd[vlabel][first_idx:last_idx]
+                values_perc = data_dd[vlabel + PERC_LABEL][first_idx:last_idx]
+                values_perc[values_perc <= -9999] = 0.0
+                perc = numpy.mean(values_perc)
+                if perc > 0.5:
+                    mean = numpy.mean(values[values > -9999])
+                else:
+                    mean = -9999
+                    perc = -9999
+                data_ww[vlabel][curr_rec] = mean
+                data_ww[vlabel + PERC_LABEL][curr_rec] = perc
+            curr_rec += 1
+
+    # MM
+    recs_mm = 12
+    dtype_mm = TIMESTAMP_DTYPE_BY_RESOLUTION['mm'] + dtype_ext
+    data_mm = numpy.empty((last_y - first_y + 1) * recs_mm, dtype=dtype_mm)
+    data_mm.fill(-9999)
+    data_mm['TIMESTAMP'] = [str(y) + str(m).zfill(2) for y in range(first_y, last_y + 1) for m in range(1, recs_mm + 1)]
+    for idx, mm in enumerate(data_mm['TIMESTAMP']):
+        mask_mm = numpy.char.startswith(data_dd['TIMESTAMP'], mm)
+        for vlabel, _ in dtype:
+            values = data_dd[vlabel][mask_mm]
+            values_perc = data_dd[vlabel + PERC_LABEL][mask_mm]
+            values_perc[values_perc <= -9999] = 0.0
+            perc = numpy.mean(values_perc)
+            if perc > 0.5:
+                mean = numpy.mean(values[values > -9999])
+            else:
+                mean = -9999
+                perc = -9999
+            data_mm[vlabel][idx] = mean
+            data_mm[vlabel + PERC_LABEL][idx] = perc
+
+    # YY
+    dtype_yy = TIMESTAMP_DTYPE_BY_RESOLUTION['yy'] + dtype_ext
+    data_yy = numpy.empty((last_y - first_y + 1), dtype=dtype_yy)
+    data_yy.fill(-9999)
+    data_yy['TIMESTAMP'] = [str(y) for y in range(first_y, last_y + 1)]
+    for idx, yy in enumerate(data_yy['TIMESTAMP']):
+        mask_yy = numpy.char.startswith(data_dd['TIMESTAMP'], yy)
+        for vlabel, _ in dtype:
+            values = data_dd[vlabel][mask_yy]
+            values_perc = data_dd[vlabel + PERC_LABEL][mask_yy]
+            values_perc[values_perc <= -9999] = 0.0
+            perc = numpy.mean(values_perc)
+            if perc > 0.5:
+                mean = numpy.mean(values[values > -9999])
+            else:
+                mean = -9999
+                perc = -9999
+            data_yy[vlabel][idx] = mean
+            data_yy[vlabel + PERC_LABEL][idx] = perc
+
+    return data_dd, data_ww, data_mm, data_yy
+
+
+class LoadNEETest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def write(self, lines):
+        with open(os.path.join(self.tdir, 'US-Xxx_NEE_dd.csv'), 'w') as f:
+            f.write('TIMESTAMP,DOY,NEE_VUT_REF\n')
+            f.write('\n'.join(lines) + '\n')
+
+    def test_dd_timestamps_fixed_from_doy(self):
+        """Test daily timestamps inconsistent with day of year are replaced (leap year)"""
+        self.write(['20040101,1,1.5', '20040228,59,1.0', '20040301,60,2.0', '20040302,62,2.5'])
+        nee = load_nee(siteid='US-Xxx', ddir=self.tdir, resolution='dd')
+        self.assertEqual(list(nee['TIMESTAMP']), ['20040101', '20040228', '20040229', '20040302'])
+
+    def test_dd_timestamps_consistent(self):
+        """Test daily timestamps consistent with day of year are kept"""
+        self.write(['20050228,59,1.0', '20050301,60,2.0', '20051231,365,2.5'])
+        nee = load_nee(siteid='US-Xxx', ddir=self.tdir, resolution='dd')
+        self.assertEqual(list(nee['TIMESTAMP']), ['20050228', '20050301', '20051231'])
+
+
+class SaveCSVTxtTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def save_csv_txt_reference(self, filename, data, delimiter=',', newline='\n', header=None):
+        """Row by row writer previously used by save_csv_txt"""
+        if header is None:
+            header = delimiter.join(data.dtype.names)
+        with open(filename, 'w') as f:
+            f.write(header + newline)
+            for row in data:
+                f.write(delimiter.join("-9999" if (value == -9999.0 or value == -9999.9) else str(value) for value in row) + newline)
+
+    def test_product_file(self):
+        """Test product file is byte-identical to row by row writer"""
+        rng = numpy.random.RandomState(7)
+        size = 2500
+        data = numpy.zeros(size, dtype=[('TIMESTAMP_START', 'a25'), ('TIMESTAMP_END', 'a25'), ('NEE_VUT_REF', 'f8'), ('NEE_VUT_REF_QC', 'i8'), ('TA_F', 'f8')])
+        data['TIMESTAMP_START'] = ['2004{i:08d}'.format(i=i) for i in range(size)]
+        data['TIMESTAMP_END'] = ['2004{i:08d}'.format(i=i + 1) for i in range(size)]
+        data['NEE_VUT_REF'] = rng.normal(0, 5, size)
+        data['NEE_VUT_REF'][::5] = -9999.0
+        data['NEE_VUT_REF_QC'] = rng.randint(-9999, 3, size)
+        data['TA_F'] = numpy.round(rng.normal(10, 8, size), 3)
+        data['TA_F'][::9] = -9999.9
+        filename, expected_filename = os.path.join(self.tdir, 'written.csv'), os.path.join(self.tdir, 'expected.csv')
+        save_csv_txt(filename=filename, data=data)
+        self.save_csv_txt_reference(filename=expected_filename, data=data)
+        with open(filename, 'r') as f, open(expected_filename, 'r') as f_expected:
+            self.assertEqual(f.read(), f_expected.read())
+
+
+class AggregateQCDataTest(unittest.TestCase):
+    def test_reference(self):
+        """Test DD, WW, MM and YY aggregations are identical to per-day loop implementation"""
+        rng = numpy.random.RandomState(3)
+        first, last = datetime(2004, 1, 1, 0, 0), datetime(2005, 12, 31, 23, 30)
+        timestamps = numpy.arange(numpy.datetime64(first), numpy.datetime64(last) + numpy.timedelta64(30, 'm'), numpy.timedelta64(30, 'm'))
+        labels = ['WD', 'USTAR', 'RH']
+        qcdata = numpy.zeros(timestamps.size, dtype=[('TIMESTAMP_START', 'a25'), ('TIMESTAMP_END', 'a25')] + [(l, 'f8') for l in labels])
+        qcdata['TIMESTAMP_START'] = [t.strftime('%Y%m%d%H%M') for t in timestamps.tolist()]
+        qcdata['TIMESTAMP_END'] = [(t + timedelta(minutes=30)).strftime('%Y%m%d%H%M') for t in timestamps.tolist()]
+        for i, l in enumerate(labels):
+            qcdata[l] = rng.gamma(2.0, 10.0 ** i, timestamps.size)
+            qcdata[l][rng.rand(timestamps.size) < 0.3 * i] = -9999 # from no gaps to mostly missing days
+        qcdata['USTAR'][48 * 40:48 * 120] = -9999 # missing month
+        qcdata['WD'][48 * 400:48 * 403 + 20] = -9999 # missing days within week
+
+        results = aggregate_qcdata(qcdata=qcdata.copy())
+        expected = aggregate_qcdata_reference(qcdata=qcdata.copy())
+        for data, data_expected in zip(results, expected):
+            self.assertEqual(data.dtype, data_expected.dtype)
+            for name in data_expected.dtype.names:
+                numpy.testing.assert_array_equal(data[name], data_expected[name], err_msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
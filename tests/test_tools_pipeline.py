@@ -0,0 +1,72 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for batch pipeline runs
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+from context import oneflux
+from oneflux import ONEFluxError
+from oneflux.tools.pipeline import load_site_manifest, run_pipeline_batch, BATCH_SITE_FAILED
+
+
+class LoadSiteManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tdir, 'manifest.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def write(self, lines):
+        with open(self.filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_load(self):
+        """Test sites loaded in order, skipping comments, empty lines and other columns"""
+        self.write(['# sites', 'site_id, site_dir, first_year, last_year, notes', 'US-Aaa, US-Aaa_sitedata, 2005, 2006, x', '', 'US-Bbb,US-Bbb,2010,2010,'])
+        sites = load_site_manifest(self.filename)
+        self.assertEqual(sites, [{'site_id': 'US-Aaa', 'site_dir': 'US-Aaa_sitedata', 'first_year': 2005, 'last_year': 2006},
+                                 {'site_id': 'US-Bbb', 'site_dir': 'US-Bbb', 'first_year': 2010, 'last_year': 2010}])
+
+    def test_invalid(self):
+        """Test missing file, missing columns, invalid years and duplicate sites are rejected"""
+        self.assertRaises(ONEFluxError, load_site_manifest, self.filename)
+        self.write(['site_id,site_dir,first_year', 'US-Aaa,US-Aaa,2005'])
+        self.assertRaises(ONEFluxError, load_site_manifest, self.filename)
+        self.write(['site_id,site_dir,first_year,last_year', 'US-Aaa,US-Aaa,2005,last'])
+        self.assertRaises(ONEFluxError, load_site_manifest, self.filename)
+        self.write(['site_id,site_dir,first_year,last_year', 'US-Aaa,US-Aaa,2005,2006', 'US-Aaa,US-Aaa2,2005,2006'])
+        self.assertRaises(ONEFluxError, load_site_manifest, self.filename)
+
+
+class RunPipelineBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_site_errors_isolated(self):
+        """Test failing sites do not stop others, with summary in manifest order and one log file per site"""
+        sites = [{'site_id': 'US-A{i:02d}'.format(i=i), 'site_dir': 'missing{i}'.format(i=i), 'first_year': 2005, 'last_year': 2005} for i in range(5)]
+        summary = run_pipeline_batch(datadir=self.tdir, sites=sites, site_workers=3, timestamp='20200101T000000')
+        self.assertEqual([s['site_id'] for s in summary], [s['site_id'] for s in sites])
+        for entry in summary:
+            self.assertEqual(entry['status'], BATCH_SITE_FAILED)
+            self.assertIn('not found', entry['message'])
+            self.assertTrue(os.path.isfile(entry['log_file']))
+            self.assertEqual(os.path.dirname(entry['log_file']), os.path.abspath(self.tdir))
+
+    def test_missing_log_dir(self):
+        """Test missing log directory is rejected before any site runs"""
+        sites = [{'site_id': 'US-Aaa', 'site_dir': 'missing', 'first_year': 2005, 'last_year': 2005}]
+        self.assertRaises(ONEFluxError, run_pipeline_batch, datadir=self.tdir, sites=sites, log_dir=os.path.join(self.tdir, 'missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
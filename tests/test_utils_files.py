@@ -0,0 +1,124 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for columnar cache of parsed text files and JSON manifests
+'''
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from context import oneflux
+from oneflux.utils import files
+from oneflux.utils.files import genfromtxt_cached, prune_columnar_cache, load_json_manifest, save_json_manifest, COLUMNAR_CACHE_META
+
+
+class GenfromtxtCachedTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='oneflux_test_')
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.filename = os.path.join(self.tempdir, 'data.csv')
+        self.write_file(rows=[('200001010030', 1.5, -9999), ('200001010100', 2.5, 3.0), ('200001010130', -9999, 4.0)])
+        self.kwargs = dict(dtype=[('timestamp_end', 'a25'), ('nee', 'f8'), ('reco', 'f8')], names=True, delimiter=',', missing_values='-9999', usemask=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def write_file(self, rows):
+        with open(self.filename, 'w') as f:
+            f.write('TIMESTAMP_END,NEE,RECO\n')
+            for row in rows:
+                f.write(','.join(str(v) for v in row) + '\n')
+
+    def assert_same(self, data, expected):
+        self.assertEqual(data.dtype, expected.dtype)
+        for name in expected.dtype.names:
+            numpy.testing.assert_array_equal(numpy.ma.getdata(data[name]), numpy.ma.getdata(expected[name]))
+            numpy.testing.assert_array_equal(numpy.ma.getmaskarray(data[name]), numpy.ma.getmaskarray(expected[name]))
+
+    def test_no_cache(self):
+        """Test no cache entries are created without cache directory"""
+        data = genfromtxt_cached(fname=self.filename, **self.kwargs)
+        self.assert_same(data, numpy.genfromtxt(fname=self.filename, **self.kwargs))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_round_trip(self):
+        """Test cached masked and unmasked arrays match numpy.genfromtxt and are writable"""
+        for usemask in (True, False):
+            self.kwargs['usemask'] = usemask
+            expected = numpy.genfromtxt(fname=self.filename, **self.kwargs)
+            first = genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, **self.kwargs)
+            second = genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, **self.kwargs)
+            self.assert_same(first, expected)
+            self.assert_same(second, expected)
+            self.assertEqual(isinstance(second, numpy.ma.MaskedArray), usemask)
+            second[second.dtype.names[1]][0] = 0.0
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_modified_file(self):
+        """Test rewritten file is parsed again"""
+        genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, **self.kwargs)
+        self.write_file(rows=[('200001010030', 7.5, 8.5)])
+        os.utime(self.filename, (time.time() + 10, time.time() + 10))
+        data = genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, **self.kwargs)
+        self.assert_same(data, numpy.genfromtxt(fname=self.filename, **self.kwargs))
+
+    def test_prune(self):
+        """Test least recently used entries are pruned"""
+        genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, **self.kwargs)
+        old_entry = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        os.utime(os.path.join(old_entry, COLUMNAR_CACHE_META), (0, 0))
+        self.kwargs['usemask'] = False
+        genfromtxt_cached(fname=self.filename, cache_dir=self.cache_dir, max_size=1, **self.kwargs)
+        entries = os.listdir(self.cache_dir)
+        self.assertEqual(len(entries), 1)
+        self.assertFalse(os.path.exists(old_entry))
+        self.assertEqual(prune_columnar_cache(cache_dir=self.cache_dir, max_size=0), [os.path.join(self.cache_dir, entries[0])])
+
+
+class JSONManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='oneflux_test_')
+        self.filename = os.path.join(self.tempdir, 'manifest.json')
+        self.rename = os.rename
+        self.system = files.platform.system
+
+    def tearDown(self):
+        os.rename = self.rename
+        files.platform.system = self.system
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_load(self):
+        """Test missing or invalid manifest loaded as copy of default"""
+        default = {'steps': {}}
+        manifest = load_json_manifest(filename=self.filename, default=default)
+        manifest['steps']['qc_auto'] = {}
+        self.assertEqual(default, {'steps': {}})
+        with open(self.filename, 'w') as f:
+            f.write('{"steps": ')
+        self.assertEqual(load_json_manifest(filename=self.filename, default=default), {'steps': {}})
+        self.assertEqual(load_json_manifest(filename=self.filename), {})
+
+    def test_save_existing(self):
+        """Test existing manifest replaced, also where rename does not replace existing files (Windows)"""
+        def rename(src, dst):
+            if os.path.exists(dst):
+                raise OSError(17, 'File exists', dst)
+            self.rename(src, dst)
+        for system in (self.system(), 'Windows'):
+            files.platform.system = lambda: system
+            os.rename = (rename if system == 'Windows' else self.rename)
+            for i in range(3):
+                save_json_manifest(filename=self.filename, manifest={'steps': {'step{i}'.format(i=i): {}}, 'system': system})
+                with open(self.filename, 'r') as f:
+                    self.assertEqual(json.load(f), {'steps': {'step{i}'.format(i=i): {}}, 'system': system})
+                self.assertEqual(os.listdir(self.tempdir), ['manifest.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
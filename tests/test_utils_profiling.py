@@ -0,0 +1,103 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for resource usage profiling
+'''
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from context import oneflux
+from oneflux.utils.profiling import resource_usage, usage_difference, collect_phases, profile_phase, \
+                                    record_phase, merge_phases, save_report, USAGE_COUNTERS
+
+
+class UsageTest(unittest.TestCase):
+    def test_difference(self):
+        """Test counters are differences between snapshots and max_rss is taken from end snapshot"""
+        begin = resource_usage()
+        sum(i * i for i in range(200000))
+        end = resource_usage()
+        usage = usage_difference(begin=begin, end=end)
+        self.assertEqual(sorted(usage.keys()), sorted(USAGE_COUNTERS + ['max_rss']))
+        self.assertEqual(usage['max_rss'], end['max_rss'])
+        for key in USAGE_COUNTERS:
+            if begin[key] is not None:
+                self.assertEqual(usage[key], end[key] - begin[key])
+                self.assertGreaterEqual(usage[key], 0)
+
+    def test_missing_counters(self):
+        """Test counters not available (e.g., Windows) are None"""
+        begin = dict((key, None) for key in USAGE_COUNTERS + ['max_rss'])
+        begin['elapsed'] = 1.0
+        end = dict(begin, elapsed=3.5)
+        usage = usage_difference(begin=begin, end=end)
+        self.assertEqual(usage['elapsed'], 2.5)
+        self.assertIsNone(usage['cpu_user'])
+        self.assertIsNone(usage['max_rss'])
+
+
+class PhasesTest(unittest.TestCase):
+    def test_collect(self):
+        """Test phases are counted and summed by label, only while collecting"""
+        with profile_phase('ignored'):
+            pass
+        with collect_phases() as phases:
+            for _ in range(3):
+                with profile_phase('load'):
+                    time.sleep(0.01)
+            record_phase(label='write', begin=resource_usage(children=False))
+        self.assertEqual(sorted(phases.keys()), ['load', 'write'])
+        self.assertEqual(phases['load']['count'], 3)
+        self.assertGreaterEqual(phases['load']['elapsed'], 0.03)
+        self.assertEqual(phases['write']['count'], 1)
+
+    def test_nested_and_threads(self):
+        """Test nested collections are separate and restored, and other threads collect separately"""
+        with collect_phases() as outer:
+            with collect_phases() as inner:
+                with profile_phase('inner'):
+                    pass
+            thread = threading.Thread(target=lambda: record_phase(label='thread', begin=resource_usage(children=False)))
+            thread.start()
+            thread.join()
+            with profile_phase('outer'):
+                pass
+        self.assertEqual(list(inner.keys()), ['inner'])
+        self.assertEqual(list(outer.keys()), ['outer'])
+
+    def test_merge(self):
+        """Test merged phases (e.g., from worker processes) are summed, with maximum max_rss"""
+        usage = {'count': 2, 'elapsed': 1.0, 'cpu_user': 0.5, 'cpu_system': 0.25, 'bytes_read': 10, 'bytes_written': 20, 'max_rss': 100}
+        merge_phases({'fit': usage})
+        with collect_phases() as phases:
+            merge_phases({'fit': usage})
+            merge_phases({'fit': dict(usage, cpu_user=None, max_rss=300)})
+        self.assertEqual(phases['fit'], {'count': 4, 'elapsed': 2.0, 'cpu_user': None, 'cpu_system': 0.5, 'bytes_read': 20, 'bytes_written': 40, 'max_rss': 300})
+        self.assertEqual(usage['count'], 2)
+
+
+class SaveReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_save(self):
+        """Test report saved as JSON, with no temporary file left"""
+        filename = os.path.join(self.tdir, 'report.json')
+        report = {'siteid': 'US-Xxx', 'steps': [{'step': 'qc_auto', 'elapsed': 1.5}]}
+        save_report(filename=filename, report=report)
+        with open(filename, 'r') as f:
+            self.assertEqual(json.load(f), report)
+        self.assertEqual(os.listdir(self.tdir), ['report.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for timestamp decoding
+'''
+import unittest
+
+import numpy
+
+from datetime import datetime, timedelta
+
+from context import oneflux
+from oneflux import ONEFluxError
+from oneflux.utils.strings import decode_timestamps, timestamps_to_datetime64
+
+
+class DecodeTimestampsTest(unittest.TestCase):
+    def setUp(self):
+        first = datetime(1995, 12, 31, 0, 30)
+        self.datetimes = [first + timedelta(minutes=30 * i) for i in range(0, 24 * 366 * 6, 7)] # includes leap days
+        self.timestamps = numpy.array([d.strftime('%Y%m%d%H%M') for d in self.datetimes])
+
+    def test_decode(self):
+        """Test decoded components and datetimes match strptime"""
+        components = decode_timestamps(self.timestamps, fmt='%Y%m%d%H%M')
+        for name in ('year', 'month', 'day', 'hour', 'minute'):
+            numpy.testing.assert_array_equal(components[name], [getattr(d, name) for d in self.datetimes])
+        self.assertEqual(timestamps_to_datetime64(components).tolist(), self.datetimes)
+
+    def test_decode_integers_and_short_formats(self):
+        """Test integer timestamps and formats without time of day"""
+        components = decode_timestamps(self.timestamps.astype(numpy.int64), fmt='%Y%m%d%H%M')
+        numpy.testing.assert_array_equal(components['day'], [d.day for d in self.datetimes])
+        days = numpy.array([d.strftime('%Y%m%d') for d in self.datetimes])
+        self.assertEqual(timestamps_to_datetime64(decode_timestamps(days, fmt='%Y%m%d')).tolist(), [datetime(d.year, d.month, d.day) for d in self.datetimes])
+        numpy.testing.assert_array_equal(decode_timestamps(numpy.array(['2004', '1999']), fmt='%Y')['year'], [2004, 1999])
+
+    def test_invalid(self):
+        """Test invalid digits, widths and component ranges are rejected"""
+        for timestamp in ('20040230', '20030229', '20041301', '20040100', '2004010', '200401011', '2004o101'):
+            self.assertRaises(ONEFluxError, decode_timestamps, numpy.array(['20040101', timestamp]), fmt='%Y%m%d')
+        for timestamp in ('200401012400', '200401010060'):
+            self.assertRaises(ONEFluxError, decode_timestamps, numpy.array([timestamp]), fmt='%Y%m%d%H%M')
+        self.assertRaises(ONEFluxError, decode_timestamps, numpy.array(['2004']), fmt='%d/%m/%Y')
+        numpy.testing.assert_array_equal(decode_timestamps(numpy.array(['20040229']), fmt='%Y%m%d')['day'], [29])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+'''
+For license information:
+see LICENSE file or headers in oneflux.__init__.py
+
+Tests for bulk CSV writer
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from context import oneflux
+from oneflux import ONEFluxError
+from oneflux.utils.writers import write_csv, format_column
+
+
+class WriteCSVTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='oneflux_test_')
+        self.filename = os.path.join(self.tempdir, 'written.csv')
+        self.expected_filename = os.path.join(self.tempdir, 'expected.csv')
+        rng = numpy.random.RandomState(42)
+        size = 1000
+        self.data = numpy.zeros(size, dtype=[('TIMESTAMP', 'a25'), ('YEAR', 'i8'), ('NEE', 'f8'), ('GPP', 'f4')])
+        self.data['TIMESTAMP'] = ['2000{i:08d}'.format(i=i) for i in range(size)]
+        self.data['YEAR'] = 2000 + rng.randint(0, 3, size)
+        self.data['NEE'] = [round(v, d) for v, d in zip(rng.normal(0, 10, size), rng.randint(0, 16, size))]
+        self.data['NEE'][::7] = -9999.0
+        self.data['NEE'][1::11] = -9999.9
+        self.data['NEE'][2::13] = numpy.nan
+        self.data['NEE'][3::17] = -0.0
+        self.data['GPP'] = rng.normal(5, 1, size)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def read(self, filename):
+        with open(filename, 'r') as f:
+            return f.read()
+
+    def test_savetxt_structured(self):
+        """Test structured array is written as numpy.savetxt (fmt='%s'), in any number of blocks"""
+        header = ','.join(self.data.dtype.names)
+        numpy.savetxt(fname=self.expected_filename, X=self.data, delimiter=',', fmt='%s', header=header, comments='')
+        for block_size in (1, 7, len(self.data), 10 * len(self.data)):
+            write_csv(filename=self.filename, data=self.data, delimiter=',', header=header, block_size=block_size)
+            self.assertEqual(self.read(self.filename), self.read(self.expected_filename))
+
+    def test_savetxt_2d(self):
+        """Test 2-d array, multi-line header and comments are written as numpy.savetxt"""
+        data = numpy.transpose([self.data['NEE'], self.data['GPP'].astype('f8')])
+        header = 'NEE,GPP\nunits'
+        numpy.savetxt(fname=self.expected_filename, X=data, delimiter=';', fmt='%s', header=header, comments='# ')
+        write_csv(filename=self.filename, data=data, delimiter=';', header=header, comments='# ', block_size=64)
+        self.assertEqual(self.read(self.filename), self.read(self.expected_filename))
+
+    def test_missing(self):
+        """Test missing values are written as per-value comparison (previous save_csv_txt)"""
+        missing_values = (-9999.0, -9999.9)
+        write_csv(filename=self.filename, data=self.data, delimiter=',', header='', missing='-9999', missing_values=missing_values, block_size=100)
+        lines = ['']
+        for row in self.data:
+            lines.append(','.join('-9999' if (value == -9999.0 or value == -9999.9) else str(value) for value in row))
+        self.assertEqual(self.read(self.filename), '\n'.join(lines) + '\n')
+
+    def test_formats(self):
+        """Test per-column formats"""
+        texts = format_column(values=self.data['NEE'], fmt='%.2f')
+        self.assertEqual(texts, ['%.2f' % v for v in self.data['NEE']])
+
+    def test_invalid_dimensions(self):
+        """Test arrays with more than two dimensions are rejected"""
+        self.assertRaises(ONEFluxError, write_csv, filename=self.filename, data=numpy.zeros((2, 2, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()